@@ -35,6 +35,21 @@ MCP_CAL_COMMAND  = _get("MCP_CAL_COMMAND", "node")
 MCP_CAL_ARGS     = _get("MCP_CAL_ARGS", "index.js")
 MCP_CAL_CWD      = _get("MCP_CAL_CWD", ".")
 
+# Pool de procesos MCP por servidor (ruteo por menos peticiones en curso + respawn)
+MCP_POOL_SIZE           = _get_int("MCP_POOL_SIZE", 2)
+MCP_CAL_POOL_SIZE       = _get_int("MCP_CAL_POOL_SIZE", 2)
+MCP_CALL_TIMEOUT_S      = _get_float("MCP_CALL_TIMEOUT_S", 60.0)
+MCP_HEALTH_INTERVAL_S   = _get_float("MCP_HEALTH_INTERVAL_S", 15.0)
+MCP_CALL_RETRIES        = _get_int("MCP_CALL_RETRIES", 1)
+# Pings fallidos / timeouts consecutivos antes de reemplazar un hijo
+MCP_MAX_FAILURES        = _get_int("MCP_MAX_FAILURES", 3)
+# Tools de solo lectura: se reintentan en otro proceso si el hijo muere a mitad de la llamada
+MCP_IDEMPOTENT_TOOLS = {t.strip() for t in _get(
+    "MCP_IDEMPOTENT_TOOLS",
+    "list_advisors,list_services,resolve_advisor,resolve_service,check_availability,list_asesorias,"
+    "semantic_search,event_list,event_get,event_find,event_find_overlap",
+).split(",") if t.strip()}
+
 API_DEBUG    = _get_bool("API_DEBUG", True)
 
 CORS_ORIGINS = [o.strip() for o in _get("CORS_ORIGINS", "http://localhost:3000").split(",") if o.strip()]
@@ -44,6 +59,9 @@ GOOGLE_CLIENT_SECRET = _get("GOOGLE_CLIENT_SECRET")
 GOOGLE_REDIRECT_URI  = _get("GOOGLE_REDIRECT_URI", "http://localhost:8010/api/auth/google/callback")
 GOOGLE_DEVICE_ID     = _get("GOOGLE_DEVICE_ID")
 GOOGLE_DEVICE_NAME   = _get("GOOGLE_DEVICE_NAME")
+# Caché de access tokens (Redis + frente en proceso); se renuevan SKEW segundos antes de expirar
+GOOGLE_TOKEN_SKEW_S    = _get_float("GOOGLE_TOKEN_SKEW_S", 120.0)
+GOOGLE_TOKEN_LOCAL_MAX = _get_int("GOOGLE_TOKEN_LOCAL_MAX", 1024)
 
 JWT_SECRET  = _get("JWT_SECRET", "change_me")
 JWT_ISSUER  = _get("JWT_ISSUER", "cinap.api")
@@ -76,8 +94,15 @@ LLM_MODEL     = _get("LLM_MODEL", "Qwen/Qwen3-4B")
 LLM_TEMP      = _get_float("LLM_TEMP", 0.2)
 LLM_TOP_P     = _get_float("LLM_TOP_P", 0.95)
 
+# Ventana de conversación que ve el modelo; al superarla se recorta a MAX * RATIO
+PROMPT_MAX_TOKENS = _get_int("PROMPT_MAX_TOKENS", 10000)
+PROMPT_TRIM_RATIO = _get_float("PROMPT_TRIM_RATIO", 0.75)
+
 REDIS_URL = _get("REDIS_URL", "redis://localhost:6379/0")
 
+# "http" (servidor de embeddings) o "local" (sustituto determinista, sin red)
+EMBEDDINGS_BACKEND = (_get("EMBEDDINGS_BACKEND", "http") or "http").lower()
+
 # Webhook Configuration
 WEBHOOK_PUBLIC_URL = _get("WEBHOOK_PUBLIC_URL", "https://7abec71a6303.ngrok-free.app/")
 
@@ -87,5 +112,48 @@ ASR_BASE_URL   = _get("ASR_BASE_URL", "http://localhost:8001")
 ASR_MODEL_NAME = _get("ASR_MODEL_NAME", "clu-ling/whisper-large-v2-spanish")
 ASR_API_KEY    = _get("ASR_API_KEY", "EMPTY")
 ASR_LANG       = _get("ASR_LANG", "es")
+# Subida en streaming Telegram -> ASR (sin cargar la nota completa en memoria)
+ASR_STREAM_UPLOAD        = _get_bool("ASR_STREAM_UPLOAD", True)
+ASR_STREAM_CHUNK_BYTES   = _get_int("ASR_STREAM_CHUNK_BYTES", 16384)
+ASR_STREAM_BUFFER_CHUNKS = _get_int("ASR_STREAM_BUFFER_CHUNKS", 8)
+# Pre-filtro de voz (ffmpeg + NumPy) antes del ASR. Desactivado por defecto: el VAD
+# necesita la nota completa, así que al activarlo se deja de usar ASR_STREAM_UPLOAD
+# (más memoria y latencia por nota a cambio de menos segundos de GPU en notas con silencio)
+ASR_VAD_ENABLED          = _get_bool("ASR_VAD_ENABLED", False)
+ASR_VAD_MIN_SPEECH_S     = _get_float("ASR_VAD_MIN_SPEECH_S", 0.3)
+ASR_VAD_MIN_TRIM_S       = _get_float("ASR_VAD_MIN_TRIM_S", 1.0)
+# Planificador ASR: menor duración primero (con envejecimiento) y concurrencia AIMD
+ASR_SCHED_MIN_CONCURRENCY     = _get_int("ASR_SCHED_MIN_CONCURRENCY", 2)
+ASR_SCHED_INITIAL_CONCURRENCY = _get_int("ASR_SCHED_INITIAL_CONCURRENCY", 16)
+ASR_SCHED_TARGET_RTF          = _get_float("ASR_SCHED_TARGET_RTF", 0.5)
+ASR_SCHED_BASE_LATENCY        = _get_float("ASR_SCHED_BASE_LATENCY", 1.0)
+ASR_SCHED_AGING               = _get_float("ASR_SCHED_AGING", 0.5)
+
+# Cola durable de updates de Telegram (opt-in): "off" (inline, por defecto), "redis" (streams)
+# o "local" (en memoria)
+TG_QUEUE_BACKEND       = (_get("TG_QUEUE_BACKEND", "off") or "off").lower()
+TG_QUEUE_WORKERS       = _get_int("TG_QUEUE_WORKERS", 8)
+TG_QUEUE_MAX_ATTEMPTS  = _get_int("TG_QUEUE_MAX_ATTEMPTS", 5)
+TG_QUEUE_BACKOFF_BASE  = _get_float("TG_QUEUE_BACKOFF_BASE", 1.0)
+TG_QUEUE_BACKOFF_MAX   = _get_float("TG_QUEUE_BACKOFF_MAX", 30.0)
+TG_QUEUE_STREAM        = _get("TG_QUEUE_STREAM", "tg:updates")
+TG_QUEUE_MAXLEN        = _get_int("TG_QUEUE_MAXLEN", 100000)
+TG_QUEUE_CLAIM_IDLE_MS = _get_int("TG_QUEUE_CLAIM_IDLE_MS", 60000)
+# Solo se reclaman entries de consumidores sin heartbeat (TTL) en Redis
+TG_QUEUE_HEARTBEAT_TTL_S = _get_float("TG_QUEUE_HEARTBEAT_TTL_S", 30.0)
+
+# Cache de identidad chat_id -> (user_id, rol, perfiles): LRU local delante de Redis.
+# TG_IDENTITY_LOCAL_TTL acota cuánto tarda otro proceso en ver una invalidación
+TG_IDENTITY_CACHE_MAX  = _get_int("TG_IDENTITY_CACHE_MAX", 10000)
+TG_IDENTITY_LOCAL_TTL  = _get_float("TG_IDENTITY_LOCAL_TTL", 30.0)
+TG_IDENTITY_TTL        = _get_int("TG_IDENTITY_TTL", 86400)
+
+# Envío a la Bot API: base configurable (servidor falso local en pruebas) y límites de salida
+TELEGRAM_API_BASE      = (_get("TELEGRAM_API_BASE", "https://api.telegram.org") or "https://api.telegram.org").rstrip("/")
+TG_SEND_GLOBAL_RATE    = _get_float("TG_SEND_GLOBAL_RATE", 30.0)
+TG_SEND_CHAT_RATE      = _get_float("TG_SEND_CHAT_RATE", 1.0)
+TG_SEND_CHAT_BURST     = _get_float("TG_SEND_CHAT_BURST", 3.0)
+TG_SEND_CONCURRENCY    = _get_int("TG_SEND_CONCURRENCY", 32)
+TG_SEND_MAX_RETRIES    = _get_int("TG_SEND_MAX_RETRIES", 3)
 
 EVAL_LOG_PATH = _get("EVAL_LOG_PATH")
\ No newline at end of file
@@ -15,14 +15,23 @@ from app.interface_adapters.gateways.db.sqlalchemy_user_repo import SqlAlchemyUs
 from app.interface_adapters.gateways.db.sqlalchemy_docente_repo import SqlAlchemyDocentePerfilRepo
 from app.interface_adapters.gateways.db.sqlalchemy_asesor_repo import SqlAlchemyAsesorRepo
 from app.interface_adapters.gateways.cache.redis_cache import RedisCache
+from app.interface_adapters.gateways.cache.telegram_identity_cache import TelegramIdentityCache
+from app.interface_adapters.gateways.embeddings.embeddings_http_client import EmbeddingsHTTPClient
+from app.interface_adapters.gateways.embeddings.local_embeddings import LocalHashEmbeddings
 from app.interface_adapters.gateways.calendar.google_calendar_client import GoogleCalendarClient
+from app.interface_adapters.gateways.oauth import google_token_broker
 from app.interface_adapters.gateways.db.sqlalchemy_calendar_events_repo import SqlAlchemyCalendarEventsRepo
 from app.use_cases.calendar.auto_configure_webhook import AutoConfigureWebhook
-from app.frameworks_drivers.config.settings import REDIS_URL
+from app.frameworks_drivers.config.settings import REDIS_URL, EMBEDDINGS_BACKEND
+from app.frameworks_drivers.config.settings import TG_IDENTITY_CACHE_MAX, TG_IDENTITY_LOCAL_TTL, TG_IDENTITY_TTL
+from app.frameworks_drivers.config.settings import GOOGLE_TOKEN_SKEW_S, GOOGLE_TOKEN_LOCAL_MAX
 from app.frameworks_drivers.mcp.stdio_client import MCPStdioClient
+from app.frameworks_drivers.mcp.client_pool import MCPClientPool
 from app.frameworks_drivers.llm.langgraph_agent import LangGraphAgent
 from app.frameworks_drivers.config.settings import (
-    VLLM_BASE_URL, VLLM_API_KEY, LLM_MODEL, LLM_TEMP, LLM_TOP_P, MCP_CAL_COMMAND, MCP_CAL_ARGS, MCP_CAL_CWD
+    VLLM_BASE_URL, VLLM_API_KEY, LLM_MODEL, LLM_TEMP, LLM_TOP_P, MCP_CAL_COMMAND, MCP_CAL_ARGS, MCP_CAL_CWD,
+    MCP_POOL_SIZE, MCP_CAL_POOL_SIZE, MCP_CALL_TIMEOUT_S, MCP_HEALTH_INTERVAL_S, MCP_CALL_RETRIES, MCP_MAX_FAILURES,
+    MCP_IDEMPOTENT_TOOLS,
 )
 
 logger = logging.getLogger(__name__)
@@ -31,8 +40,8 @@ class Container:
     oauth: GoogleOAuthClient
     jwt: PyJWTService
 
-    db_mcp: MCPStdioClient | None
-    cal_mcp: MCPStdioClient | None
+    db_mcp: MCPClientPool | None
+    cal_mcp: MCPClientPool | None
     graph_agent: LangGraphAgent | None
     main_loop: asyncio.AbstractEventLoop | None
 
@@ -82,11 +91,24 @@ class Container:
         self.jwt = PyJWTService(secret=jwt_secret, issuer=jwt_issuer, minutes=int(jwt_minutes))
         
 
-        self.db_mcp = MCPStdioClient(mcp_command, mcp_args, mcp_cwd)
-        self.cal_mcp = MCPStdioClient(
-            cal_mcp_command or MCP_CAL_COMMAND,
-            cal_mcp_args or MCP_CAL_ARGS,
-            cal_mcp_cwd or MCP_CAL_CWD,
+        pool_opts = dict(
+            idempotent_tools=MCP_IDEMPOTENT_TOOLS,
+            call_timeout=MCP_CALL_TIMEOUT_S,
+            health_interval=MCP_HEALTH_INTERVAL_S,
+            max_retries=MCP_CALL_RETRIES,
+            max_failures=MCP_MAX_FAILURES,
+        )
+        self.db_mcp = MCPClientPool(
+            lambda: MCPStdioClient(mcp_command, mcp_args, mcp_cwd),
+            size=MCP_POOL_SIZE, name="db", **pool_opts,
+        )
+        self.cal_mcp = MCPClientPool(
+            lambda: MCPStdioClient(
+                cal_mcp_command or MCP_CAL_COMMAND,
+                cal_mcp_args or MCP_CAL_ARGS,
+                cal_mcp_cwd or MCP_CAL_CWD,
+            ),
+            size=MCP_CAL_POOL_SIZE, name="cal", **pool_opts,
         )
         self.graph_agent = None
         self.main_loop = None
@@ -94,6 +116,20 @@ class Container:
         self._langgraph_db_path = langgraph_db_path
         self.redis = redis_from_url(REDIS_URL, decode_responses=False)
         self.cache = RedisCache(self.redis)
+        # Access tokens de Google compartidos por todos los GoogleCalendarClient (y los MCP vía Redis)
+        google_token_broker.configure(
+            cache=self.cache, skew_s=GOOGLE_TOKEN_SKEW_S, local_max=GOOGLE_TOKEN_LOCAL_MAX,
+        )
+        # Identidad de chats de Telegram; se invalida al vincular/desvincular y en cambios de rol
+        self.identity_cache = TelegramIdentityCache(
+            self.cache,
+            max_items=TG_IDENTITY_CACHE_MAX,
+            local_ttl=TG_IDENTITY_LOCAL_TTL,
+            ttl_seconds=TG_IDENTITY_TTL,
+        )
+        # Cliente de embeddings compartido por todo el proceso (pool HTTP/2 + micro-batching)
+        # EMBEDDINGS_BACKEND=local usa el sustituto determinista (dev/bench sin servidor)
+        self.embeddings = LocalHashEmbeddings() if EMBEDDINGS_BACKEND == "local" else EmbeddingsHTTPClient()
 
     def uc_google_callback(self, session: AsyncSession) -> GoogleCallbackUseCase:
         user_repo = SqlAlchemyUserRepo(session, default_role_id=self._default_role_id)
@@ -127,13 +163,11 @@ class Container:
 
     async def startup(self):
         self.main_loop = asyncio.get_running_loop()
-        await self.db_mcp.connect()
-        await self.cal_mcp.connect()
+        await asyncio.gather(self.db_mcp.connect(), self.cal_mcp.connect())
         self.graph_agent = LangGraphAgent(
             mcps={"db": self.db_mcp, "cal": self.cal_mcp},
             model_name=self._llm_model_name,
             db_path=self._langgraph_db_path,
-            main_loop=self.main_loop,
             public_clients={"db"},
             deny_tools={"calendar_event_upsert"}
         )
@@ -154,6 +188,11 @@ class Container:
             tasks.append(self.cal_mcp.close())
         if self.redis:
             tasks.append(self.redis.close())
+        if self.embeddings:
+            tasks.append(self.embeddings.aclose())
+        if self.graph_agent:
+            tasks.append(self.graph_agent.aclose())
+        tasks.append(google_token_broker.aclose_all())
 
         for t in tasks:
             with suppress(asyncio.CancelledError):
@@ -5,30 +5,28 @@ import copy
 from datetime import datetime
 import time
 import uuid
-from zoneinfo import ZoneInfo
-import json, sqlite3, asyncio, re, logging
-from typing import Any, Dict, List
+import json, asyncio, re, logging
+from typing import Any, AsyncIterator, Dict, List
 from contextvars import ContextVar
 from langgraph.prebuilt import create_react_agent
-from langgraph.checkpoint.sqlite import SqliteSaver
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+import aiosqlite
 from langchain.tools import StructuredTool
 from pydantic import BaseModel, create_model
-from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_core.messages import HumanMessage
 from langchain_openai import ChatOpenAI
-from langchain_core.messages.utils import trim_messages, get_buffer_string
-from langchain_core.messages import RemoveMessage
-from langgraph.graph.message import REMOVE_ALL_MESSAGES
 from langchain_core.callbacks import BaseCallbackHandler
-from app.frameworks_drivers.mcp.stdio_client import MCPStdioClient
+from app.use_cases.ports.mcp_port import MCPPort
 from app.observability.confirm_store import is_confirmation
 from app.observability.metrics import set_meta, stage, astage
 from app.observability.metrics_llm import MetricsCallbackHandler
+from app.frameworks_drivers.llm.prompt_assembly import PromptAssembler
 try:
     from langchain_ollama import ChatOllama
 except Exception:
     ChatOllama = None
 from app.frameworks_drivers.config.settings import (
-    USE_OLLAMA, EVAL_LOG_PATH,
+    USE_OLLAMA, EVAL_LOG_PATH, PROMPT_MAX_TOKENS, PROMPT_TRIM_RATIO,
     OLLAMA_BASE_URL, OLLAMA_MODEL, OLLAMA_TEMP, OLLAMA_TOP_P,
 )
 
@@ -41,6 +39,24 @@ _TOOL_JSON_RE = re.compile(
 _THINK_RE = re.compile(r"<think>.*?</think>", re.DOTALL)
 
 CURRENT_THREAD_ID: ContextVar[str | None] = ContextVar("CURRENT_THREAD_ID", default=None)
+# Contexto de tools por request (p. ej. {"user_id": ...}); lo fija invoke(tool_context=...)
+CURRENT_TOOL_CONTEXT: ContextVar[dict | None] = ContextVar("CURRENT_TOOL_CONTEXT", default=None)
+
+_UUID_RE = re.compile(r"[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}")
+
+def current_tool_context() -> dict:
+    return CURRENT_TOOL_CONTEXT.get() or {}
+
+def _context_user_id() -> str | None:
+    """user_id del contexto de la request; si no hay, el thread_id cuando es un UUID (web)."""
+    ctx = current_tool_context()
+    uid = ctx.get("user_id") or ctx.get("sub")
+    if uid:
+        return str(uid)
+    tid = CURRENT_THREAD_ID.get()
+    if tid and _UUID_RE.fullmatch(tid):
+        return tid
+    return None
 
 CONFIRM_TOOLS = {"schedule_asesoria", "cancel_asesoria", "confirm_asesoria"}
 
@@ -98,33 +114,6 @@ def _compact_content(content: Any) -> str:
 
     return _sanitize_for_state(str(content or ""))
 
-def make_pre_model_hook(system_text: str, token_counter):
-    def _hook(state: dict) -> dict:
-        trimmed = trim_messages(
-            state["messages"],
-            strategy="last",
-            token_counter=token_counter,
-            max_tokens=10000,
-            start_on="human",
-            end_on=("human","tool"),
-        )
-        cleaned = []
-        for m in trimmed:
-            try:
-                m.content = _compact_content(getattr(m, "content", ""))
-                akw = getattr(m, "additional_kwargs", None)
-                if isinstance(akw, dict):
-                    for k in ("tool_calls","function_call","refusal","audio","parsed"):
-                        akw.pop(k, None)
-            except Exception:
-                pass
-            cleaned.append(m)
-
-        non_system = [m for m in cleaned if not isinstance(m, SystemMessage)]
-        single_system = SystemMessage(content=_compact_content(system_text))
-        return {"messages": [RemoveMessage(REMOVE_ALL_MESSAGES), single_system, *non_system]}
-    return _hook
-
 def _eval_log(event: dict):
     try:
         event = dict(event or {})
@@ -392,24 +381,10 @@ def _make_token_counter(model_name: str):
 
     return counter
 
-def make_messages_token_counter(model_name: str):
-    string_counter = _make_token_counter(model_name)
-    def _messages_token_counter(messages):
-        try:
-            s = get_buffer_string(messages)
-        except Exception:
-            parts = []
-            for m in (messages or []):
-                c = getattr(m, "content", "")
-                if not isinstance(c, str):
-                    try: c = json.dumps(c, ensure_ascii=False)
-                    except Exception: c = str(c)
-                parts.append(c)
-            s = "\n".join(parts)
-        return string_counter(s or "")
-    return _messages_token_counter
-
 class MetricsCallbackHandler(BaseCallbackHandler):
+    # Con ainvoke los handlers síncronos irían al executor; este solo anota métricas
+    run_inline = True
+
     def __init__(self, stage_name="llm.http"):
         self.stage_name = stage_name
 
@@ -441,22 +416,40 @@ class MetricsCallbackHandler(BaseCallbackHandler):
                 total_tokens=usage.get("total_tokens"),
             )
 
+def _extract_reply(out: list) -> str:
+    last_msg = out[-1] if out else None
+    if not last_msg:
+        return ""
+    # Verificar si hay tool_calls sin procesar
+    if hasattr(last_msg, 'tool_calls') and last_msg.tool_calls:
+        log = logging.getLogger("langgraph")
+        log.warning(f"AIMessage con tool_calls no procesados: {last_msg.tool_calls}")
+        # Intentar obtener el contenido de todos los mensajes
+        all_contents = [m.content for m in out if hasattr(m, 'content') and m.content]
+        return "\n".join(all_contents) if all_contents else "No pude procesar la respuesta"
+    return _strip_think(last_msg.content if hasattr(last_msg, 'content') else str(last_msg))
+
 class LangGraphRunner:
+    """
+    Ejecuta el grafo de forma nativa en el event loop (ainvoke/astream): las tools
+    MCP son corutinas y el checkpointer es AsyncSqliteSaver, así que una
+    conversación no ocupa un hilo del executor y los `astage` miden tiempo real.
+    """
     def __init__(self, app, system_text: str | None = None):
         self._app = app
         self._system_text = system_text or None
 
+    @staticmethod
+    def _input(message: str, thread_id: str) -> tuple[dict, dict]:
+        with stage("agent.llm.prompt_build"):
+            msgs = [HumanMessage(content=message)]
+        return {"messages": msgs}, {"configurable": {"thread_id": thread_id}}
+
     async def invoke(self, message: str, *, thread_id: str) -> str:
-        def _run():
-            with stage("agent.llm.prompt_build"):
-                msgs = []
-                msgs.append(HumanMessage(content=message))
-
-            with stage("agent.langgraph.invoke"):
-                res = self._app.invoke(
-                    {"messages": msgs},
-                    config={"configurable": {"thread_id": thread_id}},
-                )
+        async with astage("agent.total"):
+            graph_input, config = self._input(message, thread_id)
+            async with astage("agent.langgraph.invoke"):
+                res = await self._app.ainvoke(graph_input, config=config)
                 out = res.get("messages", [])
                 try:
                     last = out[-1].content if out else ""
@@ -471,24 +464,17 @@ class LangGraphRunner:
                     pass
 
             with stage("agent.present.extract"):
-                last_msg = out[-1] if out else None
-                if last_msg:
-                    # Verificar si hay tool_calls sin procesar
-                    if hasattr(last_msg, 'tool_calls') and last_msg.tool_calls:
-                        import logging
-                        log = logging.getLogger("langgraph")
-                        log.warning(f"AIMessage con tool_calls no procesados: {last_msg.tool_calls}")
-                        # Intentar obtener el contenido de todos los mensajes
-                        all_contents = [m.content for m in out if hasattr(m, 'content') and m.content]
-                        return "\n".join(all_contents) if all_contents else "No pude procesar la respuesta"
-                    return _strip_think(last_msg.content if hasattr(last_msg, 'content') else str(last_msg))
-                return ""
+                return _extract_reply(out)
 
-        async with astage("agent.total"):
-            return await asyncio.to_thread(_run)
+    async def astream(self, message: str, *, thread_id: str) -> AsyncIterator[dict]:
+        """Actualizaciones por nodo (`{"agent": ...}`, `{"tools": ...}`) a medida que se producen."""
+        graph_input, config = self._input(message, thread_id)
+        async with astage("agent.langgraph.stream"):
+            async for update in self._app.astream(graph_input, config=config, stream_mode="updates"):
+                yield update
 
 class LangGraphAgent:
-    def __init__(self, mcps: dict[str, MCPStdioClient], *, model_name: str, db_path: str, main_loop,
+    def __init__(self, mcps: dict[str, MCPPort], *, model_name: str, db_path: str,
                  public_clients: set[str] | None = None,
                  allow_tools: set[str] | None = None,
                  deny_tools: set[str] | None = None):
@@ -497,7 +483,7 @@ class LangGraphAgent:
         self._model_name = model_name
         self._db_path = db_path
         self._runner: LangGraphRunner | None = None
-        self._main_loop = main_loop
+        self._checkpoint_conn: aiosqlite.Connection | None = None
         self._confirm_store = None
         self._public_clients = set(public_clients or set(mcps.keys()))
         self._allow_tools = set(allow_tools or [])
@@ -525,13 +511,7 @@ class LangGraphAgent:
                     args = dict(args)
 
                     if name in ("schedule_asesoria", "cancel_asesoria", "list_asesorias", "confirm_asesoria"):
-                        user = getattr(self, "_current_user", {}) or {}
-                        uid = user.get("sub") or user.get("user_id")
-                        if not uid:
-                            import re
-                            tid = CURRENT_THREAD_ID.get()
-                            if thread_id and re.fullmatch(r"[0-9a-fA-F-]{36}", thread_id):
-                                uid = thread_id
+                        uid = _context_user_id()
                         if "input" in args and isinstance(args["input"], dict):
                             if uid and not args["input"].get("user_id"):
                                 args["input"]["user_id"] = uid
@@ -660,14 +640,9 @@ class LangGraphAgent:
             except Exception as e:
                 return f"Ocurrió un error ejecutando {name}: {e!s}"
 
-        def caller_sync(**kwargs) -> str:
-            fut = asyncio.run_coroutine_threadsafe(caller_async(**kwargs), self._main_loop)
-            return fut.result()
-
         return StructuredTool.from_function(
             name=name,
             description=description or f"Tool {name}",
-            func=caller_sync,
             coroutine=caller_async,
             args_schema=ModelIn,
             return_direct=True,
@@ -697,7 +672,7 @@ class LangGraphAgent:
                 tools.append(self._make_tool(name, fn.get("description") or "", ModelIn))
         return tools
     
-    def _client_for_tool(self, tool_name: str) -> MCPStdioClient:
+    def _client_for_tool(self, tool_name: str) -> MCPPort:
         label = self._tool_to_client.get(tool_name)
         if not label:
             label = next(iter(self._mcps.keys()))
@@ -733,8 +708,9 @@ class LangGraphAgent:
             )
 
         tools = await self._build_tools_from_mcp()
-        conn = sqlite3.connect(self._db_path, check_same_thread=False)
-        checkpointer = SqliteSaver(conn)
+        self._checkpoint_conn = await aiosqlite.connect(self._db_path)
+        checkpointer = AsyncSqliteSaver(self._checkpoint_conn)
+        await checkpointer.setup()
 
         SYSTEM_STATIC_EN = """
         You are a tool-using assistant. 
@@ -787,14 +763,14 @@ class LangGraphAgent:
         Asistente:
         {"name":"semantic_search","arguments":{"q":"Qué es el programa CINAP","kinds":["general.page","doc.chunk"]}}
         """
-        now_cl = datetime.now(ZoneInfo("America/Santiago"))
-        offset = now_cl.utcoffset()
-        offset_h = int(offset.total_seconds() // 3600)
-        offset_sign = "+" if offset_h >= 0 else "-"
-        offset_txt = f"UTC{offset_sign}{abs(offset_h):02d}:00"
-        system_msg = SYSTEM_STATIC_EN + "\n" + FEW_SHOTS_ES + f"\nContext: TZ=America/Santiago ({offset_txt}), today={now_cl:%d-%m-%Y}\n /no_think"
-        token_counter = make_messages_token_counter(self._model_name)
-        pre_hook = make_pre_model_hook(system_msg, token_counter)
+        # Prefijo estático idéntico en cada turno; la fecha se agrega al final por día
+        pre_hook = PromptAssembler(
+            SYSTEM_STATIC_EN + "\n" + FEW_SHOTS_ES,
+            token_counter=_make_token_counter(self._model_name),
+            compact=_compact_content,
+            max_tokens=PROMPT_MAX_TOKENS,
+            trim_ratio=PROMPT_TRIM_RATIO,
+        )
         app_or_graph = create_react_agent(
             llm, tools,
             checkpointer=checkpointer,
@@ -803,10 +779,25 @@ class LangGraphAgent:
         app = app_or_graph.compile(checkpointer=checkpointer) if hasattr(app_or_graph, "compile") else app_or_graph
         self._runner = LangGraphRunner(app, system_text=None)
 
-    async def invoke(self, message: str, *, thread_id: str) -> str:
+    async def aclose(self) -> None:
+        if self._checkpoint_conn is not None:
+            await self._checkpoint_conn.close()
+            self._checkpoint_conn = None
+
+    async def invoke(self, message: str, *, thread_id: str, tool_context: dict | None = None) -> str:
+        """`tool_context` (p. ej. {"user_id": ...}) vale solo para esta llamada: lo leen
+        las tools vía contextvar, así varios chats comparten el agente sin pisarse."""
         if not self._runner:
             raise RuntimeError("LangGraphAgent no inicializado")
-        
+        ctx_token = CURRENT_TOOL_CONTEXT.set(dict(tool_context or {}))
+        tid_token = CURRENT_THREAD_ID.set(thread_id)
+        try:
+            return await self._invoke(message, thread_id=thread_id)
+        finally:
+            CURRENT_THREAD_ID.reset(tid_token)
+            CURRENT_TOOL_CONTEXT.reset(ctx_token)
+
+    async def _invoke(self, message: str, *, thread_id: str) -> str:
         if getattr(self, "_confirm_store", None) and not is_confirmation(message):
             pending = await self._confirm_store.pop(thread_id)
             if pending:
@@ -829,22 +820,12 @@ class LangGraphAgent:
                 if tool not in CONFIRM_TOOLS:
                     return "No hay ninguna acción pendiente de confirmación"
                 else:
-                    def _fallback_user_id():
-                        user = getattr(self, "_current_user", {}) or {}
-                        uid = user.get("sub") or user.get("user_id")
-                        if not uid:
-                            import re
-                            tid = CURRENT_THREAD_ID.get()
-                            if tid and re.fullmatch(r"[0-9a-fA-F-]{8}-[0-9a-fA-F-]{4}-[0-9a-fA-F-]{4}-[0-9a-fA-F-]{4}-[0-9a-fA-F-]{12}", tid):
-                                uid = tid
-                        return uid
-
                     def _put_confirm_and_user_id_in_input(a: dict) -> dict:
                         out = dict(a or {})
                         if "input" not in out or not isinstance(out["input"], dict):
                             out["input"] = {}
                         out["input"] = {**out["input"], "confirm": True}
-                        uid = out["input"].get("user_id") or _fallback_user_id()
+                        uid = out["input"].get("user_id") or _context_user_id()
                         if uid:
                             out["input"]["user_id"] = uid
                         return out
@@ -970,9 +951,5 @@ class LangGraphAgent:
 
             set_meta(fastpath="miss_no_pending")
 
-        token = CURRENT_THREAD_ID.set(thread_id)
-        try:
-            reply = await self._runner.invoke(message, thread_id=thread_id)
-            return _strip_think(reply)
-        finally:
-            CURRENT_THREAD_ID.reset(token)
+        reply = await self._runner.invoke(message, thread_id=thread_id)
+        return _strip_think(reply)
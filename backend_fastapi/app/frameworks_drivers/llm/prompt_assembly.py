@@ -0,0 +1,168 @@
+from __future__ import annotations
+import json, threading
+from collections import OrderedDict
+from datetime import date, datetime
+from typing import Any, Callable, Optional
+from zoneinfo import ZoneInfo
+
+from langchain_core.messages import RemoveMessage, SystemMessage
+from langgraph.graph.message import REMOVE_ALL_MESSAGES
+
+from app.observability.metrics import set_meta, stage
+
+_STRIP_KWARGS = ("tool_calls", "function_call", "refusal", "audio", "parsed")
+
+def _msg_type(m: Any) -> str:
+    return getattr(m, "type", "") or ""
+
+class PromptAssembler:
+    """
+    Arma los mensajes de cada llamada al modelo (pre_model_hook de create_react_agent).
+
+    - Prefijo de sistema compactado una sola vez y reutilizado tal cual: los mismos
+      bytes en cada turno, así la caché automática de prefijos de vLLM lo aprovecha.
+    - La línea de contexto (TZ/fecha) va al final del mensaje de sistema, fuera del
+      prefijo estable, y se recalcula al cambiar el día.
+    - Contenido compactado y tokens por mensaje en caché (id + contenido): en cada
+      llamada solo se tokenizan los mensajes nuevos.
+    - Recorte con histéresis: al superar `max_tokens` la ventana baja a
+      `max_tokens * trim_ratio`, así el inicio de la conversación no se desliza en
+      cada turno y el prefijo sigue sirviendo para la caché.
+    """
+
+    def __init__(self, static_text: str, *, token_counter: Callable[[str], int],
+                 compact: Callable[[Any], str], max_tokens: int = 10000, trim_ratio: float = 0.75,
+                 tz: str = "America/Santiago", per_message_overhead: int = 4, cache_size: int = 4096):
+        self._prefix = compact(static_text)
+        self._count = token_counter
+        self._compact = compact
+        self._max = max(1, int(max_tokens))
+        self._target = max(1, min(self._max, int(self._max * trim_ratio)))
+        self._tz_name = tz
+        self._tz = ZoneInfo(tz)
+        self._overhead = per_message_overhead
+        self._cache_size = max(1, int(cache_size))
+        self._cache: OrderedDict[tuple, tuple[str, int]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._system: Optional[tuple[date, SystemMessage]] = None
+        self.prefix_tokens = token_counter(self._prefix)
+        self.hits = 0
+        self.misses = 0
+        self.trims = 0
+
+    # ---- mensaje de sistema ----
+    def _context_line(self, now: datetime) -> str:
+        offset = now.utcoffset()
+        offset_h = int(offset.total_seconds() // 3600)
+        offset_sign = "+" if offset_h >= 0 else "-"
+        offset_txt = f"UTC{offset_sign}{abs(offset_h):02d}:00"
+        return f"\nContext: TZ={self._tz_name} ({offset_txt}), today={now:%d-%m-%Y}\n /no_think"
+
+    def system_message(self, now: Optional[datetime] = None) -> SystemMessage:
+        """Mismo objeto durante todo el día; id fijo para que add_messages no lo modifique."""
+        now = now or datetime.now(self._tz)
+        cached = self._system
+        if cached is not None and cached[0] == now.date():
+            return cached[1]
+        msg = SystemMessage(content=self._prefix + self._context_line(now), id=f"system-{now:%Y%m%d}")
+        self._system = (now.date(), msg)
+        return msg
+
+    # ---- caché por mensaje ----
+    def _measure(self, m: Any) -> tuple[str, int]:
+        content = getattr(m, "content", "")
+        mid = getattr(m, "id", None)
+        key = (mid, content) if mid and isinstance(content, str) else None
+        if key is not None:
+            with self._lock:
+                hit = self._cache.get(key)
+                if hit is not None:
+                    self._cache.move_to_end(key)
+                    self.hits += 1
+                    return hit
+
+        compacted = self._compact(content)
+        tokens = self._count(compacted) + self._overhead
+        tool_calls = getattr(m, "tool_calls", None)
+        if tool_calls:
+            try:
+                tokens += self._count(json.dumps(
+                    [{"name": tc.get("name"), "args": tc.get("args")} for tc in tool_calls],
+                    ensure_ascii=False, default=str))
+            except Exception:
+                pass
+        value = (compacted, tokens)
+        if mid:
+            with self._lock:
+                self.misses += 1
+                # El hook deja el contenido ya compactado en el estado: el próximo turno pega aquí
+                for k in {key, (mid, compacted)} - {None}:
+                    self._cache[k] = value
+                    self._cache.move_to_end(k)
+                while len(self._cache) > self._cache_size:
+                    self._cache.popitem(last=False)
+        return value
+
+    @staticmethod
+    def _apply(m: Any, compacted: str) -> None:
+        try:
+            if getattr(m, "content", None) != compacted:
+                m.content = compacted
+            akw = getattr(m, "additional_kwargs", None)
+            if isinstance(akw, dict):
+                for k in _STRIP_KWARGS:
+                    akw.pop(k, None)
+        except Exception:
+            pass
+
+    # ---- recorte ----
+    def trim(self, messages: list) -> tuple[list, int]:
+        """Ventana final (empieza en human, termina en human/tool) y sus tokens estimados."""
+        msgs = [m for m in (messages or []) if not isinstance(m, SystemMessage)]
+        end = len(msgs)
+        while end and _msg_type(msgs[end - 1]) not in ("human", "tool"):
+            end -= 1
+
+        measured: list[tuple[str, int]] = []
+        total = 0
+        start = end
+        while start > 0:
+            cur = self._measure(msgs[start - 1])
+            if total + cur[1] > self._max:
+                break
+            measured.append(cur)
+            total += cur[1]
+            start -= 1
+        measured.reverse()
+
+        if start > 0:
+            # Pasó el límite: bajar hasta el objetivo de una vez (histéresis)
+            self.trims += 1
+            while measured and total > self._target:
+                total -= measured.pop(0)[1]
+                start += 1
+        # start_on="human"
+        while start < end and _msg_type(msgs[start]) != "human":
+            total -= measured.pop(0)[1]
+            start += 1
+
+        window = msgs[start:end]
+        for m, (compacted, _) in zip(window, measured):
+            self._apply(m, compacted)
+        return window, total
+
+    def __call__(self, state: dict) -> dict:
+        with stage("agent.prompt.assemble"):
+            window, tokens = self.trim(state["messages"])
+            system = self.system_message()
+        set_meta(prompt_window_messages=len(window), prompt_window_tokens=tokens)
+        return {"messages": [RemoveMessage(REMOVE_ALL_MESSAGES), system, *window]}
+
+    def stats(self) -> dict:
+        return {
+            "prefix_tokens": self.prefix_tokens,
+            "cached_messages": len(self._cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "trims": self.trims,
+        }
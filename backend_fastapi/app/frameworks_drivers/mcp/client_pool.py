@@ -0,0 +1,285 @@
+from __future__ import annotations
+import asyncio, itertools, logging
+from contextlib import suppress
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import anyio
+from mcp.shared.exceptions import McpError
+from mcp.types import CONNECTION_CLOSED
+
+from app.frameworks_drivers.mcp.stdio_client import MCPStdioClient
+from app.observability.metrics import astage
+from app.use_cases.ports.mcp_port import MCPPort
+
+log = logging.getLogger(__name__)
+
+# Errores que indican que la sesión/proceso hijo quedó inservible (no errores de la tool)
+_TRANSPORT_ERRORS = (
+    anyio.ClosedResourceError, anyio.BrokenResourceError, anyio.EndOfStream,
+    EOFError, ConnectionError, McpError,
+)
+
+def _is_transport_error(e: BaseException) -> bool:
+    if isinstance(e, McpError):
+        return getattr(getattr(e, "error", None), "code", None) == CONNECTION_CLOSED
+    return isinstance(e, _TRANSPORT_ERRORS)
+
+class _Member:
+    __slots__ = ("index", "client", "alive", "outstanding", "calls", "errors", "failures",
+                 "restarts", "last_pick", "respawn_task", "stop", "owner", "idle")
+
+    def __init__(self, index: int):
+        self.index = index
+        self.client: Optional[MCPStdioClient] = None
+        self.alive = False
+        self.outstanding = 0
+        self.calls = 0
+        self.errors = 0
+        self.failures = 0  # pings fallidos / timeouts consecutivos, sin un éxito entre medio
+        self.restarts = 0
+        self.last_pick = 0
+        self.respawn_task: Optional[asyncio.Task] = None
+        self.stop: Optional[asyncio.Event] = None
+        self.owner: Optional[asyncio.Task] = None
+        self.idle = asyncio.Event()
+        self.idle.set()
+
+class MCPClientPool(MCPPort):
+    """
+    N procesos hijos MCP (stdio) detrás de la misma interfaz que MCPStdioClient.
+
+    - Ruteo por menos peticiones en curso (empate: el menos usado recientemente).
+    - Health check periódico con ping, solo a hijos sin llamadas en curso (un hijo
+      stdio ocupado con una tool lenta no contesta el ping). Se reemplaza tras
+      `max_failures` pings/timeouts consecutivos o ante un error de transporte,
+      en segundo plano con backoff; antes de cerrarlo se drenan sus llamadas.
+    - Si la sesión se cae a mitad de una llamada, las tools idempotentes se
+      reintentan en otro hijo; las que escriben propagan el error.
+    """
+
+    def __init__(self, factory: Callable[[], MCPStdioClient], *, size: int = 2, name: str = "mcp",
+                 idempotent_tools: Iterable[str] = (), call_timeout: float = 60.0,
+                 health_interval: float = 15.0, ping_timeout: float = 5.0,
+                 max_retries: int = 1, respawn_backoff: float = 1.0, max_failures: int = 3):
+        self._factory = factory
+        self._name = name
+        self._idempotent = frozenset(idempotent_tools)
+        self._call_timeout = call_timeout
+        self._health_interval = health_interval
+        self._ping_timeout = ping_timeout
+        self._max_retries = max(0, int(max_retries))
+        self._respawn_backoff = respawn_backoff
+        self._max_failures = max(1, int(max_failures))
+        self._members = [_Member(i) for i in range(max(1, int(size)))]
+        self._seq = itertools.count(1)
+        self._available = asyncio.Event()
+        self._health_task: Optional[asyncio.Task] = None
+        self._bg: set[asyncio.Task] = set()
+        self._closed = False
+        self.retries = 0
+        self.timeouts = 0
+
+    # ---- ciclo de vida ----
+    async def _own(self, m: _Member, client: MCPStdioClient, ready: asyncio.Future, stop: asyncio.Event) -> None:
+        """Tarea dueña del hijo: los contextos anyio de stdio_client deben cerrarse en
+        la misma tarea que los abrió."""
+        try:
+            async with astage("mcp.pool.spawn", extra={"pool": self._name, "member": m.index}):
+                await client.connect()
+        except BaseException as e:
+            with suppress(Exception):
+                await client.close()
+            if not ready.done():
+                ready.cancel() if isinstance(e, asyncio.CancelledError) else ready.set_exception(e)
+            return
+        ready.set_result(None)
+        try:
+            await stop.wait()
+        finally:
+            await client.close()
+
+    async def _spawn(self, m: _Member) -> None:
+        client = self._factory()
+        ready = asyncio.get_running_loop().create_future()
+        stop = asyncio.Event()
+        owner = asyncio.create_task(self._own(m, client, ready, stop))
+        try:
+            await ready
+        except BaseException:
+            owner.cancel()
+            raise
+        m.client, m.stop, m.owner = client, stop, owner
+        m.failures = 0
+        m.alive = True
+        # Si la tarea dueña termina sola (el task group de stdio se cayó), el hijo murió
+        owner.add_done_callback(lambda _t, c=client: self._mark_dead(m, c, "la sesión stdio terminó"))
+        self._available.set()
+
+    async def _stop(self, m: _Member) -> None:
+        owner, stop = m.owner, m.stop
+        m.client = m.owner = m.stop = None
+        if stop is not None:
+            stop.set()
+        if owner is not None:
+            with suppress(BaseException):
+                await asyncio.wait_for(owner, timeout=3.0)
+
+    async def connect(self):
+        results = await asyncio.gather(*(self._spawn(m) for m in self._members), return_exceptions=True)
+        errors = [r for r in results if isinstance(r, BaseException)]
+        if len(errors) == len(self._members):
+            raise errors[0]
+        for m, r in zip(self._members, results):
+            if isinstance(r, BaseException):
+                log.warning(f"[{self._name}] hijo {m.index} no arrancó: {r}; se reintenta en segundo plano")
+                self._schedule_respawn(m)
+        if self._health_interval > 0 and self._health_task is None:
+            self._health_task = asyncio.create_task(self._health_loop())
+
+    def _mark_dead(self, m: _Member, client: Optional[MCPStdioClient], reason: Any) -> None:
+        # Solo la primera llamada que detecta la caída de *ese* cliente dispara el respawn
+        if m.client is not client or not m.alive:
+            return
+        log.warning(f"[{self._name}] hijo {m.index} inservible ({reason}); reemplazando")
+        m.alive = False
+        if not any(x.alive for x in self._members):
+            self._available.clear()
+        self._schedule_respawn(m)
+
+    def _schedule_respawn(self, m: _Member) -> None:
+        if self._closed or (m.respawn_task is not None and not m.respawn_task.done()):
+            return
+        m.respawn_task = asyncio.create_task(self._respawn(m))
+
+    async def _drain(self, m: _Member) -> None:
+        # Ya no recibe llamadas nuevas (alive=False): esperar a que terminen las que tiene
+        if m.outstanding:
+            with suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(m.idle.wait(), timeout=self._call_timeout)
+
+    async def _respawn(self, m: _Member) -> None:
+        await self._drain(m)
+        await self._stop(m)
+        delay = self._respawn_backoff
+        while not self._closed:
+            try:
+                await self._spawn(m)
+                m.restarts += 1
+                log.info(f"[{self._name}] hijo {m.index} reemplazado (restarts={m.restarts})")
+                return
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.warning(f"[{self._name}] respawn del hijo {m.index} falló: {e}; reintento en {delay:.1f}s")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30.0)
+
+    def _failed(self, m: _Member, client: Optional[MCPStdioClient], reason: str) -> None:
+        m.failures += 1
+        if m.failures >= self._max_failures:
+            self._mark_dead(m, client, f"{reason} ({m.failures} fallos seguidos)")
+
+    async def _ping(self, m: _Member) -> None:
+        client = m.client
+        session = getattr(client, "session", None)
+        if session is None or m.outstanding:
+            return
+        try:
+            await asyncio.wait_for(session.send_ping(), timeout=self._ping_timeout)
+        except Exception as e:
+            if _is_transport_error(e):
+                self._mark_dead(m, client, f"ping: {type(e).__name__}: {e}")
+            else:
+                self._failed(m, client, f"ping: {type(e).__name__}: {e}")
+            return
+        if m.client is client:
+            m.failures = 0
+
+    async def _health_loop(self) -> None:
+        while not self._closed:
+            await asyncio.sleep(self._health_interval)
+            await asyncio.gather(*(self._ping(m) for m in self._members if m.alive), return_exceptions=True)
+
+    async def close(self):
+        self._closed = True
+        tasks = [t for t in [self._health_task, *self._bg, *(m.respawn_task for m in self._members)]
+                 if t and not t.done()]
+        for t in tasks:
+            t.cancel()
+        for t in tasks:
+            with suppress(BaseException):
+                await t
+        for m in self._members:
+            m.alive = False
+        await asyncio.gather(*(self._stop(m) for m in self._members), return_exceptions=True)
+
+    # ---- ruteo ----
+    async def _pick(self) -> _Member:
+        while True:
+            alive = [m for m in self._members if m.alive and m.client is not None]
+            if alive:
+                m = min(alive, key=lambda x: (x.outstanding, x.last_pick))
+                m.last_pick = next(self._seq)
+                return m
+            if self._closed:
+                raise RuntimeError(f"MCPClientPool {self._name} cerrado")
+            async with astage("mcp.pool.wait_alive", extra={"pool": self._name}):
+                await asyncio.wait_for(self._available.wait(), timeout=self._call_timeout)
+
+    async def _with_member(self, name: str, retryable: bool, fn):
+        attempts = 1 + (self._max_retries if retryable else 0)
+        last_exc: Optional[BaseException] = None
+        for attempt in range(attempts):
+            m = await self._pick()
+            client = m.client
+            m.outstanding += 1
+            m.idle.clear()
+            m.calls += 1
+            try:
+                result = await asyncio.wait_for(fn(client), timeout=self._call_timeout)
+                if m.client is client:
+                    m.failures = 0
+                return result
+            except asyncio.TimeoutError as e:
+                # Lento no es lo mismo que colgado: cuenta como fallo y el ping (cuando
+                # el hijo quede libre) confirma; solo N seguidos lo reemplazan
+                self.timeouts += 1
+                m.errors += 1
+                self._failed(m, client, "timeout de llamada")
+                t = asyncio.create_task(self._ping(m))
+                self._bg.add(t)
+                t.add_done_callback(self._bg.discard)
+                last_exc = e
+            except Exception as e:
+                if not _is_transport_error(e):
+                    raise
+                m.errors += 1
+                self._mark_dead(m, client, f"{type(e).__name__}: {e}")
+                last_exc = e
+            finally:
+                m.outstanding -= 1
+                if not m.outstanding:
+                    m.idle.set()
+            if attempt + 1 < attempts:
+                self.retries += 1
+                log.warning(f"[{self._name}] reintentando {name} en otro hijo ({attempt + 1}/{attempts - 1})")
+        raise last_exc
+
+    async def list_tools_openai_schema(self) -> List[Dict[str, Any]]:
+        return await self._with_member("list_tools", True, lambda c: c.list_tools_openai_schema())
+
+    async def call_tool(self, name: str, args: Dict[str, Any]) -> Dict[str, Any]:
+        return await self._with_member(name, name in self._idempotent, lambda c: c.call_tool(name, args))
+
+    def stats(self) -> dict:
+        return {
+            "name": self._name,
+            "size": len(self._members),
+            "alive": sum(1 for m in self._members if m.alive),
+            "outstanding": [m.outstanding for m in self._members],
+            "calls": [m.calls for m in self._members],
+            "errors": sum(m.errors for m in self._members),
+            "restarts": sum(m.restarts for m in self._members),
+            "retries": self.retries,
+            "timeouts": self.timeouts,
+        }
@@ -37,18 +37,21 @@ from app.interface_adapters.controllers.slots_router import make_slots_router
 from app.interface_adapters.controllers.advisor_catalog_router import (make_advisor_catalog_router)
 from app.interface_adapters.controllers.advisor_confirmations_router import make_confirmations_router
 from app.interface_adapters.controllers.asesorias_router import make_asesorias_router
-from app.interface_adapters.controllers.telegram_webhook import make_telegram_router, setup_telegram_webhook
+from app.interface_adapters.controllers.telegram_webhook import (
+    make_telegram_router, setup_telegram_webhook, start_update_workers, stop_update_workers,
+)
 from app.interface_adapters.controllers.telegram_link_router import make_telegram_link_router
 from app.interface_adapters.controllers.admin_catalog_router import make_admin_catalog_router  
 from app.interface_adapters.controllers.admin_location_router import make_admin_location_router
 from app.interface_adapters.controllers.admin_advisors_router import make_admin_advisors_router
 from app.interface_adapters.controllers.admin_teachers_router import make_admin_teachers_router
-from app.frameworks_drivers.web.semantic import admin_docs_router, semantic_router
+from app.frameworks_drivers.web.semantic import admin_docs_router, semantic_router, configure_semantic
 from app.interface_adapters.controllers.dashboard_controller import router as dashboard_router
 from app.interface_adapters.controllers.google_calendar_webhook import make_google_calendar_webhook_router
 from app.interface_adapters.controllers.calendar_router import make_calendar_router
 from app.interface_adapters.gateways.db.sqlalchemy_user_repo import SqlAlchemyUserRepo
 from app.interface_adapters.gateways.db.sqlalchemy_calendar_events_repo import SqlAlchemyCalendarEventsRepo
+from app.interface_adapters.gateways.db.pgvector_repo import PgVectorKnowledgeRepository
 from app.interface_adapters.gateways.calendar.google_calendar_client import GoogleCalendarClient
 from app.use_cases.calendar.auto_configure_webhook import AutoConfigureWebhook
 from app.interface_adapters.controllers.teacher_confirmations_router import make_teacher_confirmations_router
@@ -76,6 +79,12 @@ def require_auth(request: Request):
     except jwt.PyJWTError:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
 
+def require_admin(request: Request):
+    data = require_auth(request)
+    if data.get("role") != "Admin":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Solo administradores")
+    return data
+
 logger = logging.getLogger(__name__)
 
 async def _reset_google_webhook_cache(redis: Redis | None, *, webhook_url: str) -> None:
@@ -132,6 +141,12 @@ def make_lifespan(*, start_scheduler: bool, auto_configure_google: bool, configu
     @asynccontextmanager
     async def lifespan(app):
         await container.startup()
+        try:
+            async with AsyncSessionLocal() as session:
+                await PgVectorKnowledgeRepository(session).ensure_schema()
+                await session.commit()
+        except Exception as e:
+            logger.exception("No se pudo asegurar el esquema de knowledge_doc: %r", e)
         if getattr(container, "graph_agent", None) and hasattr(container.graph_agent, "set_confirm_store"):
             container.graph_agent.set_confirm_store(confirm_store)
         """
@@ -177,6 +192,11 @@ def make_lifespan(*, start_scheduler: bool, auto_configure_google: bool, configu
             except Exception as e:
                 logger.exception("No se pudo configurar los webhooks de Google Calendar: %r", e)
         """
+        if configure_telegram:
+            try:
+                await start_update_workers(redis=container.redis)
+            except Exception as e:
+                logger.exception("No se pudo iniciar la cola de updates de Telegram: %r", e)
         if start_scheduler:
             scheduler.start()
         try:
@@ -191,6 +211,13 @@ def make_lifespan(*, start_scheduler: bool, auto_configure_google: bool, configu
                     pass
                 except Exception as e:
                     logger.exception("Error durante shutdown del scheduler: %r", e)
+            if configure_telegram:
+                try:
+                    await asyncio.shield(stop_update_workers())
+                except asyncio.CancelledError:
+                    pass
+                except Exception as e:
+                    logger.exception("Error deteniendo la cola de updates de Telegram: %r", e)
             try:
                 await asyncio.shield(container.shutdown())
             except asyncio.CancelledError:
@@ -310,8 +337,8 @@ async def _validate_graph_chat(req: "GraphChatRequest"):
     return True
 
 @measure_stage("agent_invoke")
-async def _invoke_agent(agent, message: str, thread_id: str):
-    return await agent.invoke(message, thread_id=thread_id)
+async def _invoke_agent(agent, message: str, thread_id: str, tool_context: dict | None = None):
+    return await agent.invoke(message, thread_id=thread_id, tool_context=tool_context)
 
 @measure_stage("response_presentation")
 async def _present_reply(reply: str, thread_id: str):
@@ -365,18 +392,23 @@ async def graph_chat(req: GraphChatRequest, request: Request):
     if not container.graph_agent:
         raise HTTPException(status_code=503, detail="LangGraph agent no disponible")
 
+    user_id = (getattr(getattr(request, "state", None), "user", {}) or {}).get("sub")
     set_meta(
         endpoint="/assistant/chat",
         thread_id=req.thread_id,
         model=getattr(container.graph_agent, "_model_name", None),
-        user_id=(getattr(getattr(request, "state", None), "user", {}) or {}).get("sub"),
+        user_id=user_id,
         client_ip=(request.client.host if request.client else None),
     )
 
     await _validate_graph_chat(req)
 
     async with astage("agent.invoke"):
-        reply = await container.graph_agent.invoke(req.message, thread_id=req.thread_id)
+        reply = await container.graph_agent.invoke(
+            req.message,
+            thread_id=req.thread_id,
+            tool_context={"user_id": str(user_id)} if user_id else None,
+        )
 
     return {"reply": reply, "thread_id": req.thread_id}
 
@@ -407,9 +439,11 @@ app.include_router(asesorias_router)
 def _make_telegram_router():
     return make_telegram_router(
         cache=container.cache,
+        identity_cache=container.identity_cache,
         agent_getter=lambda: container.graph_agent,
         mcp_client_getter=lambda: container.db_mcp,
         confirm_store_getter=lambda: confirm_store,
+        require_admin=require_admin,
     )
 
 
@@ -421,6 +455,7 @@ telegram_link_router = make_telegram_link_router(
     require_auth=require_auth,
     cache=container.cache,     
     get_session_dep=get_session,   
+    identity_cache=container.identity_cache,
 )
 app.include_router(telegram_link_router)
 admin_catalog_router = make_admin_catalog_router(
@@ -433,7 +468,8 @@ app.include_router(admin_location_router)
 
 admin_advisors_router = make_admin_advisors_router(
     get_session_dep=get_session,
-    jwt_port=container.jwt
+    jwt_port=container.jwt,
+    identity_cache=container.identity_cache,
 )
 app.include_router(admin_advisors_router)
 
@@ -441,7 +477,8 @@ app.include_router(admin_advisors_router)
 
 admin_teachers_router = make_admin_teachers_router(
     get_session_dep=get_session,
-    jwt_port=container.jwt
+    jwt_port=container.jwt,
+    identity_cache=container.identity_cache,
 )
 app.include_router(admin_teachers_router)
 
@@ -455,6 +492,7 @@ app.include_router(dashboard_router, dependencies=[Depends(require_auth)])
 
 app.include_router(admin_docs_router, tags=["admin_docs"])
 
+configure_semantic(cache=container.cache, embeddings=container.embeddings)
 app.include_router(semantic_router, tags=["semantic"])
 
 calendar_router = make_calendar_router(
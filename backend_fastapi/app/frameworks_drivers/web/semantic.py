@@ -1,17 +1,51 @@
 from __future__ import annotations
-import io
-from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, Body
+import os, asyncio, logging, shutil, tempfile, time
+from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, Body, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.sql import text as sqla_text
 
-from app.frameworks_drivers.config.db import get_session
-from app.interface_adapters.gateways.db.pgvector_repo import PgVectorKnowledgeRepository
+from app.frameworks_drivers.config.db import get_session, AsyncSessionLocal
+from app.interface_adapters.gateways.db.pgvector_repo import PgVectorKnowledgeRepository, DocumentNotFoundError
 from app.interface_adapters.gateways.embeddings.embeddings_http_client import EmbeddingsHTTPClient
-from app.use_cases.semantic_search.semantic_repo import SemanticSearchUC
+from app.interface_adapters.gateways.embeddings.cached_embeddings import CachedEmbeddings, EmbeddingLRU
+from app.interface_adapters.gateways.documents.page_extractor import aiter_pages
+from app.interface_adapters.gateways.documents.ingest_jobs import IngestJobStore, JobExistsError
+from app.interface_adapters.gateways.cache.semantic_query_cache import SemanticQueryCache
+from app.use_cases.semantic_search.semantic_repo import SemanticSearchUC, SEARCH_MODES
 
 admin_docs_router = APIRouter(prefix="/api/admin", tags=["admin-docs"])
 semantic_router   = APIRouter(prefix="/api", tags=["semantic"])
 
+log = logging.getLogger(__name__)
+
+INGEST_BATCH_SIZE  = int(os.getenv("INGEST_BATCH_SIZE", "64"))
+INGEST_CONCURRENCY = int(os.getenv("INGEST_CONCURRENCY", "4"))
+INGEST_JOB_TTL     = int(os.getenv("INGEST_JOB_TTL", "3600"))
+SEMANTIC_CACHE_MAX = int(os.getenv("SEMANTIC_CACHE_MAX", "1000"))
+SEMANTIC_CACHE_TTL = int(os.getenv("SEMANTIC_CACHE_TTL", "3600"))
+
+# Dependencias configurables (se setean desde fastapi_app)
+cache = None
+embeddings = None
+_sentence_lru = EmbeddingLRU()
+_jobs = IngestJobStore(ttl_seconds=INGEST_JOB_TTL)
+_background: set[asyncio.Task] = set()
+_query_cache = SemanticQueryCache(max_items=SEMANTIC_CACHE_MAX, ttl_seconds=SEMANTIC_CACHE_TTL)
+
+def configure_semantic(*, cache=None, embeddings=None) -> None:
+    globals()["cache"] = cache
+    globals()["embeddings"] = embeddings
+    globals()["_jobs"] = IngestJobStore(cache, ttl_seconds=INGEST_JOB_TTL)
+    globals()["_query_cache"] = SemanticQueryCache(
+        cache, max_items=SEMANTIC_CACHE_MAX, ttl_seconds=SEMANTIC_CACHE_TTL
+    )
+
+def _embeddings() -> EmbeddingsHTTPClient:
+    """Cliente compartido del Container; si no se configuró, uno único por proceso."""
+    if embeddings is None:
+        globals()["embeddings"] = EmbeddingsHTTPClient()
+    return embeddings
+
 @admin_docs_router.get("/documents")
 async def list_documents(s: AsyncSession = Depends(get_session)):
     rows = await s.execute(sqla_text("""
@@ -26,47 +60,155 @@ async def list_documents(s: AsyncSession = Depends(get_session)):
     """))
     return [dict(r._mapping) for r in rows]
 
-@admin_docs_router.post("/documents/upload")
-async def upload_document(file: UploadFile = File(...), s: AsyncSession = Depends(get_session)):
+def _file_size(fp) -> int:
+    fp.seek(0, 2)
+    size = fp.tell()
+    fp.seek(0)
+    return size
+
+def _spool_copy(fp):
+    out = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+    shutil.copyfileobj(fp, out)
+    out.seek(0)
+    return out
+
+async def _run_ingest(job_id: str, name: str, fp, s: AsyncSession, *,
+                      upsert: bool = False, doc_id: str | None = None,
+                      create_if_missing: bool = False) -> dict:
     repo = PgVectorKnowledgeRepository(s)
-    emb = EmbeddingsHTTPClient()
+    emb = _embeddings()
+    if upsert and not doc_id:
+        # Identidad del documento: el último subido con el mismo nombre
+        doc_id = await repo.find_document_by_title(name)
+    total: dict = {"pages_total": None}
+
+    def on_total(n: int) -> None:
+        total["pages_total"] = n
+
+    async def on_progress(p: dict) -> None:
+        await _jobs.update(job_id, **p, **total)
+
+    pages = aiter_pages(name, fp, on_total=on_total)
+    try:
+        sid, stats = await repo.ingest_stream(
+            title=name,
+            pages=pages,
+            embed_fn=emb.embed_many,
+            batch_size=INGEST_BATCH_SIZE,
+            concurrency=INGEST_CONCURRENCY,
+            on_progress=on_progress,
+            source_id=doc_id,
+            upsert=bool(upsert and doc_id),
+            create_if_missing=create_if_missing,
+        )
+        await s.commit()
+        await _query_cache.bump_version()
+    except Exception as e:
+        await s.rollback()
+        await _jobs.update(job_id, status="error", error=str(e))
+        raise
+    finally:
+        await pages.aclose()
+    summary = {"reused": stats["reused"], "added": stats["inserted"], "removed": stats["removed"]}
+    await _jobs.update(job_id, status="done", doc_id=sid, **stats)
+    return {"ok": True, "id": sid, "name": name, "inserted": stats["inserted"],
+            "summary": summary, "job_id": job_id}
+
+async def _run_ingest_background(job_id: str, name: str, fp, **kw) -> None:
+    try:
+        async with AsyncSessionLocal() as s:
+            await _run_ingest(job_id, name, fp, s, **kw)
+    except Exception as e:
+        log.exception("Error en ingesta de documento %s (job %s): %r", name, job_id, e)
+    finally:
+        fp.close()
 
+@admin_docs_router.post("/documents/upload")
+async def upload_document(
+    file: UploadFile = File(...),
+    job_id: str | None = Query(default=None),
+    wait: bool = Query(default=True),
+    upsert: bool = Query(default=False),
+    doc_id: str | None = Query(default=None),
+    create_if_missing: bool = Query(default=False),
+    s: AsyncSession = Depends(get_session),
+):
+    """
+    Ingesta en streaming. Con wait=true (por defecto) responde al terminar;
+    para consultar el progreso en paralelo el cliente puede proponer un job_id
+    (UUID nuevo; 409 si ya existe). Con wait=false responde de inmediato con el
+    job_id generado por el servidor y procesa en segundo plano.
+    Con upsert=true re-ingesta incremental sobre doc_id (o el documento con el mismo
+    nombre): solo se embeben los chunks cuyo hash cambió y se borran los que ya no están.
+    Un doc_id inexistente responde 404, salvo create_if_missing=true.
+    """
     name = file.filename or "documento"
-    raw = await file.read()
-    if not raw:
+    if not await asyncio.to_thread(_file_size, file.file):
         raise HTTPException(400, "Archivo vacío")
+
+    if upsert and doc_id and not create_if_missing:
+        if not await PgVectorKnowledgeRepository(s).document_exists(doc_id):
+            raise HTTPException(404, f"Documento {doc_id} no encontrado")
+
     try:
-        if name.lower().endswith(".pdf"):
-            from pypdf import PdfReader
-            reader = PdfReader(io.BytesIO(raw))
-            pages = [p.extract_text() or "" for p in reader.pages]
-            sid, inserted = await repo.add_document_from_pages(
-                title=name, pages=pages, embed_fn=emb.embed_many
-            )
-        elif name.lower().endswith(".docx"):
-            import docx
-            d = docx.Document(io.BytesIO(raw))
-            text = "\n".join(p.text for p in d.paragraphs if p.text)
-            sid, inserted = await repo.add_document_from_text(
-                title=name, text=text, embed_fn=emb.embed_many
-            )
-        else:
-            text = raw.decode("utf-8", errors="ignore")
-            sid, inserted = await repo.add_document_from_text(
-                title=name, text=text, embed_fn=emb.embed_many
-            )
+        job = await _jobs.create(name, job_id)
+    except JobExistsError as e:
+        raise HTTPException(409, str(e))
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    if not wait:
+        # El UploadFile se cierra al responder: se copia a un spool propio
+        fp = await asyncio.to_thread(_spool_copy, file.file)
+        task = asyncio.create_task(
+            _run_ingest_background(job["id"], name, fp, upsert=upsert, doc_id=doc_id,
+                                   create_if_missing=create_if_missing)
+        )
+        _background.add(task)
+        task.add_done_callback(_background.discard)
+        return {"ok": True, "job_id": job["id"], "name": name, "status": job["status"]}
 
-        await s.commit()
-        return {"ok": True, "id": sid, "name": name, "inserted": inserted}
+    try:
+        return await _run_ingest(job["id"], name, file.file, s, upsert=upsert, doc_id=doc_id,
+                                 create_if_missing=create_if_missing)
+    except DocumentNotFoundError as e:
+        raise HTTPException(404, str(e))
     except Exception as e:
-        await s.rollback()
         raise HTTPException(500, f"Error procesando archivo: {e!s}")
 
+@admin_docs_router.get("/documents/jobs/{job_id}")
+async def get_ingest_job(job_id: str):
+    job = await _jobs.get(job_id)
+    if not job:
+        raise HTTPException(404, "Job no encontrado")
+    return job
+
+@admin_docs_router.post("/documents/index/rebuild")
+async def rebuild_index(
+    method: str | None = Body(default=None, embed=True),
+    lists: int | None = Body(default=None),
+    m: int = Body(default=16),
+    ef_construction: int = Body(default=64),
+    s: AsyncSession = Depends(get_session),
+):
+    """Reconstruye el índice vectorial (ivfflat con lists según filas, o hnsw) sin bloquear
+    la tabla: CREATE/DROP INDEX CONCURRENTLY en conexión autocommit."""
+    repo = PgVectorKnowledgeRepository(s)
+    t0 = time.perf_counter()
+    try:
+        out = await repo.rebuild_vector_index(method=method, lists=lists, m=m, ef_construction=ef_construction)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    except Exception as e:
+        raise HTTPException(500, f"Error reconstruyendo índice: {e!s}")
+    await _query_cache.bump_version()
+    return {"ok": True, **out, "elapsed_ms": round((time.perf_counter() - t0) * 1000, 1)}
+
 @admin_docs_router.delete("/documents/{doc_id}")
 async def delete_document(doc_id: str, s: AsyncSession = Depends(get_session)):
     repo = PgVectorKnowledgeRepository(s)
     deleted = await repo.delete_document(doc_id)
     await s.commit()
+    await _query_cache.bump_version()
     return {"ok": True, "deleted": int(deleted)}
 
 @semantic_router.post("/search/semantic")
@@ -75,9 +217,17 @@ async def search_semantic(
     kinds: list[str] | None = Body(default=None),
     top_k: int = Body(default=5),
     probes: int = Body(default=10),
+    mode: str = Body(default="vector"),
     s: AsyncSession = Depends(get_session),
 ):
-    repo = PgVectorKnowledgeRepository(s)
-    emb = EmbeddingsHTTPClient()
+    if mode not in SEARCH_MODES:
+        raise HTTPException(400, f"mode inválido; use uno de {', '.join(SEARCH_MODES)}")
+    key, hit = await _query_cache.get(q, kinds=kinds, top_k=top_k, probes=probes, mode=mode)
+    if hit is not None:
+        return {**hit, "q": q}
+    repo = PgVectorKnowledgeRepository(s, session_factory=AsyncSessionLocal)
+    emb = CachedEmbeddings(_embeddings(), lru=_sentence_lru, cache=cache)
     uc = SemanticSearchUC(repo, emb)
-    return await uc.execute(q, kinds=kinds, top_k=top_k, probes=probes)
+    out = await uc.execute(q, kinds=kinds, top_k=top_k, probes=probes, mode=mode)
+    await _query_cache.put(key, out)
+    return out
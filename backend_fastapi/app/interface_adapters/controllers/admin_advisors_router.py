@@ -57,7 +57,8 @@ class UpdateAdvisorIn(BaseModel):
     service_ids: list[str] | None = None
     active: bool | None = None
 
-def make_admin_advisors_router(*, get_session_dep: Callable[[], AsyncSession], jwt_port: JwtPort) -> APIRouter:
+def make_admin_advisors_router(*, get_session_dep: Callable[[], AsyncSession], jwt_port: JwtPort,
+                               identity_cache=None) -> APIRouter:
     r = APIRouter(prefix="/api/admin/advisors", tags=["admin-advisors"])
 
     async def require_user(req: Request):
@@ -150,6 +151,8 @@ def make_admin_advisors_router(*, get_session_dep: Callable[[], AsyncSession], j
         try:
             advisor = await use_case.execute(domain_request)
             await session.commit()
+            if identity_cache is not None:
+                await identity_cache.invalidate(user_id=advisor.usuario_id)
             
             return AdvisorOut(
                 id=advisor.id,
@@ -240,6 +243,8 @@ def make_admin_advisors_router(*, get_session_dep: Callable[[], AsyncSession], j
                 active=payload.active
             )
             await session.commit()
+            if identity_cache is not None:
+                await identity_cache.invalidate(user_id=advisor.usuario_id)
             
             return AdvisorOut(
                 id=advisor.id,
@@ -329,9 +334,13 @@ def make_admin_advisors_router(*, get_session_dep: Callable[[], AsyncSession], j
         asesor_repo = SqlAlchemyAsesorRepo(session, user_repo, asesor_role.id)
         use_case = DeleteAdvisorUseCase(asesor_repo=asesor_repo)
         
+        # usuario_id antes de borrar, para invalidar su identidad de Telegram
+        advisor = await asesor_repo.get_advisor_by_id(advisor_id)
         try:
             await use_case.execute(advisor_id)
             await session.commit()
+            if identity_cache is not None and advisor is not None:
+                await identity_cache.invalidate(user_id=advisor.usuario_id)
             return {"ok": True}
         except LookupError as e:
             raise HTTPException(status_code=404, detail=str(e))
@@ -8,6 +8,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.use_cases.ports.token_port import JwtPort
 from app.use_cases.admin.teachers_management import (
+    RegisterTeacherUseCase,
     ListTeachersUseCase,
     GetTeacherUseCase,
     UpdateTeacherUseCase,
@@ -35,12 +36,17 @@ class TeachersPageOut(BaseModel):
     total: int
     pages: int
 
+class RegisterTeacherIn(BaseModel):
+    name: str
+    email: str
+
 class UpdateTeacherIn(BaseModel):
     name: str | None = None
     email: str | None = None
     active: bool | None = None
 
-def make_admin_teachers_router(*, get_session_dep: Callable[[], AsyncSession], jwt_port: JwtPort) -> APIRouter:
+def make_admin_teachers_router(*, get_session_dep: Callable[[], AsyncSession], jwt_port: JwtPort,
+                               identity_cache=None) -> APIRouter:
     r = APIRouter(prefix="/api/admin/teachers", tags=["admin-teachers"])
 
     async def require_user(req: Request):
@@ -93,6 +99,20 @@ def make_admin_teachers_router(*, get_session_dep: Callable[[], AsyncSession], j
             pages=page_result.pages,
         )
 
+    @r.post("/", response_model=TeacherOut)
+    async def register_teacher(payload: RegisterTeacherIn, request: Request, session: AsyncSession = Depends(get_session_dep)):
+        docente_repo = await build_repos(session)
+        use_case = RegisterTeacherUseCase(docente_repo=docente_repo)
+        try:
+            # Puede promover a Docente un usuario existente: su identidad de Telegram cambia de rol
+            teacher = await use_case.execute(name=payload.name.strip(), email=payload.email.strip())
+            await session.commit()
+            if identity_cache is not None:
+                await identity_cache.invalidate(user_id=teacher.usuario_id)
+            return TeacherOut(id=teacher.id, usuario_id=teacher.usuario_id, name=teacher.name, email=teacher.email, activo=teacher.activo)
+        except Exception as e:
+            await session.rollback()
+            raise HTTPException(status_code=400, detail=f"Error al registrar docente: {e}")
 
     @r.get("/{teacher_id}", response_model=TeacherOut)
     async def get_teacher(teacher_id: str, request: Request, session: AsyncSession = Depends(get_session_dep)):
@@ -111,6 +131,8 @@ def make_admin_teachers_router(*, get_session_dep: Callable[[], AsyncSession], j
         try:
             teacher = await use_case.execute(teacher_id, name=payload.name, email=payload.email, active=payload.active)
             await session.commit()
+            if identity_cache is not None:
+                await identity_cache.invalidate(user_id=teacher.usuario_id)
             return TeacherOut(id=teacher.id, usuario_id=teacher.usuario_id, name=teacher.name, email=teacher.email, activo=teacher.activo)
         except ValueError as e:
             raise HTTPException(status_code=404, detail=str(e))
@@ -122,9 +144,13 @@ def make_admin_teachers_router(*, get_session_dep: Callable[[], AsyncSession], j
     async def delete_teacher(teacher_id: str, request: Request, session: AsyncSession = Depends(get_session_dep)):
         docente_repo = await build_repos(session)
         use_case = DeleteTeacherUseCase(docente_repo=docente_repo)
+        # usuario_id antes de borrar, para invalidar su identidad de Telegram
+        teacher = await GetTeacherUseCase(docente_repo=docente_repo).execute(teacher_id)
         try:
             await use_case.execute(teacher_id)
             await session.commit()
+            if identity_cache is not None and teacher is not None:
+                await identity_cache.invalidate(user_id=teacher.usuario_id)
             return {"ok": True}
         except TeacherDeletionBlockedError as e:
             await session.rollback()
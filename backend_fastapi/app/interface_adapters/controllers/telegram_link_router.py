@@ -8,7 +8,7 @@ from app.interface_adapters.orm.models_telegram import TelegramAccountModel
 class LinkOut(BaseModel):
     url: str
 
-def make_telegram_link_router(*, require_auth, cache, get_session_dep):
+def make_telegram_link_router(*, require_auth, cache, get_session_dep, identity_cache=None):
     if not TELEGRAM_BOT_USERNAME:
         raise RuntimeError("Falta TELEGRAM_BOT_USERNAME en .env (sin @).")
 
@@ -73,6 +73,8 @@ def make_telegram_link_router(*, require_auth, cache, get_session_dep):
             sa.delete(TelegramAccountModel).where(TelegramAccountModel.usuario_id == uuid.UUID(user_id))
         )
         await session.commit()
+        if identity_cache is not None:
+            await identity_cache.invalidate(user_id=user_id)
         return {"ok": True}
 
     return router
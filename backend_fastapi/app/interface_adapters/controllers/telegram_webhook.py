@@ -1,24 +1,31 @@
 from __future__ import annotations
 import base64 
 import json, os, time, logging, asyncio, hashlib, re, subprocess, shlex, tempfile, shutil, uuid as uuidlib
+import contextvars
 try:
     import dateparser
 except Exception:
     dateparser = None
 
-from fastapi import APIRouter, Request, Depends
+from fastapi import APIRouter, Request, Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 import sqlalchemy as sa
 import httpx
 
-try:
-    import audioop
-except ImportError:
-    audioop = None
-
 
 
-from app.frameworks_drivers.config.db import get_session as get_session_dep
+from app.frameworks_drivers.config.db import get_session as get_session_dep, AsyncSessionLocal
+from app.interface_adapters.gateways.queue.telegram_update_queue import (
+    LocalUpdateQueue, RedisStreamUpdateQueue, UpdateWorkerPool, update_chat_key, mark_side_effect,
+)
+from app.interface_adapters.gateways.queue.chat_lanes import ChatLaneScheduler
+from app.interface_adapters.gateways.telegram.outbound_dispatcher import TelegramDispatcher
+from app.interface_adapters.gateways.asr.streaming_upload import (
+    BoundedPipe, DownloadError, multipart_stream, ranged_download,
+)
+from app.interface_adapters.gateways.asr import voice_activity
+from app.interface_adapters.gateways.asr.asr_scheduler import ASRScheduler
+from app.interface_adapters.services import telegram_intent_matcher as intents
 from app.interface_adapters.gateways.db.sqlalchemy_telegram_repo import SqlAlchemyTelegramRepo
 from app.observability.metrics import (
     astage, set_meta, new_request, finalize_and_log, setup_json_logger, _get_trace
@@ -26,10 +33,20 @@ from app.observability.metrics import (
 from app.use_cases.telegram.link_account import LinkTelegramAccount
 from app.frameworks_drivers.config.settings import (
     ASR_BASE_URL, ASR_MODEL_NAME, ASR_API_KEY, ASR_LANG,
+    ASR_STREAM_UPLOAD, ASR_STREAM_CHUNK_BYTES, ASR_STREAM_BUFFER_CHUNKS,
+    ASR_VAD_ENABLED, ASR_VAD_MIN_SPEECH_S, ASR_VAD_MIN_TRIM_S,
+    ASR_SCHED_MIN_CONCURRENCY, ASR_SCHED_INITIAL_CONCURRENCY, ASR_SCHED_TARGET_RTF,
+    ASR_SCHED_BASE_LATENCY, ASR_SCHED_AGING,
     WEBHOOK_PUBLIC_URL,
+    TG_QUEUE_BACKEND, TG_QUEUE_WORKERS, TG_QUEUE_MAX_ATTEMPTS, TG_QUEUE_BACKOFF_BASE,
+    TG_QUEUE_BACKOFF_MAX, TG_QUEUE_STREAM, TG_QUEUE_MAXLEN, TG_QUEUE_CLAIM_IDLE_MS, TG_QUEUE_HEARTBEAT_TTL_S,
+    TELEGRAM_API_BASE, TG_SEND_GLOBAL_RATE, TG_SEND_CHAT_RATE, TG_SEND_CHAT_BURST,
+    TG_SEND_CONCURRENCY, TG_SEND_MAX_RETRIES,
 )
 from app.interface_adapters.orm.models_docente import DocentePerfilModel
 from app.interface_adapters.orm.models_scheduling import AsesorPerfilModel
+from app.interface_adapters.orm.models_auth import UsuarioModel, RolModel
+from app.interface_adapters.gateways.cache.telegram_identity_cache import TelegramIdentityCache
 from datetime import datetime
 from datetime import datetime, timedelta
 
@@ -122,13 +139,31 @@ MCP_TIMEOUT_AGGRESSIVE = 1.5
 PENDING_ACTION_TTL = 20  # 10 minutos para confirmar/cancelar
 
 # Límites de concurrencia
-MAX_CONCURRENT_ASR = 50  # Máximo de transcripciones simultáneas 
+MAX_CONCURRENT_ASR = 50  # Techo de transcripciones simultáneas (el planificador ajusta por debajo)
 MAX_CONCURRENT_AGENT = 20  # Máximo de consultas al LLM simultáneas
 AGENT_TIMEOUT = 30  # Timeout para agent.invoke 
 
-# Semáforos para controlar concurrencia
-_asr_semaphore = asyncio.Semaphore(MAX_CONCURRENT_ASR)
-_agent_semaphore = asyncio.Semaphore(MAX_CONCURRENT_AGENT)
+# Planificador ASR: notas cortas primero, concurrencia AIMD según latencia y 5xx
+_asr_scheduler = ASRScheduler(
+    max_concurrency=MAX_CONCURRENT_ASR,
+    min_concurrency=ASR_SCHED_MIN_CONCURRENCY,
+    initial_concurrency=ASR_SCHED_INITIAL_CONCURRENCY,
+    target_rtf=ASR_SCHED_TARGET_RTF,
+    base_latency_s=ASR_SCHED_BASE_LATENCY,
+    aging=ASR_SCHED_AGING,
+    error_types=(httpx.HTTPError,),
+    stage="telegram.asr",
+)
+# Carriles por chat: orden estricto dentro del chat, MAX_CONCURRENT_AGENT chats en paralelo
+_lanes = ChatLaneScheduler(MAX_CONCURRENT_AGENT)
+
+# Cola durable de updates (se activa en el lifespan con start_update_workers)
+_update_queue = None
+_update_pool = None
+# En los workers el audio se procesa dentro del update (orden por chat + reintentos)
+_inline_audio: contextvars.ContextVar[bool] = contextvars.ContextVar("tg_inline_audio", default=False)
+# Referencias a tareas sueltas para que el GC no las cancele
+_bg_tasks: set = set()
 
 LIST_STATE_TTL = 1800  # 30 min
 PAGE_SIZE_DEFAULT = 6
@@ -141,36 +176,20 @@ CINAP_LIST_RE = re.compile(r"<!--CINAP_LIST:([A-Za-z0-9+/=]+)-->")
 STRICT_DOMAIN_MESSAGE = "Lo siento, solo puedo ayudarte con temas del sistema de asesorías y agendamiento del CINAP."
 STRICT_DOMAIN_ENFORCEMENT = False  #  Cambia a True si quieres volver a aplicar el guard estricto
 
-DOMAIN_KEYWORDS = {
-    "cinap", "uct",
-    "asesoría", "asesoria", "tutoría", "tutoria",
-    "calendario", "calendar", "agenda", "agendar", "cita", "reunión", "reunion",
-    "profesor", "docente", "advisor", "teacher",
-    "curso", "clase", "materia", "asignatura", "disponibilidad", "horario"
-}
-ACK_KEYWORDS = {
-    "hola", "hi", "hello", "buenas", "buenos días", "buenas tardes", "buenas noches",
-    "gracias", "thanks", "thank you",
-    "ok", "vale", "perfecto", "listo", "entiendo", "sí", "si"
-}
-#  Confirm/Cancel helpers (texto)
-CONFIRM_WORDS = {"confirmar","confirmo","confirm","sí","si","ok","vale","listo","de acuerdo"}
-CANCEL_WORDS  = {"cancelar","cancela","anular","rechazar","descartar","no"}
-
+#  Vocabularios (DOMAIN/ACK/CONFIRM/CANCEL) y detectores: services/telegram_intent_matcher
 def _is_confirmation_text(t: str) -> bool:
     if not t: return False
-    tl = (t or "").lower().strip()
-    return tl in CONFIRM_WORDS
+    return intents.analyze(t).is_confirm
 
 def _is_cancellation_text(t: str) -> bool:
     if not t: return False
-    tl = (t or "").lower().strip()
-    return tl in CANCEL_WORDS
+    return intents.analyze(t).is_cancel
 
 # Router global del módulo para evitar problemas de scope con decoradores
 router = APIRouter(prefix="/telegram", tags=["telegram"])
 # Dependencias configurables del router (se setean desde fastapi_app)
 cache = None
+identity_cache = None
 agent_getter = None
 mcp_client_getter = None
 confirm_store_getter = None
@@ -179,14 +198,13 @@ confirm_store_getter = None
 def _is_ack(s: str) -> bool:
     if not s:
         return False
-    t = (s or "").lower()
-    return any(k in t for k in ACK_KEYWORDS) and len(t.split()) <= 6
+    f = intents.analyze(s)
+    return f.has("ack") and f.word_count <= 6
 
 def _is_domain_related(s: str) -> bool:
     if not s or not isinstance(s, str):
         return False
-    t = (s or "").lower()
-    return any(k in t for k in DOMAIN_KEYWORDS)
+    return intents.analyze(s).has("domain")
 
 def _enforce_domain_reply(user_text: str, reply_text: str) -> str:
     """
@@ -217,25 +235,6 @@ ACADEMIC_KEYWORDS = [
 ]
 ALL_KEYWORDS = CALENDAR_KEYWORDS + ACADEMIC_KEYWORDS
 
-GLOSARIO_REGEX = [
-    (
-        re.compile(
-            r"\b(u\.?\s*c\.?\s*t\.?|u\s*ce\s*te|ucte|ucete|u\s*c\s*t|aus-?t|universidad\s+cat+ólica(?:\s+de\s+temuco)?)\b",
-            re.IGNORECASE,
-        ),
-        "UCT",
-    ),
-    (
-        re.compile(
-            r"\b(cina?p|cina|ci\s*nap|si\s*nap|c\s*i\s*nap|"
-            r"ch[ií]n\s*up|chi\s*nap|che\s*nap|chinap|sino pop|chin up|"
-            r"centro\s+de\s+innovaci[óo]n(?:\s+en\s+aprendizaje)?(?:\s+docencia)?(?:\s+y\s+tecnolog[í]a\s+educativa)?)\b",
-            re.IGNORECASE
-        ),
-        "CINAP",
-    ),
-]
-
 #  HTTP Clients
 async def _get_telegram_client():
     global _telegram_client
@@ -269,7 +268,7 @@ async def _warmup_connections():
     try:
         async with astage("telegram.warmup"):
             tg_client = await _get_telegram_client()
-            warmup_url = f"https://api.telegram.org/bot{BOT_TOKEN}/getMe"
+            warmup_url = f"{TELEGRAM_API_BASE}/bot{BOT_TOKEN}/getMe"
             resp = await tg_client.get(warmup_url)
             if resp.status_code == 200:
                 log.info("Telegram API warm-up exitoso")
@@ -347,11 +346,21 @@ async def _cache_set_asr_transcription(audio_hash: str, transcript: str, cache=N
     except Exception as e:
         log.warning(f"Error guardando ASR en cache: {e}")
 
+async def _cache_get_asr_by_unique(file_unique_id: str, cache=None):
+    if not file_unique_id:
+        return None
+    return await _cache_get_asr_transcription(f"fu:{file_unique_id}", cache)
+
+async def _cache_set_asr_by_unique(file_unique_id: str, transcript: str, cache=None):
+    if file_unique_id:
+        await _cache_set_asr_transcription(f"fu:{file_unique_id}", transcript, cache)
+
 #  Pending Action helpers 
-async def _get_pending_action(chat_id: int, cache=None):
+async def _get_pending_action(chat_id: int, cache=None, prefetched: dict | None = None):
     if not cache: return None
+    key = f"tg_pending:{chat_id}"
     try:
-        raw = await cache.get(f"tg_pending:{chat_id}")
+        raw = prefetched[key] if prefetched and key in prefetched else await cache.get(key)
         return json.loads(raw.decode("utf-8")) if raw else None
     except Exception as e:
         log.warning(f"Error leyendo pending_action: {e}")
@@ -372,8 +381,7 @@ async def _set_pending_action(chat_id: int, payload: dict, cache=None):
 async def _clear_pending_action(chat_id: int, cache=None):
     if not cache: return
     try:
-        # Si no tienes DELETE, pisa con TTL bajisimo
-        await cache.set(f"tg_pending:{chat_id}", b"", ttl_seconds=1)
+        await cache.delete(f"tg_pending:{chat_id}")
     except Exception as e:
         log.warning(f"Error limpiando pending_action: {e}")
 
@@ -400,7 +408,7 @@ async def tg_get_file_path(file_id: str, file_unique_id: str, cache=None):
 
     try:
         client = await _get_telegram_client()
-        url = f"https://api.telegram.org/bot{BOT_TOKEN}/getFile"
+        url = f"{TELEGRAM_API_BASE}/bot{BOT_TOKEN}/getFile"
         r = await client.post(url, json={"file_id": file_id}, timeout=TELEGRAM_TIMEOUT_AGGRESSIVE)
         if r.status_code == 200:
             data = r.json()
@@ -433,7 +441,7 @@ async def tg_download_file(file_path: str):
         return None
     try:
         client = await _get_telegram_client()
-        download_url = f"https://api.telegram.org/file/bot{BOT_TOKEN}/{file_path}"
+        download_url = f"{TELEGRAM_API_BASE}/file/bot{BOT_TOKEN}/{file_path}"
         r = await client.get(download_url, timeout=TELEGRAM_DOWNLOAD_TIMEOUT)
         if r.status_code == 200:
             audio_bytes = r.content
@@ -484,95 +492,31 @@ def _analyze_audio_quality_basic(audio_bytes: bytes) -> str:
     except Exception:
         return "good"
 
-def _convert_to_wav_for_analysis(audio_bytes: bytes) -> bytes:
-    try:
-        # Si ya es WAV, retornar tal cual
-        if audio_bytes.startswith(b'RIFF') and b'WAVE' in audio_bytes[:20]:
-            return audio_bytes
-        # Si no es WAV, no podemos convertir sin ffmpeg
-        raise Exception("Audio no es WAV y no se puede convertir sin ffmpeg")
-    except Exception:
-        raise Exception("No se puede convertir audio para análisis")
-
 def _validate_audio_energy(audio_bytes: bytes) -> str:
+    """Chequeo rápido de cabecera/tamaño (sin decodificar); el análisis de voz real
+    lo hace _analyze_voice."""
     try:
         basic = _analyze_audio_quality_basic(audio_bytes)
         if basic in ("empty", "too_short"):
             return basic
         if audio_bytes.startswith(b'OggS') and len(audio_bytes) < 2500:
             return "too_short"
-        if audioop is None:
-            return "good"
-        if not audio_bytes or len(audio_bytes) < 1000:
-            return "too_short"
-        try:
-            wav_bytes = _convert_to_wav_for_analysis(audio_bytes)
-            if not wav_bytes or len(wav_bytes) < 1000:
-                return "empty"
-        except Exception:
-            return _analyze_audio_quality_basic(audio_bytes)
-
-        audio_data = wav_bytes[44:] if len(wav_bytes) > 44 else wav_bytes
-        if len(audio_data) < 320:
-            return "too_short"
-
-        frame_size = 480 * 2
-        silence_frames = 0
-        low_energy_frames = 0
-        total_frames = 0
-        max_rms = 0
-
-        step = frame_size
-        if len(audio_data) > 500000:
-            step = frame_size * 3
-        elif len(audio_data) > 200000:
-            step = frame_size * 2
-
-        for i in range(0, len(audio_data) - frame_size, step):
-            frame = audio_data[i:i + frame_size]
-            if len(frame) >= frame_size:
-                try:
-                    rms = audioop.rms(frame, 2)
-                    max_rms = max(max_rms, rms)
-                    if rms < 50:
-                        silence_frames += 1
-                    elif rms < 200:
-                        low_energy_frames += 1
-                    total_frames += 1
-                    if total_frames >= 10:
-                        early_silence_ratio = silence_frames / total_frames
-                        if early_silence_ratio > 0.95 and max_rms < 80:
-                            return "empty"
-                except Exception:
-                    continue
-
-        if total_frames == 0:
-            return "too_short"
-
-        silence_ratio = silence_frames / total_frames
-        low_energy_ratio = (silence_frames + low_energy_frames) / total_frames
-        estimated_duration = total_frames * 0.03
-
-        if max_rms < 50:
-            return "empty"
-
-        if estimated_duration > 5.0:
-            if silence_ratio > 0.90:
-                return "empty"
-            if low_energy_ratio > 0.95:
-                return "empty"
-            if max_rms < 200:
-                return "empty"
-        else:
-            if silence_ratio > 0.95:
-                return "empty"
-            if low_energy_ratio > 0.98:
-                return "empty"
-
         return "good"
     except Exception:
         return _analyze_audio_quality_basic(audio_bytes)
 
+async def _analyze_voice(audio_bytes: bytes) -> voice_activity.VoiceActivity:
+    """Decodifica Opus y calcula RMS/VAD por frame en un hilo (no bloquea el loop)."""
+    extra: dict = {}
+    async with astage("telegram.vad", extra=extra):
+        va = await asyncio.to_thread(
+            voice_activity.analyze_audio, audio_bytes,
+            min_speech_s=ASR_VAD_MIN_SPEECH_S, min_trim_s=ASR_VAD_MIN_TRIM_S,
+        )
+        extra.update(status=va.status, duration_s=round(va.duration_s, 2),
+                     speech_s=round(va.speech_s, 2), trimmed=va.trimmed)
+    return va
+
 #  ASR & Text Normalization
 def _clean_transcript_text(transcript: str) -> str:
     if not transcript:
@@ -624,30 +568,10 @@ def _build_asr_initial_prompt(keywords: list = None) -> str:
     return f"Usa estrictamente estas siglas en mayúsculas cuando suenen similares: {items}.{ex}"
 
 def _prenormalizar_fonetico(texto: str) -> str:
-    if not texto: return texto
-    t = texto
-    t = re.sub(r"\bu\s*ce?\s*te\b", "UCT", t, flags=re.IGNORECASE)
-    t = re.sub(r"\bu\s*[\.\s]*c\s*[\.\s]*t\b", "UCT", t, flags=re.IGNORECASE)
-    t = re.sub(r"\bucte?\b", "UCT", t, flags=re.IGNORECASE)
-    t = re.sub(r"\bsi\s*nap\b", "CINAP", t, flags=re.IGNORECASE)
-    t = re.sub(r"\bci\s*nap\b", "CINAP", t, flags=re.IGNORECASE)
-    t = re.sub(r"\bcina?p\b", "CINAP", t, flags=re.IGNORECASE)
-    t = re.sub(r"\bsinap\b", "CINAP", t, flags=re.IGNORECASE)
-    t = re.sub(r"\bchinap\b", "CINAP", t, flags=re.IGNORECASE)
-    t = re.sub(r"\bsyrup\b", "CINAP", t, flags=re.IGNORECASE)
-
-    t = re.sub(r"\buniversidad\s+cat[oó]lica(?:\s+de\s+temuco)?\b", "UCT", t, flags=re.IGNORECASE)
-    t = re.sub(
-        r"\bcentro\s+de\s+innovaci[oó]n(?:\s+en\s+aprendizaje)?(?:\s+docencia)?(?:\s+y\s+tecnolog[i+í]a\s+educativa)?\b",
-        "CINAP", t, flags=re.IGNORECASE)
-    return t
+    return intents.prenormalize_phonetic(texto)
 
 def _normalizar_siglas(texto: str) -> str:
-    if not texto:
-        return texto
-    for pattern, replacement in GLOSARIO_REGEX:
-        texto = pattern.sub(replacement, texto)
-    return texto
+    return intents.normalize_glossary(texto)
 
 
 #  Slot-filling simple (fecha/hora)
@@ -690,14 +614,27 @@ class ASRResult:
         self.segments = segments or []
         self.processing_time = processing_time
 
-async def asr_transcribe_filelike_optimized(filename: str, file_bytes: bytes, mime: str) -> tuple[int, str]:
+def _estimate_audio_seconds(audio_bytes: bytes) -> float:
+    """Duración aproximada cuando no hay metadata: PCM16 16 kHz o Opus de voz (~32 kbps)."""
+    if audio_bytes[:4] == b"RIFF":
+        return max(0.0, len(audio_bytes) - 44) / 32000.0
+    return len(audio_bytes) / 4000.0
+
+def _is_server_error(r) -> bool:
+    return r.status_code >= 500
+
+async def asr_transcribe_filelike_optimized(filename: str, file_bytes: bytes, mime: str,
+                                            duration: float | None = None) -> tuple[int, str]:
     url = f"{ASR_BASE_URL.rstrip('/')}/v1/audio/transcriptions"
     client = await _get_asr_client()
     files = {"file": (filename, file_bytes, mime)}
     data = {"model": ASR_MODEL_NAME, "language": ASR_LANG, "temperature": "0.0"}
     try:
-        async with astage("telegram.asr"):
-            r = await client.post(url, data=data, files=files)
+        r = await _asr_scheduler.run(
+            duration if duration is not None else _estimate_audio_seconds(file_bytes),
+            lambda: client.post(url, data=data, files=files),
+            is_error=_is_server_error,
+        )
         status = r.status_code
         try:
             js = r.json()
@@ -711,11 +648,11 @@ async def asr_transcribe_filelike_optimized(filename: str, file_bytes: bytes, mi
         return 500, str(e)
 
 
-async def _asr_fallback_wav_optimized(audio_bytes: bytes, filename: str) -> str | None:
+async def _asr_fallback_wav_optimized(audio_bytes: bytes, filename: str, duration: float | None = None) -> str | None:
     try:
         # Usar audio original sin conversión 
         status, text = await asr_transcribe_filelike_optimized(
-            filename.replace('.ogg', '.wav'), audio_bytes, "audio/wav"
+            filename.replace('.ogg', '.wav'), audio_bytes, "audio/wav", duration
         )
         if 200 <= status < 300:
             return _clean_transcript_text(text)
@@ -726,7 +663,55 @@ async def _asr_fallback_wav_optimized(audio_bytes: bytes, filename: str) -> str
         log.warning(f"Fallback WAV error: {e}")
         return None
 
-async def asr_transcribe(audio_bytes: bytes, filename: str = "audio.ogg", cache=None) -> ASRResult | None:
+def _asr_form_data() -> dict:
+    data = {
+        "model": ASR_MODEL_NAME,
+        "language": ASR_LANG,
+        "temperature": "0.0",
+        "response_format": "verbose_json",
+        "timestamp_granularities": ["segment"],
+    }
+    initial_prompt = _build_asr_initial_prompt()
+    if initial_prompt:
+        data["prompt"] = initial_prompt
+        data["initial_prompt"] = initial_prompt
+    return data
+
+def _asr_result_from_json(j: dict, start_time: float) -> ASRResult | None:
+    transcript = j.get("text") or j.get("transcript") or j.get("result")
+    if not transcript:
+        log.warning(f"ASR no retornó texto. JSON completo: {j}")
+        return None
+
+    confidence = 0.8
+    language = j.get("language", ASR_LANG)
+    segments = j.get("segments", [])
+    if segments:
+        confidences = [seg.get("avg_logprob", 0) for seg in segments if seg.get("avg_logprob")]
+        if confidences:
+            confidence = min(max(sum(confidences) / len(confidences) + 1.0, 0.0), 1.0)
+
+    transcript_original = transcript
+    transcript = _clean_transcript_text(transcript)
+    transcript = _prenormalizar_fonetico(transcript)
+    transcript_before_normalization = transcript
+    transcript = _normalizar_siglas(transcript)
+
+    if transcript != transcript_original:
+        log.info(f"DESPUÉS LIMPIEZA: '{transcript}' (antes: '{transcript_original}')")
+    if transcript != transcript_before_normalization:
+        log.info(f"DESPUÉS NORMALIZACIÓN: '{transcript}' (antes: '{transcript_before_normalization}')")
+
+    return ASRResult(
+        text=transcript,
+        confidence=confidence,
+        language=language,
+        segments=segments,
+        processing_time=time.time() - start_time
+    )
+
+async def asr_transcribe(audio_bytes: bytes, filename: str = "audio.ogg", cache=None, *,
+                         duration: float | None = None) -> ASRResult | None:
     start_time = time.time()
     audio_hash = hashlib.md5(audio_bytes).hexdigest()
 
@@ -737,89 +722,145 @@ async def asr_transcribe(audio_bytes: bytes, filename: str = "audio.ogg", cache=
         text = _normalizar_siglas(text)
         return ASRResult(text=text, confidence=0.9, processing_time=time.time() - start_time)
 
-    # Control de concurrencia: limitar transcripciones simultáneas
-    async with _asr_semaphore:
-        transcribe_url = f"{ASR_BASE_URL.rstrip('/')}/v1/audio/transcriptions"
-        original_size = len(audio_bytes)
-        log.debug(f"Audio original: {original_size} bytes")
+    transcribe_url = f"{ASR_BASE_URL.rstrip('/')}/v1/audio/transcriptions"
+    original_size = len(audio_bytes)
+    log.debug(f"Audio original: {original_size} bytes")
 
-        client = await _get_asr_client()
-        mime = "audio/ogg"
-        if audio_bytes[:4] == b"RIFF" and b"WAVE" in audio_bytes[:16]:
-            mime = "audio/wav"
-
-        files = {"file": (filename, audio_bytes, mime)}
-        data = {
-            "model": ASR_MODEL_NAME,
-            "language": ASR_LANG,
-            "temperature": "0.0",
-            "response_format": "verbose_json",
-            "timestamp_granularities": ["segment"],
-        }
-        initial_prompt = _build_asr_initial_prompt()
-        if initial_prompt:
-            data["prompt"] = initial_prompt
-            data["initial_prompt"] = initial_prompt
+    client = await _get_asr_client()
+    mime = "audio/ogg"
+    if audio_bytes[:4] == b"RIFF" and b"WAVE" in audio_bytes[:16]:
+        mime = "audio/wav"
 
-        try:
-            async with astage("telegram.asr"):
-                r = await client.post(transcribe_url, data=data, files=files)
-
-            if r.status_code >= 400:
-                log.info(f"ASR fallida con formato original ({r.status_code}), probando WAV...")
-                fallback_text = await _asr_fallback_wav_optimized(audio_bytes, filename)
-                if fallback_text:
-                    return ASRResult(text=fallback_text, confidence=0.7, processing_time=time.time() - start_time)
-                return None
+    files = {"file": (filename, audio_bytes, mime)}
+    data = _asr_form_data()
 
-            if r.status_code != 200:
-                log.warning("ASR %s: %s", r.status_code, r.text[:200])
-                return None
+    if duration is None:
+        duration = _estimate_audio_seconds(audio_bytes)
 
-            try:
-                j = r.json()
-            except Exception:
-                log.warning("Error parseando respuesta ASR JSON")
-                return None
+    try:
+        # Admisión por el planificador: espera (asr_queue_wait) y servicio (asr) por separado
+        r = await _asr_scheduler.run(
+            duration,
+            lambda: client.post(transcribe_url, data=data, files=files),
+            is_error=_is_server_error,
+        )
 
-            transcript = j.get("text") or j.get("transcript") or j.get("result")
-            if not transcript:
-                log.warning(f"ASR no retornó texto. JSON completo: {j}")
-                return None
+        if r.status_code >= 400:
+            log.info(f"ASR fallida con formato original ({r.status_code}), probando WAV...")
+            fallback_text = await _asr_fallback_wav_optimized(audio_bytes, filename, duration)
+            if fallback_text:
+                return ASRResult(text=fallback_text, confidence=0.7, processing_time=time.time() - start_time)
+            return None
 
-            confidence = 0.8
-            language = j.get("language", ASR_LANG)
-            segments = j.get("segments", [])
-            if segments:
-                confidences = [seg.get("avg_logprob", 0) for seg in segments if seg.get("avg_logprob")]
-                if confidences:
-                    confidence = min(max(sum(confidences) / len(confidences) + 1.0, 0.0), 1.0)
+        if r.status_code != 200:
+            log.warning("ASR %s: %s", r.status_code, r.text[:200])
+            return None
 
-            transcript_original = transcript
-            transcript = _clean_transcript_text(transcript)
-            transcript = _prenormalizar_fonetico(transcript)
-            transcript_before_normalization = transcript
-            transcript = _normalizar_siglas(transcript)
+        try:
+            j = r.json()
+        except Exception:
+            log.warning("Error parseando respuesta ASR JSON")
+            return None
 
-            if transcript != transcript_original:
-                log.info(f"DESPUÉS LIMPIEZA: '{transcript}' (antes: '{transcript_original}')")
-            if transcript != transcript_before_normalization:
-                log.info(f"DESPUÉS NORMALIZACIÓN: '{transcript}' (antes: '{transcript_before_normalization}')")
+        result = _asr_result_from_json(j, start_time)
+        if result and result.text:
+            await _cache_set_asr_transcription(audio_hash, result.text, cache)
+        return result
+    except Exception as e:
+        log.warning(f"Error en transcripción: {e}")
+        return None
 
-            if transcript:
-                await _cache_set_asr_transcription(audio_hash, transcript, cache)
+# Costo para el planificador cuando no hay duración ni tamaño (límite de _validate_audio_metadata)
+_STREAM_UNKNOWN_COST_S = 60.0
+
+class _AudioRejected(Exception):
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+class StreamASROutcome:
+    def __init__(self, result: ASRResult | None = None, *, status: int = 0, size: int = 0,
+                 audio_hash: str | None = None, rejected: str | None = None):
+        self.result = result
+        self.status = status
+        self.size = size
+        self.audio_hash = audio_hash
+        self.rejected = rejected
+
+async def asr_transcribe_stream(file_path: str, filename: str = "audio.ogg", cache=None, *,
+                                duration: float | None = None, file_size: int | None = None) -> StreamASROutcome:
+    """
+    Descarga de Telegram -> subida multipart al ASR en un solo flujo con buffer
+    acotado (ASR_STREAM_BUFFER_CHUNKS). La cabecera se descarga y valida antes de
+    pedir cupo al planificador, así un audio inválido no ocupa la GPU ni la espera
+    inicial de Telegram cuenta como servicio; las esperas posteriores a la descarga
+    se descuentan de la señal de latencia del planificador.
+    La descarga se reintenta con Range desde el último byte recibido.
+    """
+    start_time = time.time()
+    download_url = f"{TELEGRAM_API_BASE}/file/bot{BOT_TOKEN}/{file_path}"
+    tg_client = await _get_telegram_client()
+    pipe = BoundedPipe(
+        ranged_download(tg_client, download_url, chunk_size=ASR_STREAM_CHUNK_BYTES,
+                        read_timeout=TELEGRAM_DOWNLOAD_TIMEOUT),
+        max_chunks=ASR_STREAM_BUFFER_CHUNKS,
+    )
 
-            result = ASRResult(
-                text=transcript,
-                confidence=confidence,
-                language=language,
-                segments=segments,
-                processing_time=time.time() - start_time
-            )
-            return result
-        except Exception as e:
-            log.warning(f"Error en transcripción: {e}")
-            return None
+    async def body():
+        async for chunk in pipe:
+            yield chunk
+        # Archivo completo dentro de la cabecera: validación normal con todos los bytes
+        if pipe.size <= len(pipe.head):
+            verdict = _validate_audio_energy(pipe.head)
+            if verdict != "good":
+                raise _AudioRejected(verdict)
+
+    content_type, content = multipart_stream(
+        _asr_form_data(), file_field="file", filename=filename, mime="audio/ogg", body=body(),
+    )
+    # Sin duración: estimada por tamaño; sin ninguna de las dos, el máximo aceptado
+    # (no adelanta en la cola "más corto primero")
+    cost = duration or (file_size / 4000.0 if file_size else _STREAM_UNKNOWN_COST_S)
+    try:
+        await pipe.prime(1024)
+        if pipe.error is not None and not pipe.head:
+            raise pipe.error
+        if len(pipe.head) >= 1024:
+            verdict = _analyze_audio_quality_basic(pipe.head)
+            if verdict != "good":
+                raise _AudioRejected(verdict)
+        client = await _get_asr_client()
+        r = await _asr_scheduler.run(
+            cost,
+            lambda: client.post(
+                f"{ASR_BASE_URL.rstrip('/')}/v1/audio/transcriptions",
+                content=content, headers={"Content-Type": content_type},
+            ),
+            is_error=_is_server_error,
+            stalled=lambda: pipe.stall_s,
+        )
+    except _AudioRejected as e:
+        return StreamASROutcome(rejected=e.reason, size=pipe.size)
+    except (DownloadError, httpx.HTTPError) as e:
+        log.warning(f"ASR streaming falló tras {pipe.size} bytes: {e}")
+        return StreamASROutcome(size=pipe.size)
+    finally:
+        await pipe.aclose()
+
+    outcome = StreamASROutcome(status=r.status_code, size=pipe.size, audio_hash=pipe.md5)
+    if r.status_code != 200:
+        log.info(f"ASR streaming {r.status_code}: {r.text[:200]}")
+        return outcome
+    try:
+        j = r.json()
+    except Exception:
+        log.warning("Error parseando respuesta ASR JSON")
+        return outcome
+    outcome.result = _asr_result_from_json(j, start_time)
+    if outcome.result and outcome.result.text:
+        await _cache_set_asr_transcription(pipe.md5, outcome.result.text, cache)
+    log.info(f"ASR streaming: {pipe.size} bytes en {time.time() - start_time:.2f}s")
+    return outcome
 
 async def transcribe_optimized(audio_bytes: bytes, cache=None) -> ASRResult | None:
     return await asr_transcribe(audio_bytes, "audio.ogg", cache)
@@ -837,69 +878,30 @@ class IntentClassification:
         self.requires_llm = requires_llm
 
 def classify_user_intent(asr_result: ASRResult) -> IntentClassification:
-    text = asr_result.text.lower().strip()
+    f = intents.analyze(asr_result.text.strip())
     confidence_boost = min(asr_result.confidence * 0.2, 0.1)
 
     # Saludos simples (muy cortos)
-    greeting_patterns = ["hola", "hi", "hello", "buenas", "buenos días", "buenas tardes", "buenas noches", "saludos", "qué tal", "cómo estás"]
-    if any(p in text for p in greeting_patterns) and len(text.split()) <= 3:
+    if f.has("greeting") and f.word_count <= 3:
         return IntentClassification("greeting", 0.9 + confidence_boost, requires_llm=False)
 
-    #  PALABRAS CLAVE QUE ACTIVAN LLM+MCP
-    
-    # Palabras relacionadas con servicios/asesores
-    service_keywords = [
-        "servicio", "servicios", "asesor", "asesores", "profesor", "profesores", 
-        "docente", "docentes", "teacher", "teachers", "advisor", "advisors",
-        "recursos educativos", "comunidades de aprendizaje", "4prot", 
-        "google sites", "spatial", "ayudantes", "compromisos académicos"
-    ]
-    
-    # Palabras relacionadas con calendario/asesorías
-    calendar_keywords = [
-        "asesoría", "asesoria", "asesorías", "asesorias",
-        "cita", "citas", "reunión", "reunion", "reuniones",
-        "evento", "eventos", "event", "events",
-        "agenda", "agendar", "calendario", "calendar",
-        "horario", "horarios", "disponibilidad", "disponible",
-        "slot", "slots", "cupo", "cupos", "programar", "reservar", "reserva",
-        "confirmar", "confirma", "confirmación", "asistencia",
-        "cancelar", "cancela", "cancelación"
-    ]
-    
-    # Acciones comunes (verbos)
-    action_keywords = [
-        "lista", "listame", "listar", "mostrar", "muestra", "ver", "dame",
-        "buscar", "busca", "encuentra", "necesito", "quiero",
-        "agendar", "crear", "cancelar", "modificar", "cambiar",
-        "consulta", "consultar", "información", "info"
-    ]
-    
-    # Palabras de fechas/tiempo 
-    time_keywords = [
-        "hoy", "mañana", "semana", "mes", "día", "hora",
-        "enero", "febrero", "marzo", "abril", "mayo", "junio",
-        "julio", "agosto", "septiembre", "octubre", "noviembre", "diciembre",
-        "lunes", "martes", "miércoles", "jueves", "viernes", "sábado", "domingo"
-    ]
-    
+    #  PALABRAS CLAVE QUE ACTIVAN LLM+MCP (vocabularios en telegram_intent_matcher)
+
     # Si menciona servicios/asesores 
-    if any(kw in text for kw in service_keywords):
+    if f.has("service"):
         return IntentClassification("requires_llm", 0.9 + confidence_boost, requires_llm=True)
     
     # Si menciona calendario/asesorías 
-    if any(kw in text for kw in calendar_keywords):
+    if f.has("calendar"):
         return IntentClassification("requires_llm", 0.9 + confidence_boost, requires_llm=True)
     
     # Si usa un verbo de acción 
-    has_action = any(kw in text for kw in action_keywords)
-    if has_action:
+    if f.has("action"):
         return IntentClassification("requires_llm", 0.8 + confidence_boost, requires_llm=True)
     
     # Si menciona fechas/tiempo  contexto académico agendar/consultar
-    has_time = any(kw in text for kw in time_keywords)
-    academic_context = ["profesor", "asesor", "cita", "agenda", "horario", "materia", "asignatura", "tutoría", "asesoría", "clase", "curso"]
-    has_academic = any(c in text for c in academic_context)
+    has_time = f.has("time")
+    has_academic = f.has("academic")
     
     if has_time and has_academic:
         return IntentClassification("requires_llm", 0.8 + confidence_boost, requires_llm=True)
@@ -950,32 +952,12 @@ async def _maybe_store_pending_from_mcp(result, chat_id: int, cache=None):
 
 
 def _needs_mcp_tools(text: str) -> bool:
-    text_lower = text.lower().strip()
-    quick_exclusions = [
-        "hola", "hi", "buenas", "gracias", "ok", "vale", "perfecto",
-        "qué tal", "cómo estás", "buenos días", "buenas tardes",
-        "qué es", "explica", "define", "cuéntame", "dime sobre",
-        "información sobre", "cómo funciona", "help", "ayuda"
-    ]
-    for exclusion in quick_exclusions:
-        if exclusion in text_lower:
-            return False
-
-    high_certainty_keywords = [
-        "crear evento", "agendar cita", "programar reunión", "nueva cita",
-        "agregar evento", "crear reunión", "agendar evento", "listame",
-        "lista mis", "mis eventos", "eventos próximos", "calendario",
-        "reservar", "cancelar cita", "modificar evento"
-    ]
-    for kw in high_certainty_keywords:
-        if kw in text_lower:
-            return True
-
-    action_indicators = ["quiero", "necesito", "voy a", "tengo que", "debo", "me puedes", "puedes"]
-    calendar_words = ["evento", "cita", "reunión", "fecha", "horario", "agenda"]
-    has_action = any(a in text_lower for a in action_indicators)
-    has_calendar = any(w in text_lower for w in calendar_words)
-    if has_action and has_calendar:
+    f = intents.analyze(text.strip())
+    if f.has("mcp_exclusion"):
+        return False
+    if f.has("mcp_high"):
+        return True
+    if f.has("mcp_action") and f.has("mcp_calendar"):
         return True
 
     # Usa el detector dedicado para frases imperativas tipo "reserva una asesoría..."
@@ -1176,6 +1158,7 @@ async def route_to_mcp_direct(
             log.info(f"[MCP_DIRECT] tool={tool} args={args_preview}")
 
             async with astage("telegram.mcp_direct"):
+                mark_side_effect(f"mcp:{tool}")
                 result = await asyncio.wait_for(
                     mcp.call_tool(tool, args, thread_id=f"tg:{chat_id}"),
                     timeout=MCP_TIMEOUT_AGGRESSIVE
@@ -1274,99 +1257,36 @@ async def route_to_llm_plus_mcp(asr_result: ASRResult, chat_id: int, agent_gette
         except Exception as e:
             log.warning(f"[LLM+MCP] No se pudo setear system prompt: {e}")
 
-        # Inyectar user_id en el contexto del agente / tools 
-        if user_id:
-            try:
-                #  Contexto genérico para el agente
-                if hasattr(agent, "set_context"):
-                    agent.set_context({"user_id": user_id})
-                elif hasattr(agent, "update_context"):
-                    agent.update_context({"user_id": user_id})
-                elif hasattr(agent, "set_meta"):
-                    agent.set_meta(user_id=user_id)
-
-                #  Inyección directa para callbacks de tools 
-                try:
-                    agent._current_user = {"user_id": str(user_id)}
-                except Exception:
-                    pass
-
-                #  Defaults de herramientas 
-                defaults_flat = {
-                    "list_asesorias": {"user_id": user_id},
-                    "list_upcoming_events": {"user_id": user_id},
-                    "list_my_events": {"user_id": user_id},
-                    "create_calendar_event": {"user_id": user_id},
-                    "cancel_event": {"user_id": user_id},
-                }
-                defaults_input = {
-                    k: {"input": v} for k, v in defaults_flat.items()
-                }
-
-                # Intenta varios métodos que distintos agentes suelen exponer
-                if hasattr(agent, "set_default_tool_args"):
-                    # priorizamos la forma con "input" por el esquema pydantic típico
-                    agent.set_default_tool_args(defaults_input | defaults_flat)
-                elif hasattr(agent, "set_tool_context"):
-                    agent.set_tool_context({"user_id": user_id})
-                elif hasattr(agent, "register_tool_defaults"):
-                    agent.register_tool_defaults(defaults_input | defaults_flat)
-                else:
-                    # Último recurso: deja un atributo convencional que tu on_tool_call puede leer
-                    try:
-                        agent._default_tool_args = defaults_input | defaults_flat
-                    except Exception:
-                        pass
-
-                # Si el agente permite interceptar llamadas a tools, inyecta user_id siempre
-                async def _inject_uid_mw(tool_name: str, tool_args: dict) -> dict:
-                    try:
-                        if tool_args is None:
-                            tool_args = {}
-                        # Siempre asegura "input"
-                        if "input" not in tool_args or not isinstance(tool_args.get("input"), dict):
-                            tool_args["input"] = {}
-                        tool_args["input"].setdefault("user_id", user_id)
-                        # Y, por compatibilidad, también en plano
-                        tool_args.setdefault("user_id", user_id)
-                    except Exception:
-                        pass
-                    return tool_args
-
-                if hasattr(agent, "set_tool_call_interceptor"):
-                    agent.set_tool_call_interceptor(_inject_uid_mw)
-                elif hasattr(agent, "register_tool_middleware"):
-                    agent.register_tool_middleware(_inject_uid_mw)
-                elif hasattr(agent, "add_tool_middleware"):
-                    agent.add_tool_middleware(_inject_uid_mw)
-            except Exception as e:
-                log.warning(f"[LLM+MCP] No se pudo establecer contexto/tool defaults con user_id: {e}")
-
         #  Invocar el agente normalmente 
         text_in = (asr_result.text or "").strip() if asr_result else ""
         if not text_in:
             # Nada que preguntar; evita invocación innecesaria
             return None
 
-        # Control de concurrencia para agent
-        async with _agent_semaphore:
-            async with astage("telegram.llm_plus_mcp"):
-                log.info(
-                    f"LLM invocation: chat_id={chat_id} text_len={len(text_in)} uid={'yes' if user_id else 'no'}"
+        # La concurrencia la acota el carril del chat (_lanes)
+        async with astage("telegram.llm_plus_mcp"):
+            log.info(
+                f"LLM invocation: chat_id={chat_id} text_len={len(text_in)} uid={'yes' if user_id else 'no'}"
+            )
+            try:
+                # Las tools del agente pueden reservar/cancelar: desde aquí el update no se reintenta
+                mark_side_effect("agent")
+                result = await asyncio.wait_for(
+                    agent.invoke(
+                        text_in,
+                        thread_id=f"tg:{chat_id}",
+                        tool_context={"user_id": str(user_id)} if user_id else None,
+                    ),
+                    timeout=AGENT_TIMEOUT
                 )
-                try:
-                    result = await asyncio.wait_for(
-                        agent.invoke(text_in, thread_id=f"tg:{chat_id}"),
-                        timeout=AGENT_TIMEOUT
-                    )
-                except asyncio.TimeoutError:
-                    log.warning(f"LLM+MCP timeout ({AGENT_TIMEOUT}s) para audio transcrito (chat_id={chat_id})")
-                    return "La consulta está tomando más tiempo del esperado. Intenta con una pregunta más específica."
-                except Exception as e:
-                    log.error(f"Error en agent.invoke (audio): {e}")
-                    if "maximum context length" in str(e):
-                        return "Tu consulta es muy larga o tienes mucho historial. Intenta con una pregunta más breve."
-                    return "Error procesando tu consulta. Intenta de nuevo."
+            except asyncio.TimeoutError:
+                log.warning(f"LLM+MCP timeout ({AGENT_TIMEOUT}s) para audio transcrito (chat_id={chat_id})")
+                return "La consulta está tomando más tiempo del esperado. Intenta con una pregunta más específica."
+            except Exception as e:
+                log.error(f"Error en agent.invoke (audio): {e}")
+                if "maximum context length" in str(e):
+                    return "Tu consulta es muy larga o tienes mucho historial. Intenta con una pregunta más breve."
+                return "Error procesando tu consulta. Intenta de nuevo."
 
         # Convertir respuesta a string si es dict/list 
         if isinstance(result, str):
@@ -1495,9 +1415,12 @@ async def intelligent_routing_system(asr_result: ASRResult, chat_id: int, agent_
 
 
 #  Telegram Router
-def make_telegram_router(*, cache=None, agent_getter=None, mcp_client_getter=None, confirm_store_getter=None, get_session_dep=get_session_dep):
+def make_telegram_router(*, cache=None, agent_getter=None, mcp_client_getter=None, confirm_store_getter=None,
+                         get_session_dep=get_session_dep, identity_cache=None, require_admin=None):
     # Exponer dependencias a las funciones de ruta a través del módulo
+    globals()["require_admin"] = require_admin
     globals()["cache"] = cache
+    globals()["identity_cache"] = identity_cache or (TelegramIdentityCache(cache) if cache else None)
     globals()["agent_getter"] = agent_getter
     globals()["mcp_client_getter"] = mcp_client_getter
     globals()["confirm_store_getter"] = confirm_store_getter
@@ -1520,7 +1443,7 @@ async def setup_telegram_webhook(public_url: str | None = None):
             "url": callback_url,
             "allowed_updates": ["message", "callback_query"],
         }
-        resp = await client.post(f"https://api.telegram.org/bot{BOT_TOKEN}/setWebhook", json=payload)
+        resp = await client.post(f"{TELEGRAM_API_BASE}/bot{BOT_TOKEN}/setWebhook", json=payload)
         if resp.status_code != 200:
             log.error("Telegram setWebhook fallo: %s %s", resp.status_code, resp.text[:500])
             return
@@ -1533,14 +1456,15 @@ async def setup_telegram_webhook(public_url: str | None = None):
         log.exception("Error configurando webhook de Telegram")
 
 class OptimizedTelegramBot:
-    def __init__(self):
-        self.base = f"https://api.telegram.org/bot{BOT_TOKEN}"
+    """Salida hacia Telegram; todo pasa por el dispatcher (límites, 429, fusión de ediciones)."""
+    def __init__(self, dispatcher: TelegramDispatcher):
+        self.dispatcher = dispatcher
+        self.base = dispatcher.base
 
     async def send_message(self, chat_id: int, text: str,
                             disable_web_page_preview: bool = False,
                             allow_sending_without_reply: bool = False,
                             reply_markup: dict | None = None):
-        client = await _get_telegram_client()
         try:
             text = _fix_mojibake(text)
         except Exception:
@@ -1555,11 +1479,12 @@ class OptimizedTelegramBot:
         if reply_markup:
             payload["reply_markup"] = reply_markup
         try:
-            response = await client.post(f"{self.base}/sendMessage", json=payload)
-            if response.status_code == 200:
-                return response.json().get("result")
+            status, data = await self.dispatcher.call("sendMessage", payload, chat_id=chat_id)
+            if status == 200:
+                mark_side_effect("sendMessage")
+                return data.get("result")
             else:
-                log.error(f"Telegram API error: status={response.status_code}, response={response.text[:200]}")
+                log.error(f"Telegram API error: status={status}, response={str(data)[:200]}")
                 return None
         except Exception as e:
             log.error(f"HTTPx exception: {e}")
@@ -1568,7 +1493,6 @@ class OptimizedTelegramBot:
     async def edit_message(self, chat_id: int, message_id: int, text: str,
                             disable_web_page_preview: bool = False,
                             reply_markup: dict | None = None):
-        client = await _get_telegram_client()
         payload = {
             "chat_id": chat_id,
             "message_id": message_id,
@@ -1579,14 +1503,15 @@ class OptimizedTelegramBot:
         if reply_markup:
             payload["reply_markup"] = reply_markup
         try:
-            response = await client.post(f"{self.base}/editMessageText", json=payload)
-            return response.status_code == 200
+            status, _ = await self.dispatcher.edit(chat_id, message_id, payload)
+            if status == 200:
+                mark_side_effect("editMessageText")
+            return status == 200
         except Exception:
             return False
             
     async def answer_callback(self, callback_query_id: str, text: str | None = None,
                             show_alert: bool = False, cache_time: int | None = None):
-        client = await _get_telegram_client()
         payload = {"callback_query_id": callback_query_id}
         if text is not None:
             payload["text"] = text
@@ -1595,12 +1520,23 @@ class OptimizedTelegramBot:
         if cache_time is not None:
             payload["cache_time"] = int(cache_time)
         try:
-            await client.post(f"{self.base}/answerCallbackQuery", json=payload)
+            # Sin bucket por chat: el spinner del botón debe cerrarse cuanto antes
+            await self.dispatcher.call("answerCallbackQuery", payload)
         except Exception as e:
             log.warning(f"answerCallbackQuery error: {e}")
 
 
-bot = OptimizedTelegramBot()
+_dispatcher = TelegramDispatcher(
+    _get_telegram_client,
+    base_url=TELEGRAM_API_BASE,
+    token=BOT_TOKEN,
+    global_rate=TG_SEND_GLOBAL_RATE,
+    chat_rate=TG_SEND_CHAT_RATE,
+    chat_burst=TG_SEND_CHAT_BURST,
+    concurrency=TG_SEND_CONCURRENCY,
+    max_retries=TG_SEND_MAX_RETRIES,
+)
+bot = OptimizedTelegramBot(_dispatcher)
 
 def _normalize_role_name(role: str | None) -> str | None:
     if not role:
@@ -1621,35 +1557,6 @@ def _role_allows_cancel(role: str | None) -> bool:
     normalized = _normalize_role_name(role)
     return normalized in {"teacher", "advisor", "admin"}
 
-async def _user_has_profile(session, model, user_id: str) -> bool:
-    if not user_id:
-        return False
-    try:
-        uid = uuidlib.UUID(str(user_id))
-    except Exception:
-        return False
-    try:
-        stmt = sa.select(model.usuario_id).where(model.usuario_id == uid).limit(1)
-        res = await session.execute(stmt)
-        return res.first() is not None
-    except Exception as e:
-        log.debug(f"profile lookup failed for {model.__tablename__}: {e}")
-        return False
-
-async def _derive_effective_role(session, user_id: str | None, base_role: str | None) -> str | None:
-    normalized = _normalize_role_name(base_role)
-    if not user_id:
-        return normalized
-    if normalized == "admin":
-        return "admin"
-    has_docente = await _user_has_profile(session, DocentePerfilModel, user_id)
-    if has_docente:
-        return "teacher"
-    has_asesor = await _user_has_profile(session, AsesorPerfilModel, user_id)
-    if has_asesor:
-        return "advisor"
-    return normalized
-
 async def _get_role_cached(*, chat_id: int | None = None, telegram_user_id: int | None = None, user_id: str | None = None) -> str | None:
     if not cache:
         return None
@@ -1660,62 +1567,13 @@ async def _get_role_cached(*, chat_id: int | None = None, telegram_user_id: int
         keys.append(f"role_by_tgid:{telegram_user_id}")
     if user_id is not None:
         keys.append(f"role_by_user:{user_id}")
-    for key in keys:
-        try:
-            value = await cache.get(key)
+    try:
+        for value in await cache.mget(keys):
             if value:
                 return value.decode("utf-8")
-        except Exception:
-            pass
-    return None
-
-async def _ensure_role_cached(session, cache, *, user_id: str | None, chat_id: int | None = None,
-                                telegram_user_id: int | None = None, force_refresh: bool = False) -> str | None:
-    if not user_id:
-        return None
-    cached_role = None
-    if not force_refresh:
-        cached_role = await _get_role_cached(chat_id=chat_id, telegram_user_id=telegram_user_id, user_id=user_id)
-        if cached_role:
-            if cache:
-                role_bytes = cached_role.encode("utf-8")
-                try:
-                    if chat_id is not None:
-                        await cache.set(f"role_by_chat:{chat_id}", role_bytes, ttl_seconds=86400)
-                    if telegram_user_id is not None:
-                        await cache.set(f"role_by_tgid:{telegram_user_id}", role_bytes, ttl_seconds=86400)
-                except Exception:
-                    pass
-            return cached_role
-    try:
-        from app.interface_adapters.gateways.db.sqlalchemy_user_repo import SqlAlchemyUserRepo
-        user_repo = SqlAlchemyUserRepo(session, default_role_id=None)
-        base_role = await user_repo.get_role_name(user_id)
-    except Exception as e:
-        log.warning(f"Role lookup failed: {e}")
-        base_role = None
-
-    effective_role = await _derive_effective_role(session, user_id, base_role)
-    role_to_store = effective_role or base_role
-    if boost := _normalize_role_name(role_to_store):
-        if boost in {"teacher", "advisor", "admin"}:
-            role_to_store = boost
-
-    if role_to_store and cache:
-        role_bytes = str(role_to_store).encode("utf-8")
-        try:
-            await cache.set(f"role_by_user:{user_id}", role_bytes, ttl_seconds=86400)
-            if chat_id is not None:
-                await cache.set(f"role_by_chat:{chat_id}", role_bytes, ttl_seconds=86400)
-            if telegram_user_id is not None:
-                await cache.set(f"role_by_tgid:{telegram_user_id}", role_bytes, ttl_seconds=86400)
-        except Exception:
-            pass
-    try:
-        log.info(f"role_resolved user_id={user_id} base={base_role} effective={effective_role} stored={role_to_store} force={force_refresh}")
     except Exception:
         pass
-    return role_to_store
+    return None
 
 async def _get_user_id_cached(chat_id: int) -> str | None:
     if not cache:
@@ -1726,118 +1584,165 @@ async def _get_user_id_cached(chat_id: int) -> str | None:
     except Exception:
         return None
 
-async def _cache_try_delete(key: str) -> None:
-    if not cache or not key:
+async def _clear_user_cache(*, chat_id: int | None = None, telegram_user_id: int | None = None, user_id: str | None = None) -> None:
+    if not cache:
         return
+    keys = []
+    if chat_id is not None:
+        keys += [f"user_by_chat:{chat_id}", f"role_by_chat:{chat_id}"]
+    if telegram_user_id is not None:
+        keys += [f"user_by_tgid:{telegram_user_id}", f"role_by_tgid:{telegram_user_id}"]
+    if user_id is not None:
+        keys.append(f"role_by_user:{user_id}")
     try:
-        if hasattr(cache, "delete"):
-            await cache.delete(key)
-        else:
-            await cache.set(key, b"", ttl_seconds=1)
+        await cache.delete_many(keys)
     except Exception:
         pass
 
-async def _clear_user_cache(*, chat_id: int | None = None, telegram_user_id: int | None = None, user_id: str | None = None) -> None:
-    if not cache:
-        return
+async def _load_role_and_profiles(session, user_id: str) -> tuple[str | None, list[str]]:
+    """Rol efectivo y perfiles (teacher/advisor) en un solo round-trip."""
     try:
-        if chat_id is not None:
-            await _cache_try_delete(f"user_by_chat:{chat_id}")
-            await _cache_try_delete(f"role_by_chat:{chat_id}")
-        if telegram_user_id is not None:
-            await _cache_try_delete(f"user_by_tgid:{telegram_user_id}")
-            await _cache_try_delete(f"role_by_tgid:{telegram_user_id}")
-        if user_id is not None:
-            await _cache_try_delete(f"role_by_user:{user_id}")
+        uid = uuidlib.UUID(str(user_id))
     except Exception:
-        pass
+        return None, []
+    stmt = (
+        sa.select(
+            RolModel.nombre,
+            sa.exists().where(DocentePerfilModel.usuario_id == uid),
+            sa.exists().where(AsesorPerfilModel.usuario_id == uid),
+        )
+        .select_from(UsuarioModel)
+        .join(RolModel, UsuarioModel.rol_id == RolModel.id)
+        .where(UsuarioModel.id == uid)
+    )
+    row = (await session.execute(stmt)).first()
+    if not row:
+        return None, []
+    base_role, has_docente, has_asesor = row
+    profiles = (["teacher"] if has_docente else []) + (["advisor"] if has_asesor else [])
+    normalized = _normalize_role_name(base_role)
+    if normalized == "admin":
+        role = "admin"
+    elif has_docente:
+        role = "teacher"
+    elif has_asesor:
+        role = "advisor"
+    else:
+        role = normalized or base_role
+    return role, profiles
 
-async def _resolve_and_cache_user_id(
+async def _resolve_identity(
     session,
-    cache,
     *,
     chat_id: int | None = None,
     telegram_user_id: int | None = None,
     force_refresh: bool = False,
-):
+    prefetch_keys: list[str] | None = None,
+    prefetched: dict | None = None,
+) -> dict | None:
     """
-    Resuelve el usuario (UUID) a partir del chat_id o telegram_user_id y lo cachea.
-    Retorna str(user_id) o None.
+    Identidad del chat: {user_id, role, profiles}. Se sirve desde identity_cache
+    (LRU local + Redis) y solo va a la DB en un miss o con force_refresh (/start).
+    `prefetch_keys` se leen en el mismo MGET y quedan en `prefetched`.
     """
-    uid: str | None = None
-    cached_chat_uid: str | None = None
-    cached_tgid_uid: str | None = None
-
-    #  Cache por chat
-    if cache and chat_id is not None and not force_refresh:
-        try:
-            b = await cache.get(f"user_by_chat:{chat_id}")
-            if b:
-                uid_cached = b.decode("utf-8")
-                await _ensure_role_cached(session, cache, user_id=uid_cached, chat_id=chat_id, telegram_user_id=telegram_user_id, force_refresh=True)
-                cached_chat_uid = uid_cached
-                if telegram_user_id is None:
-                    return cached_chat_uid
-        except Exception:
-            pass
-
-    #  Cache por telegram_user_id
-    if cache and telegram_user_id is not None and not force_refresh:
+    keys = list(prefetch_keys or [])
+    if identity_cache is not None and chat_id is not None and not force_refresh:
+        record, fetched = await identity_cache.get_with(chat_id, keys)
+        if prefetched is not None:
+            prefetched.update(fetched)
+        if record and record.get("user_id"):
+            return record
+    elif keys and cache and prefetched is not None:
         try:
-            b = await cache.get(f"user_by_tgid:{telegram_user_id}")
-            if b:
-                cached_tgid_uid = b.decode("utf-8")
-                await _ensure_role_cached(session, cache, user_id=cached_tgid_uid, chat_id=chat_id, telegram_user_id=telegram_user_id, force_refresh=True)
-        except Exception:
-            pass
+            prefetched.update(zip(keys, await cache.mget(keys)))
+        except Exception as e:
+            log.warning(f"prefetch de estado del chat falló: {e}")
 
+    uid: str | None = None
     db_lookup_success = False
-    db_uid: str | None = None
-
-    #  Repo (DB) - valida siempre que tengamos telegram_user_id
     if telegram_user_id is not None:
         try:
-            repo = SqlAlchemyTelegramRepo(session, cache)
-            got = await repo.find_user_id_by_telegram(telegram_user_id)
+            async with astage("telegram.identity_db"):
+                got = await SqlAlchemyTelegramRepo(session, cache).find_user_id_by_telegram(telegram_user_id)
             db_lookup_success = True
-            if got is not None:
-                db_uid = str(got)
+            uid = str(got) if got is not None else None
         except Exception as e:
-            log.warning(f"_resolve_and_cache_user_id db lookup failed: {e}")
+            log.warning(f"_resolve_identity db lookup failed: {e}")
 
-    if db_lookup_success:
-        if db_uid:
-            uid = db_uid
-        else:
-            #  Desvinculado: limpiar caches y roles
-            await _clear_user_cache(chat_id=chat_id, telegram_user_id=telegram_user_id, user_id=cached_chat_uid or cached_tgid_uid)
-            return None
-    else:
-        uid = cached_chat_uid or cached_tgid_uid
+    if db_lookup_success and not uid:
+        #  Desvinculado: limpiar caches y roles
+        await _clear_user_cache(chat_id=chat_id, telegram_user_id=telegram_user_id)
+        return None
+    if not uid and chat_id is not None:
+        uid = await _get_user_id_cached(chat_id)
+    if not uid:
+        return None
 
-    # Cachear si lo obtuvimos
-    if uid and cache:
-        try:
+    role, profiles = None, []
+    try:
+        async with astage("telegram.identity_db"):
+            role, profiles = await _load_role_and_profiles(session, uid)
+    except Exception as e:
+        log.warning(f"Role lookup failed: {e}")
+
+    # Claves sueltas que siguen leyendo otras rutas (user_by_chat / role_by_*), en un pipeline
+    if cache:
+        items: dict[str, bytes] = {}
+        uid_bytes = uid.encode("utf-8")
+        if chat_id is not None:
+            items[f"user_by_chat:{chat_id}"] = uid_bytes
+        if telegram_user_id is not None:
+            items[f"user_by_tgid:{telegram_user_id}"] = uid_bytes
+        if role:
+            role_bytes = str(role).encode("utf-8")
+            items[f"role_by_user:{uid}"] = role_bytes
             if chat_id is not None:
-                await cache.set(f"user_by_chat:{chat_id}", uid.encode("utf-8"), ttl_seconds=86400)
+                items[f"role_by_chat:{chat_id}"] = role_bytes
             if telegram_user_id is not None:
-                await cache.set(f"user_by_tgid:{telegram_user_id}", uid.encode("utf-8"), ttl_seconds=86400)
+                items[f"role_by_tgid:{telegram_user_id}"] = role_bytes
+        try:
+            await cache.mset(items, ttl_seconds=86400)
         except Exception:
             pass
 
-    if uid:
-        try:
-            await _ensure_role_cached(
-                session, cache,
-                user_id=uid,
-                chat_id=chat_id,
-                telegram_user_id=telegram_user_id,
-                force_refresh=True
-            )
-        except Exception as e:
-            log.warning(f"ensure role cache failed: {e}")
+    if identity_cache is not None:
+        return await identity_cache.put(chat_id, user_id=uid, role=role, profiles=profiles)
+    return {"user_id": uid, "role": role, "profiles": profiles}
 
-    return uid
+async def _resolve_and_cache_user_id(
+    session,
+    cache,
+    *,
+    chat_id: int | None = None,
+    telegram_user_id: int | None = None,
+    force_refresh: bool = False,
+):
+    """
+    Resuelve el usuario (UUID) a partir del chat_id o telegram_user_id (vía _resolve_identity).
+    Retorna str(user_id) o None.
+    """
+    record = await _resolve_identity(
+        session, chat_id=chat_id, telegram_user_id=telegram_user_id, force_refresh=force_refresh,
+    )
+    return record["user_id"] if record else None
+
+async def _cached_identity(chat_id) -> dict | None:
+    """Identidad solo desde cache (sin DB): identity_cache y, si no está, claves sueltas."""
+    if identity_cache is not None:
+        record = await identity_cache.get(chat_id)
+        if record:
+            return record
+    if not cache:
+        return None
+    try:
+        uid_raw, role_raw = await cache.mget([f"user_by_chat:{chat_id}", f"role_by_chat:{chat_id}"])
+    except Exception:
+        return None
+    uid = uid_raw.decode("utf-8") if uid_raw else None
+    role = role_raw.decode("utf-8") if role_raw else None
+    if not uid and not role:
+        return None
+    return {"user_id": uid, "role": role, "profiles": []}
 
 
 
@@ -2256,7 +2161,7 @@ async def _send_list_message(chat_id: int, raw_text: str, *, user_role: str | No
     human_readable = _render_page_text(state["items"], page, page_size, kind=state["kind"], title=None)
     text_display = _mdv2_escape(human_readable)
     if user_role is None:
-        user_role = await _get_role_cached(chat_id=chat_id)
+        user_role = (await _cached_identity(chat_id) or {}).get("role")
     kb = _build_list_keyboard(state["items"], key, page, page_size, state["kind"], user_role=user_role)
     await bot.send_message(chat_id, text_display, disable_web_page_preview=True, allow_sending_without_reply=True, reply_markup=kb)
     return True
@@ -2349,28 +2254,24 @@ def _describe_action(tool_name: str, tool_args: dict) -> str:
     else:
         return "esta acción"
 
-async def _is_duplicate_update(update_id: int) -> bool:
+async def _claim_update(update_id: int) -> bool:
+    """Dedup atómico (SET NX): True si este proceso es el primero en ver el update."""
     if not cache or not update_id:
-        return False
+        return True
     try:
-        key = f"tg_update:{update_id}"
-        exists = await cache.get(key)
-        return exists is not None
+        return await cache.set_nx(f"tg_update:{update_id}", b"1", ttl_seconds=3600)
     except Exception as e:
         log.warning(f"Error verificando duplicado: {e}")
-        return False
-
-async def _mark_update_processed(update_id: int) -> None:
-    if not cache or not update_id:
-        return
-    try:
-        key = f"tg_update:{update_id}"
-        await cache.set(key, b"1", ttl_seconds=3600)
-        log.debug(f"Update {update_id} marcado como procesado")
-    except Exception as e:
-        log.warning(f"Error marcando update: {e}")
+        return True
 
 #  Background: Audio Flow 
+def _energy_error_message(energy_result: str) -> str:
+    if energy_result == "empty":
+        return " Audio vacío o muy silencioso\\. Intenta de nuevo\\."
+    if energy_result == "too_short":
+        return " Audio demasiado corto\\. Mínimo 1 segundo\\."
+    return " Audio no válido\\."
+
 async def _process_audio_background(chat_id: int, file_id: str, file_unique_id: str, audio_obj: dict):
     log.info(f"ULTRA-FAST background task: chat_id={chat_id}, file_id={file_id[:8] if file_id else 'None'}...")
     rid = new_request()
@@ -2399,75 +2300,127 @@ async def _process_audio_background(chat_id: int, file_id: str, file_unique_id:
             await _send_direct_message(chat_id, error_msg)
             return
 
-        #  getFile -> descarga
-        async with astage("telegram.get_file_path"):
-            file_id_hash = hashlib.md5(file_id.encode()).hexdigest()[:8] if file_id else "unknown"
-            file_path = await tg_get_file_path(file_id, file_unique_id, cache)
-        if not file_path:
-            log.error(f"No se pudo obtener file_path para audio {file_id_hash}")
-            await _send_direct_message(chat_id, " Error obteniendo archivo de audio")
-            return
-
-        async with astage("telegram.download"):
-            audio_bytes = None
-            download_exc = None
-            for i in range(3):
-                try:
-                    audio_bytes = await tg_download_file(file_path)
-                    if audio_bytes:
-                        break
-                except Exception as e:
-                    download_exc = e
-                    log.warning(f"tg_download_file intento {i+1}/3 falló: {e}")
-                    await asyncio.sleep(0.2)
-            if not audio_bytes:
-                log.error(f"No se pudo descargar audio tras reintentos: {download_exc}")
-                await _send_direct_message(chat_id, " Error descargando audio")
-                return
-
-        # 4) Validación energética + ASR
-        energy_result = _validate_audio_energy(audio_bytes)
-        audio_hash = hashlib.md5(audio_bytes).hexdigest()
-        if energy_result != "good":
-            if energy_result == "empty":
-                error_msg = " Audio vacío o muy silencioso\\. Intenta de nuevo\\."
-            elif energy_result == "too_short":
-                error_msg = " Audio demasiado corto\\. Mínimo 1 segundo\\."
-            else:
-                error_msg = " Audio no válido\\."
-            log.info(f"Audio rechazado por energía: {energy_result} - {len(audio_bytes)} bytes")
-            await _send_direct_message(chat_id, error_msg)
-            return
-
-        cached_transcript = await _cache_get_asr_transcription(audio_hash, cache)
+        #  Aviso "transcribiendo…" en paralelo a getFile; se edita con el texto al llegar
+        progress_task = asyncio.create_task(bot.send_message(
+            chat_id, _mdv2_escape("🎙️ Transcribiendo…"),
+            disable_web_page_preview=True, allow_sending_without_reply=True,
+        ))
+
+        async def _notify(text: str) -> None:
+            sent = await progress_task
+            if sent and sent.get("message_id"):
+                if await bot.edit_message(chat_id, sent["message_id"], text, disable_web_page_preview=True):
+                    return
+            await _send_direct_message(chat_id, text)
+
+        asr_result = None
+        cached_transcript = await _cache_get_asr_by_unique(file_unique_id, cache)
         if cached_transcript:
             transcript = _clean_transcript_text(cached_transcript)
             transcript = _prenormalizar_fonetico(transcript)
             transcript = _normalizar_siglas(transcript)
             asr_result = ASRResult(text=transcript, confidence=0.9, language=ASR_LANG, segments=[], processing_time=0.01)
         else:
-            try:
-                asr_result = await asyncio.wait_for(transcribe_optimized(audio_bytes, cache), timeout=ASR_TIMEOUT)
-                transcript = asr_result.text if asr_result else None
-            except asyncio.TimeoutError:
-                log.warning(f"ASR timeout after {ASR_TIMEOUT}s for {len(audio_bytes)} bytes")
-                asr_result = None
-                transcript = None
+            #  getFile
+            async with astage("telegram.get_file_path"):
+                file_id_hash = hashlib.md5(file_id.encode()).hexdigest()[:8] if file_id else "unknown"
+                file_path = await tg_get_file_path(file_id, file_unique_id, cache)
+            if not file_path:
+                log.error(f"No se pudo obtener file_path para audio {file_id_hash}")
+                await _notify(" Error obteniendo archivo de audio")
+                return
 
+            #  Descarga -> ASR en streaming; si el ASR rechaza el formato o la descarga
+            #  falla se usa el camino con buffer (que incluye el fallback WAV).
+            #  Con el pre-filtro de voz (ASR_VAD_ENABLED, off por defecto) se descarga
+            #  completa para analizarla antes: VAD y streaming son excluyentes.
+            use_vad = ASR_VAD_ENABLED and voice_activity.available()
+            stream = ASR_STREAM_UPLOAD and not use_vad
+            use_buffered = not stream
+            if stream:
+                try:
+                    outcome = await asyncio.wait_for(
+                        asr_transcribe_stream(file_path, cache=cache, duration=audio_obj.get("duration"),
+                                              file_size=audio_obj.get("file_size")),
+                        timeout=ASR_TIMEOUT,
+                    )
+                except asyncio.TimeoutError:
+                    log.warning(f"ASR streaming timeout after {ASR_TIMEOUT}s")
+                    outcome = StreamASROutcome(status=504)
+                if outcome.rejected:
+                    log.info(f"Audio rechazado por energía (streaming): {outcome.rejected} - {outcome.size} bytes")
+                    await _notify(_energy_error_message(outcome.rejected))
+                    return
+                asr_result = outcome.result
+                use_buffered = asr_result is None and outcome.status not in (200, 504)
+
+            if use_buffered:
+                async with astage("telegram.download"):
+                    audio_bytes = None
+                    download_exc = None
+                    for i in range(3):
+                        try:
+                            audio_bytes = await tg_download_file(file_path)
+                            if audio_bytes:
+                                break
+                        except Exception as e:
+                            download_exc = e
+                            log.warning(f"tg_download_file intento {i+1}/3 falló: {e}")
+                            await asyncio.sleep(0.2)
+                    if not audio_bytes:
+                        log.error(f"No se pudo descargar audio tras reintentos: {download_exc}")
+                        await _notify(" Error descargando audio")
+                        return
+
+                # Validación energética (cabecera + VAD) + ASR
+                energy_result = _validate_audio_energy(audio_bytes)
+                asr_input, asr_filename = audio_bytes, "audio.ogg"
+                asr_duration = audio_obj.get("duration")
+                if energy_result == "good" and use_vad:
+                    va = await _analyze_voice(audio_bytes)
+                    if va.status in ("empty", "too_short"):
+                        energy_result = va.status
+                    elif va.trimmed:
+                        # Solo el tramo con voz: menos segundos de GPU en el ASR
+                        log.info(f"VAD: voz {va.start_s:.2f}-{va.end_s:.2f}s de {va.duration_s:.2f}s")
+                        asr_input, asr_filename = va.trimmed_wav, "audio.wav"
+                        asr_duration = va.end_s - va.start_s
+                if energy_result != "good":
+                    log.info(f"Audio rechazado por energía: {energy_result} - {len(audio_bytes)} bytes")
+                    await _notify(_energy_error_message(energy_result))
+                    return
+                try:
+                    asr_result = await asyncio.wait_for(
+                        asr_transcribe(asr_input, asr_filename, cache, duration=asr_duration),
+                        timeout=ASR_TIMEOUT,
+                    )
+                except asyncio.TimeoutError:
+                    log.warning(f"ASR timeout after {ASR_TIMEOUT}s for {len(asr_input)} bytes")
+                    asr_result = None
+
+            if asr_result and asr_result.text:
+                await _cache_set_asr_by_unique(file_unique_id, asr_result.text, cache)
+
+        transcript = asr_result.text if asr_result else None
         if not transcript or not asr_result:
-            await _send_direct_message(chat_id, " Audio vacío o no detectado. Intenta hablar más claro.")
+            await _notify(" Audio vacío o no detectado. Intenta hablar más claro.")
             return
 
         # Autenticidad
         if not _validate_transcript_authenticity(transcript):
-            await _send_direct_message(chat_id, "🎙️ Audio no claro o con ruido. Intenta de nuevo.")
+            await _notify("🎙️ Audio no claro o con ruido. Intenta de nuevo.")
             return
 
         # Validación temprana: evitar procesar queries muy cortas/vacías
         if len(transcript.strip()) < 3:
-            await _send_direct_message(chat_id, "🔇 No detecté suficiente contenido. Intenta hablar más claro.")
+            await _notify("🔇 No detecté suficiente contenido. Intenta hablar más claro.")
             return
 
+        sent = await progress_task
+        if sent and sent.get("message_id"):
+            await bot.edit_message(chat_id, sent["message_id"], f"🎙️ _{_mdv2_escape(transcript)}_",
+                                   disable_web_page_preview=True)
+
         if not _is_domain_related(transcript) and not _is_ack(transcript):
             log.info("Transcripción fuera de dominio (permitido por configuración relajada)")
 
@@ -2475,8 +2428,8 @@ async def _process_audio_background(chat_id: int, file_id: str, file_unique_id:
 
         pending = await _get_pending_action(chat_id, cache)
         if pending and (_is_confirmation_text(text_lower) or _is_cancellation_text(text_lower)):
-            resolved_user_id = await _get_user_id_cached(chat_id)
-            role_name = await _get_role_cached(chat_id=chat_id, user_id=resolved_user_id)
+            identity = await _cached_identity(chat_id) or {}
+            resolved_user_id, role_name = identity.get("user_id"), identity.get("role")
             wants_confirm = _is_confirmation_text(text_lower)
             try:
                 log.info(f"Pending action audio role={role_name} wants_confirm={wants_confirm} user_id={resolved_user_id}")
@@ -2503,6 +2456,7 @@ async def _process_audio_background(chat_id: int, file_id: str, file_unique_id:
                 args["user_id"] = str(resolved_user_id)
 
             try:
+                mark_side_effect(f"mcp:{tool}")
                 result = await asyncio.wait_for(
                     mcp.call_tool(tool, args, thread_id=f"tg:{chat_id}"),
                     timeout=MCP_TIMEOUT_AGGRESSIVE
@@ -2606,7 +2560,7 @@ async def _process_audio_background(chat_id: int, file_id: str, file_unique_id:
 
         #  Si no es confirmación, intenta si es lista con UI
         try:
-            audio_role = await _get_role_cached(chat_id=chat_id)
+            audio_role = (await _cached_identity(chat_id) or {}).get("role")
             rendered = await _send_list_message(chat_id, response, user_role=audio_role)
             if rendered:
                 return
@@ -2625,1069 +2579,1053 @@ async def _process_audio_background(chat_id: int, file_id: str, file_unique_id:
         log.error(f"Error procesando audio: {e}")
         await _send_direct_message(chat_id, " Error interno\\. Contacta soporte\\.")
 
-#  Webhook principal
-@router.post("/webhook")
-async def webhook(req: Request, session: AsyncSession = Depends(get_session_dep)):
-    async with astage("telegram.total"):
-        update = await req.json()
-        update_id = update.get("update_id")
-
-        if await _is_duplicate_update(update_id):
-            log.info(f"Update {update_id} ya procesado - skipping")
-            return {"ok": True}
-
-        msg = update.get("message")
-        cbq = update.get("callback_query")
-        set_meta(source="telegram", update_id=update_id)
-        
+async def _run_audio(chat_id: int, file_id: str, file_unique_id: str, audio_obj: dict):
+    """Procesa el audio: en línea dentro de un worker de la cola; en segundo plano
+    (en el carril del chat) en modo webhook."""
+    if _inline_audio.get():
+        # Tarea hija esperada: hereda el carril del update (reentrante) pero aísla su trace
+        await asyncio.create_task(_process_audio_background(chat_id, file_id, file_unique_id, audio_obj))
+        return
+    task = _lanes.spawn(chat_id, lambda: _process_audio_background(chat_id, file_id, file_unique_id, audio_obj))
+    _bg_tasks.add(task)
+    task.add_done_callback(_bg_tasks.discard)
+
+#  Procesamiento de un update (inline desde el webhook o desde los workers de la cola)
+async def _handle_update(update: dict, session: AsyncSession) -> dict:
+    update_id = update.get("update_id")
+    msg = update.get("message")
+    cbq = update.get("callback_query")
+    set_meta(update_id=update_id)
+
+    if msg:
+        chat_id = msg.get("chat", {}).get("id")
+        text = (msg.get("text") or "").strip()
+        voice = msg.get("voice")
+        audio = msg.get("audio")
+        document = msg.get("document")
+
+        if chat_id:
+            set_meta(
+                chat_id=chat_id,
+                telegram_user_id=msg.get("from", {}).get("id"),
+                telegram_username=msg.get("from", {}).get("first_name", "Unknown")
+            )
 
-        try:
-            if msg:
-                chat_id = msg.get("chat", {}).get("id")
-                text = (msg.get("text") or "").strip()
-                voice = msg.get("voice")
-                audio = msg.get("audio")
-                document = msg.get("document")
-
-                if chat_id:
-                    set_meta(
+        # /start
+        if text.startswith("/start"):
+            parts = text.split(maxsplit=1)
+            if len(parts) > 1:
+                token = parts[1]
+                try:
+                    link_account = LinkTelegramAccount(
+                        repo=SqlAlchemyTelegramRepo(session, cache)
+                    )
+                    success = await link_account.execute(
+                        token=token,
+                        telegram_user_id=msg["from"]["id"],
                         chat_id=chat_id,
-                        telegram_user_id=msg.get("from", {}).get("id"),
-                        telegram_username=msg.get("from", {}).get("first_name", "Unknown")
+                        username=msg["from"].get("username") or msg["from"].get("first_name")
                     )
+                    if success:
+                        await bot.send_message(chat_id, _mdv2_escape("Cuenta vinculada exitosamente!"))
 
-                # /start
-                if text.startswith("/start"):
-                    parts = text.split(maxsplit=1)
-                    if len(parts) > 1:
-                        token = parts[1]
+                        # invalidar este chat y los chats anteriores del usuario; cachear la nueva
                         try:
-                            link_account = LinkTelegramAccount(
-                                repo=SqlAlchemyTelegramRepo(session, cache)
-                            )
-                            success = await link_account.execute(
-                                token=token,
-                                telegram_user_id=msg["from"]["id"],
+                            if identity_cache is not None:
+                                await identity_cache.invalidate(chat_id=chat_id)
+                            ident = await _resolve_identity(
+                                session,
                                 chat_id=chat_id,
-                                username=msg["from"].get("username") or msg["from"].get("first_name")
+                                telegram_user_id=msg["from"]["id"],
+                                force_refresh=True,
                             )
-                            if success:
-                                await bot.send_message(chat_id, _mdv2_escape("Cuenta vinculada exitosamente!"))
-
-                                # cachear user_id para este chat 
-                                try:
-                                    repo2 = SqlAlchemyTelegramRepo(session, cache)
-                                    uid = await repo2.find_user_id_by_telegram(msg["from"]["id"])
-                                    if uid and cache:
-                                        # Mapeo principal: chat_id -> user_id 
-                                        await cache.set(f"user_by_chat:{chat_id}", uid.encode("utf-8"), ttl_seconds=86400)
-                                        # Opcional: mapeo adicional por telegram_user_id 
-                                        await cache.set(f"user_by_tgid:{msg['from']['id']}", uid.encode("utf-8"), ttl_seconds=86400)
-                                        try:
-                                            await _ensure_role_cached(
-                                                session, cache,
-                                                user_id=str(uid),
-                                                chat_id=chat_id,
-                                                telegram_user_id=msg["from"]["id"],
-                                                force_refresh=True
-                                            )
-                                        except Exception as role_err:
-                                            log.warning(f"no se pudo cachear rol tras /start: {role_err}")
-                                except Exception as e:
-                                    log.warning(f"no se pudo cachear user_id tras /start: {e}")
-
-                            else:
-                                await bot.send_message(chat_id, _mdv2_escape("Token inválido o expirado"))
+                            if identity_cache is not None and ident:
+                                await identity_cache.invalidate(user_id=ident["user_id"])
+                                await identity_cache.put(chat_id, user_id=ident["user_id"],
+                                                         role=ident.get("role"), profiles=ident.get("profiles") or [])
                         except Exception as e:
-                            log.error(f"Error vinculando cuenta: {e}")
-                            await bot.send_message(chat_id, _mdv2_escape("Error interno"))
+                            log.warning(f"no se pudo cachear identidad tras /start: {e}")
+
                     else:
-                        await bot.send_message(chat_id, _mdv2_escape("Enviando: /start "))
+                        await bot.send_message(chat_id, _mdv2_escape("Token inválido o expirado"))
+                except Exception as e:
+                    log.error(f"Error vinculando cuenta: {e}")
+                    await bot.send_message(chat_id, _mdv2_escape("Error interno"))
+            else:
+                await bot.send_message(chat_id, _mdv2_escape("Enviando: /start "))
+            return {"ok": True}
+
+        # Audio 
+        elif voice or audio:
+            audio_obj = voice or audio
+            file_id = audio_obj.get("file_id")
+            file_unique_id = audio_obj.get("file_unique_id")
+            if chat_id and file_id:
+                resolved_user_id = None
+                try:
+                    resolved_user_id = await _resolve_and_cache_user_id(
+                        session, cache,
+                        chat_id=chat_id,
+                        telegram_user_id=msg.get("from", {}).get("id"),
+                    )
+                except Exception as e:
+                    log.warning(f"audio resolve user_id failed: {e}")
+                if not resolved_user_id:
+                    await _send_link_required(chat_id)
                     return {"ok": True}
 
-                # Audio 
-                elif voice or audio:
-                    audio_obj = voice or audio
-                    file_id = audio_obj.get("file_id")
-                    file_unique_id = audio_obj.get("file_unique_id")
-                    if chat_id and file_id:
-                        resolved_user_id = None
+                log.info(f"Iniciando background task audio: chat_id={chat_id}, file_id={file_id[:8]}...")
+                await _run_audio(chat_id, file_id, file_unique_id, audio_obj)
+            else:
+                log.warning(f"Audio sin chat_id o file_id: chat_id={chat_id}, file_id={file_id}")
+            return {"ok": True}
+
+        # Texto normal
+        elif text and chat_id:
+            text_lower = text.lower().strip()
+            words = text_lower.split()
+
+            # identidad del chat (user_id + rol) y pending action en un solo MGET
+            identity = None
+            prefetched: dict = {}
+            try:
+                identity = await _resolve_identity(
+                    session,
+                    chat_id=chat_id,
+                    telegram_user_id=msg["from"]["id"],
+                    prefetch_keys=[f"tg_pending:{chat_id}"],
+                    prefetched=prefetched,
+                )
+            except Exception as e:
+                log.warning(f"resolve user_id failed: {e}")
+
+            resolved_user_id = identity["user_id"] if identity else None
+            if not resolved_user_id:
+                await _send_link_required(chat_id)
+                return {"ok": True}
+
+            role_name = identity.get("role")
+
+            #si hay acción pendiente y el usuario dice confirmar/cancelar, ir directo a MCP
+            pending = await _get_pending_action(chat_id, cache, prefetched=prefetched)
+            if pending and (_is_confirmation_text(text_lower) or _is_cancellation_text(text_lower)):
+                wants_confirm = _is_confirmation_text(text_lower)
+                try:
+                    log.info(f"Pending action text role={role_name} wants_confirm={wants_confirm} user_id={resolved_user_id}")
+                except Exception:
+                    pass
+                if wants_confirm and not _role_allows_confirm(role_name):
+                    await bot.send_message(chat_id, _mdv2_escape(" Solo los docentes pueden confirmar esta asesoría."))
+                    return {"ok": True}
+                if not wants_confirm and not _role_allows_cancel(role_name):
+                    await bot.send_message(chat_id, _mdv2_escape(" No tienes permiso para cancelar esta asesoría."))
+                    return {"ok": True}
+
+                mcp = mcp_client_getter() if mcp_client_getter else None
+                if not mcp:
+                    await bot.send_message(chat_id, _mdv2_escape(" No puedo confirmar ahora mismo. Intenta de nuevo."))
+                    return {"ok": True}
+
+                tool = pending.get("tool") or "create_calendar_event"
+                args = pending.get("args") or {}
+                args["confirm"] = wants_confirm
+                args["idempotency_key"] = f"tg:{chat_id}:{int(time.time()*1000)}"
+
+                #   inyectar user_id si falta 
+                if "user_id" not in args or not args.get("user_id"):
+                    if resolved_user_id and _normalize_role_name(role_name) == "teacher":
+                        args["user_id"] = str(resolved_user_id)
+                    elif cache:
                         try:
-                            resolved_user_id = await _resolve_and_cache_user_id(
-                                session, cache,
-                                chat_id=chat_id,
-                                telegram_user_id=msg.get("from", {}).get("id"),
-                                force_refresh=True,
-                            )
-                        except Exception as e:
-                            log.warning(f"audio resolve user_id failed: {e}")
-                        if not resolved_user_id:
-                            await _send_link_required(chat_id)
-                            return {"ok": True}
-                        
-                        log.info(f"Iniciando background task audio: chat_id={chat_id}, file_id={file_id[:8]}...")
-                        asyncio.create_task(_process_audio_background(chat_id, file_id, file_unique_id, audio_obj))
-                    else:
-                        log.warning(f"Audio sin chat_id o file_id: chat_id={chat_id}, file_id={file_id}")
+                            uid_bytes = await cache.get(f"user_by_chat:{chat_id}")
+                            if uid_bytes and _normalize_role_name(role_name) == "teacher":
+                                args["user_id"] = uid_bytes.decode("utf-8")
+                        except Exception:
+                            pass
+
+                try:
+                    mark_side_effect(f"mcp:{tool}")
+                    result = await asyncio.wait_for(
+                        mcp.call_tool(tool, args, thread_id=f"tg:{chat_id}"),
+                        timeout=MCP_TIMEOUT_AGGRESSIVE
+                    )
+                    await _clear_pending_action(chat_id, cache)
+                    text_result = result.get("message") if isinstance(result, dict) else str(result)
+                    await bot.send_message(chat_id, _mdv2_escape(text_result or " Hecho."))
+                except asyncio.TimeoutError:
+                    await bot.send_message(chat_id, _mdv2_escape(" No pude confirmar a tiempo. Intenta de nuevo."))
+                return {"ok": True}
+
+            # Respuestas instant+�neas 
+            if len(words) <= 5:
+                if any(k in text_lower for k in ["hola", "hi", "buenas", "buenos días", "buenas tardes", "hello", "saludos"]):
+                    quick_response = _mdv2_escape(" ¡Hola! Soy tu asistente de CINAP. - En qué puedo ayudarte hoy?")
+                    await bot.send_message(chat_id, quick_response, disable_web_page_preview=True, allow_sending_without_reply=True)
+                    return {"ok": True}
+                if any(k in text_lower for k in ["uct", "universidad católica", "católica temuco"]):
+                    uct_response = _mdv2_escape(
+                        " UCT - Universidad Católica de Temuco \n\n"
+                        "La Universidad Católica de Temuco es una institución de educación superior tradicional privada, "
+                        "reconocida por su excelencia académica y compromiso con el desarrollo regional."
+                    )
+                    await bot.send_message(chat_id, uct_response, disable_web_page_preview=True, allow_sending_without_reply=True)
+                    return {"ok": True}
+                if any(k in text_lower for k in ["cinap", "centro de innovación", "centro innovación aprendizaje", "centro de docencia", "centro de apoyo docente"]):
+                    cinap_response = _mdv2_escape(
+                        " CINAP - Centro de Innovación en Aprendizaje, Docencia y Tecnología Educativa \n\n"
+                        "El CINAP acompaña pedagógicamente a los docentes de la UCT, fortaleciendo la enseñanza mediante "
+                        "asesorías en formación docente, educación digital, innovación en la docencia, investigación aplicada "
+                        "y experimentación pedagógica en entornos de laboratorio."
+                    )
+                    await bot.send_message(chat_id, cinap_response, disable_web_page_preview=True, allow_sending_without_reply=True)
+                    return {"ok": True}
+                if any(k in text_lower for k in ["gracias", "thanks", "thank you", "muchas gracias"]):
+                    thanks_response = _mdv2_escape(" ¡De nada! Estoy aquí para ayudarte. ¿Necesitas algo más?")
+                    await bot.send_message(chat_id, thanks_response, disable_web_page_preview=True, allow_sending_without_reply=True)
                     return {"ok": True}
 
-                # Texto normal
-                elif text and chat_id:
-                    text_lower = text.lower().strip()
-                    words = text_lower.split()
+            if not _is_domain_related(text) and not _is_ack(text):
+                log.info("Mensaje de texto fuera de dominio (permitido por configuración relajada)")
 
-                    # resolver user_id y guardarlo en cache 
-                    resolved_user_id = None
+            # Agente
+            if not agent_getter:
+                await bot.send_message(chat_id, " Servicio no disponible")
+                return {"ok": True}
+            agent = agent_getter()
+            if not agent:
+                await bot.send_message(chat_id, " No se pudo obtener agente")
+                return {"ok": True}
+
+            try:
+                needs_mcp = _needs_mcp_tools(text)
+                timeout = 45 if needs_mcp else 20
+                async with astage("telegram.agent_fast"):
                     try:
-                        repo = SqlAlchemyTelegramRepo(session, cache)
-                        resolved_user_id = await _resolve_and_cache_user_id(
-                            session,
-                            cache,
-                            chat_id=chat_id,
-                            telegram_user_id=msg["from"]["id"],
-                            force_refresh=True,
+                        mark_side_effect("agent")
+                        reply = await asyncio.wait_for(
+                            agent.invoke(
+                                text,
+                                thread_id=f"tg:{chat_id}",
+                                tool_context={"user_id": str(resolved_user_id)} if resolved_user_id else None,
+                            ),
+                            timeout=timeout
                         )
-                        if resolved_user_id and cache:
-                            await cache.set(
-                                f"user_by_chat:{chat_id}",
-                                str(resolved_user_id).encode("utf-8"),
-                                ttl_seconds=86400
-                            )
+                        reply = reply or " No tengo una respuesta para eso."
+                    except asyncio.TimeoutError:
+                        log.warning(f"Agent timeout ({timeout}s) para texto: '{text[:30]}...'")
+                        reply = " La consulta está tomando más tiempo del esperado. Intenta con una pregunta más específica."
                     except Exception as e:
-                        log.warning(f"resolve user_id failed: {e}")
+                        log.error(f"Error en agent.invoke: {e}")
+                        if "maximum context length" in str(e):
+                            reply = " Tu consulta es muy larga o tienes mucho historial. Intenta con una pregunta más breve o empieza una nueva conversación."
+                        else:
+                            reply = " Error procesando tu consulta. Intenta de nuevo."
+
+                #   Convertir dict/list a string antes de procesar
+                if isinstance(reply, (dict, list)):
+                    try:
+                        reply = json.dumps(reply, ensure_ascii=False, indent=2)
+                    except Exception:
+                        reply = str(reply)
+
+                # list_asesorias 
+                try:
+                    reply_str = str(reply)
+
+                    if (
+                        "Error executing tool list_asesorias" in reply_str
+                        and "Field required" in reply_str
+                        and "user_id" in reply_str
+                    ):
+                        #  Resolver user_id si aún no lo tenemos
+                        uid = resolved_user_id
+                        if not uid and cache:
+                            try:
+                                b = await cache.get(f"user_by_chat:{chat_id}")
+                                if b:
+                                    uid = b.decode("utf-8")
+                            except Exception:
+                                pass
+
+                        if not uid:
+                            # No hay user vinculado: pide /start
+                            reply = ("Para listar tus asesorías primero debes vincular tu cuenta.\n\n"
+                                    "Envía: /start")
+                        else:
+                            #  Extraer start/end del mensaje de error
+                            start = None
+                            end = None
+
+                            # Patrón común en el error pydantic mostrado
+                            m_start = re.search(r"'start':\s*'([^']+)'", reply_str)
+                            m_end   = re.search(r"'end':\s*'([^']+)'", reply_str)
+                            if m_start: start = m_start.group(1)
+                            if m_end:   end   = m_end.group(1)
+
+                            # Fallback genérico a any ISO-like en el string
+                            if not (start and end):
+                                iso_matches = re.findall(r"\d{4}-\d{2}-\d{2}T[0-9:\-+]+", reply_str)
+                                if len(iso_matches) >= 2:
+                                    start, end = iso_matches[0], iso_matches[1]
+
+                            if start and end and mcp_client_getter:
+                                try:
+                                    mcp = mcp_client_getter()
+                                    args_retry = {
+                                        "start": start,
+                                        "end": end,
+                                        "user_id": str(uid),
+                                        "idempotency_key": f"tg:{chat_id}:{int(time.time()*1000)}",
+                                    }
+                                    mark_side_effect("mcp:list_asesorias")
+                                    tool_result = await asyncio.wait_for(
+                                        mcp.call_tool("list_asesorias", args_retry, thread_id=f"tg:{chat_id}"),
+                                        timeout=max(MCP_TIMEOUT_AGGRESSIVE, 2.0)
+                                    )
+                                    reply = tool_result.get("message") if isinstance(tool_result, dict) else str(tool_result)
+                                except Exception as e:
+                                    log.warning(f"Retry list_asesorias with user_id failed: {e}")
+                                    # dejamos reply con el error original si el retry falla
+                            else:
+                                # Si no tenemos fechas, dejamos el error original
+                                pass
+                except Exception as e:
+                    log.warning(f"HOTFIX list_asesorias failed: {e}")
+                #  /HOTFIX list_asesorias 
 
-                    if not resolved_user_id:
-                        await _send_link_required(chat_id)
+                # En modo relajado no se fuerza dominio; _enforce_domain_reply será no-op
+                final_reply = _enforce_domain_reply(text, reply)
+
+                #  Primero intenta si es confirmación con botones Sí/No
+                try:
+                    confirm_sent = await _send_confirm_message(chat_id, final_reply, thread_id=f"tg:{chat_id}")
+                    if confirm_sent:
+                        return {"ok": True}  # Ya enviamos confirmación con botones
+                except Exception as e:
+                    log.warning(f"CINAP_CONFIRM render failed: {e}")
+
+                #  Si no es confirmación, intenta si hay lista CINAP
+                try:
+                    rendered = await _send_list_message(chat_id, final_reply, user_role=role_name)
+                    if rendered:
                         return {"ok": True}
+                except Exception as e:
+                    log.warning(f"CINAP_LIST render failed: {e}")
 
-                    role_name = None
-                    try:
-                        role_name = await _get_role_cached(
-                            chat_id=chat_id,
-                            user_id=str(resolved_user_id) if resolved_user_id else None,
-                            telegram_user_id=msg.get("from", {}).get("id")
-                        )
-                        if not role_name and resolved_user_id:
-                            role_name = await _ensure_role_cached(
-                                session, cache,
-                                user_id=str(resolved_user_id),
-                                chat_id=chat_id,
-                                telegram_user_id=msg.get("from", {}).get("id")
-                            )
-                    except Exception as role_err:
-                        log.warning(f"role lookup failed: {role_err}")
+                # Si no es lista ni confirmación, enviamos como texto normal:
+                safe_reply_fast = _mdv2_escape(final_reply)
+                if len(safe_reply_fast) > 4000:
+                    for part in _chunk(safe_reply_fast, 3900):
+                        await bot.send_message(chat_id, part, disable_web_page_preview=True, allow_sending_without_reply=True)
+                else:
+                    await bot.send_message(chat_id, safe_reply_fast, disable_web_page_preview=True, allow_sending_without_reply=True)
+
+            except Exception as e:
+                log.error(f"Error procesando texto: {e}")
+                await bot.send_message(chat_id, "Error procesando mensaje")
+            return {"ok": True}
+
+    # Callback Query: paginación/ítems de listas CINAP
+    if cbq:
+        chat_id = cbq.get("message", {}).get("chat", {}).get("id")
+        msg_id  = cbq.get("message", {}).get("message_id")
+        data    = cbq.get("data") or ""
+        cq_id   = cbq.get("id")
+        # corta el spinner al toque
+        if cq_id:
+            try:
+                await bot.answer_callback(cq_id, text="Procesando...")
+            except Exception:
+                pass
+
+        identity = None
+        tg_user_id = (cbq.get("from") or {}).get("id")
+        if chat_id is not None:
+            try:
+                identity = await _resolve_identity(
+                    session,
+                    chat_id=chat_id,
+                    telegram_user_id=tg_user_id,
+                )
+            except Exception as e:
+                log.warning(f"resolve user_id en callback failed: {e}")
+        resolved_user_id = identity["user_id"] if identity else None
+        if not resolved_user_id:
+            if cq_id:
+                try:
+                    await bot.answer_callback(cq_id, text="Vincula tu cuenta")
+                except Exception:
+                    pass
+            if chat_id is not None:
+                await _send_link_required(int(chat_id))
+            return {"ok": True}
 
-                    #si hay acción pendiente y el usuario dice confirmar/cancelar, ir directo a MCP
-                    pending = await _get_pending_action(chat_id, cache)
-                    if pending and (_is_confirmation_text(text_lower) or _is_cancellation_text(text_lower)):
-                        wants_confirm = _is_confirmation_text(text_lower)
+        try:
+            # Handler para confirmaciones con botones Sí/No
+            if data.startswith("CONF_YES|") or data.startswith("CONF_NO|"):
+                is_yes = data.startswith("CONF_YES|")
+                key = data.split("|", 1)[1]
+
+                # Cargar la acción pendiente
+                pending_action = await _load_list_state(key)
+
+                if not pending_action:
+                    await bot.edit_message(
+                        int(chat_id), int(msg_id),
+                        _mdv2_escape("Esta confirmación ha expirado. Intenta de nuevo."),
+                        disable_web_page_preview=True
+                    )
+                    if cq_id:
                         try:
-                            log.info(f"Pending action text role={role_name} wants_confirm={wants_confirm} user_id={resolved_user_id}")
+                            await bot.answer_callback(cq_id, text="Confirmación expirada")
                         except Exception:
                             pass
-                        if wants_confirm and not _role_allows_confirm(role_name):
-                            await bot.send_message(chat_id, _mdv2_escape(" Solo los docentes pueden confirmar esta asesoría."))
-                            return {"ok": True}
-                        if not wants_confirm and not _role_allows_cancel(role_name):
-                            await bot.send_message(chat_id, _mdv2_escape(" No tienes permiso para cancelar esta asesoría."))
-                            return {"ok": True}
-
-                        mcp = mcp_client_getter() if mcp_client_getter else None
-                        if not mcp:
-                            await bot.send_message(chat_id, _mdv2_escape(" No puedo confirmar ahora mismo. Intenta de nuevo."))
-                            return {"ok": True}
-
-                        tool = pending.get("tool") or "create_calendar_event"
-                        args = pending.get("args") or {}
-                        args["confirm"] = wants_confirm
-                        args["idempotency_key"] = f"tg:{chat_id}:{int(time.time()*1000)}"
-
-                        #   inyectar user_id si falta 
-                        if "user_id" not in args or not args.get("user_id"):
-                            if resolved_user_id and _normalize_role_name(role_name) == "teacher":
-                                args["user_id"] = str(resolved_user_id)
-                            elif cache:
-                                try:
-                                    uid_bytes = await cache.get(f"user_by_chat:{chat_id}")
-                                    if uid_bytes and _normalize_role_name(role_name) == "teacher":
-                                        args["user_id"] = uid_bytes.decode("utf-8")
-                                except Exception:
-                                    pass
+                    return {"ok": True}
 
-                        try:
-                            result = await asyncio.wait_for(
-                                mcp.call_tool(tool, args, thread_id=f"tg:{chat_id}"),
-                                timeout=MCP_TIMEOUT_AGGRESSIVE
-                            )
-                            await _clear_pending_action(chat_id, cache)
-                            text_result = result.get("message") if isinstance(result, dict) else str(result)
-                            await bot.send_message(chat_id, _mdv2_escape(text_result or " Hecho."))
-                        except asyncio.TimeoutError:
-                            await bot.send_message(chat_id, _mdv2_escape(" No pude confirmar a tiempo. Intenta de nuevo."))
-                        return {"ok": True}
+                if is_yes:
+                    # Usuario confirmó - invocar al agent con "sí" para que use su fastpath
+                    thread_id = pending_action.get("thread_id") or f"tg:{chat_id}"
 
-                    # Respuestas instant+�neas 
-                    if len(words) <= 5:
-                        if any(k in text_lower for k in ["hola", "hi", "buenas", "buenos días", "buenas tardes", "hello", "saludos"]):
-                            quick_response = _mdv2_escape(" ¡Hola! Soy tu asistente de CINAP. - En qué puedo ayudarte hoy?")
-                            await bot.send_message(chat_id, quick_response, disable_web_page_preview=True, allow_sending_without_reply=True)
-                            return {"ok": True}
-                        if any(k in text_lower for k in ["uct", "universidad católica", "católica temuco"]):
-                            uct_response = _mdv2_escape(
-                                " UCT - Universidad Católica de Temuco \n\n"
-                                "La Universidad Católica de Temuco es una institución de educación superior tradicional privada, "
-                                "reconocida por su excelencia académica y compromiso con el desarrollo regional."
-                            )
-                            await bot.send_message(chat_id, uct_response, disable_web_page_preview=True, allow_sending_without_reply=True)
-                            return {"ok": True}
-                        if any(k in text_lower for k in ["cinap", "centro de innovación", "centro innovación aprendizaje", "centro de docencia", "centro de apoyo docente"]):
-                            cinap_response = _mdv2_escape(
-                                " CINAP - Centro de Innovación en Aprendizaje, Docencia y Tecnología Educativa \n\n"
-                                "El CINAP acompaña pedagógicamente a los docentes de la UCT, fortaleciendo la enseñanza mediante "
-                                "asesorías en formación docente, educación digital, innovación en la docencia, investigación aplicada "
-                                "y experimentación pedagógica en entornos de laboratorio."
+                    if not agent_getter:
+                        error_message = "Agent getter no está configurado"
+                        log.error(error_message)
+                    else:
+                        agent = agent_getter()
+                        if not agent:
+                            error_message = "No se pudo obtener instancia del agent"
+                            log.error("agent_getter() retornó None")
+                        else:
+                            # Actualizar mensaje para mostrar que se está procesando
+                            await bot.edit_message(
+                                int(chat_id), int(msg_id),
+                                _mdv2_escape("Procesando..."),
+                                disable_web_page_preview=True
                             )
-                            await bot.send_message(chat_id, cinap_response, disable_web_page_preview=True, allow_sending_without_reply=True)
-                            return {"ok": True}
-                        if any(k in text_lower for k in ["gracias", "thanks", "thank you", "muchas gracias"]):
-                            thanks_response = _mdv2_escape(" ¡De nada! Estoy aquí para ayudarte. ¿Necesitas algo más?")
-                            await bot.send_message(chat_id, thanks_response, disable_web_page_preview=True, allow_sending_without_reply=True)
-                            return {"ok": True}
-
-                    if not _is_domain_related(text) and not _is_ack(text):
-                        log.info("Mensaje de texto fuera de dominio (permitido por configuración relajada)")
 
-                    # Agente
-                    if not agent_getter:
-                        await bot.send_message(chat_id, " Servicio no disponible")
-                        return {"ok": True}
-                    agent = agent_getter()
-                    if not agent:
-                        await bot.send_message(chat_id, " No se pudo obtener agente")
-                        return {"ok": True}
+                            try:
+                                # Invocar al agent con "sí" - el agent usará su fastpath de confirmación
+                                log.info(f"Invocando agent con confirmación para thread_id: {thread_id}")
+                                mark_side_effect("agent")
+                                result = await asyncio.wait_for(
+                                    agent.invoke("sí", thread_id=thread_id),
+                                    timeout=AGENT_TIMEOUT
+                                )
 
-                    #  pasar user_id al Agent para tools 
-                    try:
-                        if resolved_user_id and hasattr(agent, "_current_user"):
-                            agent._current_user = {"user_id": str(resolved_user_id)}
-                        elif hasattr(agent, "_current_user"):
-                            agent._current_user = {}
-                    except Exception:
-                        pass
+                                # Actualizar mensaje con resultado
+                                success_msg = _mdv2_escape(result or "✅ Confirmado exitosamente")
+                                await bot.edit_message(
+                                    int(chat_id), int(msg_id),
+                                    success_msg,
+                                    disable_web_page_preview=True
+                                )
 
-                    try:
-                        needs_mcp = _needs_mcp_tools(text)
-                        timeout = 45 if needs_mcp else 20
-                        async with astage("telegram.agent_fast"):
-                            #  pasar user_id al Agent para tools
-                            try:
-                                # Fallbacks por si aún no está resuelto
-                                if not resolved_user_id:
-                                    #  cache por chat_id
-                                    if cache:
-                                        b = await cache.get(f"user_by_chat:{chat_id}")
-                                        if b:
-                                            resolved_user_id = b.decode("utf-8")
-
-                                    #  cache por telegram_user_id
-                                    if not resolved_user_id and cache and msg.get("from", {}).get("id"):
-                                        b = await cache.get(f"user_by_tgid:{msg['from']['id']}")
-                                        if b:
-                                            resolved_user_id = b.decode("utf-8")
-
-                                    #  DB (repo)
-                                    if not resolved_user_id and msg.get("from", {}).get("id"):
-                                        repo = SqlAlchemyTelegramRepo(session, cache)
-                                        got = await repo.find_user_id_by_telegram(msg["from"]["id"])
-                                        if got:
-                                            resolved_user_id = str(got)
-                                            # cachear para siguientes mensajes
-                                            if cache:
-                                                await cache.set(f"user_by_chat:{chat_id}", resolved_user_id.encode("utf-8"), ttl_seconds=86400)
-                                                await cache.set(f"user_by_tgid:{msg['from']['id']}", resolved_user_id.encode("utf-8"), ttl_seconds=86400)
-                                if resolved_user_id:
+                                if cq_id:
                                     try:
-                                        await _ensure_role_cached(
-                                            session, cache,
-                                            user_id=str(resolved_user_id),
-                                            chat_id=chat_id,
-                                            telegram_user_id=msg.get("from", {}).get("id")
-                                        )
-                                    except Exception as role_err:
-                                        log.warning(f"role cache fallback failed: {role_err}")
-
-                                # Inyecta al agente 
-                                if resolved_user_id:
-                                    agent._current_user = {"user_id": str(resolved_user_id)}
-                            except Exception as e:
-                                log.warning(f"set _current_user failed: {e}")
+                                        await bot.answer_callback(cq_id, text="✅ Confirmado")
+                                    except Exception:
+                                        pass
+
+                                # Limpiar la acción pendiente del cache local
+                                try:
+                                    if cache and key:
+                                        await cache.delete(key)
+                                except Exception as e:
+                                    log.warning(f"Error limpiando cache: {e}")
+
+                                return {"ok": True}
 
-                            try:
-                                reply = await asyncio.wait_for(
-                                    agent.invoke(text, thread_id=f"tg:{chat_id}"),
-                                    timeout=timeout
-                                )
-                                reply = reply or " No tengo una respuesta para eso."
                             except asyncio.TimeoutError:
-                                log.warning(f"Agent timeout ({timeout}s) para texto: '{text[:30]}...'")
-                                reply = " La consulta está tomando más tiempo del esperado. Intenta con una pregunta más específica."
+                                error_message = "Timeout confirmando acción"
+                                log.error(f"Timeout al invocar agent para confirmación")
                             except Exception as e:
-                                log.error(f"Error en agent.invoke: {e}")
-                                if "maximum context length" in str(e):
-                                    reply = " Tu consulta es muy larga o tienes mucho historial. Intenta con una pregunta más breve o empieza una nueva conversación."
-                                else:
-                                    reply = " Error procesando tu consulta. Intenta de nuevo."
-
-                        #   Convertir dict/list a string antes de procesar
-                        if isinstance(reply, (dict, list)):
-                            try:
-                                reply = json.dumps(reply, ensure_ascii=False, indent=2)
-                            except Exception:
-                                reply = str(reply)
-                        
-                        # list_asesorias 
-                        try:
-                            reply_str = str(reply)
-
-                            if (
-                                "Error executing tool list_asesorias" in reply_str
-                                and "Field required" in reply_str
-                                and "user_id" in reply_str
-                            ):
-                                #  Resolver user_id si aún no lo tenemos
-                                uid = resolved_user_id
-                                if not uid and cache:
+                                error_message = str(e)
+                                log.error(f"Error invocando agent para confirmación: {e}", exc_info=True)
+
+                                error_msg = f"Error al confirmar la acción."
+                                if error_message:
+                                    error_msg += f"\n\nDetalle: {error_message[:200]}"
+
+                                await bot.edit_message(
+                                    int(chat_id), int(msg_id),
+                                    _mdv2_escape(error_msg),
+                                    disable_web_page_preview=True
+                                )
+
+                                if cq_id:
                                     try:
-                                        b = await cache.get(f"user_by_chat:{chat_id}")
-                                        if b:
-                                            uid = b.decode("utf-8")
+                                        await bot.answer_callback(cq_id, text="Error", show_alert=True)
                                     except Exception:
                                         pass
 
-                                if not uid:
-                                    # No hay user vinculado: pide /start
-                                    reply = ("Para listar tus asesorías primero debes vincular tu cuenta.\n\n"
-                                            "Envía: /start")
-                                else:
-                                    #  Extraer start/end del mensaje de error
-                                    start = None
-                                    end = None
-
-                                    # Patrón común en el error pydantic mostrado
-                                    m_start = re.search(r"'start':\s*'([^']+)'", reply_str)
-                                    m_end   = re.search(r"'end':\s*'([^']+)'", reply_str)
-                                    if m_start: start = m_start.group(1)
-                                    if m_end:   end   = m_end.group(1)
-
-                                    # Fallback genérico a any ISO-like en el string
-                                    if not (start and end):
-                                        iso_matches = re.findall(r"\d{4}-\d{2}-\d{2}T[0-9:\-+]+", reply_str)
-                                        if len(iso_matches) >= 2:
-                                            start, end = iso_matches[0], iso_matches[1]
-
-                                    if start and end and mcp_client_getter:
-                                        try:
-                                            mcp = mcp_client_getter()
-                                            args_retry = {
-                                                "start": start,
-                                                "end": end,
-                                                "user_id": str(uid),
-                                                "idempotency_key": f"tg:{chat_id}:{int(time.time()*1000)}",
-                                            }
-                                            tool_result = await asyncio.wait_for(
-                                                mcp.call_tool("list_asesorias", args_retry, thread_id=f"tg:{chat_id}"),
-                                                timeout=max(MCP_TIMEOUT_AGGRESSIVE, 2.0)
-                                            )
-                                            reply = tool_result.get("message") if isinstance(tool_result, dict) else str(tool_result)
-                                        except Exception as e:
-                                            log.warning(f"Retry list_asesorias with user_id failed: {e}")
-                                            # dejamos reply con el error original si el retry falla
-                                    else:
-                                        # Si no tenemos fechas, dejamos el error original
-                                        pass
-                        except Exception as e:
-                            log.warning(f"HOTFIX list_asesorias failed: {e}")
-                        #  /HOTFIX list_asesorias 
+                                return {"ok": True}
+                else:
+                    # Usuario canceló - invocar al agent para que limpie el confirm_store
+                    thread_id = pending_action.get("thread_id") or f"tg:{chat_id}"
+                    if agent_getter:
+                        agent = agent_getter()
+                        if agent:
+                            try:
+                                # Invocar con "no" para que el agent cancele (con timeout corto)
+                                mark_side_effect("agent")
+                                await asyncio.wait_for(
+                                    agent.invoke("no", thread_id=thread_id),
+                                    timeout=5  # Solo limpia cache, no necesita mucho tiempo
+                                )
+                            except asyncio.TimeoutError:
+                                log.warning(f"Timeout invocando agent para cancelación (thread_id={thread_id})")
+                            except Exception as e:
+                                log.warning(f"Error invocando agent para cancelación: {e}")
 
-                        # En modo relajado no se fuerza dominio; _enforce_domain_reply será no-op
-                        final_reply = _enforce_domain_reply(text, reply)
-                        
-                        #  Primero intenta si es confirmación con botones Sí/No
-                        try:
-                            confirm_sent = await _send_confirm_message(chat_id, final_reply, thread_id=f"tg:{chat_id}")
-                            if confirm_sent:
-                                return {"ok": True}  # Ya enviamos confirmación con botones
-                        except Exception as e:
-                            log.warning(f"CINAP_CONFIRM render failed: {e}")
-                        
-                        #  Si no es confirmación, intenta si hay lista CINAP
+                    action_desc = pending_action.get("action_description", "la acción")
+                    cancel_msg = f"{action_desc.capitalize()} cancelada."
+
+                    await bot.edit_message(
+                        int(chat_id), int(msg_id),
+                        _mdv2_escape(cancel_msg),
+                        disable_web_page_preview=True
+                    )
+
+                    if cq_id:
                         try:
-                            rendered = await _send_list_message(chat_id, final_reply, user_role=role_name)
-                            if rendered:
-                                return {"ok": True}
-                        except Exception as e:
-                            log.warning(f"CINAP_LIST render failed: {e}")
-                        
-                        # Si no es lista ni confirmación, enviamos como texto normal:
-                        safe_reply_fast = _mdv2_escape(final_reply)
-                        if len(safe_reply_fast) > 4000:
-                            for part in _chunk(safe_reply_fast, 3900):
-                                await bot.send_message(chat_id, part, disable_web_page_preview=True, allow_sending_without_reply=True)
-                        else:
-                            await bot.send_message(chat_id, safe_reply_fast, disable_web_page_preview=True, allow_sending_without_reply=True)
+                            await bot.answer_callback(cq_id, text="Cancelado")
+                        except Exception:
+                            pass
 
-                    except Exception as e:
-                        log.error(f"Error procesando texto: {e}")
-                        await bot.send_message(chat_id, "Error procesando mensaje")
-                    return {"ok": True}
+                # Limpiar la acción pendiente del cache local
+                try:
+                    if cache and key:
+                        await cache.delete(key)
+                except Exception as e:
+                    log.warning(f"Error limpiando pending_key: {e}")
+
+                return {"ok": True}
+                # Limpiar la acción pendiente del cache
+                try:
+                    if cache:
+                        await cache.delete(f"list_state:{key}")
+                except Exception:
+                    pass
+
+                return {"ok": True}
+
+            # Paginación
+            if data.startswith("LPG|"):
+                _, key, page_str = data.split("|", 2)
+                state = await _load_list_state(key) or {"items": [], "kind": ""}
+                items = state.get("items", [])
+                kind  = state.get("kind", "")
+                page  = max(0, int(page_str))
+
+                # Log para debugging
+                log.info(f"Paginación - kind recibido: '{kind}', página: {page}")
+
+                # Usar title=None para que se aplique la traducción automática
+                human_readable = _render_page_text(items, page, PAGE_SIZE_DEFAULT, kind=kind, title=None)
+                text = _mdv2_escape(human_readable)
+                user_role = (await _cached_identity(chat_id) or {}).get("role")
+                kb   = _build_list_keyboard(items, key, page, PAGE_SIZE_DEFAULT, kind, user_role=user_role)
+
+                await bot.edit_message(int(chat_id), int(msg_id), text, disable_web_page_preview=True, reply_markup=kb)
+
+                if cq_id:
+                    try:
+                        await bot.answer_callback(cq_id)
+                    except Exception:
+                            pass
+                return {"ok": True}
+
+
+                # Ver detalle
+
+            elif data.startswith("LIT|"):
+                _, key, idx_str = data.split("|", 2)
+                state = await _load_list_state(key) or {"items": [], "kind": ""}
+                items = state.get("items", [])
+                idx   = int(idx_str)
+                it    = items[idx] if 0 <= idx < len(items) else {}
+
+                title = _title_of(it)
+                sub   = _subtitle_of(it)
+
+                detail_lines = [title] if title else []
+                if sub:
+                    detail_lines.append(sub)
+                when_str = _format_item_when(it)
+                if when_str:
+                    detail_lines.append(when_str)
+                detail_text = "\n".join(detail_lines) or "Sin detalles"
+
+                await bot.send_message(
+                    int(chat_id),
+                    _mdv2_escape(detail_text),
+                    disable_web_page_preview=True,
+                    allow_sending_without_reply=True
+                )
 
-            # Callback Query: paginación/ítems de listas CINAP
-            if cbq:
-                chat_id = cbq.get("message", {}).get("chat", {}).get("id")
-                msg_id  = cbq.get("message", {}).get("message_id")
-                data    = cbq.get("data") or ""
-                cq_id   = cbq.get("id")
-                # corta el spinner al toque
                 if cq_id:
                     try:
-                        await bot.answer_callback(cq_id, text="Procesando...")
+                        await bot.answer_callback(cq_id)
                     except Exception:
                         pass
+                return {"ok": True}
 
-                resolved_user_id = None
-                tg_user_id = (cbq.get("from") or {}).get("id")
-                if chat_id is not None:
+
+                # Confirmar asesoría
+            elif data.startswith("LCONFIRM|"):
+                _, key, idx_str = data.split("|", 2)
+                state = await _load_list_state(key) or {"items": [], "kind": ""}
+                items = state.get("items", [])
+                kind  = state.get("kind", "")
+                idx   = int(idx_str)
+                it    = items[idx] if 0 <= idx < len(items) else {}
+
+                #  Confirmar en BD
+                asesoria_id = (it.get("meta") or {}).get("id") or it.get("asesoria_id") or it.get("id")
+                repo_events = None
+                try:
+                    from app.interface_adapters.gateways.db.sqlalchemy_calendar_events_repo import SqlAlchemyCalendarEventsRepo
+                    repo_events = SqlAlchemyCalendarEventsRepo(session, cache)
+                    if asesoria_id:
+                        await repo_events.mark_confirmed(str(asesoria_id))
+                except Exception as e:
+                    log.warning(f"mark_confirmed failed: {e}")
+
+                # Preparar datos para RSVP en Google Calendar del usuario autenticado
+                meta            = it.get("meta") or {}
+                # Aunque tengas calendarId del organizador, para RSVP marcamos la copia del USUARIO => "primary"
+                event_id        = (
+                    meta.get("google_event_id")
+                    or meta.get("event_id")
+                    or meta.get("eventId")
+                    or meta.get("calendar_event_id")
+                    or meta.get("calendarEventId")
+                    or meta.get("provider_event_id")
+                    or meta.get("providerEventId")
+                )
+                attendee_email  = (
+                    meta.get("email")
+                    or meta.get("student_email")
+                    or meta.get("attendee_email")
+                    or meta.get("docente_email")
+                    or meta.get("teacher_email")
+                    or meta.get("usuario_email")
+                )
+                organizer_usuario_id = (
+                    meta.get("organizer_usuario_id")
+                    or meta.get("organizerUsuarioId")
+                    or meta.get("organizer_user_id")
+                )
+
+                if asesoria_id and (not event_id or not attendee_email or not organizer_usuario_id):
                     try:
-                        resolved_user_id = await _resolve_and_cache_user_id(
-                            session, cache,
-                            chat_id=chat_id,
-                            telegram_user_id=tg_user_id,
-                            force_refresh=True,
-                        )
+                        if repo_events is None:
+                            from app.interface_adapters.gateways.db.sqlalchemy_calendar_events_repo import SqlAlchemyCalendarEventsRepo
+                            repo_events = SqlAlchemyCalendarEventsRepo(session, cache)
+                        extra_meta = await repo_events.get_calendar_payload(str(asesoria_id))
+                        if extra_meta:
+                            event_id = event_id or extra_meta.get("calendar_event_id")
+                            attendee_email = attendee_email or extra_meta.get("docente_email")
+                            organizer_usuario_id = organizer_usuario_id or extra_meta.get("organizer_usuario_id")
                     except Exception as e:
-                        log.warning(f"resolve user_id en callback failed: {e}")
-                if not resolved_user_id:
+                        log.warning(f"calendar payload lookup failed: {e}")
+
+                # Resolver usuario vinculado a este chat (para usar sus credenciales Google)
+                resolved_user_id = identity["user_id"] if identity else None
+                role_name = identity.get("role") if identity else None
+                try:
+                    log.info(f"Callback confirm role={role_name} user_id={resolved_user_id} event_id={event_id}")
+                except Exception:
+                    pass
+                if not _role_allows_confirm(role_name):
+                    await bot.send_message(
+                        int(chat_id),
+                        _mdv2_escape(" Solo los docentes pueden confirmar esta asesoría desde Telegram."),
+                        disable_web_page_preview=True,
+                        allow_sending_without_reply=True
+                    )
                     if cq_id:
                         try:
-                            await bot.answer_callback(cq_id, text="Vincula tu cuenta")
+                            await bot.answer_callback(cq_id, text="Sin permisos")
                         except Exception:
                             pass
-                    if chat_id is not None:
-                        await _send_link_required(int(chat_id))
                     return {"ok": True}
 
-                try:
-                    # Handler para confirmaciones con botones Sí/No
-                    if data.startswith("CONF_YES|") or data.startswith("CONF_NO|"):
-                        is_yes = data.startswith("CONF_YES|")
-                        key = data.split("|", 1)[1]
-                        
-                        # Cargar la acción pendiente
-                        pending_action = await _load_list_state(key)
-                        
-                        if not pending_action:
-                            await bot.edit_message(
-                                int(chat_id), int(msg_id),
-                                _mdv2_escape("Esta confirmación ha expirado. Intenta de nuevo."),
-                                disable_web_page_preview=True
+                calendar_user_id = str(resolved_user_id) if resolved_user_id else None
+
+                g_ok = False
+                if event_id and attendee_email and calendar_user_id:
+                    try:
+                        #  Obtener refresh token del usuario para Google
+                        try:
+                            from app.interface_adapters.gateways.db.sqlalchemy_user_repo import SqlAlchemyUserRepo
+                            oauth_repo = SqlAlchemyUserRepo(session, default_role_id=None)
+                            refresh_token = await oauth_repo.get_refresh_token_by_usuario_id(
+                                str(calendar_user_id), provider="google"
                             )
-                            if cq_id:
-                                try:
-                                    await bot.answer_callback(cq_id, text="Confirmación expirada")
-                                except Exception:
-                                    pass
-                            return {"ok": True}
-                        
-                        if is_yes:
-                            # Usuario confirmó - invocar al agent con "sí" para que use su fastpath
-                            thread_id = pending_action.get("thread_id") or f"tg:{chat_id}"
-                            
-                            if not agent_getter:
-                                error_message = "Agent getter no está configurado"
-                                log.error(error_message)
-                            else:
-                                agent = agent_getter()
-                                if not agent:
-                                    error_message = "No se pudo obtener instancia del agent"
-                                    log.error("agent_getter() retornó None")
-                                else:
-                                    # Actualizar mensaje para mostrar que se está procesando
-                                    await bot.edit_message(
-                                        int(chat_id), int(msg_id),
-                                        _mdv2_escape("Procesando..."),
-                                        disable_web_page_preview=True
-                                    )
-                                    
-                                    try:
-                                        # Invocar al agent con "sí" - el agent usará su fastpath de confirmación
-                                        log.info(f"Invocando agent con confirmación para thread_id: {thread_id}")
-                                        result = await asyncio.wait_for(
-                                            agent.invoke("sí", thread_id=thread_id),
-                                            timeout=AGENT_TIMEOUT
-                                        )
-                                        
-                                        # Actualizar mensaje con resultado
-                                        success_msg = _mdv2_escape(result or "✅ Confirmado exitosamente")
-                                        await bot.edit_message(
-                                            int(chat_id), int(msg_id),
-                                            success_msg,
-                                            disable_web_page_preview=True
-                                        )
-                                        
-                                        if cq_id:
-                                            try:
-                                                await bot.answer_callback(cq_id, text="✅ Confirmado")
-                                            except Exception:
-                                                pass
-                                        
-                                        # Limpiar la acción pendiente del cache local
-                                        try:
-                                            if cache and key:
-                                                await cache.delete(key)
-                                        except Exception as e:
-                                            log.warning(f"Error limpiando cache: {e}")
-                                        
-                                        return {"ok": True}
-                                        
-                                    except asyncio.TimeoutError:
-                                        error_message = "Timeout confirmando acción"
-                                        log.error(f"Timeout al invocar agent para confirmación")
-                                    except Exception as e:
-                                        error_message = str(e)
-                                        log.error(f"Error invocando agent para confirmación: {e}", exc_info=True)
-                                        
-                                        error_msg = f"Error al confirmar la acción."
-                                        if error_message:
-                                            error_msg += f"\n\nDetalle: {error_message[:200]}"
-                                        
-                                        await bot.edit_message(
-                                            int(chat_id), int(msg_id),
-                                            _mdv2_escape(error_msg),
-                                            disable_web_page_preview=True
-                                        )
-                                        
-                                        if cq_id:
-                                            try:
-                                                await bot.answer_callback(cq_id, text="Error", show_alert=True)
-                                            except Exception:
-                                                pass
-                                        
-                                        return {"ok": True}
+                        except Exception as e:
+                            refresh_token = None
+                            log.warning(f"get_refresh_token_by_usuario_id failed: {e}")
+
+                        if not refresh_token:
+                            log.info("Usuario sin refresh token de Google: no se puede marcar RSVP")
                         else:
-                            # Usuario canceló - invocar al agent para que limpie el confirm_store
-                            thread_id = pending_action.get("thread_id") or f"tg:{chat_id}"
-                            if agent_getter:
-                                agent = agent_getter()
-                                if agent:
-                                    try:
-                                        # Invocar con "no" para que el agent cancele (con timeout corto)
-                                        await asyncio.wait_for(
-                                            agent.invoke("no", thread_id=thread_id),
-                                            timeout=5  # Solo limpia cache, no necesita mucho tiempo
-                                        )
-                                    except asyncio.TimeoutError:
-                                        log.warning(f"Timeout invocando agent para cancelación (thread_id={thread_id})")
-                                    except Exception as e:
-                                        log.warning(f"Error invocando agent para cancelación: {e}")
-                            
-                            action_desc = pending_action.get("action_description", "la acción")
-                            cancel_msg = f"{action_desc.capitalize()} cancelada."
-                            
-                            await bot.edit_message(
-                                int(chat_id), int(msg_id),
-                                _mdv2_escape(cancel_msg),
-                                disable_web_page_preview=True
+                            # Llamar a GoogleCalendarClient autenticado como el usuario
+                            from app.interface_adapters.gateways.calendar.google_calendar_client import GoogleCalendarClient
+                            gclient = GoogleCalendarClient(
+                                client_id=os.environ.get("GOOGLE_CLIENT_ID", ""),
+                                client_secret=os.environ.get("GOOGLE_CLIENT_SECRET", ""),
+                                # Este getter se usa internamente por el cliente; devolvemos el token del usuario resuelto
+                                get_refresh_token_by_usuario_id=lambda uid: refresh_token if str(uid) == str(calendar_user_id) else None,
+                                invalidate_refresh_token_by_usuario_id=oauth_repo.invalidate_refresh_token,
                             )
-                            
-                            if cq_id:
-                                try:
-                                    await bot.answer_callback(cq_id, text="Cancelado")
-                                except Exception:
-                                    pass
-                        
-                        # Limpiar la acción pendiente del cache local
-                        try:
-                            if cache and key:
-                                await cache.delete(key)
-                        except Exception as e:
-                            log.warning(f"Error limpiando pending_key: {e}")
-                        
-                        return {"ok": True}
-                        # Limpiar la acción pendiente del cache
-                        try:
-                            if cache:
-                                await cache.delete(f"list_state:{key}")
-                        except Exception:
-                            pass
-                        
-                        return {"ok": True}
-                    
-                    # Paginación
-                    if data.startswith("LPG|"):
-                        _, key, page_str = data.split("|", 2)
-                        state = await _load_list_state(key) or {"items": [], "kind": ""}
-                        items = state.get("items", [])
-                        kind  = state.get("kind", "")
-                        page  = max(0, int(page_str))
-
-                        # Log para debugging
-                        log.info(f"Paginación - kind recibido: '{kind}', página: {page}")
-
-                        # Usar title=None para que se aplique la traducción automática
-                        human_readable = _render_page_text(items, page, PAGE_SIZE_DEFAULT, kind=kind, title=None)
-                        text = _mdv2_escape(human_readable)
-                        user_role = await _get_role_cached(chat_id=chat_id)
-                        kb   = _build_list_keyboard(items, key, page, PAGE_SIZE_DEFAULT, kind, user_role=user_role)
-
-                        await bot.edit_message(int(chat_id), int(msg_id), text, disable_web_page_preview=True, reply_markup=kb)
-
-                        if cq_id:
-                            try:
-                                await bot.answer_callback(cq_id)
-                            except Exception:
-                                    pass
-                        return {"ok": True}
 
-                        
-                        # Ver detalle
-                        
-                    elif data.startswith("LIT|"):
-                        _, key, idx_str = data.split("|", 2)
-                        state = await _load_list_state(key) or {"items": [], "kind": ""}
-                        items = state.get("items", [])
-                        idx   = int(idx_str)
-                        it    = items[idx] if 0 <= idx < len(items) else {}
-
-                        title = _title_of(it)
-                        sub   = _subtitle_of(it)
-
-                        detail_lines = [title] if title else []
-                        if sub:
-                            detail_lines.append(sub)
-                        when_str = _format_item_when(it)
-                        if when_str:
-                            detail_lines.append(when_str)
-                        detail_text = "\n".join(detail_lines) or "Sin detalles"
-
-                        await bot.send_message(
-                            int(chat_id),
-                            _mdv2_escape(detail_text),
-                            disable_web_page_preview=True,
-                            allow_sending_without_reply=True
-                        )
+                            # Marcamos el RSVP en la COPIA del usuario
+                            await gclient.set_attendee_response(
+                                usuario_id=str(calendar_user_id),   # importante: que el cliente cargue las credenciales de este usuario
+                                calendar_id="primary",
+                                event_id=str(event_id),
+                                attendee_email=str(attendee_email),
+                                response="accepted",                # {'accepted','declined','tentative'}
+                            )
+                            g_ok = True
 
-                        if cq_id:
-                            try:
-                                await bot.answer_callback(cq_id)
-                            except Exception:
-                                pass
-                        return {"ok": True}
+                    except Exception as e:
+                        log.warning(f"Google RSVP accept failed: {e}")
 
-                        
-                        # Confirmar asesoría
-                    elif data.startswith("LCONFIRM|"):
-                        _, key, idx_str = data.split("|", 2)
-                        state = await _load_list_state(key) or {"items": [], "kind": ""}
-                        items = state.get("items", [])
-                        kind  = state.get("kind", "")
-                        idx   = int(idx_str)
-                        it    = items[idx] if 0 <= idx < len(items) else {}
-
-                        #  Confirmar en BD
-                        asesoria_id = (it.get("meta") or {}).get("id") or it.get("asesoria_id") or it.get("id")
-                        repo_events = None
-                        try:
-                            from app.interface_adapters.gateways.db.sqlalchemy_calendar_events_repo import SqlAlchemyCalendarEventsRepo
-                            repo_events = SqlAlchemyCalendarEventsRepo(session, cache)
-                            if asesoria_id:
-                                await repo_events.mark_confirmed(str(asesoria_id))
-                        except Exception as e:
-                            log.warning(f"mark_confirmed failed: {e}")
-
-                        # Preparar datos para RSVP en Google Calendar del usuario autenticado
-                        meta            = it.get("meta") or {}
-                        # Aunque tengas calendarId del organizador, para RSVP marcamos la copia del USUARIO => "primary"
-                        event_id        = (
-                            meta.get("google_event_id")
-                            or meta.get("event_id")
-                            or meta.get("eventId")
-                            or meta.get("calendar_event_id")
-                            or meta.get("calendarEventId")
-                            or meta.get("provider_event_id")
-                            or meta.get("providerEventId")
-                        )
-                        attendee_email  = (
-                            meta.get("email")
-                            or meta.get("student_email")
-                            or meta.get("attendee_email")
-                            or meta.get("docente_email")
-                            or meta.get("teacher_email")
-                            or meta.get("usuario_email")
-                        )
-                        organizer_usuario_id = (
-                            meta.get("organizer_usuario_id")
-                            or meta.get("organizerUsuarioId")
-                            or meta.get("organizer_user_id")
-                        )
+                #  Mensaje al usuario
+                detalle = it.get("title") or "Asesoría"
+                confirm_lines = [detalle or "Asesoría", "Estado: Confirmada"]
+                if g_ok:
+                    confirm_lines.append("Confirmado también en tu Google Calendar.")
+                else:
+                    confirm_lines.append("No pude actualizar tu Google Calendar. Vincula tu cuenta o vuelve a intentarlo.")
+                msg = _mdv2_escape("\n".join(confirm_lines))
+
+                await bot.send_message(
+                    int(chat_id),
+                    text=msg,
+                    disable_web_page_preview=True,
+                    allow_sending_without_reply=True
+                )
 
-                        if asesoria_id and (not event_id or not attendee_email or not organizer_usuario_id):
-                            try:
-                                if repo_events is None:
-                                    from app.interface_adapters.gateways.db.sqlalchemy_calendar_events_repo import SqlAlchemyCalendarEventsRepo
-                                    repo_events = SqlAlchemyCalendarEventsRepo(session, cache)
-                                extra_meta = await repo_events.get_calendar_payload(str(asesoria_id))
-                                if extra_meta:
-                                    event_id = event_id or extra_meta.get("calendar_event_id")
-                                    attendee_email = attendee_email or extra_meta.get("docente_email")
-                                    organizer_usuario_id = organizer_usuario_id or extra_meta.get("organizer_usuario_id")
-                            except Exception as e:
-                                log.warning(f"calendar payload lookup failed: {e}")
+                if cq_id:
+                    try:
+                        await bot.answer_callback(cq_id, text="✅ Confirmada")
+                    except Exception:
+                        pass
 
-                        # Resolver usuario vinculado a este chat (para usar sus credenciales Google)
-                        resolved_user_id = await _get_user_id_cached(chat_id)
-                        if not resolved_user_id:
-                            try:
-                                # Intenta resolver y cachear desde DB si no estaba en cache
-                                tg_user_id = (cbq.get("from") or {}).get("id")
-                                resolved_user_id = await _resolve_and_cache_user_id(
-                                    session, cache,
-                                    chat_id=chat_id,
-                                    telegram_user_id=tg_user_id,
-                                    force_refresh=True,
-                                )
-                            except Exception as e:
-                                log.warning(f"resolve user_id on LCONFIRM failed: {e}")
+                return {"ok": True}
+
+                # Cancelar asesoría
+            elif data.startswith("LCANCEL|"):
+                _, key, idx_str = data.split("|", 2)
+                state = await _load_list_state(key) or {"items": [], "kind": ""}
+                items = state.get("items", [])
+                kind  = state.get("kind", "")
+                idx   = int(idx_str)
+                it    = items[idx] if 0 <= idx < len(items) else {}
+
+                asesoria_id = (it.get("meta") or {}).get("id") or it.get("asesoria_id") or it.get("id")
+                cupo_id     = (it.get("meta") or {}).get("cupo_id") or (it.get("meta") or {}).get("slot_id")
+                meta        = it.get("meta") or {}
+                event_id = (
+                    meta.get("google_event_id")
+                    or meta.get("event_id")
+                    or meta.get("eventId")
+                    or meta.get("calendar_event_id")
+                    or meta.get("calendarEventId")
+                    or meta.get("provider_event_id")
+                    or meta.get("providerEventId")
+                )
+                attendee_email = (
+                    meta.get("email")
+                    or meta.get("student_email")
+                    or meta.get("attendee_email")
+                    or meta.get("docente_email")
+                    or meta.get("teacher_email")
+                    or meta.get("usuario_email")
+                )
+                organizer_usuario_id = (
+                    meta.get("organizer_usuario_id")
+                    or meta.get("organizerUsuarioId")
+                    or meta.get("organizer_user_id")
+                )
 
-                        role_name = await _get_role_cached(
-                            chat_id=chat_id,
-                            user_id=str(resolved_user_id) if resolved_user_id else None,
-                            telegram_user_id=(cbq.get("from") or {}).get("id")
-                        )
+                ok_db = True
+                repo_events = None
+                try:
+                    from app.interface_adapters.gateways.db.sqlalchemy_calendar_events_repo import SqlAlchemyCalendarEventsRepo
+                    repo_events = SqlAlchemyCalendarEventsRepo(session, cache)
+                    if asesoria_id and cupo_id:
+                        await repo_events.delete_asesoria_and_mark_cancelled(str(asesoria_id), cupo_id=str(cupo_id))
+                    elif asesoria_id:
+                        await repo_events.update_event_state(str(asesoria_id), "CANCELADA")
+                    else:
+                        ok_db = False
+                except Exception as e:
+                    log.warning(f"cancel failed: {e}")
+                    ok_db = False
+
+                if asesoria_id and (not event_id or not attendee_email or not organizer_usuario_id):
+                    try:
+                        repo_for_meta = repo_events or SqlAlchemyCalendarEventsRepo(session, cache)
+                        extra_meta = await repo_for_meta.get_calendar_payload(str(asesoria_id))
+                        if extra_meta:
+                            event_id = event_id or extra_meta.get("calendar_event_id")
+                            attendee_email = attendee_email or extra_meta.get("docente_email")
+                            organizer_usuario_id = organizer_usuario_id or extra_meta.get("organizer_usuario_id")
+                    except Exception as e:
+                        log.warning(f"calendar payload lookup failed (cancel): {e}")
+
+                # identidad ya resuelta al inicio del callback
+                resolved_user_id = identity["user_id"] if identity else None
+                role_name = identity.get("role") if identity else None
+                try:
+                    log.info(f"Callback cancel role={role_name} user_id={resolved_user_id} event_id={event_id} organizer={organizer_usuario_id}")
+                except Exception:
+                    pass
+                if not _role_allows_cancel(role_name):
+                    await bot.send_message(
+                        int(chat_id),
+                        _mdv2_escape(" No tienes permiso para cancelar esta asesoría desde Telegram."),
+                        disable_web_page_preview=True,
+                        allow_sending_without_reply=True
+                    )
+                    if cq_id:
                         try:
-                            log.info(f"Callback confirm role={role_name} user_id={resolved_user_id} event_id={event_id}")
+                            await bot.answer_callback(cq_id, text="Sin permisos")
                         except Exception:
                             pass
-                        if not _role_allows_confirm(role_name):
-                            await bot.send_message(
-                                int(chat_id),
-                                _mdv2_escape(" Solo los docentes pueden confirmar esta asesoría desde Telegram."),
-                                disable_web_page_preview=True,
-                                allow_sending_without_reply=True
-                            )
-                            if cq_id:
-                                try:
-                                    await bot.answer_callback(cq_id, text="Sin permisos")
-                                except Exception:
-                                    pass
-                            return {"ok": True}
+                    return {"ok": True}
 
-                        calendar_user_id = str(resolved_user_id) if resolved_user_id else None
+                norm_role = _normalize_role_name(role_name)
+                acting_as_organizer = norm_role in {"advisor", "admin"}
+                calendar_user_id = None
+                if norm_role == "teacher":
+                    calendar_user_id = str(resolved_user_id) if resolved_user_id else None
+                elif acting_as_organizer:
+                    calendar_user_id = str(organizer_usuario_id) if organizer_usuario_id else None
 
-                        g_ok = False
-                        if event_id and attendee_email and calendar_user_id:
+                g_ok = False
+                if event_id and calendar_user_id:
+                    try:
+                        from app.interface_adapters.gateways.calendar.google_calendar_client import GoogleCalendarClient
+                        if acting_as_organizer:
                             try:
-                                #  Obtener refresh token del usuario para Google
+                                from app.interface_adapters.gateways.db.sqlalchemy_user_repo import SqlAlchemyUserRepo
+                                oauth_repo = SqlAlchemyUserRepo(session, default_role_id=None)
+                                refresh_token = await oauth_repo.get_refresh_token_by_usuario_id(str(calendar_user_id))
+                            except Exception as e:
+                                refresh_token = None
+                                log.warning(f"get_refresh_token_by_usuario_id (cancel organizer) failed: {e}")
+                            if refresh_token:
+                                gclient = GoogleCalendarClient(
+                                    client_id=os.environ.get("GOOGLE_CLIENT_ID", ""),
+                                    client_secret=os.environ.get("GOOGLE_CLIENT_SECRET", ""),
+                                    get_refresh_token_by_usuario_id=lambda uid: refresh_token if str(uid) == str(calendar_user_id) else None,
+                                invalidate_refresh_token_by_usuario_id=oauth_repo.invalidate_refresh_token,
+                                )
+                                await gclient.delete_event(
+                                    organizer_usuario_id=str(calendar_user_id),
+                                    event_id=str(event_id),
+                                )
+                                g_ok = True
+                        else:
+                            if attendee_email:
                                 try:
                                     from app.interface_adapters.gateways.db.sqlalchemy_user_repo import SqlAlchemyUserRepo
                                     oauth_repo = SqlAlchemyUserRepo(session, default_role_id=None)
-                                    refresh_token = await oauth_repo.get_refresh_token_by_usuario_id(
-                                        str(calendar_user_id), provider="google"
-                                    )
+                                    refresh_token = await oauth_repo.get_refresh_token_by_usuario_id(str(calendar_user_id))
                                 except Exception as e:
                                     refresh_token = None
-                                    log.warning(f"get_refresh_token_by_usuario_id failed: {e}")
-
-                                if not refresh_token:
-                                    log.info("Usuario sin refresh token de Google: no se puede marcar RSVP")
-                                else:
-                                    # Llamar a GoogleCalendarClient autenticado como el usuario
-                                    from app.interface_adapters.gateways.calendar.google_calendar_client import GoogleCalendarClient
+                                    log.warning(f"get_refresh_token_by_usuario_id (cancel) failed: {e}")
+                                if refresh_token:
                                     gclient = GoogleCalendarClient(
                                         client_id=os.environ.get("GOOGLE_CLIENT_ID", ""),
                                         client_secret=os.environ.get("GOOGLE_CLIENT_SECRET", ""),
-                                        # Este getter se usa internamente por el cliente; devolvemos el token del usuario resuelto
                                         get_refresh_token_by_usuario_id=lambda uid: refresh_token if str(uid) == str(calendar_user_id) else None,
-                                        invalidate_refresh_token_by_usuario_id=oauth_repo.invalidate_refresh_token,
+                                invalidate_refresh_token_by_usuario_id=oauth_repo.invalidate_refresh_token,
                                     )
-
-                                    # Marcamos el RSVP en la COPIA del usuario
                                     await gclient.set_attendee_response(
-                                        usuario_id=str(calendar_user_id),   # importante: que el cliente cargue las credenciales de este usuario
+                                        usuario_id=str(calendar_user_id),
                                         calendar_id="primary",
                                         event_id=str(event_id),
                                         attendee_email=str(attendee_email),
-                                        response="accepted",                # {'accepted','declined','tentative'}
+                                        response="declined",
                                     )
                                     g_ok = True
+                    except Exception as e:
+                        log.warning(f"Google cancel operation failed: {e}")
+
+                    # Actualiza el +�tem en la lista y re-renderiza
+                if 0 <= idx < len(items):
+                    items[idx]["estado"] = "CANCELADA"
+                    items[idx]["status"] = "CANCELADA"
+                    state["items"] = items
+                    await _save_list_state(key, state)
+
+                page = 0  # si no llevas tracking de página
+                human_readable = _render_page_text(items, page, PAGE_SIZE_DEFAULT, kind=kind, title=state.get("kind"))
+                user_role = (await _cached_identity(chat_id) or {}).get("role")
+                kb   = _build_list_keyboard(items, key, page, PAGE_SIZE_DEFAULT, kind, user_role=user_role)
+                    # feedback rápido al tap
+                if cq_id:
+                    try:
+                        await bot.answer_callback(cq_id, text=" Cancelada")
+                    except Exception:
+                        pass
 
-                            except Exception as e:
-                                log.warning(f"Google RSVP accept failed: {e}")
-
-                        #  Mensaje al usuario
-                        detalle = it.get("title") or "Asesoría"
-                        confirm_lines = [detalle or "Asesoría", "Estado: Confirmada"]
-                        if g_ok:
-                            confirm_lines.append("Confirmado también en tu Google Calendar.")
-                        else:
-                            confirm_lines.append("No pude actualizar tu Google Calendar. Vincula tu cuenta o vuelve a intentarlo.")
-                        msg = _mdv2_escape("\n".join(confirm_lines))
-
-                        await bot.send_message(
-                            int(chat_id),
-                            text=msg,
-                            disable_web_page_preview=True,
-                            allow_sending_without_reply=True
-                        )
+                    # edita el mensaje original (lista)
+                text_display = _mdv2_escape(human_readable)
+                await bot.edit_message(int(chat_id), int(msg_id), text_display, disable_web_page_preview=True, reply_markup=kb)
 
-                        if cq_id:
-                            try:
-                                await bot.answer_callback(cq_id, text="✅ Confirmada")
-                            except Exception:
-                                pass
+                    # y manda un mensaje corto (opcional)
+                detalle = it.get("title") or "Asesoría"
+                cancel_lines = [detalle or 'Asesoría', 'Estado: Cancelada']
+                if g_ok:
+                    if acting_as_organizer:
+                        cancel_lines.append('Evento eliminado de Google Calendar.')
+                    else:
+                        cancel_lines.append('Actualicé tu asistencia en Google Calendar.')
+                elif event_id:
+                    cancel_lines.append('No pude actualizar Google Calendar. Vincula tu cuenta o vuelve a intentarlo.')
+                msg = _mdv2_escape("\n".join(cancel_lines))
+
+                await bot.send_message(
+                    int(chat_id),
+                    msg,
+                    disable_web_page_preview=True,
+                    allow_sending_without_reply=True
+                )
+                return {"ok": True}
 
-                        return {"ok": True}
 
-                        # Cancelar asesoría
-                    elif data.startswith("LCANCEL|"):
-                        _, key, idx_str = data.split("|", 2)
-                        state = await _load_list_state(key) or {"items": [], "kind": ""}
-                        items = state.get("items", [])
-                        kind  = state.get("kind", "")
-                        idx   = int(idx_str)
-                        it    = items[idx] if 0 <= idx < len(items) else {}
-
-                        asesoria_id = (it.get("meta") or {}).get("id") or it.get("asesoria_id") or it.get("id")
-                        cupo_id     = (it.get("meta") or {}).get("cupo_id") or (it.get("meta") or {}).get("slot_id")
-                        meta        = it.get("meta") or {}
-                        event_id = (
-                            meta.get("google_event_id")
-                            or meta.get("event_id")
-                            or meta.get("eventId")
-                            or meta.get("calendar_event_id")
-                            or meta.get("calendarEventId")
-                            or meta.get("provider_event_id")
-                            or meta.get("providerEventId")
-                        )
-                        attendee_email = (
-                            meta.get("email")
-                            or meta.get("student_email")
-                            or meta.get("attendee_email")
-                            or meta.get("docente_email")
-                            or meta.get("teacher_email")
-                            or meta.get("usuario_email")
-                        )
-                        organizer_usuario_id = (
-                            meta.get("organizer_usuario_id")
-                            or meta.get("organizerUsuarioId")
-                            or meta.get("organizer_user_id")
-                        )
+                # Cerrar lista
+            elif data.startswith("LCLOSE|"):
+                try:
+                    await bot.edit_message(
+                        int(chat_id),
+                        int(msg_id),
+                        _mdv2_escape("Cerrado."),
+                        disable_web_page_preview=True,
+                        reply_markup={"inline_keyboard": []}
+                    )
+                except Exception:
+                    pass
+                if cq_id:
+                    try:
+                        await bot.answer_callback(cq_id, text="Cerrado")
+                    except Exception:
+                        pass
+                return {"ok": True}
 
-                        ok_db = True
-                        repo_events = None
-                        try:
-                            from app.interface_adapters.gateways.db.sqlalchemy_calendar_events_repo import SqlAlchemyCalendarEventsRepo
-                            repo_events = SqlAlchemyCalendarEventsRepo(session, cache)
-                            if asesoria_id and cupo_id:
-                                await repo_events.delete_asesoria_and_mark_cancelled(str(asesoria_id), cupo_id=str(cupo_id))
-                            elif asesoria_id:
-                                await repo_events.update_event_state(str(asesoria_id), "CANCELADA")
-                            else:
-                                ok_db = False
-                        except Exception as e:
-                            log.warning(f"cancel failed: {e}")
-                            ok_db = False
+                # Fallback
+            else:
+                await bot.send_message(int(chat_id), _mdv2_escape(f"Callback: {data}"), disable_web_page_preview=True, allow_sending_without_reply=True)
+                if cq_id:
+                    try:
+                        await bot.answer_callback(cq_id)
+                    except Exception:
+                        pass
+                return {"ok": True}
 
-                        if asesoria_id and (not event_id or not attendee_email or not organizer_usuario_id):
-                            try:
-                                repo_for_meta = repo_events or SqlAlchemyCalendarEventsRepo(session, cache)
-                                extra_meta = await repo_for_meta.get_calendar_payload(str(asesoria_id))
-                                if extra_meta:
-                                    event_id = event_id or extra_meta.get("calendar_event_id")
-                                    attendee_email = attendee_email or extra_meta.get("docente_email")
-                                    organizer_usuario_id = organizer_usuario_id or extra_meta.get("organizer_usuario_id")
-                            except Exception as e:
-                                log.warning(f"calendar payload lookup failed (cancel): {e}")
+        except Exception as e:
+            log.warning(f"Error en callback: {e}")
+            if cq_id:
+                try:
+                    await bot.answer_callback(cq_id, text=" Error")
+                except Exception:
+                    pass
+            return {"ok": True}
 
-                        resolved_user_id = await _get_user_id_cached(chat_id)
-                        if not resolved_user_id:
-                            try:
-                                tg_user_id = (cbq.get("from") or {}).get("id")
-                                resolved_user_id = await _resolve_and_cache_user_id(
-                                    session, cache,
-                                    chat_id=chat_id,
-                                    telegram_user_id=tg_user_id,
-                                    force_refresh=True,
-                                )
-                            except Exception as e:
-                                log.warning(f"resolve user_id on LCANCEL failed: {e}")
+    return {"ok": True}
 
-                        role_name = await _get_role_cached(
-                            chat_id=chat_id,
-                            user_id=str(resolved_user_id) if resolved_user_id else None,
-                            telegram_user_id=(cbq.get("from") or {}).get("id")
-                        )
-                        try:
-                            log.info(f"Callback cancel role={role_name} user_id={resolved_user_id} event_id={event_id} organizer={organizer_usuario_id}")
-                        except Exception:
-                            pass
-                        if not _role_allows_cancel(role_name):
-                            await bot.send_message(
-                                int(chat_id),
-                                _mdv2_escape(" No tienes permiso para cancelar esta asesoría desde Telegram."),
-                                disable_web_page_preview=True,
-                                allow_sending_without_reply=True
-                            )
-                            if cq_id:
-                                try:
-                                    await bot.answer_callback(cq_id, text="Sin permisos")
-                                except Exception:
-                                    pass
-                            return {"ok": True}
-
-                        norm_role = _normalize_role_name(role_name)
-                        acting_as_organizer = norm_role in {"advisor", "admin"}
-                        calendar_user_id = None
-                        if norm_role == "teacher":
-                            calendar_user_id = str(resolved_user_id) if resolved_user_id else None
-                        elif acting_as_organizer:
-                            calendar_user_id = str(organizer_usuario_id) if organizer_usuario_id else None
-
-                        g_ok = False
-                        if event_id and calendar_user_id:
-                            try:
-                                from app.interface_adapters.gateways.calendar.google_calendar_client import GoogleCalendarClient
-                                if acting_as_organizer:
-                                    try:
-                                        from app.interface_adapters.gateways.db.sqlalchemy_user_repo import SqlAlchemyUserRepo
-                                        oauth_repo = SqlAlchemyUserRepo(session, default_role_id=None)
-                                        refresh_token = await oauth_repo.get_refresh_token_by_usuario_id(str(calendar_user_id))
-                                    except Exception as e:
-                                        refresh_token = None
-                                        log.warning(f"get_refresh_token_by_usuario_id (cancel organizer) failed: {e}")
-                                    if refresh_token:
-                                        gclient = GoogleCalendarClient(
-                                            client_id=os.environ.get("GOOGLE_CLIENT_ID", ""),
-                                            client_secret=os.environ.get("GOOGLE_CLIENT_SECRET", ""),
-                                            get_refresh_token_by_usuario_id=lambda uid: refresh_token if str(uid) == str(calendar_user_id) else None,
-                                        invalidate_refresh_token_by_usuario_id=oauth_repo.invalidate_refresh_token,
-                                        )
-                                        await gclient.delete_event(
-                                            organizer_usuario_id=str(calendar_user_id),
-                                            event_id=str(event_id),
-                                        )
-                                        g_ok = True
-                                else:
-                                    if attendee_email:
-                                        try:
-                                            from app.interface_adapters.gateways.db.sqlalchemy_user_repo import SqlAlchemyUserRepo
-                                            oauth_repo = SqlAlchemyUserRepo(session, default_role_id=None)
-                                            refresh_token = await oauth_repo.get_refresh_token_by_usuario_id(str(calendar_user_id))
-                                        except Exception as e:
-                                            refresh_token = None
-                                            log.warning(f"get_refresh_token_by_usuario_id (cancel) failed: {e}")
-                                        if refresh_token:
-                                            gclient = GoogleCalendarClient(
-                                                client_id=os.environ.get("GOOGLE_CLIENT_ID", ""),
-                                                client_secret=os.environ.get("GOOGLE_CLIENT_SECRET", ""),
-                                                get_refresh_token_by_usuario_id=lambda uid: refresh_token if str(uid) == str(calendar_user_id) else None,
-                                        invalidate_refresh_token_by_usuario_id=oauth_repo.invalidate_refresh_token,
-                                            )
-                                            await gclient.set_attendee_response(
-                                                usuario_id=str(calendar_user_id),
-                                                calendar_id="primary",
-                                                event_id=str(event_id),
-                                                attendee_email=str(attendee_email),
-                                                response="declined",
-                                            )
-                                            g_ok = True
-                            except Exception as e:
-                                log.warning(f"Google cancel operation failed: {e}")
-
-                            # Actualiza el +�tem en la lista y re-renderiza
-                        if 0 <= idx < len(items):
-                            items[idx]["estado"] = "CANCELADA"
-                            items[idx]["status"] = "CANCELADA"
-                            state["items"] = items
-                            await _save_list_state(key, state)
-
-                        page = 0  # si no llevas tracking de página
-                        human_readable = _render_page_text(items, page, PAGE_SIZE_DEFAULT, kind=kind, title=state.get("kind"))
-                        user_role = await _get_role_cached(chat_id=chat_id)
-                        kb   = _build_list_keyboard(items, key, page, PAGE_SIZE_DEFAULT, kind, user_role=user_role)
-                            # feedback rápido al tap
-                        if cq_id:
-                            try:
-                                await bot.answer_callback(cq_id, text=" Cancelada")
-                            except Exception:
-                                pass
+async def _process_queued_update(update: dict) -> None:
+    """Handler de los workers: sesión y trace propios; el audio se procesa en orden."""
+    new_request()
+    set_meta(source="telegram.queue", update_id=update.get("update_id"))
+    token = _inline_audio.set(True)
+    try:
+        async with AsyncSessionLocal() as session:
+            async with astage("telegram.total"), _lanes.lane(update_chat_key(update)):
+                await _handle_update(update, session)
+    finally:
+        _inline_audio.reset(token)
+        try:
+            finalize_and_log(_BGLOGGER, {"kind": "telegram.queue"})
+        except Exception:
+            pass
 
-                            # edita el mensaje original (lista)
-                        text_display = _mdv2_escape(human_readable)
-                        await bot.edit_message(int(chat_id), int(msg_id), text_display, disable_web_page_preview=True, reply_markup=kb)
+async def start_update_workers(*, redis=None) -> None:
+    """Arranca la cola durable de updates (lifespan). TG_QUEUE_BACKEND=off la desactiva."""
+    global _update_queue, _update_pool
+    if _update_pool is not None or TG_QUEUE_BACKEND == "off":
+        return
+    if TG_QUEUE_BACKEND == "redis" and redis is not None:
+        queue = RedisStreamUpdateQueue(
+            redis, stream=TG_QUEUE_STREAM, maxlen=TG_QUEUE_MAXLEN, claim_idle_ms=TG_QUEUE_CLAIM_IDLE_MS,
+            heartbeat_ttl_s=TG_QUEUE_HEARTBEAT_TTL_S,
+        )
+    else:
+        queue = LocalUpdateQueue()
+    pool = UpdateWorkerPool(
+        queue, _process_queued_update,
+        workers=TG_QUEUE_WORKERS,
+        max_attempts=TG_QUEUE_MAX_ATTEMPTS,
+        backoff_base=TG_QUEUE_BACKOFF_BASE,
+        backoff_max=TG_QUEUE_BACKOFF_MAX,
+    )
+    await pool.start()
+    _update_queue, _update_pool = queue, pool
+    log.info(f"Cola de updates Telegram activa: backend={type(queue).__name__} workers={TG_QUEUE_WORKERS}")
+
+async def stop_update_workers() -> None:
+    global _update_queue, _update_pool
+    pool = _update_pool
+    _update_queue, _update_pool = None, None
+    if pool is not None:
+        await pool.stop()
+
+def _require_admin(req: Request):
+    dep = globals().get("require_admin")
+    if dep is None:
+        raise HTTPException(status_code=403, detail="Solo administradores")
+    return dep(req)
+
+@router.get("/queue/stats")
+async def update_queue_stats(_admin: dict = Depends(_require_admin)):
+    mcp = mcp_client_getter() if mcp_client_getter else None
+    extra = {"lanes": _lanes.stats(), "outbound": _dispatcher.stats(), "asr": _asr_scheduler.stats(),
+             "mcp": mcp.stats() if hasattr(mcp, "stats") else None}
+    if _update_pool is None:
+        return {"enabled": False, **extra}
+    return {"enabled": True, **(await _update_pool.stats()), **extra}
 
-                            # y manda un mensaje corto (opcional)
-                        detalle = it.get("title") or "Asesoría"
-                        cancel_lines = [detalle or 'Asesoría', 'Estado: Cancelada']
-                        if g_ok:
-                            if acting_as_organizer:
-                                cancel_lines.append('Evento eliminado de Google Calendar.')
-                            else:
-                                cancel_lines.append('Actualicé tu asistencia en Google Calendar.')
-                        elif event_id:
-                            cancel_lines.append('No pude actualizar Google Calendar. Vincula tu cuenta o vuelve a intentarlo.')
-                        msg = _mdv2_escape("\n".join(cancel_lines))
-
-                        await bot.send_message(
-                            int(chat_id),
-                            msg,
-                            disable_web_page_preview=True,
-                            allow_sending_without_reply=True
-                        )
-                        return {"ok": True}
+#  Webhook principal
+@router.post("/webhook")
+async def webhook(req: Request, session: AsyncSession = Depends(get_session_dep)):
+    async with astage("telegram.total"):
+        update = await req.json()
+        update_id = update.get("update_id")
 
+        if not await _claim_update(update_id):
+            log.info(f"Update {update_id} ya procesado - skipping")
+            return {"ok": True}
 
-                        # Cerrar lista
-                    elif data.startswith("LCLOSE|"):
-                        try:
-                            await bot.edit_message(
-                                int(chat_id),
-                                int(msg_id),
-                                _mdv2_escape("Cerrado."),
-                                disable_web_page_preview=True,
-                                reply_markup={"inline_keyboard": []}
-                            )
-                        except Exception:
-                            pass
-                        if cq_id:
-                            try:
-                                await bot.answer_callback(cq_id, text="Cerrado")
-                            except Exception:
-                                pass
-                        return {"ok": True}
+        set_meta(source="telegram", update_id=update_id)
 
-                        # Fallback
-                    else:
-                        await bot.send_message(int(chat_id), _mdv2_escape(f"Callback: {data}"), disable_web_page_preview=True, allow_sending_without_reply=True)
-                        if cq_id:
-                            try:
-                                await bot.answer_callback(cq_id)
-                            except Exception:
-                                pass
-                        return {"ok": True}
+        # Encolar y responder de inmediato; si la cola falla se procesa inline
+        if _update_queue is not None:
+            try:
+                async with astage("telegram.enqueue"):
+                    await _update_queue.enqueue(update)
+                return {"ok": True}
+            except Exception as e:
+                log.warning(f"No se pudo encolar update {update_id}; se procesa inline: {e}")
 
-                except Exception as e:
-                    log.warning(f"Error en callback: {e}")
-                    if cq_id:
-                        try:
-                            await bot.answer_callback(cq_id, text=" Error")
-                        except Exception:
-                            pass
-                    return {"ok": True}
+        async with _lanes.lane(update_chat_key(update)):
+            return await _handle_update(update, session)
 
-            return {"ok": True}
-        finally:
-            await _mark_update_processed(update_id)
-    return {"ok": True}
 
 
     router.close_clients = _close_shared_clients
@@ -3699,20 +3637,11 @@ async def webhook(req: Request, session: AsyncSession = Depends(get_session_dep)
 def _detect_calendar_event_intent(text: str) -> dict:
     if not text or not isinstance(text, str):
         return {"is_calendar_event": False}
-    text_lower = text.lower().strip()
-    calendar_patterns = [
-        r'\b(agendar|programar|crear)\s+(una?\s+)?(cita|asesor[íi]a|reuni[óo]n|meeting|appointment)\b',
-        r'\b(quiero|necesito|puedo)\s+(agendar|programar|una?\s+cita|una?\s+asesor[íi]a)\b',
-        r'\b(asesor[íi]a|cita|reuni[óo]n|meeting)\s+(con|para|de)\b',
-        r'\b(agenda|calendar|calendario)\b.*\b(evento|cita|asesor[íi]a)\b',
-        r'\b(disponibilidad|horario)\s+(para|de)\s+(profesor|teacher|advisor)\b'
-    ]
-    detected_intent = None
-    for i, pattern in enumerate(calendar_patterns):
-        if re.search(pattern, text_lower):
-            detected_intent = f"calendar_pattern_{i+1}"
-            break
-    if detected_intent:
+    f = intents.analyze(text.strip())
+    if f.calendar_event:
+        # Camino poco frecuente: se identifica el patrón y se extraen menciones
+        text_lower = text.lower().strip()
+        detected_intent = f"calendar_pattern_{intents.calendar_pattern_index(f.folded.strip())}"
         time_mentions = re.findall(r'\b(\d{1,2}:\d{2}|\d{1,2}\s*(?:am|pm)|mañana|tarde|hoy|mañana)\b', text_lower)
         person_mentions = re.findall(r'\bcon\s+([A-ZÁÉÍÓÚÑ][\wáéíóúñ]+(?:\s+[A-ZÁÉÍÓÚÑ][\wáéíóúñ]+)*)', text, re.U)
         return {
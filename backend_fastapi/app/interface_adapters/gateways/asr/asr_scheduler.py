@@ -0,0 +1,129 @@
+from __future__ import annotations
+import asyncio, heapq, itertools, time
+from typing import Awaitable, Callable, Optional, TypeVar
+
+from app.observability.metrics import astage
+
+T = TypeVar("T")
+
+class ASRScheduler:
+    """
+    Admisión delante del servidor ASR.
+
+    - Orden "shortest-audio-first" con envejecimiento: la clave es
+      `llegada + aging * duración`, así una nota de 5 s pasa delante de una de 60 s
+      que llegó hasta ~27 s antes (aging=0.5), pero ninguna espera indefinidamente.
+    - Concurrencia adaptativa AIMD: +1/limit por petición dentro del objetivo
+      (`base_latency_s + target_rtf * duración`); ×decrease ante 5xx/errores o
+      latencia > 2× objetivo (como máximo una vez por ventana, para no colapsar
+      por varias respuestas lentas de la misma ráfaga).
+    - Etapas separadas: `<stage>_queue_wait` (espera de cupo) y `<stage>` (servicio).
+    - `stalled()` (opcional) devuelve los segundos del servicio que no dependen del
+      ASR (p. ej. esperando la descarga que alimenta la subida); se descuentan de la
+      señal de latencia para que un origen lento no reduzca la concurrencia.
+    """
+
+    def __init__(self, *, max_concurrency: int, min_concurrency: int = 1,
+                 initial_concurrency: Optional[int] = None, target_rtf: float = 0.5,
+                 base_latency_s: float = 1.0, aging: float = 0.5, decrease: float = 0.5,
+                 error_types: tuple = (Exception,), stage: str = "asr"):
+        self._max = max(1, int(max_concurrency))
+        self._min = max(1, min(int(min_concurrency), self._max))
+        self._limit = float(min(self._max, max(self._min, initial_concurrency or self._max)))
+        self._target_rtf = target_rtf
+        self._base = base_latency_s
+        self._aging = aging
+        self._decrease = decrease
+        self._error_types = error_types
+        self._stage = stage
+        self._heap: list = []
+        self._seq = itertools.count()
+        self._inflight = 0
+        self._last_decrease = 0.0
+        self.completed = 0
+        self.errors = 0
+        self.decreases = 0
+        self.ewma_wait_ms = 0.0
+        self.ewma_service_ms = 0.0
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    def _wake(self) -> None:
+        while self._heap and self._inflight < int(self._limit):
+            _, _, fut = heapq.heappop(self._heap)
+            if fut.done():
+                continue
+            self._inflight += 1
+            fut.set_result(None)
+
+    async def _acquire(self, cost: float) -> None:
+        if not self._heap and self._inflight < int(self._limit):
+            self._inflight += 1
+            return
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._heap, (time.monotonic() + self._aging * cost, next(self._seq), fut))
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                # Se obtuvo el cupo justo al cancelar: devolverlo
+                self._inflight -= 1
+                self._wake()
+            raise
+
+    def _release(self, service_s: float, cost: float, error: bool) -> None:
+        self._inflight -= 1
+        self.completed += 1
+        target = self._base + self._target_rtf * max(cost, 1.0)
+        now = time.monotonic()
+        if error or service_s > 2 * target:
+            self.errors += int(error)
+            if now - self._last_decrease >= target:
+                self._limit = max(float(self._min), self._limit * self._decrease)
+                self._last_decrease = now
+                self.decreases += 1
+        elif service_s <= target:
+            self._limit = min(float(self._max), self._limit + 1.0 / self._limit)
+        self._wake()
+
+    async def run(self, cost: float, fn: Callable[[], Awaitable[T]], *,
+                  is_error: Optional[Callable[[T], bool]] = None,
+                  stalled: Optional[Callable[[], float]] = None) -> T:
+        """Ejecuta `fn()` cuando le toca según `cost` (segundos de audio)."""
+        cost = max(0.0, float(cost or 0.0))
+        t_wait = time.perf_counter()
+        async with astage(f"{self._stage}_queue_wait", extra={"audio_s": round(cost, 2)}):
+            await self._acquire(cost)
+        wait_ms = (time.perf_counter() - t_wait) * 1000.0
+        self.ewma_wait_ms += 0.1 * (wait_ms - self.ewma_wait_ms)
+
+        t0 = time.perf_counter()
+        error = False
+        try:
+            async with astage(self._stage):
+                result = await fn()
+            error = bool(is_error and is_error(result))
+            return result
+        except self._error_types:
+            error = True
+            raise
+        finally:
+            service_s = time.perf_counter() - t0
+            if stalled is not None:
+                service_s = max(0.0, service_s - stalled())
+            self.ewma_service_ms += 0.1 * (service_s * 1000.0 - self.ewma_service_ms)
+            self._release(service_s, cost, error)
+
+    def stats(self) -> dict:
+        return {
+            "limit": int(self._limit),
+            "inflight": self._inflight,
+            "queued": sum(1 for _, _, f in self._heap if not f.done()),
+            "completed": self.completed,
+            "errors": self.errors,
+            "decreases": self.decreases,
+            "ewma_wait_ms": round(self.ewma_wait_ms, 1),
+            "ewma_service_ms": round(self.ewma_service_ms, 1),
+        }
@@ -0,0 +1,149 @@
+from __future__ import annotations
+import asyncio, hashlib, logging, time, uuid
+from typing import AsyncIterator, Optional
+
+import httpx
+
+log = logging.getLogger(__name__)
+
+_EOF = object()
+
+class DownloadError(Exception):
+    pass
+
+async def ranged_download(client: httpx.AsyncClient, url: str, *, chunk_size: int = 16384,
+                          max_attempts: int = 3, read_timeout: float = 2.0,
+                          backoff: float = 0.2) -> AsyncIterator[bytes]:
+    """
+    Descarga en streaming. Si la conexión se corta a mitad, reanuda con
+    `Range: bytes=<offset>-` en vez de bajar todo de nuevo; si el servidor ignora
+    el Range (200 en lugar de 206) se descartan los bytes ya entregados.
+    """
+    offset = 0
+    attempt = 0
+    timeout = httpx.Timeout(read_timeout, connect=1.0)
+    while True:
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+        try:
+            async with client.stream("GET", url, headers=headers, timeout=timeout) as r:
+                if r.status_code not in (200, 206):
+                    raise DownloadError(f"descarga {r.status_code}")
+                skip = offset if (offset and r.status_code == 200) else 0
+                async for chunk in r.aiter_bytes(chunk_size):
+                    if skip:
+                        if len(chunk) <= skip:
+                            skip -= len(chunk)
+                            continue
+                        chunk, skip = chunk[skip:], 0
+                    offset += len(chunk)
+                    yield chunk
+            return
+        except (httpx.HTTPError, DownloadError) as e:
+            attempt += 1
+            if attempt >= max_attempts:
+                raise DownloadError(f"descarga fallida tras {attempt} intentos (offset={offset}): {e}") from e
+            log.warning(f"Descarga interrumpida en offset={offset} (intento {attempt}/{max_attempts}): {e}")
+            await asyncio.sleep(backoff * attempt)
+
+class BoundedPipe:
+    """
+    Productor -> consumidor con buffer acotado (`max_chunks`): la descarga no se
+    adelanta más de ese número de chunks a la subida. Calcula md5 y tamaño al paso y
+    guarda los primeros `head_bytes` para validaciones rápidas.
+    """
+    def __init__(self, source: AsyncIterator[bytes], *, max_chunks: int = 8, head_bytes: int = 4096):
+        self._source = source
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, int(max_chunks)))
+        self._head_bytes = head_bytes
+        self._task: Optional[asyncio.Task] = None
+        self._md5 = hashlib.md5()
+        self._progress = asyncio.Event()
+        self._finished = False
+        self.head = b""
+        self.size = 0
+        self.done = False
+        self.stall_s = 0.0  # tiempo que el consumidor esperó a la descarga
+        self.error: Optional[Exception] = None
+
+    async def _produce(self) -> None:
+        try:
+            async for chunk in self._source:
+                if not chunk:
+                    continue
+                self._md5.update(chunk)
+                self.size += len(chunk)
+                if len(self.head) < self._head_bytes:
+                    self.head += chunk[: self._head_bytes - len(self.head)]
+                self._progress.set()
+                await self._queue.put(chunk)
+            await self._queue.put(_EOF)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.error = e
+            await self._queue.put(e)
+        finally:
+            self._finished = True
+            self._progress.set()
+
+    def _start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._produce())
+
+    async def prime(self, min_bytes: int) -> None:
+        """Espera a tener `min_bytes` de cabecera (o el fin de la descarga) sin consumir."""
+        self._start()
+        min_bytes = min(min_bytes, self._head_bytes)
+        while len(self.head) < min_bytes and not self._finished:
+            self._progress.clear()
+            await self._progress.wait()
+
+    async def __aiter__(self):
+        self._start()
+        while True:
+            if self._queue.empty():
+                t0 = time.perf_counter()
+                item = await self._queue.get()
+                self.stall_s += time.perf_counter() - t0
+            else:
+                item = self._queue.get_nowait()
+            if item is _EOF:
+                self.done = True
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    @property
+    def md5(self) -> str:
+        return self._md5.hexdigest()
+
+    async def aclose(self) -> None:
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except BaseException:
+                pass
+
+def multipart_stream(fields: dict, *, file_field: str, filename: str, mime: str,
+                     body: AsyncIterator[bytes]) -> tuple[str, AsyncIterator[bytes]]:
+    """multipart/form-data armado a mano para poder subir el archivo desde un
+    iterador asíncrono (httpx solo acepta archivos síncronos en `files=`)."""
+    boundary = uuid.uuid4().hex
+    head = bytearray()
+    for name, value in fields.items():
+        for v in (value if isinstance(value, (list, tuple)) else [value]):
+            head += (f"--{boundary}\r\nContent-Disposition: form-data; name=\"{name}\"\r\n\r\n"
+                     f"{v}\r\n").encode("utf-8")
+    head += (f"--{boundary}\r\nContent-Disposition: form-data; name=\"{file_field}\"; "
+             f"filename=\"{filename}\"\r\nContent-Type: {mime}\r\n\r\n").encode("utf-8")
+    tail = f"\r\n--{boundary}--\r\n".encode("utf-8")
+
+    async def gen():
+        yield bytes(head)
+        async for chunk in body:
+            yield chunk
+        yield tail
+
+    return f"multipart/form-data; boundary={boundary}", gen()
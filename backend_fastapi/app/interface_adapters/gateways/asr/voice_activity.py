@@ -0,0 +1,123 @@
+from __future__ import annotations
+import io, logging, shutil, wave
+from dataclasses import dataclass
+from typing import Optional
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+try:
+    import ffmpeg
+except ImportError:
+    ffmpeg = None
+
+log = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000
+FRAME_MS = 30            # 480 muestras a 16 kHz, igual que el análisis anterior con audioop
+SILENCE_RMS = 50         # por debajo: silencio digital
+MIN_SPEECH_RMS = 200     # por debajo: energía baja (ruido de fondo)
+
+@dataclass
+class VoiceActivity:
+    status: str                      # "good" | "empty" | "too_short" | "undecodable"
+    duration_s: float = 0.0
+    speech_s: float = 0.0
+    max_rms: float = 0.0
+    start_s: float = 0.0
+    end_s: float = 0.0
+    trimmed_wav: Optional[bytes] = None
+
+    @property
+    def trimmed(self) -> bool:
+        return self.trimmed_wav is not None
+
+def available() -> bool:
+    return np is not None and ffmpeg is not None and shutil.which("ffmpeg") is not None
+
+def _pcm_from_wav(audio_bytes: bytes):
+    with wave.open(io.BytesIO(audio_bytes), "rb") as w:
+        if w.getsampwidth() != 2 or w.getnchannels() != 1 or w.getframerate() != SAMPLE_RATE:
+            return None
+        return np.frombuffer(w.readframes(w.getnframes()), dtype="<i2")
+
+def decode_pcm(audio_bytes: bytes):
+    """Audio (OGG/Opus de Telegram, WAV, …) -> int16 mono 16 kHz. Bloqueante: usar en un hilo."""
+    if audio_bytes[:4] == b"RIFF" and b"WAVE" in audio_bytes[:16]:
+        try:
+            pcm = _pcm_from_wav(audio_bytes)
+            if pcm is not None:
+                return pcm
+        except Exception:
+            pass
+    out, _ = (
+        ffmpeg.input("pipe:0")
+        .output("pipe:1", format="s16le", acodec="pcm_s16le", ac=1, ar=SAMPLE_RATE)
+        .global_args("-hide_banner", "-loglevel", "error")
+        .run(input=audio_bytes, capture_stdout=True, capture_stderr=True)
+    )
+    return np.frombuffer(out, dtype="<i2")
+
+def pcm_to_wav(pcm) -> bytes:
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(SAMPLE_RATE)
+        w.writeframes(pcm.astype("<i2", copy=False).tobytes())
+    return buf.getvalue()
+
+def frame_rms(pcm, frame: int):
+    """RMS por frame en una sola pasada vectorizada (frames sin solape; se descarta la cola)."""
+    n = len(pcm) // frame
+    if n == 0:
+        return np.zeros(0, dtype=np.float32)
+    x = pcm[: n * frame].astype(np.float32).reshape(n, frame)
+    return np.sqrt(np.einsum("ij,ij->i", x, x) / frame)
+
+def analyze_pcm(pcm, *, min_speech_s: float = 0.3, pad_s: float = 0.25,
+                min_trim_s: float = 1.0, noise_ratio: float = 3.0) -> VoiceActivity:
+    frame = SAMPLE_RATE * FRAME_MS // 1000
+    frame_s = FRAME_MS / 1000.0
+    duration = len(pcm) / SAMPLE_RATE
+    rms = frame_rms(pcm, frame)
+    if rms.size == 0:
+        return VoiceActivity("too_short", duration_s=duration)
+
+    max_rms = float(rms.max())
+    if max_rms < SILENCE_RMS:
+        return VoiceActivity("empty", duration_s=duration, max_rms=max_rms)
+
+    # Umbral adaptativo: piso de ruido (percentil 10) * noise_ratio, acotado a 1/4 del pico
+    # (notas sin pausas) y nunca bajo MIN_SPEECH_RMS
+    floor = float(np.percentile(rms, 10))
+    threshold = max(MIN_SPEECH_RMS, min(floor * noise_ratio, max_rms * 0.25))
+    active = rms >= threshold
+    # Hangover: extender cada frame con voz ~pad_s a ambos lados (cubre pausas entre palabras)
+    pad = max(1, int(round(pad_s / frame_s)))
+    voiced = np.convolve(active.astype(np.int8), np.ones(2 * pad + 1, dtype=np.int8), mode="same") > 0
+    raw_speech_s = float(active.sum()) * frame_s
+    if raw_speech_s < min_speech_s:
+        return VoiceActivity("empty", duration_s=duration, speech_s=raw_speech_s, max_rms=max_rms)
+
+    idx = np.flatnonzero(voiced)
+    start_f, end_f = int(idx[0]), int(idx[-1]) + 1
+    result = VoiceActivity(
+        "good", duration_s=duration, speech_s=raw_speech_s, max_rms=max_rms,
+        start_s=start_f * frame_s, end_s=min(duration, end_f * frame_s),
+    )
+    if duration - (result.end_s - result.start_s) >= min_trim_s:
+        result.trimmed_wav = pcm_to_wav(pcm[start_f * frame: end_f * frame])
+    return result
+
+def analyze_audio(audio_bytes: bytes, **kwargs) -> VoiceActivity:
+    """Decodifica y analiza; pensado para asyncio.to_thread."""
+    if not available():
+        return VoiceActivity("undecodable")
+    try:
+        pcm = decode_pcm(audio_bytes)
+    except Exception as e:
+        log.warning(f"No se pudo decodificar audio para VAD: {e}")
+        return VoiceActivity("undecodable")
+    return analyze_pcm(pcm, **kwargs)
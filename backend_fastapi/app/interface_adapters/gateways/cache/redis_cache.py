@@ -18,6 +18,31 @@ class RedisCache:
     async def delete(self, key: str) -> None:
         await self._r.delete(key)
 
+    async def mget(self, keys: list[str]) -> list[Optional[bytes]]:
+        if not keys:
+            return []
+        return list(await self._r.mget(keys))
+
+    async def mset(self, items: dict[str, bytes], ttl_seconds: int | None = None) -> None:
+        # MSET no acepta TTL: SETs en un pipeline sin transacción (un round-trip)
+        if not items:
+            return
+        pipe = self._r.pipeline(transaction=False)
+        for key, value in items.items():
+            if ttl_seconds:
+                pipe.set(key, value, ex=ttl_seconds)
+            else:
+                pipe.set(key, value)
+        await pipe.execute()
+
+    async def delete_many(self, keys: list[str]) -> None:
+        if keys:
+            await self._r.delete(*keys)
+
+    async def set_nx(self, key: str, value: bytes, ttl_seconds: int | None = None) -> bool:
+        ok = await self._r.set(key, value, ex=ttl_seconds or None, nx=True)
+        return bool(ok)
+
     async def acquire_lock(self, key: str, ttl_seconds: int = 10) -> bool:
         ok = await self._r.set(f"lock:{key}", b"1", ex=ttl_seconds, nx=True)
         return bool(ok)
@@ -0,0 +1,119 @@
+from __future__ import annotations
+import hashlib, json, logging, re, time
+from collections import OrderedDict
+from typing import Optional
+from app.use_cases.ports.cache_port import CachePort
+from app.observability.metrics import astage
+
+log = logging.getLogger(__name__)
+
+VERSION_KEY = "semantic:corpus_version"
+
+def normalize_query(q: str) -> str:
+    q = re.sub(r"\s+", " ", (q or "").strip().casefold())
+    return q.strip("¿?¡!.,;: ")
+
+class SemanticQueryCache:
+    """
+    Cache de respuestas de /api/search/semantic: LRU en proceso delante de CachePort.
+    Las claves incluyen la versión del corpus; subir o borrar documentos la cambia
+    (bump_version) y con eso todas las entradas previas quedan inalcanzables.
+    La versión se relee desde Redis como máximo cada `version_ttl` segundos, así
+    los aciertos del LRU no cuestan round-trips.
+    """
+    def __init__(self, cache: CachePort | None = None, *, max_items: int = 1000,
+                 ttl_seconds: int = 3600, version_ttl: float = 1.0):
+        self._cache = cache
+        self._max = max(0, int(max_items))
+        self._ttl = ttl_seconds
+        self._version_ttl = version_ttl
+        self._version = "0"
+        self._version_at = 0.0
+        self._lru: "OrderedDict[str, dict]" = OrderedDict()
+        self.hits_lru = 0
+        self.hits_redis = 0
+        self.misses = 0
+
+    async def _current_version(self) -> str:
+        if self._cache is None or time.monotonic() - self._version_at < self._version_ttl:
+            return self._version
+        try:
+            raw = await self._cache.get(VERSION_KEY)
+            self._version = raw.decode() if raw else "0"
+            self._version_at = time.monotonic()
+        except Exception as e:
+            log.warning(f"Error leyendo versión del corpus: {e}")
+        return self._version
+
+    async def bump_version(self) -> None:
+        self._version = str(time.time_ns())
+        self._version_at = time.monotonic()
+        self._lru.clear()
+        if self._cache is None:
+            return
+        try:
+            await self._cache.set(VERSION_KEY, self._version.encode())
+        except Exception as e:
+            log.warning(f"Error actualizando versión del corpus: {e}")
+
+    @staticmethod
+    def _digest(q: str, kinds, top_k: int, probes: int, mode: str) -> str:
+        raw = json.dumps({
+            "q": normalize_query(q),
+            "kinds": sorted(kinds) if kinds else None,
+            "top_k": int(top_k),
+            "probes": int(probes),
+            "mode": mode,
+        }, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _lru_put(self, key: str, value: dict) -> None:
+        if self._max <= 0:
+            return
+        self._lru[key] = value
+        self._lru.move_to_end(key)
+        while len(self._lru) > self._max:
+            self._lru.popitem(last=False)
+
+    def _counters(self, result: str) -> dict:
+        return {"result": result, "hits_lru": self.hits_lru,
+                "hits_redis": self.hits_redis, "misses": self.misses}
+
+    async def get(self, q: str, *, kinds, top_k: int, probes: int, mode: str) -> tuple[str, Optional[dict]]:
+        """Retorna (clave, respuesta|None); la clave se reutiliza en put()."""
+        extra: dict = {}
+        async with astage("semantic.query_cache", extra=extra):
+            key = f"semq:{await self._current_version()}:{self._digest(q, kinds, top_k, probes, mode)}"
+            value = self._lru.get(key)
+            if value is not None:
+                self._lru.move_to_end(key)
+                self.hits_lru += 1
+                extra.update(self._counters("lru"))
+                return key, value
+
+            raw = None
+            if self._cache is not None:
+                try:
+                    raw = await self._cache.get(key)
+                except Exception as e:
+                    log.warning(f"Error leyendo query cache: {e}")
+            if raw:
+                value = json.loads(raw)
+                self._lru_put(key, value)
+                self.hits_redis += 1
+                extra.update(self._counters("redis"))
+            else:
+                self.misses += 1
+                extra.update(self._counters("miss"))
+            return key, value
+
+    async def put(self, key: str, value: dict) -> None:
+        value = json.loads(json.dumps(value, default=str))
+        self._lru_put(key, value)
+        if self._cache is None:
+            return
+        try:
+            await self._cache.set(key, json.dumps(value, ensure_ascii=False).encode("utf-8"),
+                                  ttl_seconds=self._ttl)
+        except Exception as e:
+            log.warning(f"Error guardando query cache: {e}")
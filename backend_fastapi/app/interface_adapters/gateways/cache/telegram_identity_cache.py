@@ -0,0 +1,159 @@
+from __future__ import annotations
+import json, logging, time
+from collections import OrderedDict
+from typing import Optional
+from app.use_cases.ports.cache_port import CachePort
+from app.observability.metrics import astage
+
+log = logging.getLogger(__name__)
+
+class TelegramIdentityCache:
+    """
+    Identidad resuelta por chat de Telegram: chat_id -> {user_id, role, profiles}.
+    Dos niveles: LRU en proceso (con TTL corto) delante de CachePort.
+    No se refresca por mensaje; se invalida explícitamente y de forma puntual
+    (vincular/desvincular, cambios de un asesor/docente desde admin): se borran
+    `tg_identity:{chat_id}` y, por usuario, los chats del índice
+    `tg_identity:user:{user_id}`. Sin marca global: los LRU de otros procesos
+    expiran solos en <= `local_ttl` s y entonces releen de Redis.
+    """
+    def __init__(self, cache: CachePort | None = None, *, max_items: int = 10000,
+                 local_ttl: float = 30.0, ttl_seconds: int = 86400):
+        self._cache = cache
+        self._max = max(0, int(max_items))
+        self._local_ttl = local_ttl
+        self._ttl = ttl_seconds
+        self._lru: "OrderedDict[str, tuple[float, dict]]" = OrderedDict()
+        self.hits_lru = 0
+        self.hits_redis = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(chat_id) -> str:
+        return f"tg_identity:{chat_id}"
+
+    @staticmethod
+    def _user_key(user_id) -> str:
+        return f"tg_identity:user:{user_id}"
+
+    def _lru_put(self, key: str, record: dict) -> None:
+        if self._max <= 0:
+            return
+        self._lru[key] = (time.monotonic() + self._local_ttl, record)
+        self._lru.move_to_end(key)
+        while len(self._lru) > self._max:
+            self._lru.popitem(last=False)
+
+    def _counters(self, result: str) -> dict:
+        return {"result": result, "hits_lru": self.hits_lru,
+                "hits_redis": self.hits_redis, "misses": self.misses}
+
+    async def get(self, chat_id) -> Optional[dict]:
+        record, _ = await self.get_with(chat_id, [])
+        return record
+
+    async def get_with(self, chat_id, keys: list[str]) -> tuple[Optional[dict], dict[str, Optional[bytes]]]:
+        """Identidad del chat + otras claves del mismo update en un solo MGET.
+        Con acierto en el LRU solo se leen `keys`; si Redis falla, `keys` no vienen."""
+        keys = list(keys or [])
+        extra: dict = {}
+        async with astage("telegram.identity_cache", extra=extra):
+            record = None
+            key = None
+            if chat_id is not None:
+                key = self._key(chat_id)
+                entry = self._lru.get(key)
+                if entry is not None:
+                    expires, cached = entry
+                    if expires > time.monotonic():
+                        self._lru.move_to_end(key)
+                        record = dict(cached)
+                    else:
+                        self._lru.pop(key, None)
+
+            lookup = keys + ([key] if key is not None and record is None else [])
+            values: list[Optional[bytes]] = [None] * len(lookup)
+            fetched: dict[str, Optional[bytes]] = {}
+            if self._cache is not None and lookup:
+                try:
+                    values = await self._cache.mget(lookup)
+                    fetched = dict(zip(keys, values[:len(keys)]))
+                except Exception as e:
+                    log.warning(f"Error leyendo identidad de chat {chat_id}: {e}")
+
+            if record is not None:
+                self.hits_lru += 1
+                extra.update(self._counters("lru"))
+                return record, fetched
+            raw = values[len(keys)] if len(values) > len(keys) else None
+            if raw:
+                try:
+                    record = json.loads(raw)
+                except Exception:
+                    record = None
+            if record is None:
+                self.misses += 1
+                extra.update(self._counters("miss"))
+                return None, fetched
+            self._lru_put(key, record)
+            self.hits_redis += 1
+            extra.update(self._counters("redis"))
+            return dict(record), fetched
+
+    async def put(self, chat_id, *, user_id: str, role: str | None, profiles: list[str]) -> dict:
+        record = {"user_id": str(user_id), "role": role, "profiles": sorted(set(profiles or []))}
+        if chat_id is None:
+            return record
+        key = self._key(chat_id)
+        self._lru_put(key, record)
+        if self._cache is not None:
+            try:
+                items = {key: json.dumps(record).encode("utf-8")}
+                # Índice user_id -> chats (mismo TTL), para invalidar por usuario desde admin
+                ukey = self._user_key(user_id)
+                chats = self._decode_chats(await self._cache.get(ukey)) | {str(chat_id)}
+                items[ukey] = json.dumps(sorted(chats)).encode("utf-8")
+                await self._cache.mset(items, ttl_seconds=self._ttl)
+            except Exception as e:
+                log.warning(f"Error guardando identidad de chat {chat_id}: {e}")
+        return dict(record)
+
+    @staticmethod
+    def _decode_chats(raw: Optional[bytes]) -> set[str]:
+        if not raw:
+            return set()
+        try:
+            return {str(c) for c in json.loads(raw)}
+        except Exception:
+            return set()
+
+    async def invalidate(self, *, chat_id=None, user_id=None) -> None:
+        """Invalida la identidad de un chat y/o de todos los chats de un usuario.
+        En este proceso al instante; en los demás en <= local_ttl."""
+        chats = {str(chat_id)} if chat_id is not None else set()
+        keys: list[str] = []
+        if user_id is not None:
+            uid = str(user_id)
+            ukey = self._user_key(uid)
+            keys.append(ukey)
+            if self._cache is not None:
+                try:
+                    chats |= self._decode_chats(await self._cache.get(ukey))
+                except Exception as e:
+                    log.warning(f"Error leyendo chats del usuario {uid}: {e}")
+            for k, (_, rec) in list(self._lru.items()):
+                if rec.get("user_id") == uid:
+                    self._lru.pop(k, None)
+        keys += [self._key(c) for c in chats]
+        for k in keys:
+            self._lru.pop(k, None)
+        if self._cache is None or not keys:
+            return
+        try:
+            await self._cache.delete_many(keys)
+        except Exception as e:
+            log.warning(f"Error invalidando identidades de Telegram: {e}")
+
+    def stats(self) -> dict:
+        return {"items": len(self._lru), "hits_lru": self.hits_lru,
+                "hits_redis": self.hits_redis, "misses": self.misses}
@@ -3,6 +3,7 @@ import httpx, uuid, asyncio, logging, inspect
 from typing import Optional
 from datetime import datetime, timezone
 from app.use_cases.ports.calendar_port import CalendarPort, CalendarEventInput, CalendarEventOut
+from app.interface_adapters.gateways.oauth.google_token_broker import GoogleTokenBroker, InvalidGrantError, get_broker
 
 GOOGLE_TOKEN_URL = "https://oauth2.googleapis.com/token"
 CAL_EVENTS_URL = "https://www.googleapis.com/calendar/v3/calendars/primary/events"
@@ -22,6 +23,7 @@ class GoogleCalendarClient(CalendarPort):
         timeout: int = 20,
         get_refresh_token_by_usuario_id=None,
         invalidate_refresh_token_by_usuario_id=None,
+        token_broker: GoogleTokenBroker | None = None,
     ):
         """
         get_refresh_token_by_usuario_id: async fn(usuario_id: str) -> str | None
@@ -32,6 +34,7 @@ class GoogleCalendarClient(CalendarPort):
         self.timeout = timeout
         self._get_rt = get_refresh_token_by_usuario_id
         self._invalidate_rt = invalidate_refresh_token_by_usuario_id
+        self._tokens = token_broker or get_broker(client_id, client_secret)
 
     async def _get_refresh_token(self, usuario_id: str) -> Optional[str]:
         """Acepta factories async o sync para recuperar refresh token."""
@@ -54,45 +57,19 @@ class GoogleCalendarClient(CalendarPort):
         return {"Authorization": f"Bearer {access}"}
 
     async def _exchange_refresh(self, refresh_token: str, *, usuario_id: str | None = None) -> str:
-        log.debug("Attempting to refresh Google token (len=%s)", len(refresh_token) if refresh_token else None)
-        async with httpx.AsyncClient(timeout=self.timeout) as client:
-            r = await client.post(
-                GOOGLE_TOKEN_URL,
-                data={
-                    "client_id": self.client_id,
-                    "client_secret": self.client_secret,
-                    "grant_type": "refresh_token",
-                    "refresh_token": refresh_token,
-                },
-            )
-            try:
-                r.raise_for_status()
-            except httpx.HTTPStatusError as exc:
-                body_json = None
+        """Access token vía el broker compartido (caché + single-flight)."""
+        try:
+            return await self._tokens.access_token(refresh_token)
+        except InvalidGrantError:
+            if usuario_id and self._invalidate_rt:
                 try:
-                    body_json = r.json()
-                except Exception:
-                    body_json = None
-                body_repr = body_json if body_json is not None else r.text[:500] if hasattr(r, "text") else "<unavailable>"
-                log.warning(
-                    "Google refresh_token exchange failed (status=%s, body=%s)",
-                    r.status_code,
-                    body_repr,
-                )
-                error_code = None
-                if isinstance(body_json, dict):
-                    error_code = body_json.get("error")
-                    if error_code == "invalid_grant" and usuario_id and self._invalidate_rt:
-                        try:
-                            maybe = self._invalidate_rt(usuario_id)
-                            if inspect.isawaitable(maybe):
-                                await maybe
-                            log.info("Marcado refresh_token inválido para usuario %s", usuario_id)
-                        except Exception as cb_exc:
-                            log.warning("No se pudo marcar refresh token inválido para %s: %s", usuario_id, cb_exc)
-                raise
-            data = r.json()
-            return data["access_token"]
+                    maybe = self._invalidate_rt(usuario_id)
+                    if inspect.isawaitable(maybe):
+                        await maybe
+                    log.info("Marcado refresh_token inválido para usuario %s", usuario_id)
+                except Exception as cb_exc:
+                    log.warning("No se pudo marcar refresh token inválido para %s: %s", usuario_id, cb_exc)
+            raise
 
     def _rfc3339(self, dt: datetime) -> dict:
         return {"dateTime": dt.isoformat(), "timeZone": "America/Santiago"}
@@ -1,27 +1,69 @@
 from __future__ import annotations
-import os
+import os, logging, math
 import uuid, hashlib, re
-from typing import List, Optional
+import numpy as np
+import asyncio
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable, Iterable, Iterator, List, Optional, Tuple
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import Text as sa_Text
 from sqlalchemy.sql import text as sqla_text, bindparam
 from pgvector.sqlalchemy import Vector
+from app.use_cases.semantic_search.semantic_repo import split_sentences
+from app.observability.metrics import astage
 
 DIM = int(os.getenv("EMBED_DIM", "768"))
 
+# Índice vectorial por despliegue: "ivfflat" (probes) o "hnsw" (ef_search)
+VECTOR_INDEX = os.getenv("VECTOR_INDEX", "ivfflat").lower()
+VECTOR_INDEX_NAME = "ix_knowledge_doc_embedding"
+IVFFLAT_MAX_PROBES = int(os.getenv("IVFFLAT_MAX_PROBES", "64"))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "40"))
+HNSW_MAX_EF_SEARCH = int(os.getenv("HNSW_MAX_EF_SEARCH", "200"))
+# Política adaptativa: si el mejor hit queda más lejos que este umbral (distancia
+# coseno) o el índice devolvió menos de top_k filas existiendo más, se repite la
+# búsqueda duplicando probes/ef_search; se corta apenas un intento no mejora.
+# 0 = off (por defecto, hasta medirlo con benchmarks.rag_bench / semantic_recall).
+VECTOR_ADAPTIVE_DIST = float(os.getenv("VECTOR_ADAPTIVE_DIST", "0"))
+
+log = logging.getLogger(__name__)
+
+# Embeddings por oración de cada chunk (se calculan al ingerir, no al buscar)
+# y búsqueda léxica (tsvector 'spanish' sobre texto sin acentos).
+SCHEMA_DDL = [
+    f"""
+    CREATE TABLE IF NOT EXISTS knowledge_sentence (
+      chunk_id  text        NOT NULL,
+      sent_no   integer     NOT NULL,
+      text      text        NOT NULL,
+      embedding vector({DIM}) NOT NULL,
+      PRIMARY KEY (chunk_id, sent_no)
+    )
+    """,
+    "CREATE EXTENSION IF NOT EXISTS unaccent",
+    """
+    CREATE OR REPLACE FUNCTION f_unaccent(text) RETURNS text
+    LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT
+    AS $$ SELECT public.unaccent('public.unaccent', $1) $$
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS ix_knowledge_doc_fts
+    ON knowledge_doc USING gin (to_tsvector('spanish', f_unaccent(text)))
+    """,
+]
+
+# tsquery en OR: con consultas cortas ("horario CINAP") exigir todos los términos
+# deja fuera demasiados chunks; ts_rank_cd ya premia a los que calzan más términos.
+_TSQUERY = "replace(plainto_tsquery('spanish', f_unaccent(:q))::text, ' & ', ' | ')::tsquery"
+
 def _hash(text: str) -> str:
     return hashlib.sha256(text.encode("utf-8")).hexdigest()
 
-def _chunk_text(text: str, max_chars=1200, overlap=200) -> List[str]:
+def _iter_chunks(text: str, max_chars=1200, overlap=200) -> Iterator[str]:
+    """Generador de chunks: no materializa la lista completa del documento."""
     paras = re.split(r"\n\s*\n+", (text or "").strip())
-    chunks: List[str] = []
     buf = ""
 
-    def flush():
-        nonlocal buf
-        if buf.strip():
-            chunks.append(re.sub(r"\s+", " ", buf.strip()))
-        buf = ""
-
     for p in paras:
         sents = re.split(r"(?<=[\.\?\!])\s+", p.strip())
         for s in sents:
@@ -31,28 +73,160 @@ def _chunk_text(text: str, max_chars=1200, overlap=200) -> List[str]:
                 buf = f"{buf} {s}".strip() if buf else s
             else:
                 if buf:
-                    chunks.append(re.sub(r"\s+", " ", buf.strip()))
+                    yield re.sub(r"\s+", " ", buf.strip())
                     tail = buf[-overlap:] if overlap > 0 else ""
                     buf = (tail + " " + s).strip() if tail else s
                 else:
                     for i in range(0, len(s), max_chars):
                         part = s[i:i+max_chars]
                         if part:
-                            chunks.append(part)
+                            yield part
                     buf = ""
         if len(buf) < max_chars:
             buf = buf.strip()
-    flush()
-    return [c for c in chunks if c]
+    if buf.strip():
+        yield re.sub(r"\s+", " ", buf.strip())
+
+def _chunk_text(text: str, max_chars=1200, overlap=200) -> List[str]:
+    return list(_iter_chunks(text, max_chars=max_chars, overlap=overlap))
+
+async def _embed_chunks_and_sentences(chunks: List[str], embed_fn):
+    """
+    Embebe chunks y sus oraciones (deduplicadas) en una sola llamada.
+    Las filas de la matriz float32 se enlazan directo como vector de pgvector.
+    Retorna (embs_chunks, [[(sent_no, texto, emb), ...] por chunk]).
+    """
+    per_chunk = [split_sentences(c) for c in chunks]
+    uniq: dict[str, int] = {}
+    for sents in per_chunk:
+        for st in sents:
+            uniq.setdefault(st, len(uniq))
+    embs = await embed_fn(list(chunks) + list(uniq))
+    chunk_embs, sent_embs = embs[:len(chunks)], embs[len(chunks):]
+    sentences = [
+        [(i, st, sent_embs[uniq[st]]) for i, st in enumerate(sents)]
+        for sents in per_chunk
+    ]
+    return chunk_embs, sentences
+
+class DocumentNotFoundError(LookupError):
+    """upsert sobre un source_id que no existe."""
 
 class PgVectorKnowledgeRepository:
-    def __init__(self, session: AsyncSession):
+    def __init__(self, session: AsyncSession, *, session_factory=None):
         self.s = session
+        # Permite correr la consulta léxica en otra conexión, en paralelo a la vectorial
+        self._session_factory = session_factory
+        # Sin session_factory ambas búsquedas comparten self.s: se serializan
+        self._lock = asyncio.Lock()
+
+    async def ensure_schema(self) -> None:
+        for ddl in SCHEMA_DDL:
+            try:
+                async with self.s.begin_nested():
+                    await self.s.execute(sqla_text(ddl))
+            except Exception as e:
+                log.warning(f"No se pudo aplicar DDL de knowledge_doc: {e}")
+
+    async def _insert_sentences(self, rows: List[dict], sentences) -> None:
+        srows = [{
+            "chunk_id": row["id"],
+            "sent_no": sent_no,
+            "text": st,
+            "embedding": emb,
+        } for row, sents in zip(rows, sentences) for sent_no, st, emb in sents]
+        if not srows:
+            return
+        stmt = sqla_text("""
+            INSERT INTO knowledge_sentence (chunk_id, sent_no, text, embedding)
+            VALUES (:chunk_id, :sent_no, :text, :embedding)
+            ON CONFLICT (chunk_id, sent_no) DO NOTHING
+        """).bindparams(bindparam("embedding", type_=Vector(DIM)))
+        await self.s.execute(stmt, srows)
 
-    async def search_topk(self, qvec, *, kinds=None, top_k=5, probes=10):
-        await self.s.execute(sqla_text(f"SET LOCAL ivfflat.probes = {int(probes)};"))
+    async def load_sentences(self, items: List[dict], session: AsyncSession | None = None) -> None:
+        """Adjunta a cada hit sus oraciones precomputadas: item["sentences"] = [(texto, emb), ...]."""
+        ids = [str(it["id"]) for it in items]
+        if not ids:
+            return
+        stmt = (
+            sqla_text("""
+                SELECT chunk_id, text, embedding
+                FROM knowledge_sentence
+                WHERE chunk_id = ANY(:ids)
+                ORDER BY chunk_id, sent_no
+            """)
+            .columns(chunk_id=sa_Text(), text=sa_Text(), embedding=Vector(DIM))
+        )
+        async with astage("pgvector.sentences", extra={"chunks": len(ids)}):
+            res = await (session or self.s).execute(stmt, {"ids": ids})
+        by_chunk: dict[str, list] = {}
+        for r in res:
+            by_chunk.setdefault(r.chunk_id, []).append((r.text, r.embedding))
+        for it in items:
+            it["sentences"] = by_chunk.get(str(it["id"])) or []
+
+    async def search_topk(self, qvec, *, kinds=None, top_k=5, probes=10, with_sentences=True):
+        async with self._lock:
+            return await self._search_topk(qvec, kinds=kinds, top_k=top_k, probes=probes,
+                                           with_sentences=with_sentences)
+
+    async def _set_width(self, width: int) -> None:
+        if VECTOR_INDEX == "hnsw":
+            await self.s.execute(sqla_text(f"SET LOCAL hnsw.ef_search = {int(width)};"))
+        else:
+            await self.s.execute(sqla_text(f"SET LOCAL ivfflat.probes = {int(width)};"))
+
+    async def _search_topk(self, qvec, *, kinds, top_k, probes, with_sentences):
+        if VECTOR_INDEX == "hnsw":
+            width, max_width = max(HNSW_EF_SEARCH, int(top_k)), HNSW_MAX_EF_SEARCH
+        else:
+            width, max_width = max(1, int(probes)), IVFFLAT_MAX_PROBES
+        extra = {"index": VECTOR_INDEX, "width": width, "attempts": 0}
+        available: Optional[int] = None
+        prev: Optional[Tuple[int, float]] = None
+        async with astage("pgvector.search", extra=extra):
+            while True:
+                extra["attempts"] += 1
+                extra["width"] = width
+                items = await self._scan(qvec, kinds=kinds, top_k=top_k, width=width)
+                if VECTOR_ADAPTIVE_DIST <= 0 or width >= max_width:
+                    break
+                best = float(items[0]["dist"]) if items else math.inf
+                # Sin mejora respecto del intento anterior: ensanchar más no ayuda
+                if prev is not None and len(items) <= prev[0] and best >= prev[1]:
+                    break
+                prev = (len(items), best)
+                short = False
+                if len(items) < int(top_k):
+                    # Corto solo por culpa del índice si existen más filas (corpus chico o filtro por kinds)
+                    if available is None:
+                        available = await self._count_rows(kinds=kinds, limit=int(top_k))
+                    short = available > len(items)
+                if not short and best <= VECTOR_ADAPTIVE_DIST:
+                    break
+                if not short and not items:
+                    break
+                width = min(width * 2, max_width)
+        if with_sentences:
+            await self.load_sentences(items)
+        return items
+
+    async def _count_rows(self, *, kinds, limit: int) -> int:
+        """Filas candidatas (acotado a `limit`), sin usar el índice vectorial."""
+        where, params = "", {"k": int(limit)}
+        if kinds:
+            where = "WHERE kd.kind = ANY(:kinds)"
+            params["kinds"] = kinds
+        res = await self.s.execute(sqla_text(f"""
+            SELECT count(*) FROM (SELECT 1 FROM knowledge_doc kd {where} LIMIT :k) t
+        """), params)
+        return int(res.scalar() or 0)
+
+    async def _scan(self, qvec, *, kinds, top_k, width) -> List[dict]:
+        await self._set_width(width)
         where = "WHERE 1=1"
-        params = {"qvec": qvec, "k": int(top_k)}
+        params = {"qvec": np.asarray(qvec, dtype=np.float32), "k": int(top_k)}
 
         if kinds:
             where += " AND kd.kind = ANY(:kinds)"
@@ -75,37 +249,53 @@ class PgVectorKnowledgeRepository:
         res = await self.s.execute(stmt, params)
         return [dict(r._mapping) for r in res]
 
-    async def add_document_from_text(
-        self,
-        *,
-        title: str,
-        text: str,
-        url: Optional[str] = None,
-        source_table: str = "document",
-        kind: str = "doc.chunk",
-        embed_fn,
-    ) -> tuple[str, int]:
-        chunks = _chunk_text(text, max_chars=1200, overlap=200)
-        if not chunks:
-            return (str(uuid.uuid4()), 0)
-
-        embs = await embed_fn(chunks)
-        source_id = str(uuid.uuid4())
-
-        rows = [{
-            "id": str(uuid.uuid4()),
-            "source_table": source_table,
-            "source_id": source_id,
-            "kind": kind,
-            "text": chunk,
-            "page_no": None,
-            "chunk_no": idx,
-            "doc_title": title,
-            "doc_url": url,
-            "hash": _hash(chunk),
-            "embedding": emb,
-        } for idx, (chunk, emb) in enumerate(zip(chunks, embs))]
+    async def _lexical(self, s: AsyncSession, q: str, kinds, top_k: int) -> List[dict]:
+        async with astage("pgvector.lexical"):
+            return await self._lexical_query(s, q, kinds, top_k)
 
+    async def _lexical_query(self, s: AsyncSession, q: str, kinds, top_k: int) -> List[dict]:
+        where = f"WHERE to_tsvector('spanish', f_unaccent(kd.text)) @@ {_TSQUERY}"
+        params = {"q": q, "k": int(top_k)}
+        if kinds:
+            where += " AND kd.kind = ANY(:kinds)"
+            params["kinds"] = kinds
+        res = await s.execute(sqla_text(f"""
+            SELECT
+                kd.id, kd.source_table, kd.source_id, kd.kind,
+                kd.text, kd.page_no, kd.doc_title,
+                ts_rank_cd(to_tsvector('spanish', f_unaccent(kd.text)), {_TSQUERY}) AS rank
+            FROM knowledge_doc kd
+            {where}
+            ORDER BY rank DESC
+            LIMIT :k
+        """), params)
+        return [dict(r._mapping) for r in res]
+
+    async def search_lexical(self, q: str, *, kinds=None, top_k=5, with_sentences=True) -> List[dict]:
+        """
+        Full-text (config 'spanish' + unaccent). Si hay session_factory corre en su
+        propia conexión, así puede ir en paralelo con search_topk. Ante error
+        (p.ej. sin extensión unaccent) retorna [] y la búsqueda sigue solo vectorial.
+        """
+        try:
+            if self._session_factory is not None:
+                async with self._session_factory() as s:
+                    items = await self._lexical(s, q, kinds, top_k)
+                    if with_sentences:
+                        await self.load_sentences(items, session=s)
+                    return items
+            async with self._lock:
+                async with self.s.begin_nested():
+                    items = await self._lexical(self.s, q, kinds, top_k)
+                if with_sentences:
+                    await self.load_sentences(items)
+                return items
+        except Exception as e:
+            log.warning(f"Búsqueda léxica falló: {e}")
+            return []
+
+    async def _insert_chunks(self, rows: List[dict], sentences) -> None:
+        """Inserta un batch de chunks (executemany) y sus oraciones."""
         stmt = sqla_text("""
             INSERT INTO knowledge_doc (
               id, source_table, source_id, kind, text,
@@ -118,56 +308,309 @@ class PgVectorKnowledgeRepository:
             )
             ON CONFLICT (id) DO NOTHING
         """).bindparams(bindparam("embedding", type_=Vector(DIM)))
-
         await self.s.execute(stmt, rows)
-        return (source_id, len(rows))
+        await self._insert_sentences(rows, sentences)
 
-    async def add_document_from_pages(
+    async def _existing_chunks(self, source_id: str) -> dict[str, deque]:
+        """hash -> cola de (id, page_no, chunk_no) de los chunks actuales del documento."""
+        res = await self.s.execute(
+            sqla_text("""
+                SELECT id::text AS id, hash, page_no, chunk_no
+                FROM knowledge_doc
+                WHERE source_id = :sid
+                ORDER BY page_no NULLS FIRST, chunk_no
+            """),
+            {"sid": source_id},
+        )
+        by_hash: dict[str, deque] = {}
+        for r in res:
+            by_hash.setdefault(r.hash, deque()).append((r.id, r.page_no, r.chunk_no))
+        return by_hash
+
+    async def _move_chunks(self, rows: List[dict]) -> None:
+        if not rows:
+            return
+        await self.s.execute(
+            sqla_text("""
+                UPDATE knowledge_doc
+                SET page_no = :page_no, chunk_no = :chunk_no, updated_at = now()
+                WHERE id = :id
+            """),
+            rows,
+        )
+
+    async def _retitle_chunks(self, source_id: str, title: str, url: Optional[str]) -> None:
+        # Los chunks reutilizados conservan metadatos de la versión anterior
+        await self.s.execute(
+            sqla_text("""
+                UPDATE knowledge_doc
+                SET doc_title = :title, doc_url = :url, updated_at = now()
+                WHERE source_id = :sid
+                  AND (doc_title IS DISTINCT FROM :title OR doc_url IS DISTINCT FROM :url)
+            """),
+            {"sid": source_id, "title": title, "url": url},
+        )
+
+    async def _delete_chunks(self, ids: List[str]) -> None:
+        if not ids:
+            return
+        await self.s.execute(
+            sqla_text("DELETE FROM knowledge_sentence WHERE chunk_id = ANY(:ids)"),
+            {"ids": ids},
+        )
+        await self.s.execute(
+            sqla_text("DELETE FROM knowledge_doc WHERE id = ANY(:ids)"),
+            {"ids": ids},
+        )
+
+    async def document_exists(self, source_id: str) -> bool:
+        res = await self.s.execute(
+            sqla_text("SELECT 1 FROM knowledge_doc WHERE source_id = :sid LIMIT 1"),
+            {"sid": source_id},
+        )
+        return res.first() is not None
+
+    async def find_document_by_title(self, title: str) -> Optional[str]:
+        res = await self.s.execute(
+            sqla_text("""
+                SELECT source_id FROM knowledge_doc
+                WHERE doc_title = :title
+                ORDER BY created_at DESC
+                LIMIT 1
+            """),
+            {"title": title},
+        )
+        row = res.first()
+        return str(row.source_id) if row else None
+
+    async def ingest_stream(
         self,
         *,
         title: str,
-        pages: List[str],
+        pages: AsyncIterator[Tuple[Optional[int], str]],
         url: Optional[str] = None,
+        source_table: str = "document",
+        kind: str = "doc.chunk",
         embed_fn,
-    ) -> tuple[str, int]:
-        source_id = str(uuid.uuid4())
-        stmt = sqla_text("""
-            INSERT INTO knowledge_doc (
-              id, source_table, source_id, kind, text,
-              page_no, chunk_no, doc_title, doc_url, hash,
-              embedding, created_at, updated_at
-            ) VALUES (
-              :id, 'document', :source_id, 'doc.chunk', :text,
-              :page_no, :chunk_no, :doc_title, :doc_url, :hash,
-              :embedding, now(), now()
+        batch_size: int = 64,
+        concurrency: int = 4,
+        on_progress: Optional[Callable[[dict], Awaitable[None]]] = None,
+        source_id: Optional[str] = None,
+        upsert: bool = False,
+        create_if_missing: bool = False,
+    ) -> tuple[str, dict]:
+        """
+        Pipeline de ingesta en streaming:
+        páginas (async) -> chunks (generador) -> batches de `batch_size` embebidos
+        con hasta `concurrency` llamadas en vuelo -> inserción por batch.
+        Las inserciones se serializan sobre la sesión (AsyncSession no es concurrente).
+
+        Con upsert=True sobre un source_id existente, los chunks cuyo hash ya está
+        se reutilizan (sin re-embeber), solo se embeben los nuevos y se borran los
+        que desaparecieron. Si el source_id no existe levanta DocumentNotFoundError,
+        salvo create_if_missing=True (lo crea con ese id).
+        Retorna (source_id, {inserted, reused, removed, ...}).
+        """
+        explicit_id = source_id is not None
+        source_id = source_id or str(uuid.uuid4())
+        batch_size = max(1, int(batch_size))
+        concurrency = max(1, int(concurrency))
+        in_flight: set[asyncio.Task] = set()
+        progress = {"pages": 0, "chunks": 0, "inserted": 0, "reused": 0, "removed": 0}
+        batch: List[Tuple[Optional[int], int, str, str]] = []
+        moved: List[dict] = []
+
+        existing: dict[str, deque] = {}
+        if upsert:
+            # Serializa re-ingestas concurrentes del mismo documento
+            await self.s.execute(
+                sqla_text("SELECT pg_advisory_xact_lock(hashtext(:sid))"), {"sid": source_id}
             )
-            ON CONFLICT (id) DO NOTHING
-        """).bindparams(bindparam("embedding", type_=Vector(DIM)))
+            existing = await self._existing_chunks(source_id)
+            if explicit_id and not existing and not create_if_missing:
+                raise DocumentNotFoundError(f"Documento {source_id} no encontrado")
 
-        total = 0
-        for pno, page_text in enumerate(pages, start=1):
-            chunks = _chunk_text(page_text)
-            if not chunks:
-                continue
-            embs = await embed_fn(chunks)
-            rows = []
-            for idx, (chunk, emb) in enumerate(zip(chunks, embs)):
-                rows.append({
+        async def report():
+            if on_progress is not None:
+                await on_progress(dict(progress))
+
+        async def embed_batch(items):
+            async with astage("ingest.embed_batch", extra={"chunks": len(items)}):
+                embs, sentences = await _embed_chunks_and_sentences([c for _, _, c, _ in items], embed_fn)
+            return items, embs, sentences
+
+        async def store(done: Iterable[asyncio.Task]):
+            for t in done:
+                items, embs, sentences = t.result()
+                rows = [{
                     "id": str(uuid.uuid4()),
+                    "source_table": source_table,
                     "source_id": source_id,
+                    "kind": kind,
                     "text": chunk,
                     "page_no": pno,
                     "chunk_no": idx,
                     "doc_title": title,
                     "doc_url": url,
-                    "hash": _hash(chunk),
+                    "hash": h,
                     "embedding": emb,
-                })
-            await self.s.execute(stmt, rows)
-            total += len(rows)
-        return (source_id, total)
+                } for (pno, idx, chunk, h), emb in zip(items, embs)]
+                async with astage("ingest.insert", extra={"chunks": len(rows)}):
+                    await self._insert_chunks(rows, sentences)
+                progress["inserted"] += len(rows)
+            await report()
+
+        async def submit():
+            nonlocal batch, in_flight
+            if batch:
+                in_flight.add(asyncio.create_task(embed_batch(batch)))
+                batch = []
+            while len(in_flight) >= concurrency:
+                done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                await store(done)
+
+        try:
+            async for pno, page_text in pages:
+                for idx, chunk in enumerate(_iter_chunks(page_text)):
+                    h = _hash(chunk)
+                    progress["chunks"] += 1
+                    prev = existing.get(h)
+                    if prev:
+                        cid, old_pno, old_idx = prev.popleft()
+                        progress["reused"] += 1
+                        if (old_pno, old_idx) != (pno, idx):
+                            moved.append({"id": cid, "page_no": pno, "chunk_no": idx})
+                        continue
+                    batch.append((pno, idx, chunk, h))
+                    if len(batch) >= batch_size:
+                        await submit()
+                progress["pages"] += 1
+                await report()
+            await submit()
+            while in_flight:
+                done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                await store(done)
+        finally:
+            for t in in_flight:
+                t.cancel()
+
+        if upsert:
+            await self._move_chunks(moved)
+            await self._retitle_chunks(source_id, title, url)
+            stale = [cid for q in existing.values() for cid, _, _ in q]
+            await self._delete_chunks(stale)
+            progress["removed"] = len(stale)
+            await report()
+
+        return (source_id, progress)
+
+    async def add_document_from_text(
+        self,
+        *,
+        title: str,
+        text: str,
+        url: Optional[str] = None,
+        source_table: str = "document",
+        kind: str = "doc.chunk",
+        embed_fn,
+    ) -> tuple[str, int]:
+        async def pages():
+            yield (None, text)
+        sid, stats = await self.ingest_stream(
+            title=title, pages=pages(), url=url,
+            source_table=source_table, kind=kind, embed_fn=embed_fn,
+        )
+        return (sid, stats["inserted"])
+
+    async def add_document_from_pages(
+        self,
+        *,
+        title: str,
+        pages: List[str],
+        url: Optional[str] = None,
+        embed_fn,
+    ) -> tuple[str, int]:
+        async def numbered():
+            for pno, page_text in enumerate(pages, start=1):
+                yield (pno, page_text)
+        sid, stats = await self.ingest_stream(title=title, pages=numbered(), url=url, embed_fn=embed_fn)
+        return (sid, stats["inserted"])
+
+    @staticmethod
+    def ivfflat_lists(rows: int) -> int:
+        """Recomendación de pgvector: rows/1000 hasta 1M filas, sqrt(rows) por encima."""
+        if rows <= 1_000_000:
+            return max(1, rows // 1000)
+        return max(1, int(math.sqrt(rows)))
+
+    async def rebuild_vector_index(self, *, method: Optional[str] = None, lists: Optional[int] = None,
+                                   m: int = 16, ef_construction: int = 64) -> dict:
+        """
+        Reconstruye el índice vectorial de knowledge_doc (ivfflat o hnsw).
+        Usa CREATE/DROP INDEX CONCURRENTLY en una conexión autocommit propia (fuera
+        de la transacción de la sesión): lecturas y escrituras siguen durante la
+        construcción; solo el RENAME final toma un lock breve. Un `_new` INVALID
+        de un intento anterior fallido se descarta antes de empezar.
+        """
+        method = (method or VECTOR_INDEX).lower()
+        if method not in ("ivfflat", "hnsw"):
+            raise ValueError("method debe ser 'ivfflat' o 'hnsw'")
+
+        tmp = f"{VECTOR_INDEX_NAME}_new"
+        engine = self.s.bind
+        async with engine.connect() as raw:
+            # CONCURRENTLY no admite bloque de transacción y espera a las transacciones
+            # abiertas: todo va por esta conexión, nada por la sesión
+            conn = await raw.execution_options(isolation_level="AUTOCOMMIT")
+            rows = int((await conn.execute(sqla_text("SELECT count(*) FROM knowledge_doc"))).scalar() or 0)
+
+            if method == "ivfflat":
+                lists = int(lists or self.ivfflat_lists(rows))
+                with_opts = f"lists = {lists}"
+            else:
+                with_opts = f"m = {int(m)}, ef_construction = {int(ef_construction)}"
+
+            leftover = (await conn.execute(sqla_text("""
+                SELECT i.indisvalid FROM pg_index i
+                JOIN pg_class c ON c.oid = i.indexrelid
+                WHERE c.relname = :tmp
+            """), {"tmp": tmp})).first()
+            if leftover is not None:
+                log.warning("Índice %s previo (valid=%s); se descarta", tmp, leftover[0])
+                await conn.execute(sqla_text(f"DROP INDEX CONCURRENTLY IF EXISTS {tmp}"))
+
+            try:
+                await conn.execute(sqla_text(f"""
+                    CREATE INDEX CONCURRENTLY {tmp} ON knowledge_doc
+                    USING {method} (embedding vector_cosine_ops) WITH ({with_opts})
+                """))
+            except Exception:
+                # Un CREATE CONCURRENTLY fallido deja el índice INVALID
+                await conn.execute(sqla_text(f"DROP INDEX CONCURRENTLY IF EXISTS {tmp}"))
+                raise
+
+            # Cualquier otro índice vectorial previo sobre embedding se reemplaza
+            old = await conn.execute(sqla_text("""
+                SELECT indexname FROM pg_indexes
+                WHERE tablename = 'knowledge_doc' AND indexname <> :tmp
+                  AND indexdef ~* 'using (ivfflat|hnsw)'
+            """), {"tmp": tmp})
+            for (name,) in old.all():
+                await conn.execute(sqla_text(f'DROP INDEX CONCURRENTLY IF EXISTS "{name}"'))
+            await conn.execute(sqla_text(f"ALTER INDEX {tmp} RENAME TO {VECTOR_INDEX_NAME}"))
+            await conn.execute(sqla_text("ANALYZE knowledge_doc"))
+        return {"method": method, "rows": rows, "lists": lists if method == "ivfflat" else None,
+                "m": m if method == "hnsw" else None,
+                "ef_construction": ef_construction if method == "hnsw" else None}
 
     async def delete_document(self, source_id: str) -> int:
+        await self.s.execute(
+            sqla_text("""
+                DELETE FROM knowledge_sentence
+                WHERE chunk_id IN (SELECT id::text FROM knowledge_doc WHERE source_id = :sid)
+            """),
+            {"sid": source_id},
+        )
         res = await self.s.execute(
             sqla_text("DELETE FROM knowledge_doc WHERE source_id = :sid"),
             {"sid": source_id},
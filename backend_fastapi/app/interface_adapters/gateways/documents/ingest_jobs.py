@@ -0,0 +1,100 @@
+from __future__ import annotations
+import json, logging, time, uuid
+from collections import OrderedDict
+from typing import Optional
+from app.use_cases.ports.cache_port import CachePort
+
+log = logging.getLogger(__name__)
+
+class JobExistsError(Exception):
+    """El job_id propuesto ya existe."""
+
+class IngestJobStore:
+    """
+    Estado de los jobs de ingesta de documentos, consultable por job_id.
+    Con CachePort la fuente de verdad es Redis (cualquier worker responde el
+    progreso); en proceso solo queda la copia de los jobs que corre este worker.
+    El id lo genera el servidor; uno propuesto por el cliente debe ser un UUID y se
+    reserva con SET NX, así un id repetido o adivinado no pisa otro job.
+    """
+    def __init__(self, cache: CachePort | None = None, *, ttl_seconds: int = 3600, max_items: int = 200):
+        self._cache = cache
+        self._ttl = ttl_seconds
+        self._max = max_items
+        self._jobs: "OrderedDict[str, dict]" = OrderedDict()
+
+    @staticmethod
+    def _key(job_id: str) -> str:
+        return f"ingest_job:{job_id}"
+
+    async def create(self, name: str, job_id: Optional[str] = None) -> dict:
+        if job_id is not None:
+            try:
+                job_id = str(uuid.UUID(job_id))
+            except ValueError:
+                raise ValueError("job_id debe ser un UUID")
+        job = {
+            "id": job_id or str(uuid.uuid4()),
+            "name": name,
+            "status": "running",
+            "pages_total": None,
+            "pages": 0,
+            "chunks": 0,
+            "inserted": 0,
+            "reused": 0,
+            "removed": 0,
+            "doc_id": None,
+            "error": None,
+            "started_at": time.time(),
+            "finished_at": None,
+        }
+        if not await self._reserve(job):
+            raise JobExistsError(f"job {job['id']} ya existe")
+        self._remember(job)
+        return job
+
+    async def _reserve(self, job: dict) -> bool:
+        if self._cache is not None:
+            try:
+                return await self._cache.set_nx(self._key(job["id"]), json.dumps(job).encode("utf-8"),
+                                                ttl_seconds=self._ttl)
+            except Exception as e:
+                log.warning(f"Error reservando job de ingesta: {e}")
+        return job["id"] not in self._jobs
+
+    async def update(self, job_id: str, **fields) -> dict | None:
+        job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        job.update(fields)
+        if fields.get("status") in ("done", "error"):
+            job["finished_at"] = time.time()
+        await self._save(job)
+        return job
+
+    async def get(self, job_id: str) -> dict | None:
+        if self._cache is None:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+        try:
+            raw = await self._cache.get(self._key(job_id))
+        except Exception as e:
+            log.warning(f"Error leyendo job de ingesta: {e}")
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+        return json.loads(raw) if raw else None
+
+    def _remember(self, job: dict) -> None:
+        self._jobs[job["id"]] = job
+        self._jobs.move_to_end(job["id"])
+        while len(self._jobs) > self._max:
+            self._jobs.popitem(last=False)
+
+    async def _save(self, job: dict) -> None:
+        self._remember(job)
+        if self._cache is None:
+            return
+        try:
+            await self._cache.set(self._key(job["id"]), json.dumps(job).encode("utf-8"), ttl_seconds=self._ttl)
+        except Exception as e:
+            log.warning(f"Error guardando job de ingesta: {e}")
\ No newline at end of file
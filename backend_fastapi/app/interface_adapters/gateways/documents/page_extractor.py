@@ -0,0 +1,79 @@
+from __future__ import annotations
+import asyncio, threading
+from typing import IO, AsyncIterator, Callable, Iterator, Optional, Tuple
+
+_DONE = object()
+
+def iter_pages(name: str, fp: IO[bytes], *, on_total: Optional[Callable[[int], None]] = None
+               ) -> Iterator[Tuple[Optional[int], str]]:
+    """
+    Extrae el texto página a página (síncrono, pensado para correr en un hilo).
+    PDF -> (n_página, texto); DOCX/texto -> una única "página" con page_no None.
+    """
+    lname = (name or "").lower()
+    if lname.endswith(".pdf"):
+        from pypdf import PdfReader
+        reader = PdfReader(fp)
+        if on_total:
+            on_total(len(reader.pages))
+        for pno, page in enumerate(reader.pages, start=1):
+            yield (pno, page.extract_text() or "")
+    elif lname.endswith(".docx"):
+        import docx
+        d = docx.Document(fp)
+        if on_total:
+            on_total(1)
+        yield (None, "\n".join(p.text for p in d.paragraphs if p.text))
+    else:
+        if on_total:
+            on_total(1)
+        yield (None, fp.read().decode("utf-8", errors="ignore"))
+
+async def aiter_pages(name: str, fp: IO[bytes], *, maxsize: int = 8,
+                      on_total: Optional[Callable[[int], None]] = None
+                      ) -> AsyncIterator[Tuple[Optional[int], str]]:
+    """
+    Corre iter_pages en un hilo y entrega las páginas por una cola acotada,
+    de modo que la extracción (pypdf) nunca bloquea el event loop y no se
+    adelanta más de `maxsize` páginas al consumidor.
+    """
+    loop = asyncio.get_running_loop()
+    q: asyncio.Queue = asyncio.Queue(maxsize=max(1, maxsize))
+    stop = threading.Event()
+
+    def put(item) -> None:
+        while not stop.is_set():
+            fut = asyncio.run_coroutine_threadsafe(q.put(item), loop)
+            try:
+                fut.result(timeout=1.0)
+                return
+            except TimeoutError:
+                if not fut.cancel():
+                    return
+
+    def total_cb(n: int) -> None:
+        if on_total:
+            loop.call_soon_threadsafe(on_total, n)
+
+    def worker() -> None:
+        try:
+            for page in iter_pages(name, fp, on_total=total_cb):
+                if stop.is_set():
+                    return
+                put(page)
+            put(_DONE)
+        except BaseException as e:
+            put(e)
+
+    th = threading.Thread(target=worker, name="ingest-pages", daemon=True)
+    th.start()
+    try:
+        while True:
+            item = await q.get()
+            if item is _DONE:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
\ No newline at end of file
@@ -0,0 +1,110 @@
+from __future__ import annotations
+import os, hashlib, logging, asyncio
+import numpy as np
+from collections import OrderedDict
+from typing import List, Optional
+from app.use_cases.ports.embeddings_port import EmbeddingsPort
+from app.use_cases.ports.cache_port import CachePort
+from app.observability.metrics import astage
+
+log = logging.getLogger(__name__)
+
+def _key(model: str, text: str) -> str:
+    return hashlib.sha256(f"{model}\x00{text}".encode("utf-8")).hexdigest()
+
+def _pack(vec: np.ndarray) -> bytes:
+    return np.asarray(vec, dtype=np.float32).tobytes()
+
+def _unpack(raw: bytes) -> np.ndarray:
+    return np.frombuffer(raw, dtype=np.float32)
+
+class EmbeddingLRU:
+    """Cache en proceso (LRU) de embeddings indexado por hash de contenido."""
+    def __init__(self, max_items: int = 20000):
+        self._max = max(0, int(max_items))
+        self._data: "OrderedDict[str, np.ndarray]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        v = self._data.get(key)
+        if v is not None:
+            self._data.move_to_end(key)
+        return v
+
+    def put(self, key: str, vec: np.ndarray) -> None:
+        if self._max <= 0:
+            return
+        self._data[key] = vec
+        self._data.move_to_end(key)
+        while len(self._data) > self._max:
+            self._data.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+class CachedEmbeddings(EmbeddingsPort):
+    """
+    Decorador de EmbeddingsPort: LRU en proceso + tier Redis opcional.
+    Solo los textos que no están en ningún tier se envían (en un único batch) al servidor.
+    """
+    def __init__(self, inner: EmbeddingsPort, *, lru: EmbeddingLRU | None = None,
+                 cache: CachePort | None = None, ttl_seconds: int | None = None,
+                 model: str | None = None):
+        self._inner = inner
+        self._lru = lru if lru is not None else EmbeddingLRU(int(os.getenv("EMBED_CACHE_MAX", "20000")))
+        self._cache = cache
+        self._ttl = ttl_seconds if ttl_seconds is not None else int(os.getenv("EMBED_CACHE_TTL", "604800"))
+        self._model = model or os.getenv("EMBED_MODEL", "hiiamsid/sentence_similarity_spanish_es")
+
+    @property
+    def dim(self) -> int: return self._inner.dim
+
+    async def embed_many(self, texts: List[str]) -> np.ndarray:
+        if not texts:
+            return np.empty((0, self.dim), dtype=np.float32)
+        keys = [_key(self._model, t) for t in texts]
+        out: List[Optional[np.ndarray]] = [self._lru.get(k) for k in keys]
+        lru_hits = sum(1 for v in out if v is not None)
+
+        redis_hits = 0
+        if self._cache is not None and lru_hits < len(texts):
+            missing = [i for i, v in enumerate(out) if v is None]
+            raws = await asyncio.gather(
+                *(self._cache.get(f"emb:{keys[i]}") for i in missing), return_exceptions=True
+            )
+            for i, raw in zip(missing, raws):
+                if isinstance(raw, Exception):
+                    log.warning(f"Error leyendo embedding cache: {raw}")
+                    continue
+                if raw:
+                    vec = _unpack(raw)
+                    if vec.shape[0] == self.dim:
+                        out[i] = vec
+                        self._lru.put(keys[i], vec)
+                        redis_hits += 1
+
+        pending: dict[str, List[int]] = {}
+        for i, k in enumerate(keys):
+            if out[i] is None:
+                pending.setdefault(k, []).append(i)
+
+        async with astage("embeddings.cache", extra={
+            "texts": len(texts), "lru_hits": lru_hits, "redis_hits": redis_hits, "misses": len(pending),
+        }):
+            if pending:
+                uniq = [texts[idxs[0]] for idxs in pending.values()]
+                vecs = await self._inner.embed_many(uniq)
+                for (k, idxs), vec in zip(pending.items(), vecs):
+                    self._lru.put(k, vec.copy())
+                    for i in idxs:
+                        out[i] = vec
+                if self._cache is not None:
+                    res = await asyncio.gather(
+                        *(self._cache.set(f"emb:{k}", _pack(vec), ttl_seconds=self._ttl)
+                          for k, vec in zip(pending.keys(), vecs)),
+                        return_exceptions=True,
+                    )
+                    errs = [r for r in res if isinstance(r, Exception)]
+                    if errs:
+                        log.warning(f"Error guardando embedding cache: {errs[0]}")
+
+        return np.vstack(out).astype(np.float32, copy=False)
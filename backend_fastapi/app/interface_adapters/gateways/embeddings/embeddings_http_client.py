@@ -1,29 +1,94 @@
-import os, httpx
-from typing import List
+import os, httpx, asyncio
+import numpy as np
+from typing import List, Optional
 from app.use_cases.ports.embeddings_port import EmbeddingsPort
+from app.observability.metrics import astage
+
+def l2_normalize(m: np.ndarray) -> np.ndarray:
+    n = np.linalg.norm(m, axis=1, keepdims=True)
+    n[n == 0] = 1.0
+    return m / n
 
 class EmbeddingsHTTPClient(EmbeddingsPort):
-    def __init__(self):
+    """
+    Cliente del servidor de embeddings (API estilo OpenAI).
+    Pensado como instancia única por proceso (ver Container): reutiliza un pool
+    HTTP/2 acotado y agrupa (micro-batching) las llamadas de un solo texto que
+    llegan dentro de `coalesce_ms` en una única request al servidor.
+    """
+    def __init__(self, *, max_connections: Optional[int] = None, max_keepalive: Optional[int] = None,
+                 coalesce_ms: Optional[float] = None, max_batch: Optional[int] = None):
         self._url = os.getenv("EMBEDDINGS_URL", "http://127.0.0.1:8004/v1/embeddings")
         self._model = os.getenv("EMBED_MODEL", "hiiamsid/sentence_similarity_spanish_es")
         self._api_key = os.getenv("EMBED_API_KEY", "")
         self._dim = int(os.getenv("EMBED_DIM", "768"))
-        self._client = httpx.AsyncClient(timeout=httpx.Timeout(30.0, connect=5.0), http2=True)
+        limits = httpx.Limits(
+            max_connections=max_connections or int(os.getenv("EMBED_MAX_CONNECTIONS", "20")),
+            max_keepalive_connections=max_keepalive or int(os.getenv("EMBED_MAX_KEEPALIVE", "10")),
+        )
+        self._client = httpx.AsyncClient(timeout=httpx.Timeout(30.0, connect=5.0), http2=True, limits=limits)
+        self._coalesce = (coalesce_ms if coalesce_ms is not None
+                          else float(os.getenv("EMBED_COALESCE_MS", "5"))) / 1000.0
+        self._max_batch = max_batch or int(os.getenv("EMBED_MAX_BATCH", "256"))
+        self._pending: list[tuple[str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: set[asyncio.Task] = set()
 
     @property
     def dim(self) -> int: return self._dim
 
-    async def embed_many(self, texts: List[str]) -> List[List[float]]:
+    async def _post(self, texts: List[str]) -> np.ndarray:
         headers = {"Authorization": f"Bearer {self._api_key}"} if self._api_key else {}
         payload = {"model": self._model, "input": texts}
-        r = await self._client.post(self._url, json=payload, headers=headers)
-        r.raise_for_status()
+        async with astage("embeddings.http", extra={"texts": len(texts)}):
+            r = await self._client.post(self._url, json=payload, headers=headers)
+            r.raise_for_status()
         data = (r.json() or {}).get("data") or []
         if len(data) != len(texts): raise RuntimeError("Mismatch embeddings/texts")
-        embs = [it["embedding"] for it in data]
-        if any(len(e) != self._dim for e in embs): raise RuntimeError("Unexpected dim")
-        import math
-        def l2(v): 
-            n = math.sqrt(sum(x*x for x in v)) or 1.0
-            return [x/n for x in v]
-        return [l2(e) for e in embs]
+        m = np.asarray([it["embedding"] for it in data], dtype=np.float32)
+        if m.ndim != 2 or m.shape[1] != self._dim: raise RuntimeError("Unexpected dim")
+        return l2_normalize(m)
+
+    async def embed_many(self, texts: List[str]) -> np.ndarray:
+        """Retorna una matriz float32 (len(texts), dim) con filas normalizadas L2."""
+        if not texts:
+            return np.empty((0, self._dim), dtype=np.float32)
+        if len(texts) > 1 or self._coalesce <= 0:
+            return await self._post(list(texts))
+
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self._pending.append((texts[0], fut))
+        if len(self._pending) >= self._max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self._coalesce, self._flush)
+        return (await fut)[None, :]
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.get_running_loop().create_task(self._run_batch(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, batch: list[tuple[str, asyncio.Future]]) -> None:
+        uniq: dict[str, int] = {}
+        for t, _ in batch:
+            uniq.setdefault(t, len(uniq))
+        try:
+            m = await self._post(list(uniq))
+        except Exception as e:
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        for t, fut in batch:
+            if not fut.done():
+                fut.set_result(m[uniq[t]])
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
\ No newline at end of file
@@ -0,0 +1,62 @@
+from __future__ import annotations
+import os, re, asyncio, hashlib, unicodedata
+import numpy as np
+from typing import List
+from app.use_cases.ports.embeddings_port import EmbeddingsPort
+from app.observability.metrics import astage
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+def _fold(text: str) -> str:
+    t = unicodedata.normalize("NFKD", (text or "").casefold())
+    return "".join(c for c in t if not unicodedata.combining(c))
+
+def _bucket(feature: str, dim: int) -> tuple[int, float]:
+    h = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+    return h % dim, (1.0 if (h >> 63) & 1 else -1.0)
+
+class LocalHashEmbeddings(EmbeddingsPort):
+    """
+    Sustituto local y determinista del servidor de embeddings (benchmarks / dev offline).
+    Feature hashing de palabras y trigramas de caracteres sin acentos: textos con
+    vocabulario común quedan cerca, sin red ni modelo. No reemplaza la calidad semántica.
+    """
+    def __init__(self, dim: int | None = None, *, latency_ms: float | None = None):
+        self._dim = int(dim or os.getenv("EMBED_DIM", "768"))
+        self._latency = (latency_ms if latency_ms is not None
+                         else float(os.getenv("LOCAL_EMBED_LATENCY_MS", "0"))) / 1000.0
+        self._memo: dict[str, tuple[int, float]] = {}
+
+    @property
+    def dim(self) -> int: return self._dim
+
+    def _features(self, text: str):
+        words = _WORD.findall(_fold(text))
+        for w in words:
+            yield w, 1.0
+            padded = f"#{w}#"
+            for i in range(len(padded) - 2):
+                yield padded[i:i+3], 0.5
+
+    def _vector(self, text: str, out: np.ndarray) -> None:
+        for feat, weight in self._features(text):
+            b = self._memo.get(feat)
+            if b is None:
+                if len(self._memo) > 500_000:
+                    self._memo.clear()
+                b = self._memo[feat] = _bucket(feat, self._dim)
+            out[b[0]] += b[1] * weight
+
+    async def embed_many(self, texts: List[str]) -> np.ndarray:
+        async with astage("embeddings.local", extra={"texts": len(texts)}):
+            if self._latency > 0:
+                await asyncio.sleep(self._latency)
+            m = np.zeros((len(texts), self._dim), dtype=np.float32)
+            for i, t in enumerate(texts):
+                self._vector(t, m[i])
+            n = np.linalg.norm(m, axis=1, keepdims=True)
+            n[n == 0] = 1.0
+            return m / n
+
+    async def aclose(self) -> None:
+        return None
\ No newline at end of file
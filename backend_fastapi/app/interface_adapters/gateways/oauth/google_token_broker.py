@@ -0,0 +1,230 @@
+from __future__ import annotations
+import asyncio, hashlib, json, logging, time
+from collections import OrderedDict
+from typing import Optional
+
+import httpx
+
+log = logging.getLogger(__name__)
+
+GOOGLE_TOKEN_URL = "https://oauth2.googleapis.com/token"
+# Mismo formato de clave/valor que el broker del MCP de calendario: comparten caché en Redis
+KEY_PREFIX = "gtok:"
+
+class InvalidGrantError(httpx.HTTPStatusError):
+    """El refresh_token fue revocado o expiró (`invalid_grant`)."""
+
+def token_key(refresh_token: str) -> str:
+    return KEY_PREFIX + hashlib.sha256(refresh_token.encode("utf-8")).hexdigest()
+
+class GoogleTokenBroker:
+    """
+    Access tokens de Google reutilizados hasta poco antes de `expires_in`.
+
+    - Frente en proceso (LRU acotado) + Redis compartido con los servidores MCP,
+      clave = sha256(refresh_token); el refresh_token nunca se guarda.
+    - Single-flight: llamadas concurrentes con el mismo refresh_token comparten un
+      solo intercambio (tarea en proceso + lock corto en Redis entre procesos).
+    - `invalid_grant` borra la entrada y se propaga como InvalidGrantError.
+    """
+
+    def __init__(self, *, client_id: str, client_secret: str, cache=None, skew_s: float = 120.0,
+                 local_max: int = 1024, timeout: float = 20.0, lock_wait_s: float = 3.0):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self._cache = cache
+        self._skew = skew_s
+        self._local_max = max(1, int(local_max))
+        self._timeout = timeout
+        self._lock_wait = lock_wait_s
+        self._local: OrderedDict[str, tuple[str, float]] = OrderedDict()
+        self._inflight: dict[str, asyncio.Task] = {}
+        self._client: httpx.AsyncClient | None = None
+        self.local_hits = 0
+        self.shared_hits = 0
+        self.exchanges = 0
+        self.coalesced = 0
+
+    def set_cache(self, cache) -> None:
+        self._cache = cache
+
+    def _http(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(timeout=self._timeout, http2=True)
+        return self._client
+
+    # ---- caché ----
+    def _local_get(self, key: str) -> Optional[str]:
+        hit = self._local.get(key)
+        if hit is None:
+            return None
+        token, exp = hit
+        if exp - self._skew <= time.time():
+            self._local.pop(key, None)
+            return None
+        self._local.move_to_end(key)
+        return token
+
+    def _local_put(self, key: str, token: str, exp: float) -> None:
+        self._local[key] = (token, exp)
+        self._local.move_to_end(key)
+        while len(self._local) > self._local_max:
+            self._local.popitem(last=False)
+
+    async def _shared_get(self, key: str) -> Optional[str]:
+        if self._cache is None:
+            return None
+        try:
+            raw = await self._cache.get(key)
+            if not raw:
+                return None
+            obj = json.loads(raw)
+            token, exp = obj["t"], float(obj["exp"])
+        except Exception as e:
+            log.debug(f"token broker: lectura de Redis falló: {e}")
+            return None
+        if exp - self._skew <= time.time():
+            return None
+        self._local_put(key, token, exp)
+        return token
+
+    async def _shared_put(self, key: str, token: str, exp: float) -> None:
+        if self._cache is None:
+            return
+        ttl = int(exp - self._skew - time.time())
+        if ttl <= 0:
+            return
+        try:
+            await self._cache.set(key, json.dumps({"t": token, "exp": exp}).encode("utf-8"), ttl_seconds=ttl)
+        except Exception as e:
+            log.debug(f"token broker: escritura en Redis falló: {e}")
+
+    # ---- intercambio ----
+    async def _exchange(self, refresh_token: str) -> tuple[str, float]:
+        self.exchanges += 1
+        r = await self._http().post(
+            GOOGLE_TOKEN_URL,
+            data={
+                "client_id": self.client_id,
+                "client_secret": self.client_secret,
+                "grant_type": "refresh_token",
+                "refresh_token": refresh_token,
+            },
+        )
+        if r.status_code >= 400:
+            try:
+                body = r.json()
+            except Exception:
+                body = None
+            log.warning(
+                "Google refresh_token exchange failed (status=%s, body=%s)",
+                r.status_code, body if body is not None else r.text[:500],
+            )
+            if isinstance(body, dict) and body.get("error") == "invalid_grant":
+                await self.invalidate(refresh_token)
+                raise InvalidGrantError("invalid_grant", request=r.request, response=r)
+            r.raise_for_status()
+        data = r.json()
+        return data["access_token"], time.time() + float(data.get("expires_in") or 3600)
+
+    async def _resolve(self, key: str, refresh_token: str) -> str:
+        token = await self._shared_get(key)
+        if token:
+            self.shared_hits += 1
+            return token
+
+        locked = False
+        if self._cache is not None:
+            try:
+                locked = await self._cache.acquire_lock(key, ttl_seconds=max(5, int(self._timeout)))
+            except Exception:
+                locked = True  # sin Redis: intercambiar directamente
+            if not locked:
+                # Otro proceso está intercambiando: esperar a que publique el token
+                deadline = time.monotonic() + self._lock_wait
+                while time.monotonic() < deadline:
+                    await asyncio.sleep(0.1)
+                    token = await self._shared_get(key)
+                    if token:
+                        self.shared_hits += 1
+                        return token
+        try:
+            token, exp = await self._exchange(refresh_token)
+        finally:
+            if locked and self._cache is not None:
+                try:
+                    await self._cache.release_lock(key)
+                except Exception:
+                    pass
+        self._local_put(key, token, exp)
+        await self._shared_put(key, token, exp)
+        return token
+
+    async def access_token(self, refresh_token: str) -> str:
+        if not refresh_token:
+            raise RuntimeError("refresh_token vacío")
+        key = token_key(refresh_token)
+        token = self._local_get(key)
+        if token:
+            self.local_hits += 1
+            return token
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._resolve(key, refresh_token))
+            self._inflight[key] = task
+
+            def _done(t: asyncio.Task, key=key) -> None:
+                self._inflight.pop(key, None)
+                if not t.cancelled():
+                    t.exception()
+            task.add_done_callback(_done)
+        else:
+            self.coalesced += 1
+        # shield: si quien inició el intercambio se cancela, los demás igual lo reciben
+        return await asyncio.shield(task)
+
+    async def invalidate(self, refresh_token: str) -> None:
+        key = token_key(refresh_token)
+        self._local.pop(key, None)
+        if self._cache is not None:
+            try:
+                await self._cache.delete(key)
+            except Exception:
+                pass
+
+    def stats(self) -> dict:
+        return {
+            "local_items": len(self._local),
+            "local_hits": self.local_hits,
+            "shared_hits": self.shared_hits,
+            "exchanges": self.exchanges,
+            "coalesced": self.coalesced,
+        }
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+# Un broker por client_id en el proceso; el contenedor le inyecta la caché Redis al arrancar
+_brokers: dict[str, GoogleTokenBroker] = {}
+_defaults: dict = {}
+
+def configure(*, cache=None, **options) -> None:
+    _defaults.update(options)
+    if cache is not None:
+        _defaults["cache"] = cache
+        for b in _brokers.values():
+            b.set_cache(cache)
+
+def get_broker(client_id: str, client_secret: str) -> GoogleTokenBroker:
+    b = _brokers.get(client_id)
+    if b is None or b.client_secret != client_secret:
+        b = GoogleTokenBroker(client_id=client_id, client_secret=client_secret, **_defaults)
+        _brokers[client_id] = b
+    return b
+
+async def aclose_all() -> None:
+    for b in list(_brokers.values()):
+        await b.aclose()
@@ -0,0 +1,89 @@
+from __future__ import annotations
+import asyncio, contextvars
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Hashable
+
+from app.observability.metrics import astage
+
+class _Lane:
+    __slots__ = ("lock", "refs")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.refs = 0
+
+class ChatLaneScheduler:
+    """Carriles por chat: el trabajo de un mismo chat corre en orden estricto (FIFO)
+    y chats distintos corren en paralelo hasta `max_concurrent`.
+
+    - El cupo global se toma después del lock del carril: un chat en espera no ocupa cupo.
+    - Reentrante dentro de la misma tarea (y de las tareas hijas que se esperan),
+      para que un paso anidado del mismo chat no se bloquee a sí mismo.
+    - Un carril sin usuarios se elimina al salir (GC inmediato, sin barridos).
+    """
+
+    def __init__(self, max_concurrent: int):
+        self._slots = asyncio.Semaphore(max(1, int(max_concurrent)))
+        self.max_concurrent = max(1, int(max_concurrent))
+        self._lanes: dict[Hashable, _Lane] = {}
+        self._held: contextvars.ContextVar[frozenset] = contextvars.ContextVar(
+            f"chat_lanes_{id(self)}", default=frozenset()
+        )
+        self._running = 0
+        self.completed = 0
+        self.collected = 0
+
+    @asynccontextmanager
+    async def lane(self, key: Hashable):
+        key = str(key)
+        held = self._held.get()
+        if key in held:
+            yield
+            return
+
+        lane = self._lanes.get(key)
+        if lane is None:
+            lane = self._lanes[key] = _Lane()
+        lane.refs += 1
+        try:
+            async with astage("telegram.lane_wait"):
+                await lane.lock.acquire()
+                try:
+                    await self._slots.acquire()
+                except BaseException:
+                    lane.lock.release()
+                    raise
+            token = self._held.set(held | {key})
+            self._running += 1
+            try:
+                yield
+            finally:
+                self._running -= 1
+                self._held.reset(token)
+                self._slots.release()
+                lane.lock.release()
+                self.completed += 1
+        finally:
+            lane.refs -= 1
+            if lane.refs == 0 and self._lanes.get(key) is lane:
+                del self._lanes[key]
+                self.collected += 1
+
+    def spawn(self, key: Hashable, fn: Callable[[], Awaitable]) -> asyncio.Task:
+        """Lanza `fn()` en segundo plano dentro del carril `key`, encolado detrás del
+        trabajo actual del chat (no hereda la reentrada de quien lo lanza)."""
+        async def _run():
+            self._held.set(frozenset())
+            async with self.lane(key):
+                return await fn()
+        return asyncio.create_task(_run())
+
+    def stats(self) -> dict:
+        return {
+            "lanes": len(self._lanes),
+            "running": self._running,
+            "waiting": sum(l.refs for l in self._lanes.values()) - self._running,
+            "max_concurrent": self.max_concurrent,
+            "completed": self.completed,
+            "collected": self.collected,
+        }
@@ -0,0 +1,399 @@
+from __future__ import annotations
+import asyncio, contextvars, json, logging, random, time, uuid
+from collections import deque
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Optional
+
+from app.observability.metrics import astage
+
+log = logging.getLogger(__name__)
+
+# Efectos externos del intento en curso (mensaje enviado, tool/agente invocado):
+# tras el primero un fallo ya no se reintenta, porque repetiría mensajes o acciones
+_side_effects: contextvars.ContextVar[Optional[list]] = contextvars.ContextVar("tg_update_side_effects", default=None)
+
+def mark_side_effect(what: str) -> None:
+    """Lo llama el handler al producir un efecto externo; fuera de un worker no hace nada."""
+    box = _side_effects.get()
+    if box is not None and not box:
+        box.append(what)
+
+def update_chat_key(update: dict) -> str:
+    """Clave de orden: chat del mensaje o del callback; si no hay, el propio update."""
+    msg = update.get("message") or (update.get("callback_query") or {}).get("message") or {}
+    chat_id = (msg.get("chat") or {}).get("id")
+    return str(chat_id) if chat_id is not None else f"u:{update.get('update_id')}"
+
+@dataclass
+class QueuedUpdate:
+    id: str
+    chat_key: str
+    payload: dict
+    enqueued_at: float
+    attempts: int = 0
+
+class LocalUpdateQueue:
+    """Backend en memoria (tests / desarrollo). No sobrevive reinicios."""
+    def __init__(self, *, maxsize: int = 10000):
+        self._q: asyncio.Queue[QueuedUpdate] = asyncio.Queue(maxsize=maxsize)
+        self._outstanding: dict[str, float] = {}
+        self.dead: list[dict] = []
+
+    async def ensure(self) -> None:
+        return None
+
+    async def enqueue(self, update: dict) -> str:
+        item = QueuedUpdate(id=str(uuid.uuid4()), chat_key=update_chat_key(update),
+                            payload=update, enqueued_at=time.time())
+        self._outstanding[item.id] = item.enqueued_at
+        await self._q.put(item)
+        return item.id
+
+    async def read(self, count: int, block_ms: int) -> list[QueuedUpdate]:
+        try:
+            first = await asyncio.wait_for(self._q.get(), timeout=block_ms / 1000.0)
+        except asyncio.TimeoutError:
+            return []
+        items = [first]
+        while len(items) < count and not self._q.empty():
+            items.append(self._q.get_nowait())
+        return items
+
+    async def heartbeat(self) -> None:
+        return None
+
+    async def close(self) -> None:
+        return None
+
+    async def claim_stale(self, count: int) -> list[QueuedUpdate]:
+        return []
+
+    async def ack(self, item: QueuedUpdate) -> None:
+        self._outstanding.pop(item.id, None)
+
+    async def dead_letter(self, item: QueuedUpdate, error: str) -> None:
+        self.dead.append({"id": item.id, "update": item.payload, "error": error, "attempts": item.attempts})
+        await self.ack(item)
+
+    async def stats(self) -> dict:
+        oldest = min(self._outstanding.values(), default=None)
+        return {
+            "backend": "local",
+            "depth": len(self._outstanding),
+            "pending": len(self._outstanding) - self._q.qsize(),
+            "lag_seconds": round(time.time() - oldest, 3) if oldest else 0.0,
+            "dead_letters": len(self.dead),
+        }
+
+class RedisStreamUpdateQueue:
+    """
+    Cola durable sobre Redis Streams con consumer group.
+    Los entries se confirman (XACK + XDEL) solo al terminar de procesarlos, así el
+    stream contiene exactamente lo pendiente.
+
+    Cada consumidor mantiene una clave de heartbeat con TTL. Solo se reclaman entries
+    de consumidores cuyo heartbeat expiró (proceso muerto): un entry que sigue en el
+    buffer, en backoff o en una corrida larga del agente/ASR nunca se ejecuta dos
+    veces. Los entries propios ociosos se re-reclaman (XCLAIM) para extenderlos; el
+    pool descarta los que ya tiene en curso.
+    """
+    def __init__(self, redis, *, stream: str = "tg:updates", group: str = "tg-workers",
+                 consumer: Optional[str] = None, maxlen: int = 100000, claim_idle_ms: int = 60000,
+                 heartbeat_ttl_s: float = 30.0, dead_letter_key: Optional[str] = None,
+                 dead_letter_max: int = 1000):
+        self._r = redis
+        self._stream = stream
+        self._group = group
+        self._consumer = consumer or f"c-{uuid.uuid4().hex[:8]}"
+        self._maxlen = maxlen
+        self._claim_idle_ms = claim_idle_ms
+        self._hb_ttl_ms = max(1000, int(heartbeat_ttl_s * 1000))
+        self._dead_key = dead_letter_key or f"{stream}:dead"
+        self._dead_max = dead_letter_max
+
+    @property
+    def heartbeat_interval(self) -> float:
+        return self._hb_ttl_ms / 3000.0
+
+    def _hb_key(self, consumer: str) -> str:
+        return f"{self._stream}:hb:{consumer}"
+
+    async def ensure(self) -> None:
+        try:
+            await self._r.xgroup_create(self._stream, self._group, id="0", mkstream=True)
+        except Exception as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+        await self.heartbeat()
+
+    async def heartbeat(self) -> None:
+        await self._r.set(self._hb_key(self._consumer), b"1", px=self._hb_ttl_ms)
+
+    async def close(self) -> None:
+        # Parada ordenada: lo que quedó en el buffer lo reclaman los demás de inmediato
+        try:
+            await self._r.delete(self._hb_key(self._consumer))
+        except Exception:
+            pass
+
+    async def enqueue(self, update: dict) -> str:
+        fields = {"chat": update_chat_key(update), "data": json.dumps(update, ensure_ascii=False)}
+        eid = await self._r.xadd(self._stream, fields, maxlen=self._maxlen, approximate=True)
+        return eid.decode() if isinstance(eid, bytes) else str(eid)
+
+    @staticmethod
+    def _s(v) -> str:
+        return v.decode() if isinstance(v, bytes) else str(v)
+
+    def _to_item(self, eid, fields: dict) -> Optional[QueuedUpdate]:
+        f = {self._s(k): v for k, v in (fields or {}).items()}
+        eid = self._s(eid)
+        try:
+            payload = json.loads(self._s(f["data"]))
+        except Exception:
+            log.warning(f"Entry {eid} ilegible en {self._stream}; se descarta")
+            return None
+        return QueuedUpdate(id=eid, chat_key=self._s(f.get("chat") or update_chat_key(payload)),
+                            payload=payload, enqueued_at=int(eid.split("-", 1)[0]) / 1000.0)
+
+    async def read(self, count: int, block_ms: int) -> list[QueuedUpdate]:
+        res = await self._r.xreadgroup(self._group, self._consumer, {self._stream: ">"},
+                                       count=count, block=block_ms)
+        items: list[QueuedUpdate] = []
+        for _stream, entries in res or []:
+            for eid, fields in entries:
+                it = self._to_item(eid, fields)
+                if it is None:
+                    await self._r.xack(self._stream, self._group, eid)
+                    await self._r.xdel(self._stream, eid)
+                    continue
+                items.append(it)
+        return items
+
+    async def claim_stale(self, count: int) -> list[QueuedUpdate]:
+        pending = await self._r.xpending_range(self._stream, self._group, min="-", max="+",
+                                               count=max(count * 4, 100), idle=self._claim_idle_ms)
+        alive: dict[str, bool] = {self._consumer: True}
+        ids = []
+        for p in pending or []:
+            consumer = self._s(p["consumer"])
+            if consumer not in alive:
+                alive[consumer] = bool(await self._r.exists(self._hb_key(consumer)))
+            # Propios: se reclaman igual (extiende el claim); de otro vivo: no se tocan
+            if consumer == self._consumer or not alive[consumer]:
+                ids.append(p["message_id"])
+            if len(ids) >= count:
+                break
+        if not ids:
+            return []
+        entries = await self._r.xclaim(self._stream, self._group, self._consumer,
+                                       min_idle_time=self._claim_idle_ms, message_ids=ids)
+        items = [self._to_item(eid, fields) for eid, fields in entries or [] if fields]
+        return [it for it in items if it is not None]
+
+    async def ack(self, item: QueuedUpdate) -> None:
+        await self._r.xack(self._stream, self._group, item.id)
+        await self._r.xdel(self._stream, item.id)
+
+    async def dead_letter(self, item: QueuedUpdate, error: str) -> None:
+        record = {"id": item.id, "chat": item.chat_key, "update": item.payload,
+                  "error": error, "attempts": item.attempts, "failed_at": time.time()}
+        await self._r.lpush(self._dead_key, json.dumps(record, ensure_ascii=False))
+        await self._r.ltrim(self._dead_key, 0, self._dead_max - 1)
+        await self.ack(item)
+
+    async def stats(self) -> dict:
+        depth = await self._r.xlen(self._stream)
+        pending = 0
+        try:
+            info = await self._r.xpending(self._stream, self._group)
+            pending = int((info or {}).get("pending") or 0)
+        except Exception:
+            pass
+        oldest = await self._r.xrange(self._stream, count=1)
+        lag = 0.0
+        if oldest:
+            ms = int(self._s(oldest[0][0]).split("-", 1)[0])
+            lag = max(0.0, time.time() - ms / 1000.0)
+        return {
+            "backend": "redis",
+            "stream": self._stream,
+            "depth": int(depth or 0),
+            "pending": pending,
+            "lag_seconds": round(lag, 3),
+            "dead_letters": int(await self._r.llen(self._dead_key) or 0),
+        }
+
+@dataclass
+class _PoolCounters:
+    processed: int = 0
+    retried: int = 0
+    dead_lettered: int = 0
+    not_retried: int = 0
+    last_service_ms: float = 0.0
+
+class UpdateWorkerPool:
+    """
+    Pool de workers sobre una cola de updates.
+    Orden por chat: los updates de un mismo chat se procesan de a uno y en orden de
+    llegada; chats distintos corren en paralelo hasta `workers`. Los fallos se
+    reintentan en el mismo lugar (backoff exponencial con jitter, sin romper el
+    orden del chat) y tras `max_attempts` van a la lista dead-letter. Solo se
+    reintenta si el intento falló antes de cualquier efecto externo
+    (`mark_side_effect`); si no, va directo a dead-letter sin re-ejecutar.
+    """
+    def __init__(self, queue, handler: Callable[[dict], Awaitable[None]], *, workers: int = 8,
+                 max_attempts: int = 5, backoff_base: float = 1.0, backoff_max: float = 30.0,
+                 read_count: int = 32, block_ms: int = 1000, claim_interval: float = 30.0,
+                 max_buffered: Optional[int] = None):
+        self._queue = queue
+        self._handler = handler
+        self._workers = max(1, int(workers))
+        self._max_attempts = max(1, int(max_attempts))
+        self._backoff_base = backoff_base
+        self._backoff_max = backoff_max
+        self._read_count = read_count
+        self._block_ms = block_ms
+        self._claim_interval = claim_interval
+        self._max_buffered = max_buffered or self._workers * 8
+        self._chats: dict[str, deque[QueuedUpdate]] = {}
+        self._active: set[str] = set()
+        self._ready: asyncio.Queue[str] = asyncio.Queue()
+        self._buffered = 0
+        self._space = asyncio.Event()
+        self._tasks: list[asyncio.Task] = []
+        self._seen: set[str] = set()
+        self.counters = _PoolCounters()
+
+    async def start(self) -> None:
+        await self._queue.ensure()
+        self._space.set()
+        self._tasks = [asyncio.create_task(self._read_loop(), name="tg-queue-reader"),
+                       asyncio.create_task(self._heartbeat_loop(), name="tg-queue-heartbeat")]
+        self._tasks += [asyncio.create_task(self._worker(i), name=f"tg-queue-worker-{i}")
+                        for i in range(self._workers)]
+
+    async def stop(self) -> None:
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await self._queue.close()
+
+    async def _heartbeat_loop(self) -> None:
+        interval = getattr(self._queue, "heartbeat_interval", 10.0)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self._queue.heartbeat()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.warning(f"Heartbeat de la cola de updates falló: {e}")
+
+    def _dispatch(self, item: QueuedUpdate) -> None:
+        if item.id in self._seen:
+            return
+        self._seen.add(item.id)
+        self._buffered += 1
+        if self._buffered >= self._max_buffered:
+            self._space.clear()
+        self._chats.setdefault(item.chat_key, deque()).append(item)
+        if item.chat_key not in self._active:
+            self._active.add(item.chat_key)
+            self._ready.put_nowait(item.chat_key)
+
+    async def _read_loop(self) -> None:
+        last_claim = 0.0
+        while True:
+            try:
+                await self._space.wait()
+                if time.monotonic() - last_claim >= self._claim_interval:
+                    last_claim = time.monotonic()
+                    for it in await self._queue.claim_stale(self._read_count):
+                        self._dispatch(it)
+                for it in await self._queue.read(self._read_count, self._block_ms):
+                    self._dispatch(it)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.warning(f"Error leyendo cola de updates: {e}")
+                await asyncio.sleep(1.0)
+
+    async def _worker(self, n: int) -> None:
+        while True:
+            key = await self._ready.get()
+            dq = self._chats.get(key)
+            while dq:
+                try:
+                    await self._process(dq.popleft())
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    # Fallo de la cola (ack/dead-letter): el entry queda pendiente y se reclama luego
+                    log.warning(f"Error confirmando update en la cola: {e}")
+            self._chats.pop(key, None)
+            self._active.discard(key)
+
+    async def _process(self, item: QueuedUpdate) -> None:
+        try:
+            while True:
+                item.attempts += 1
+                t0 = time.perf_counter()
+                effects: list = []
+                token = _side_effects.set(effects)
+                try:
+                    async with astage("telegram.queue.handle", extra={
+                        "lag_ms": round((time.time() - item.enqueued_at) * 1000, 1),
+                        "attempt": item.attempts,
+                    }):
+                        await self._handler(item.payload)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    if effects:
+                        log.error(f"Update {item.id} falló tras efecto externo ({effects[0]}); "
+                                  f"a dead-letter sin reintentar: {e!r}")
+                        self.counters.not_retried += 1
+                        self.counters.dead_lettered += 1
+                        await self._queue.dead_letter(item, f"{e!r} tras {effects[0]}")
+                        return
+                    if item.attempts >= self._max_attempts:
+                        log.error(f"Update {item.id} a dead-letter tras {item.attempts} intentos: {e!r}")
+                        self.counters.dead_lettered += 1
+                        await self._queue.dead_letter(item, repr(e))
+                        return
+                    delay = min(self._backoff_max, self._backoff_base * 2 ** (item.attempts - 1))
+                    delay *= 0.5 + random.random() / 2
+                    log.warning(f"Update {item.id} falló (intento {item.attempts}); reintento en {delay:.1f}s: {e!r}")
+                    self.counters.retried += 1
+                    await asyncio.sleep(delay)
+                    continue
+                finally:
+                    _side_effects.reset(token)
+                self.counters.last_service_ms = round((time.perf_counter() - t0) * 1000, 1)
+                self.counters.processed += 1
+                await self._queue.ack(item)
+                return
+        finally:
+            self._seen.discard(item.id)
+            self._buffered -= 1
+            if self._buffered < self._max_buffered:
+                self._space.set()
+
+    async def stats(self) -> dict:
+        try:
+            q = await self._queue.stats()
+        except Exception as e:
+            q = {"error": str(e)}
+        return {
+            **q,
+            "workers": self._workers,
+            "buffered": self._buffered,
+            "active_chats": len(self._active),
+            "processed": self.counters.processed,
+            "retried": self.counters.retried,
+            "dead_lettered": self.counters.dead_lettered,
+            "not_retried": self.counters.not_retried,
+            "last_service_ms": self.counters.last_service_ms,
+        }
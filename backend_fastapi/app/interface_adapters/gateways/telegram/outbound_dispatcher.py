@@ -0,0 +1,264 @@
+from __future__ import annotations
+import asyncio, bisect, logging, time
+from typing import Hashable, Awaitable, Callable, Optional
+
+import httpx
+
+from app.observability.metrics import astage
+
+log = logging.getLogger(__name__)
+
+# Límites de la Bot API: ~30 msg/s global y ~1 msg/s sostenido por chat
+LATENCY_BUCKETS_MS = (25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+class TokenBucket:
+    """Token bucket asíncrono; `block()` congela el bucket (retry_after de un 429)."""
+    __slots__ = ("rate", "capacity", "tokens", "updated", "blocked_until")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = max(1e-6, float(rate))
+        self.capacity = max(1.0, float(capacity))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self) -> float:
+        """Toma un token; retorna los segundos esperados."""
+        waited = 0.0
+        while True:
+            now = time.monotonic()
+            if now < self.blocked_until:
+                delay = self.blocked_until - now
+            else:
+                self._refill(now)
+                if self.tokens >= 1.0:
+                    self.tokens -= 1.0
+                    return waited
+                delay = (1.0 - self.tokens) / self.rate
+            await asyncio.sleep(delay)
+            waited += delay
+
+    def idle(self, now: float) -> bool:
+        """Sin congelar y recargado al máximo: descartarlo equivale a crear uno nuevo."""
+        return (now >= self.blocked_until
+                and self.tokens + (now - self.updated) * self.rate >= self.capacity)
+
+    def block(self, seconds: float) -> None:
+        self.blocked_until = max(self.blocked_until, time.monotonic() + max(0.0, seconds))
+        self.tokens = 0.0
+
+class LatencyHistogram:
+    def __init__(self, buckets_ms=LATENCY_BUCKETS_MS):
+        self.bounds = tuple(buckets_ms)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.total = 0
+        self.sum_ms = 0.0
+
+    def observe(self, ms: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, ms)] += 1
+        self.total += 1
+        self.sum_ms += ms
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Cota superior del bucket que contiene el cuantil q."""
+        if not self.total:
+            return None
+        target = q * self.total
+        acc = 0
+        for i, c in enumerate(self.counts):
+            acc += c
+            if acc >= target:
+                return float(self.bounds[i]) if i < len(self.bounds) else float("inf")
+        return float("inf")
+
+    def snapshot(self) -> dict:
+        labels = [f"le_{b}" for b in self.bounds] + ["le_inf"]
+        return {
+            "count": self.total,
+            "mean_ms": round(self.sum_ms / self.total, 2) if self.total else None,
+            "p50_ms": self.quantile(0.50),
+            "p95_ms": self.quantile(0.95),
+            "p99_ms": self.quantile(0.99),
+            "buckets": dict(zip(labels, self.counts)),
+        }
+
+class _ChatState:
+    __slots__ = ("bucket", "lock", "refs")
+
+    def __init__(self, rate: float, burst: float):
+        self.bucket = TokenBucket(rate, burst)
+        self.lock = asyncio.Lock()
+        self.refs = 0
+
+class _PendingEdit:
+    __slots__ = ("payload", "future")
+
+    def __init__(self, payload: dict, future: asyncio.Future):
+        self.payload = payload
+        self.future = future
+
+class TelegramDispatcher:
+    """
+    Despachador de salida hacia la Bot API.
+
+    - Token bucket global y uno por chat; los envíos de un mismo chat salen en orden.
+    - 429: respeta `parameters.retry_after` (congela el bucket del chat y, si no hay
+      chat, el global) y reintenta hasta `max_retries`.
+    - Ediciones al mismo mensaje que aún esperan turno se fusionan: sale solo la última.
+    - `concurrency` acota las peticiones HTTP en vuelo.
+    - Histograma de latencia de envío (incluye la espera en buckets).
+    `base_url` apunta a https://api.telegram.org o a un servidor falso local.
+    """
+
+    def __init__(self, client_getter: Callable[[], Awaitable[httpx.AsyncClient]], *, base_url: str, token: str,
+                 global_rate: float = 30.0, chat_rate: float = 1.0, chat_burst: float = 3.0,
+                 concurrency: int = 32, max_retries: int = 3):
+        self._client_getter = client_getter
+        self.base = f"{base_url.rstrip('/')}/bot{token}"
+        self._global = TokenBucket(global_rate, max(1.0, global_rate))
+        self._chat_rate = chat_rate
+        self._chat_burst = chat_burst
+        self._slots = asyncio.Semaphore(max(1, int(concurrency)))
+        self._max_retries = max(0, int(max_retries))
+        self._chats: dict[Hashable, _ChatState] = {}
+        # Barrido de chats inactivos: cada lo que tarda un bucket en recargarse entero
+        self._sweep_s = max(1.0, chat_burst / max(1e-6, chat_rate))
+        self._next_sweep = time.monotonic() + self._sweep_s
+        self._edits: dict[tuple, _PendingEdit] = {}
+        self.latency = LatencyHistogram()
+        self.sent = 0
+        self.failed = 0
+        self.rate_limited = 0
+        self.retries = 0
+        self.coalesced = 0
+
+    def _acquire_chat(self, chat_id) -> _ChatState:
+        now = time.monotonic()
+        if now >= self._next_sweep:
+            self._sweep(now)
+        state = self._chats.get(chat_id)
+        if state is None:
+            state = self._chats[chat_id] = _ChatState(self._chat_rate, self._chat_burst)
+        state.refs += 1
+        return state
+
+    def _release_chat(self, chat_id, state: _ChatState) -> None:
+        # Solo se descarta si el bucket ya está lleno; si no, un envío secuencial
+        # posterior partiría con la ráfaga completa y saltaría el límite por chat
+        state.refs -= 1
+        if (state.refs == 0 and self._chats.get(chat_id) is state
+                and state.bucket.idle(time.monotonic())):
+            del self._chats[chat_id]
+
+    def _sweep(self, now: float) -> None:
+        for chat_id in [c for c, st in self._chats.items() if st.refs == 0 and st.bucket.idle(now)]:
+            del self._chats[chat_id]
+        self._next_sweep = now + self._sweep_s
+
+    async def _post(self, method: str, payload: dict) -> tuple[int, dict]:
+        client = await self._client_getter()
+        async with self._slots:
+            resp = await client.post(f"{self.base}/{method}", json=payload)
+        try:
+            data = resp.json()
+        except Exception:
+            data = {"ok": False, "description": resp.text[:200]}
+        return resp.status_code, data
+
+    async def _send(self, method: str, payload: dict, state: Optional[_ChatState]) -> tuple[int, dict]:
+        t0 = time.perf_counter()
+        extra: dict = {"method": method}
+        try:
+            async with astage("telegram.send", extra=extra):
+                attempt = 0
+                while True:
+                    if state is not None:
+                        await state.bucket.acquire()
+                    await self._global.acquire()
+                    try:
+                        status, data = await self._post(method, payload)
+                    except httpx.HTTPError:
+                        if attempt >= self._max_retries:
+                            raise
+                        attempt += 1
+                        self.retries += 1
+                        await asyncio.sleep(min(2.0, 0.2 * 2 ** attempt))
+                        continue
+                    if status != 429 or attempt >= self._max_retries:
+                        break
+                    self.rate_limited += 1
+                    retry_after = float(((data.get("parameters") or {}).get("retry_after")) or 1)
+                    (state.bucket if state is not None else self._global).block(retry_after)
+                    attempt += 1
+                    self.retries += 1
+                    log.warning(f"Telegram 429 en {method}; retry_after={retry_after}s (intento {attempt})")
+                extra.update(status=status, attempts=attempt + 1)
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.latency.observe((time.perf_counter() - t0) * 1000.0)
+        if status == 200:
+            self.sent += 1
+        else:
+            self.failed += 1
+        return status, data
+
+    async def call(self, method: str, payload: dict, *, chat_id=None) -> tuple[int, dict]:
+        """Petición a la Bot API con límites; (status, json)."""
+        if chat_id is None:
+            return await self._send(method, payload, None)
+        state = self._acquire_chat(chat_id)
+        try:
+            async with state.lock:
+                return await self._send(method, payload, state)
+        finally:
+            self._release_chat(chat_id, state)
+
+    async def edit(self, chat_id, message_id, payload: dict) -> tuple[int, dict]:
+        """editMessageText con fusión: si ya hay una edición en espera para el mismo
+        mensaje se reemplaza su payload y se comparte el resultado."""
+        key = (chat_id, message_id)
+        pending = self._edits.get(key)
+        if pending is not None:
+            pending.payload = payload
+            self.coalesced += 1
+            return await asyncio.shield(pending.future)
+
+        loop = asyncio.get_running_loop()
+        pending = self._edits[key] = _PendingEdit(payload, loop.create_future())
+        state = self._acquire_chat(chat_id)
+        try:
+            async with state.lock:
+                # A partir de aquí el payload queda fijo; nuevas ediciones esperan su turno
+                if self._edits.get(key) is pending:
+                    del self._edits[key]
+                result = await self._send("editMessageText", pending.payload, state)
+            pending.future.set_result(result)
+            return result
+        except BaseException as e:
+            if self._edits.get(key) is pending:
+                del self._edits[key]
+            if not pending.future.done():
+                if isinstance(e, Exception):
+                    pending.future.set_exception(e)
+                else:
+                    pending.future.cancel()
+            raise
+        finally:
+            self._release_chat(chat_id, state)
+
+    def stats(self) -> dict:
+        return {
+            "sent": self.sent,
+            "failed": self.failed,
+            "rate_limited": self.rate_limited,
+            "retries": self.retries,
+            "coalesced_edits": self.coalesced,
+            "chats": len(self._chats),
+            "latency": self.latency.snapshot(),
+        }
@@ -0,0 +1,249 @@
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Iterable, Mapping, Optional
+
+# Vocabularios del fast-path de Telegram. Se comparan como subcadenas (igual que los
+# `any(k in text ...)` originales) sobre texto en minúsculas y sin tildes.
+
+DOMAIN_KEYWORDS = {
+    "cinap", "uct",
+    "asesoría", "asesoria", "tutoría", "tutoria",
+    "calendario", "calendar", "agenda", "agendar", "cita", "reunión", "reunion",
+    "profesor", "docente", "advisor", "teacher",
+    "curso", "clase", "materia", "asignatura", "disponibilidad", "horario"
+}
+ACK_KEYWORDS = {
+    "hola", "hi", "hello", "buenas", "buenos días", "buenas tardes", "buenas noches",
+    "gracias", "thanks", "thank you",
+    "ok", "vale", "perfecto", "listo", "entiendo", "sí", "si"
+}
+CONFIRM_WORDS = {"confirmar", "confirmo", "confirm", "sí", "si", "ok", "vale", "listo", "de acuerdo"}
+CANCEL_WORDS = {"cancelar", "cancela", "anular", "rechazar", "descartar", "no"}
+
+GREETING_KEYWORDS = [
+    "hola", "hi", "hello", "buenas", "buenos días", "buenas tardes", "buenas noches",
+    "saludos", "qué tal", "cómo estás",
+]
+SERVICE_KEYWORDS = [
+    "servicio", "servicios", "asesor", "asesores", "profesor", "profesores",
+    "docente", "docentes", "teacher", "teachers", "advisor", "advisors",
+    "recursos educativos", "comunidades de aprendizaje", "4prot",
+    "google sites", "spatial", "ayudantes", "compromisos académicos",
+]
+CALENDAR_KEYWORDS = [
+    "asesoría", "asesoria", "asesorías", "asesorias",
+    "cita", "citas", "reunión", "reunion", "reuniones",
+    "evento", "eventos", "event", "events",
+    "agenda", "agendar", "calendario", "calendar",
+    "horario", "horarios", "disponibilidad", "disponible",
+    "slot", "slots", "cupo", "cupos", "programar", "reservar", "reserva",
+    "confirmar", "confirma", "confirmación", "asistencia",
+    "cancelar", "cancela", "cancelación",
+]
+ACTION_KEYWORDS = [
+    "lista", "listame", "listar", "mostrar", "muestra", "ver", "dame",
+    "buscar", "busca", "encuentra", "necesito", "quiero",
+    "agendar", "crear", "cancelar", "modificar", "cambiar",
+    "consulta", "consultar", "información", "info",
+]
+TIME_KEYWORDS = [
+    "hoy", "mañana", "semana", "mes", "día", "hora",
+    "enero", "febrero", "marzo", "abril", "mayo", "junio",
+    "julio", "agosto", "septiembre", "octubre", "noviembre", "diciembre",
+    "lunes", "martes", "miércoles", "jueves", "viernes", "sábado", "domingo",
+]
+ACADEMIC_CONTEXT = [
+    "profesor", "asesor", "cita", "agenda", "horario", "materia", "asignatura",
+    "tutoría", "asesoría", "clase", "curso",
+]
+MCP_EXCLUSIONS = [
+    "hola", "hi", "buenas", "gracias", "ok", "vale", "perfecto",
+    "qué tal", "cómo estás", "buenos días", "buenas tardes",
+    "qué es", "explica", "define", "cuéntame", "dime sobre",
+    "información sobre", "cómo funciona", "help", "ayuda",
+]
+MCP_HIGH_CERTAINTY = [
+    "crear evento", "agendar cita", "programar reunión", "nueva cita",
+    "agregar evento", "crear reunión", "agendar evento", "listame",
+    "lista mis", "mis eventos", "eventos próximos", "calendario",
+    "reservar", "cancelar cita", "modificar evento",
+]
+MCP_ACTION = ["quiero", "necesito", "voy a", "tengo que", "debo", "me puedes", "puedes"]
+MCP_CALENDAR = ["evento", "cita", "reunión", "fecha", "horario", "agenda"]
+
+KEYWORD_GROUPS: dict[str, Iterable[str]] = {
+    "domain": DOMAIN_KEYWORDS,
+    "ack": ACK_KEYWORDS,
+    "greeting": GREETING_KEYWORDS,
+    "service": SERVICE_KEYWORDS,
+    "calendar": CALENDAR_KEYWORDS,
+    "action": ACTION_KEYWORDS,
+    "time": TIME_KEYWORDS,
+    "academic": ACADEMIC_CONTEXT,
+    "mcp_exclusion": MCP_EXCLUSIONS,
+    "mcp_high": MCP_HIGH_CERTAINTY,
+    "mcp_action": MCP_ACTION,
+    "mcp_calendar": MCP_CALENDAR,
+}
+
+CALENDAR_EVENT_PATTERNS = [
+    r'\b(agendar|programar|crear)\s+(una?\s+)?(cita|asesor[íi]a|reuni[óo]n|meeting|appointment)\b',
+    r'\b(quiero|necesito|puedo)\s+(agendar|programar|una?\s+cita|una?\s+asesor[íi]a)\b',
+    r'\b(asesor[íi]a|cita|reuni[óo]n|meeting)\s+(con|para|de)\b',
+    r'\b(agenda|calendar|calendario)\b.*\b(evento|cita|asesor[íi]a)\b',
+    r'\b(disponibilidad|horario)\s+(para|de)\s+(profesor|teacher|advisor)\b'
+]
+
+GLOSARIO_REGEX = [
+    (
+        re.compile(
+            r"\b(u\.?\s*c\.?\s*t\.?|u\s*ce\s*te|ucte|ucete|u\s*c\s*t|aus-?t|universidad\s+cat+ólica(?:\s+de\s+temuco)?)\b",
+            re.IGNORECASE,
+        ),
+        "UCT",
+    ),
+    (
+        re.compile(
+            r"\b(cina?p|cina|ci\s*nap|si\s*nap|c\s*i\s*nap|"
+            r"ch[ií]n\s*up|chi\s*nap|che\s*nap|chinap|sino pop|chin up|"
+            r"centro\s+de\s+innovaci[óo]n(?:\s+en\s+aprendizaje)?(?:\s+docencia)?(?:\s+y\s+tecnolog[í]a\s+educativa)?)\b",
+            re.IGNORECASE
+        ),
+        "CINAP",
+    ),
+]
+
+# Pre-normalización fonética (antes eran 12 re.sub consecutivos), en el mismo orden
+PHONETIC_RULES = [
+    (r"\bu\s*ce?\s*te\b", "UCT"),
+    (r"\bu\s*[\.\s]*c\s*[\.\s]*t\b", "UCT"),
+    (r"\bucte?\b", "UCT"),
+    (r"\bsi\s*nap\b", "CINAP"),
+    (r"\bci\s*nap\b", "CINAP"),
+    (r"\bcina?p\b", "CINAP"),
+    (r"\bsinap\b", "CINAP"),
+    (r"\bchinap\b", "CINAP"),
+    (r"\bsyrup\b", "CINAP"),
+    (r"\buniversidad\s+cat[oó]lica(?:\s+de\s+temuco)?\b", "UCT"),
+    (r"\bcentro\s+de\s+innovaci[oó]n(?:\s+en\s+aprendizaje)?(?:\s+docencia)?(?:\s+y\s+tecnolog[i+í]a\s+educativa)?\b", "CINAP"),
+]
+
+_FOLD = str.maketrans("áéíóúüñàèìòùâêîôûäëïö", "aeiouunaeiouaeiouaeio")
+
+def fold(text: str) -> str:
+    """Minúsculas sin tildes/diéresis (ñ -> n)."""
+    return (text or "").lower().translate(_FOLD)
+
+def _trie_pattern(words: Iterable[str]) -> str:
+    """Alternancia factorizada por prefijos; los `?` greedy hacen que gane la más larga."""
+    trie: dict = {}
+    for w in words:
+        node = trie
+        for ch in w:
+            node = node.setdefault(ch, {})
+        node[""] = True
+
+    def build(node: dict) -> str:
+        end = "" in node
+        alts = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not alts:
+            return ""
+        body = alts[0] if len(alts) == 1 else "(?:" + "|".join(alts) + ")"
+        if end:
+            return ("(?:" + body + ")?") if len(alts) == 1 else body + "?"
+        return body
+
+    return build(trie)
+
+class KeywordMatcher:
+    """
+    Todas las apariciones de todas las palabras clave en una sola pasada.
+    Un lookahead por posición devuelve la palabra más larga que empieza ahí; cada
+    palabra trae precalculados los grupos de todas las palabras contenidas en ella,
+    así se recuperan también las apariciones solapadas (semántica de `k in text`).
+    """
+    def __init__(self, groups: Mapping[str, Iterable[str]]):
+        by_word: dict[str, set[str]] = {}
+        for group, words in groups.items():
+            for w in words:
+                by_word.setdefault(fold(w), set()).add(group)
+        self._closure: dict[str, frozenset[str]] = {
+            w: frozenset(g for other, gs in by_word.items() if other in w for g in gs)
+            for w in by_word
+        }
+        self._re = re.compile("(?=(" + _trie_pattern(by_word) + "))")
+
+    def groups(self, folded: str) -> frozenset[str]:
+        found: set[str] = set()
+        closure = self._closure
+        for m in self._re.finditer(folded):
+            found |= closure[m.group(1)]
+        return frozenset(found)
+
+@dataclass(frozen=True, slots=True)
+class IntentFeatures:
+    folded: str
+    groups: frozenset[str]
+    word_count: int
+    is_confirm: bool
+    is_cancel: bool
+    calendar_event: bool
+
+    def has(self, group: str) -> bool:
+        return group in self.groups
+
+_KEYWORDS = KeywordMatcher(KEYWORD_GROUPS)
+_CONFIRM = frozenset(fold(w) for w in CONFIRM_WORDS)
+_CANCEL = frozenset(fold(w) for w in CANCEL_WORDS)
+_CALENDAR_EVENT_RE = re.compile("|".join(f"(?:{p})" for p in CALENDAR_EVENT_PATTERNS))
+_CALENDAR_EVENT_PATTERNS = [re.compile(p) for p in CALENDAR_EVENT_PATTERNS]
+
+def _combined_sub(patterns: list[str], first_chars: str, prefix: str) -> re.Pattern:
+    """Una sola regex para reglas que empiezan con \\b: el \\b y la primera letra se
+    comprueban una vez por posición antes de probar las alternativas (mismo orden)."""
+    alts = []
+    for i, p in enumerate(patterns):
+        assert p.startswith(r"\b"), p
+        alts.append(f"(?P<{prefix}{i}>{p[2:]})")
+    return re.compile(rf"\b(?=[{first_chars}])(?:" + "|".join(alts) + ")", re.IGNORECASE)
+
+# Primeras letras posibles de cada conjunto de reglas (el benchmark verifica equivalencia)
+_GLOSSARY_RE = _combined_sub([p.pattern for p, _ in GLOSARIO_REGEX], "ucas", "g")
+_GLOSSARY_REPL = {f"g{i}": r for i, (_, r) in enumerate(GLOSARIO_REGEX)}
+_PHONETIC_RE = _combined_sub([p for p, _ in PHONETIC_RULES], "ucs", "p")
+_PHONETIC_REPL = {f"p{i}": r for i, (_, r) in enumerate(PHONETIC_RULES)}
+
+@lru_cache(maxsize=2048)
+def analyze(text: str) -> IntentFeatures:
+    """Rasgos de intención de un mensaje (memoizado: el mismo texto pasa por varios
+    detectores durante un update)."""
+    folded = fold(text)
+    stripped = folded.strip()
+    return IntentFeatures(
+        folded=folded,
+        groups=_KEYWORDS.groups(folded),
+        word_count=len(folded.split()),
+        is_confirm=stripped in _CONFIRM,
+        is_cancel=stripped in _CANCEL,
+        calendar_event=_CALENDAR_EVENT_RE.search(folded) is not None,
+    )
+
+def calendar_pattern_index(folded: str) -> Optional[int]:
+    """Índice (1-based) del primer patrón de agenda que coincide, como el detector original."""
+    for i, p in enumerate(_CALENDAR_EVENT_PATTERNS):
+        if p.search(folded):
+            return i + 1
+    return None
+
+def normalize_glossary(text: str) -> str:
+    if not text:
+        return text
+    return _GLOSSARY_RE.sub(lambda m: _GLOSSARY_REPL[m.lastgroup], text)
+
+def prenormalize_phonetic(text: str) -> str:
+    if not text:
+        return text
+    return _PHONETIC_RE.sub(lambda m: _PHONETIC_REPL[m.lastgroup], text)
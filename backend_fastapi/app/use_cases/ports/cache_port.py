@@ -5,4 +5,10 @@ class CachePort(Protocol):
     async def set(self, key: str, value: bytes, ttl_seconds: int | None = None) -> None: ...
     async def delete(self, key: str) -> None: ...
     async def acquire_lock(self, key: str, ttl_seconds: int = 10) -> bool: ...
-    async def release_lock(self, key: str) -> None: ...
\ No newline at end of file
+    async def release_lock(self, key: str) -> None: ...
+    # Operaciones en lote: un solo round-trip
+    async def mget(self, keys: list[str]) -> list[Optional[bytes]]: ...
+    async def mset(self, items: dict[str, bytes], ttl_seconds: int | None = None) -> None: ...
+    async def delete_many(self, keys: list[str]) -> None: ...
+    # SET NX atómico; True si la clave no existía
+    async def set_nx(self, key: str, value: bytes, ttl_seconds: int | None = None) -> bool: ...
@@ -1,6 +1,7 @@
 from typing import List, Protocol
+import numpy as np
 
 class EmbeddingsPort(Protocol):
-    async def embed_many(self, texts: List[str]) -> List[List[float]]: ...
+    async def embed_many(self, texts: List[str]) -> np.ndarray: ...
     @property
     def dim(self) -> int: ...
\ No newline at end of file
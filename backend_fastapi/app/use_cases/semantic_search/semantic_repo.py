@@ -1,37 +1,119 @@
-import re
+import re, asyncio
+import numpy as np
 from app.use_cases.ports.embeddings_port import EmbeddingsPort
 
 def split_sentences(text: str) -> list[str]:
     sents = re.split(r'(?<=[\.\?\!])\s+', (text or "").strip())
     return [re.sub(r"\s+"," ", s).strip() for s in sents if s.strip()]
 
-def cos(a, b): return sum(x*y for x,y in zip(a,b))
+def cos(qvec, m) -> np.ndarray:
+    """Similitud coseno (vectores normalizados) de qvec contra cada fila de m."""
+    return np.asarray(m, dtype=np.float32) @ np.asarray(qvec, dtype=np.float32)
+
+def _snippet(sents: list[str], i: int) -> str:
+    window = [sents[i]]
+    if i-1 >= 0 and len(window[0]) < 240: window.insert(0, sents[i-1])
+    if i+1 < len(sents) and sum(len(x) for x in window) < 480: window.append(sents[i+1])
+    return " ".join(window).strip()
+
+async def rerank_sentences(emb: EmbeddingsPort, qvec, items: list[dict]):
+    """
+    Elige la mejor oración entre todos los hits.
+    Usa los embeddings por oración precomputados al ingerir (item["sentences"]);
+    solo los hits sin ellos (ingestas antiguas) se embeben, en UNA sola llamada.
+    Retorna (score, snippet, item) o None.
+    """
+    best = None
+
+    def consider(it, sents, scores: np.ndarray):
+        nonlocal best
+        i = int(np.argmax(scores))
+        if (best is None) or (scores[i] > best[0]):
+            best = (float(scores[i]), sents, i, it)
+
+    legacy = []
+    for it in items:
+        pre = it.get("sentences")
+        if pre:
+            consider(it, [t for t, _ in pre], cos(qvec, np.vstack([v for _, v in pre])))
+        else:
+            sents = split_sentences(it.get("text") or "")
+            if sents:
+                legacy.append((it, sents))
+
+    if legacy:
+        uniq: dict[str, int] = {}
+        for _, sents in legacy:
+            for s in sents:
+                uniq.setdefault(s, len(uniq))
+        sims = cos(qvec, await emb.embed_many(list(uniq)))
+        for it, sents in legacy:
+            consider(it, sents, sims[[uniq[s] for s in sents]])
+
+    if best is None:
+        return None
+    score, sents, i, it = best
+    return (score, _snippet(sents, i), it)
+
+SEARCH_MODES = ("vector", "lexical", "hybrid")
+
+def rrf_fuse(rankings: list[list[dict]], *, top_k: int, k: int = 60) -> list[dict]:
+    """
+    Reciprocal Rank Fusion: score(d) = sum(1 / (k + rank_i(d))).
+    Cada ranking es una lista de hits (con "id") ordenada de mejor a peor.
+    """
+    scores: dict[str, float] = {}
+    first: dict[str, dict] = {}
+    for ranking in rankings:
+        for rank, it in enumerate(ranking, start=1):
+            key = str(it["id"])
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+            if key in first:
+                first[key] = {**it, **first[key]}
+            else:
+                first[key] = dict(it)
+    order = sorted(scores, key=scores.__getitem__, reverse=True)[:top_k]
+    return [{**first[key], "rrf": scores[key]} for key in order]
 
 class SemanticSearchUC:
-    def __init__(self, repo, emb: EmbeddingsPort):
+    def __init__(self, repo, emb: EmbeddingsPort, *, rrf_k: int = 60, candidates: int = 20):
         self.repo = repo
         self.emb = emb
+        self.rrf_k = rrf_k
+        self.candidates = candidates
+
+    async def _embed_query(self, q: str):
+        return (await self.emb.embed_many([q]))[0]
+
+    async def _vector(self, q: str, **kw):
+        qvec = await self._embed_query(q)
+        return qvec, await self.repo.search_topk(qvec, **kw)
 
-    async def execute(self, q: str, *, kinds=None, top_k=5, probes=10):
-        qvec = (await self.emb.embed_many([q]))[0]
-        items = await self.repo.search_topk(qvec, kinds=kinds, top_k=top_k, probes=probes)
+    async def execute(self, q: str, *, kinds=None, top_k=5, probes=10, mode="vector"):
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"mode debe ser uno de {SEARCH_MODES}")
 
-        qv = qvec
-        best = None
+        if mode == "vector":
+            qvec, items = await self._vector(q, kinds=kinds, top_k=top_k, probes=probes)
+        elif mode == "lexical":
+            qvec, items = await asyncio.gather(
+                self._embed_query(q),
+                self.repo.search_lexical(q, kinds=kinds, top_k=top_k),
+            )
+        else:
+            depth = max(int(top_k), self.candidates)
+            (qvec, vec_items), lex_items = await asyncio.gather(
+                self._vector(q, kinds=kinds, top_k=depth, probes=probes, with_sentences=False),
+                self.repo.search_lexical(q, kinds=kinds, top_k=depth, with_sentences=False),
+            )
+            items = rrf_fuse([vec_items, lex_items], top_k=top_k, k=self.rrf_k)
+            await self.repo.load_sentences(items)
+
+        best = await rerank_sentences(self.emb, qvec, items)
         for it in items:
-            sents = split_sentences(it.get("text") or "")
-            if not sents: continue
-            svecs = await self.emb.embed_many(sents)
-            sims = [cos(qv, sv) for sv in svecs]
-            i = max(range(len(sims)), key=sims.__getitem__)
-            window = [sents[i]]
-            if i-1 >= 0 and len(window[0]) < 240: window.insert(0, sents[i-1])
-            if i+1 < len(sents) and sum(len(x) for x in window) < 480: window.append(sents[i+1])
-            snippet = " ".join(window).strip()
-            cand = (sims[i], snippet, it)
-            if (best is None) or (cand[0] > best[0]): best = cand
-
-        return {"q": q, "items": items, "best": None if not best else {
+            it.pop("sentences", None)
+
+        return {"q": q, "mode": mode, "items": items, "best": None if not best else {
             "text": best[1],
             "title": best[2].get("doc_title"),
             "page_no": best[2].get("page_no"),
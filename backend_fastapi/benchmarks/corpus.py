@@ -0,0 +1,94 @@
+"""
+Carga de corpus de prueba para los benchmarks del RAG.
+
+- Fixture JSON: {"docs": [{"key", "title", "text"}], "queries": [{"q", "relevant": [keys]}]}
+- Directorio: cada .txt/.md/.pdf/.docx es un documento (sin consultas etiquetadas).
+
+Los documentos se ingieren con kind 'bench.chunk' para no mezclarse con el corpus real.
+"""
+from __future__ import annotations
+import json
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from app.frameworks_drivers.config.db import AsyncSessionLocal
+from app.interface_adapters.gateways.db.pgvector_repo import PgVectorKnowledgeRepository
+from app.interface_adapters.gateways.documents.page_extractor import aiter_pages
+from app.interface_adapters.gateways.embeddings.embeddings_http_client import EmbeddingsHTTPClient
+from app.interface_adapters.gateways.embeddings.local_embeddings import LocalHashEmbeddings
+
+FIXTURE = Path(__file__).parent / "fixtures" / "semantic_corpus.json"
+KIND = "bench.chunk"
+SOURCE_TABLE = "bench"
+
+@dataclass
+class BenchDoc:
+    key: str
+    title: str
+    text: str | None = None
+    path: Path | None = None
+
+@dataclass
+class Corpus:
+    docs: list[BenchDoc] = field(default_factory=list)
+    queries: list[dict] = field(default_factory=list)
+
+    def key_by_title(self) -> dict[str, str]:
+        return {d.title: d.key for d in self.docs}
+
+def load_fixture(path: Path = FIXTURE) -> Corpus:
+    data = json.loads(Path(path).read_text(encoding="utf-8"))
+    return Corpus(
+        docs=[BenchDoc(key=d["key"], title=d["title"], text=d["text"]) for d in data.get("docs", [])],
+        queries=list(data.get("queries", [])),
+    )
+
+def load_dir(path: Path) -> Corpus:
+    exts = {".txt", ".md", ".pdf", ".docx"}
+    files = sorted(p for p in Path(path).rglob("*") if p.suffix.lower() in exts)
+    return Corpus(docs=[BenchDoc(key=p.stem, title=p.name, path=p) for p in files])
+
+def replicate(corpus: Corpus, times: int) -> Corpus:
+    """Multiplica los documentos (títulos distintos) para medir throughput a mayor escala."""
+    if times <= 1:
+        return corpus
+    docs = list(corpus.docs)
+    for i in range(1, times):
+        docs += [BenchDoc(key=d.key, title=f"{d.title} #{i}", text=d.text, path=d.path) for d in corpus.docs]
+    return Corpus(docs=docs, queries=corpus.queries)
+
+def make_embeddings(backend: str):
+    return LocalHashEmbeddings() if backend == "local" else EmbeddingsHTTPClient()
+
+async def _pages(doc: BenchDoc):
+    if doc.text is not None:
+        yield (None, doc.text)
+        return
+    with open(doc.path, "rb") as fp:
+        async for page in aiter_pages(doc.path.name, fp):
+            yield page
+
+async def ingest(corpus: Corpus, emb, *, batch_size: int = 64, concurrency: int = 4) -> tuple[list[str], dict]:
+    """Ingiere el corpus; retorna (source_ids, totales de ingest_stream)."""
+    source_ids: list[str] = []
+    totals = {"pages": 0, "chunks": 0, "inserted": 0}
+    async with AsyncSessionLocal() as s:
+        repo = PgVectorKnowledgeRepository(s)
+        await repo.ensure_schema()
+        for d in corpus.docs:
+            sid, stats = await repo.ingest_stream(
+                title=d.title, pages=_pages(d), source_table=SOURCE_TABLE, kind=KIND,
+                embed_fn=emb.embed_many, batch_size=batch_size, concurrency=concurrency,
+            )
+            source_ids.append(sid)
+            for k in totals:
+                totals[k] += stats[k]
+        await s.commit()
+    return source_ids, totals
+
+async def purge(source_ids: list[str]) -> None:
+    async with AsyncSessionLocal() as s:
+        repo = PgVectorKnowledgeRepository(s)
+        for sid in source_ids:
+            await repo.delete_document(sid)
+        await s.commit()
@@ -0,0 +1,113 @@
+"""
+Servidor falso de la Bot API de Telegram para pruebas de salida.
+
+Acepta sendMessage / editMessageText / answerCallbackQuery / getMe y aplica
+límites parecidos a los reales (ventana de 1 s por chat y global); al excederlos
+responde 429 con `parameters.retry_after`, igual que Telegram. Guarda lo recibido
+para verificar orden y fusión de ediciones.
+
+    cd backend_fastapi
+    uvicorn benchmarks.fake_telegram_api:app --port 8081
+    TELEGRAM_API_BASE=http://localhost:8081 ...    # el bot apunta al servidor falso
+
+También se puede montar en proceso con httpx.ASGITransport (ver telegram_send_bench).
+"""
+from __future__ import annotations
+import asyncio, math, os, time
+from collections import defaultdict, deque
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+class FakeTelegramState:
+    def __init__(self, *, chat_limit: int = 3, global_limit: int = 30,
+                 window_s: float = 1.0, latency_ms: float = 20.0):
+        self.chat_limit = chat_limit
+        self.global_limit = global_limit
+        self.window_s = window_s
+        self.latency_ms = latency_ms
+        self.reset()
+
+    def reset(self) -> None:
+        self._chat_hits: dict[str, deque] = defaultdict(deque)
+        self._global_hits: deque = deque()
+        self._next_message_id = 1
+        self.messages: dict[str, list[dict]] = defaultdict(list)
+        self.edits: dict[tuple[str, int], list[str]] = defaultdict(list)
+        self.requests = 0
+        self.throttled = 0
+
+    def _prune(self, hits: deque, now: float) -> None:
+        while hits and now - hits[0] >= self.window_s:
+            hits.popleft()
+
+    def check(self, chat_id: str | None) -> float:
+        """0 si se acepta; si no, segundos hasta que haya cupo."""
+        now = time.monotonic()
+        self._prune(self._global_hits, now)
+        if len(self._global_hits) >= self.global_limit:
+            return self.window_s - (now - self._global_hits[0])
+        if chat_id is not None:
+            hits = self._chat_hits[chat_id]
+            self._prune(hits, now)
+            if len(hits) >= self.chat_limit:
+                return self.window_s - (now - hits[0])
+            hits.append(now)
+        self._global_hits.append(now)
+        return 0.0
+
+def create_app(state: FakeTelegramState | None = None) -> FastAPI:
+    state = state or FakeTelegramState(
+        chat_limit=int(os.getenv("FAKE_TG_CHAT_LIMIT", "3")),
+        global_limit=int(os.getenv("FAKE_TG_GLOBAL_LIMIT", "30")),
+        latency_ms=float(os.getenv("FAKE_TG_LATENCY_MS", "20")),
+    )
+    api = FastAPI(title="fake-telegram-bot-api")
+    api.state.tg = state
+
+    @api.post("/bot{token}/{method}")
+    @api.get("/bot{token}/{method}")
+    async def bot_method(token: str, method: str, req: Request):
+        state.requests += 1
+        try:
+            body = await req.json()
+        except Exception:
+            body = {}
+        chat_id = body.get("chat_id")
+        chat_id = str(chat_id) if chat_id is not None else None
+
+        wait = state.check(chat_id)
+        if wait > 0:
+            state.throttled += 1
+            retry_after = max(1, math.ceil(wait))
+            return JSONResponse(status_code=429, content={
+                "ok": False, "error_code": 429,
+                "description": f"Too Many Requests: retry after {retry_after}",
+                "parameters": {"retry_after": retry_after},
+            })
+        if state.latency_ms > 0:
+            await asyncio.sleep(state.latency_ms / 1000.0)
+
+        if method == "getMe":
+            return {"ok": True, "result": {"id": 1, "is_bot": True, "username": "fake_bot"}}
+        if method == "sendMessage":
+            mid = state._next_message_id
+            state._next_message_id += 1
+            state.messages[chat_id].append({"message_id": mid, "text": body.get("text")})
+            return {"ok": True, "result": {"message_id": mid, "chat": {"id": body.get("chat_id")},
+                                           "text": body.get("text")}}
+        if method == "editMessageText":
+            state.edits[(chat_id, int(body.get("message_id") or 0))].append(body.get("text"))
+            return {"ok": True, "result": True}
+        if method == "answerCallbackQuery":
+            return {"ok": True, "result": True}
+        return JSONResponse(status_code=404, content={"ok": False, "error_code": 404, "description": "Not Found"})
+
+    @api.get("/_stats")
+    async def stats():
+        return {"requests": state.requests, "throttled": state.throttled,
+                "chats": len(state.messages), "edits": sum(len(v) for v in state.edits.values())}
+
+    return api
+
+app = create_app()
@@ -0,0 +1,178 @@
+"""
+Microbenchmark del fast-path de intención de Telegram.
+
+Compara las funciones originales (copiadas abajo como referencia congelada:
+classify_user_intent, _needs_mcp_tools, _is_domain_related, _is_ack,
+_detect_calendar_event_intent, confirmación/cancelación y la normalización de
+glosario) contra el matcher precompilado de telegram_intent_matcher, que calcula
+todos los rasgos en una sola pasada. Reporta µs por mensaje y los mensajes cuyo
+resultado difiere (esperable solo por el plegado de tildes).
+
+    cd backend_fastapi
+    python -m benchmarks.intent_bench --iterations 2000
+"""
+from __future__ import annotations
+import argparse, itertools, json, random, re, time
+
+from app.interface_adapters.services import telegram_intent_matcher as intents
+
+SAMPLES = [
+    "hola", "buenas tardes", "gracias!", "ok", "sí", "no", "de acuerdo", "confirmar",
+    "quiero agendar una asesoría con el profesor Pérez mañana a las 10:00",
+    "listame mis eventos próximos", "¿qué es el CINAP?", "necesito una cita para el lunes",
+    "cancelar cita del jueves", "muéstrame la disponibilidad de los asesores de educación digital",
+    "tengo que reservar un cupo para la reunión de la semana", "me puedes decir el horario del docente",
+    "cuéntame sobre la u ce te", "centro de innovación en aprendizaje docencia y tecnología educativa",
+    "qué servicios ofrece el si nap", "agenda evento con la profesora González", "info de google sites",
+    "asesoria para el curso de matematicas en marzo", "reunion con el asesor", "buenos días, cómo estás",
+    "el calendario está vacío?", "programar reunión para el viernes", "hay disponibilidad para profesor",
+    "me gustaría ver mis asesorías", "nada que ver", "perfecto, listo", "explica cómo funciona",
+]
+
+# ---- Referencia: implementación anterior (sin cambios) ----
+_L_DOMAIN = intents.DOMAIN_KEYWORDS
+_L_ACK = intents.ACK_KEYWORDS
+_L_CONFIRM = intents.CONFIRM_WORDS
+_L_CANCEL = intents.CANCEL_WORDS
+
+def legacy_is_ack(s):
+    t = (s or "").lower()
+    return any(k in t for k in _L_ACK) and len(t.split()) <= 6
+
+def legacy_is_domain_related(s):
+    t = (s or "").lower()
+    return any(k in t for k in _L_DOMAIN)
+
+def legacy_confirm_cancel(t):
+    tl = (t or "").lower().strip()
+    return tl in _L_CONFIRM, tl in _L_CANCEL
+
+def legacy_detect_calendar_event(text):
+    text_lower = text.lower().strip()
+    for i, pattern in enumerate(intents.CALENDAR_EVENT_PATTERNS):
+        if re.search(pattern, text_lower):
+            return f"calendar_pattern_{i+1}"
+    return None
+
+def legacy_needs_mcp(text):
+    text_lower = text.lower().strip()
+    for exclusion in intents.MCP_EXCLUSIONS:
+        if exclusion in text_lower:
+            return False
+    for kw in intents.MCP_HIGH_CERTAINTY:
+        if kw in text_lower:
+            return True
+    has_action = any(a in text_lower for a in intents.MCP_ACTION)
+    has_calendar = any(w in text_lower for w in intents.MCP_CALENDAR)
+    if has_action and has_calendar:
+        return True
+    return legacy_detect_calendar_event(text) is not None
+
+def legacy_classify(text):
+    text = text.lower().strip()
+    if any(p in text for p in intents.GREETING_KEYWORDS) and len(text.split()) <= 3:
+        return "greeting"
+    if any(kw in text for kw in intents.SERVICE_KEYWORDS):
+        return "service"
+    if any(kw in text for kw in intents.CALENDAR_KEYWORDS):
+        return "calendar"
+    if any(kw in text for kw in intents.ACTION_KEYWORDS):
+        return "action"
+    has_time = any(kw in text for kw in intents.TIME_KEYWORDS)
+    has_academic = any(c in text for c in intents.ACADEMIC_CONTEXT)
+    if has_time and has_academic:
+        return "time+academic"
+    if has_academic:
+        return "academic"
+    if has_time:
+        return "time"
+    return "unknown"
+
+def legacy_glossary(texto):
+    for pattern, replacement in intents.GLOSARIO_REGEX:
+        texto = pattern.sub(replacement, texto)
+    return texto
+
+def legacy_phonetic(t):
+    for p, r in intents.PHONETIC_RULES:
+        t = re.sub(p, r, t, flags=re.IGNORECASE)
+    return t
+
+def legacy_all(text):
+    return (legacy_classify(text), legacy_needs_mcp(text), legacy_is_domain_related(text),
+            legacy_is_ack(text), legacy_confirm_cancel(text), legacy_detect_calendar_event(text),
+            legacy_glossary(legacy_phonetic(text)))
+
+# ---- Nueva implementación: mismos resultados derivados de un solo analyze() ----
+def matcher_classify(f):
+    if f.has("greeting") and f.word_count <= 3:
+        return "greeting"
+    for g in ("service", "calendar", "action"):
+        if f.has(g):
+            return g
+    if f.has("time") and f.has("academic"):
+        return "time+academic"
+    if f.has("academic"):
+        return "academic"
+    if f.has("time"):
+        return "time"
+    return "unknown"
+
+def matcher_all(text):
+    f = intents.analyze(text.strip())
+    needs = (not f.has("mcp_exclusion")) and (
+        f.has("mcp_high") or (f.has("mcp_action") and f.has("mcp_calendar")) or f.calendar_event)
+    cal = f"calendar_pattern_{intents.calendar_pattern_index(f.folded.strip())}" if f.calendar_event else None
+    return (matcher_classify(f), needs, f.has("domain"), f.has("ack") and f.word_count <= 6,
+            (f.is_confirm, f.is_cancel), cal,
+            intents.normalize_glossary(intents.prenormalize_phonetic(text)))
+
+def corpus(n: int, seed: int = 7) -> list[str]:
+    rnd = random.Random(seed)
+    words = list(itertools.chain.from_iterable(s.split() for s in SAMPLES))
+    out = list(SAMPLES)
+    while len(out) < n:
+        out.append(" ".join(rnd.choice(words) for _ in range(rnd.randint(1, 18))))
+    return out[:n]
+
+def bench(fn, texts, iterations: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(iterations):
+        for t in texts:
+            fn(t)
+    return (time.perf_counter() - t0) / (iterations * len(texts)) * 1e6
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--messages", type=int, default=500)
+    ap.add_argument("--iterations", type=int, default=200)
+    ap.add_argument("--json", action="store_true", help="imprimir el reporte como JSON")
+    args = ap.parse_args()
+
+    texts = corpus(args.messages)
+    diffs = [t for t in texts if legacy_all(t) != matcher_all(t)]
+    legacy_us = bench(legacy_all, texts, args.iterations)
+    intents.analyze.cache_clear()
+    cold_us = bench(lambda t: (intents.analyze.cache_clear(), matcher_all(t)), texts, max(1, args.iterations // 10))
+    warm_us = bench(matcher_all, texts, args.iterations)
+    report = {
+        "messages": len(texts),
+        "legacy_us_per_msg": round(legacy_us, 2),
+        "matcher_cold_us_per_msg": round(cold_us, 2),
+        "matcher_warm_us_per_msg": round(warm_us, 2),
+        "speedup_cold": round(legacy_us / cold_us, 2) if cold_us else None,
+        "differences": len(diffs),
+        "difference_examples": diffs[:10],
+    }
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return
+    print(f"messages={report['messages']}  legacy={report['legacy_us_per_msg']} µs/msg  "
+          f"matcher(cold)={report['matcher_cold_us_per_msg']} µs/msg  "
+          f"matcher(memo)={report['matcher_warm_us_per_msg']} µs/msg  speedup(cold)={report['speedup_cold']}x")
+    print(f"diferencias={report['differences']}")
+    for t in report["difference_examples"]:
+        print(f"    {t!r}\n        legacy ={legacy_all(t)}\n        matcher={matcher_all(t)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+Benchmark del camino RAG: embeddings -> PgVectorKnowledgeRepository -> SemanticSearchUC.
+
+Mide throughput de ingesta (chunks/s), latencia de consulta p50/p95/p99 y el
+desglose por etapa registrado con astage (embeddings.*, pgvector.*, ingest.*).
+Con --embeddings local no necesita servidor de embeddings (solo Postgres + pgvector).
+
+    cd backend_fastapi
+    python -m benchmarks.rag_bench --embeddings local --repeat 20 --iterations 5
+"""
+from __future__ import annotations
+import argparse, asyncio, json, math, time
+from pathlib import Path
+
+from app.frameworks_drivers.config.db import AsyncSessionLocal
+from app.interface_adapters.gateways.db.pgvector_repo import PgVectorKnowledgeRepository
+from app.observability.metrics import new_request, _get_trace, astage
+from app.use_cases.semantic_search.semantic_repo import SemanticSearchUC, SEARCH_MODES
+from benchmarks.corpus import FIXTURE, KIND, load_fixture, load_dir, replicate, make_embeddings, ingest, purge
+
+def percentile(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+    xs = sorted(values)
+    i = min(len(xs) - 1, max(0, math.ceil(p / 100.0 * len(xs)) - 1))  # nearest-rank
+    return xs[i]
+
+def stage_breakdown(stage_lists: list[list[dict]]) -> dict:
+    by_name: dict[str, list[float]] = {}
+    for stages in stage_lists:
+        for st in stages:
+            by_name.setdefault(st["name"], []).append(float(st["elapsed_ms"]))
+    return {
+        name: {
+            "count": len(ms),
+            "mean_ms": round(sum(ms) / len(ms), 2),
+            "p95_ms": round(percentile(ms, 95), 2),
+            "total_ms": round(sum(ms), 1),
+        }
+        for name, ms in sorted(by_name.items(), key=lambda kv: -sum(kv[1]))
+    }
+
+async def bench_ingest(corpus, emb, *, batch_size: int, concurrency: int) -> tuple[list[str], dict]:
+    new_request()
+    t0 = time.perf_counter()
+    async with astage("bench.ingest"):
+        source_ids, totals = await ingest(corpus, emb, batch_size=batch_size, concurrency=concurrency)
+    elapsed = time.perf_counter() - t0
+    return source_ids, {
+        **totals,
+        "docs": len(corpus.docs),
+        "elapsed_s": round(elapsed, 3),
+        "chunks_per_s": round(totals["chunks"] / elapsed, 1) if elapsed else 0.0,
+        "stages": stage_breakdown([_get_trace()["stages"]]),
+    }
+
+async def bench_queries(queries: list[str], emb, *, iterations: int, concurrency: int,
+                        mode: str, top_k: int, probes: int) -> dict:
+    sem = asyncio.Semaphore(max(1, concurrency))
+    latencies: list[float] = []
+    stage_lists: list[list[dict]] = []
+
+    async def one(q: str) -> None:
+        async with sem:
+            new_request()
+            t0 = time.perf_counter()
+            async with AsyncSessionLocal() as s:
+                repo = PgVectorKnowledgeRepository(s, session_factory=AsyncSessionLocal)
+                await SemanticSearchUC(repo, emb).execute(q, kinds=[KIND], top_k=top_k, probes=probes, mode=mode)
+            latencies.append((time.perf_counter() - t0) * 1000)
+            stage_lists.append(list(_get_trace()["stages"]))
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one(q) for _ in range(max(1, iterations)) for q in queries))
+    wall = time.perf_counter() - t0
+    return {
+        "mode": mode,
+        "queries": len(latencies),
+        "qps": round(len(latencies) / wall, 1) if wall else 0.0,
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "stages": stage_breakdown(stage_lists),
+    }
+
+async def run(args) -> dict:
+    corpus = load_dir(args.dir) if args.dir else load_fixture(args.fixture)
+    if args.dir:
+        corpus.queries = load_fixture(args.fixture).queries
+    corpus = replicate(corpus, args.repeat)
+    emb = make_embeddings(args.embeddings)
+    queries = [q["q"] for q in corpus.queries]
+
+    source_ids: list[str] = []
+    try:
+        source_ids, ingest_report = await bench_ingest(
+            corpus, emb, batch_size=args.batch_size, concurrency=args.ingest_concurrency,
+        )
+        modes = SEARCH_MODES if args.mode == "all" else (args.mode,)
+        query_reports = [
+            await bench_queries(queries, emb, iterations=args.iterations, concurrency=args.concurrency,
+                                mode=m, top_k=args.top_k, probes=args.probes)
+            for m in modes
+        ]
+    finally:
+        if source_ids and not args.keep:
+            await purge(source_ids)
+        if hasattr(emb, "aclose"):
+            await emb.aclose()
+    return {"embeddings": args.embeddings, "ingest": ingest_report, "query": query_reports}
+
+def _print_stages(stages: dict, indent: str = "    ") -> None:
+    for name, st in stages.items():
+        print(f"{indent}{name:<24} n={st['count']:<5} mean={st['mean_ms']:>8} ms  "
+              f"p95={st['p95_ms']:>8} ms  total={st['total_ms']:>9} ms")
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--fixture", type=Path, default=FIXTURE)
+    ap.add_argument("--dir", type=Path, default=None, help="directorio con .txt/.md/.pdf/.docx a ingerir")
+    ap.add_argument("--repeat", type=int, default=1, help="replicar el corpus N veces")
+    ap.add_argument("--embeddings", choices=["http", "local"], default="local")
+    ap.add_argument("--mode", choices=[*SEARCH_MODES, "all"], default="vector")
+    ap.add_argument("--iterations", type=int, default=5)
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--top-k", type=int, default=5)
+    ap.add_argument("--probes", type=int, default=10)
+    ap.add_argument("--batch-size", type=int, default=64)
+    ap.add_argument("--ingest-concurrency", type=int, default=4)
+    ap.add_argument("--keep", action="store_true", help="no borrar el corpus de prueba al terminar")
+    ap.add_argument("--json", action="store_true", help="imprimir el reporte como JSON")
+    args = ap.parse_args()
+
+    report = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return
+
+    ing = report["ingest"]
+    print(f"ingest: docs={ing['docs']} chunks={ing['chunks']} in {ing['elapsed_s']} s "
+          f"-> {ing['chunks_per_s']} chunks/s")
+    _print_stages(ing["stages"])
+    for qr in report["query"]:
+        print(f"query[{qr['mode']}]: n={qr['queries']} qps={qr['qps']} "
+              f"p50={qr['p50_ms']} ms p95={qr['p95_ms']} ms p99={qr['p99_ms']} ms")
+        _print_stages(qr["stages"])
+
+if __name__ == "__main__":
+    main()
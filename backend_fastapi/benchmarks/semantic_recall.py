@@ -0,0 +1,75 @@
+"""
+Recall@k de la búsqueda semántica por modo (vector / lexical / hybrid).
+
+Ingresa el corpus de fixtures en la BD configurada (kind 'bench.chunk', aislado
+del corpus real), corre las consultas en cada modo y luego lo elimina.
+
+    cd backend_fastapi
+    python -m benchmarks.semantic_recall --k 1 3 5 [--embeddings local]
+"""
+from __future__ import annotations
+import argparse, asyncio, time
+from pathlib import Path
+
+from app.frameworks_drivers.config.db import AsyncSessionLocal
+from app.interface_adapters.gateways.db.pgvector_repo import PgVectorKnowledgeRepository
+from app.use_cases.semantic_search.semantic_repo import SemanticSearchUC, SEARCH_MODES
+from benchmarks.corpus import FIXTURE, KIND, load_fixture, make_embeddings, ingest, purge
+
+def recall_at_k(hits: list[str], relevant: list[str], k: int) -> float:
+    rel = set(relevant)
+    return len(rel & set(hits[:k])) / len(rel) if rel else 0.0
+
+async def run(fixture: Path, ks: list[int], probes: int, keep: bool, backend: str) -> dict:
+    corpus = load_fixture(fixture)
+    emb = make_embeddings(backend)
+    title_to_key = corpus.key_by_title()
+    source_ids, _ = await ingest(corpus, emb)
+
+    report: dict = {}
+    try:
+        for mode in SEARCH_MODES:
+            sums = {k: 0.0 for k in ks}
+            t0 = time.perf_counter()
+            for qd in corpus.queries:
+                async with AsyncSessionLocal() as s:
+                    repo = PgVectorKnowledgeRepository(s, session_factory=AsyncSessionLocal)
+                    out = await SemanticSearchUC(repo, emb).execute(
+                        qd["q"], kinds=[KIND], top_k=max(ks), probes=probes, mode=mode,
+                    )
+                hits: list[str] = []
+                for it in out["items"]:
+                    key = title_to_key.get(it.get("doc_title"))
+                    if key and key not in hits:
+                        hits.append(key)
+                for k in ks:
+                    sums[k] += recall_at_k(hits, qd["relevant"], k)
+            n = len(corpus.queries) or 1
+            report[mode] = {
+                **{f"recall@{k}": round(sums[k] / n, 3) for k in ks},
+                "ms_per_query": round((time.perf_counter() - t0) * 1000 / n, 1),
+            }
+    finally:
+        if not keep:
+            await purge(source_ids)
+        if hasattr(emb, "aclose"):
+            await emb.aclose()
+    return report
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--fixture", type=Path, default=FIXTURE)
+    ap.add_argument("--k", type=int, nargs="+", default=[1, 3, 5])
+    ap.add_argument("--probes", type=int, default=10)
+    ap.add_argument("--embeddings", choices=["http", "local"], default="http")
+    ap.add_argument("--keep", action="store_true", help="no borrar el corpus de prueba al terminar")
+    args = ap.parse_args()
+
+    report = asyncio.run(run(args.fixture, sorted(set(args.k)), args.probes, args.keep, args.embeddings))
+    width = max(len(m) for m in report)
+    for mode, row in report.items():
+        cols = "  ".join(f"{k}={v}" for k, v in row.items())
+        print(f"{mode:<{width}}  {cols}")
+
+if __name__ == "__main__":
+    main()
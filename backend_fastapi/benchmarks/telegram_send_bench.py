@@ -0,0 +1,168 @@
+"""
+Benchmark de la salida hacia Telegram contra el servidor falso (benchmarks.fake_telegram_api).
+
+Simula N chats que reciben ráfagas de mensajes y ediciones rápidas al mismo mensaje
+(el "escribiendo…" que se va actualizando) y compara:
+  - naive:      POST directo, sin límites (como antes del dispatcher)
+  - dispatcher: TelegramDispatcher con buckets global/por chat, retry_after y fusión de ediciones
+Reporta 429 recibidos, mensajes entregados, orden por chat e histograma de latencia.
+Por defecto monta el servidor en proceso (httpx.ASGITransport); con --base-url usa uno externo.
+
+    cd backend_fastapi
+    python -m benchmarks.telegram_send_bench --chats 20 --messages 5 --edits 10
+
+Con --check sale con código 1 si el dispatcher recibió algún 429, perdió mensajes o
+los desordenó (p.ej. envíos secuenciales por chat, como una respuesta larga en partes):
+
+    python -m benchmarks.telegram_send_bench --mode dispatcher --chats 5 --messages 10 --edits 0 --check
+"""
+from __future__ import annotations
+import argparse, asyncio, json, sys, time
+
+import httpx
+
+from app.interface_adapters.gateways.telegram.outbound_dispatcher import TelegramDispatcher, LatencyHistogram
+from benchmarks.fake_telegram_api import FakeTelegramState, create_app
+
+TOKEN = "123:fake"
+
+def _client_factory(args, state: FakeTelegramState):
+    client: httpx.AsyncClient | None = None
+    async def get() -> httpx.AsyncClient:
+        nonlocal client
+        if client is None:
+            if args.base_url:
+                client = httpx.AsyncClient(timeout=10.0)
+            else:
+                client = httpx.AsyncClient(transport=httpx.ASGITransport(app=create_app(state)),
+                                           base_url="http://fake-telegram", timeout=10.0)
+        return client
+    return get
+
+async def _server_counts(args, state: FakeTelegramState, get_client) -> tuple[int, int]:
+    if not args.base_url:
+        return state.requests, state.throttled
+    data = (await (await get_client()).get(f"{args.base_url.rstrip('/')}/_stats")).json()
+    return data["requests"], data["throttled"]
+
+async def _scenario(send, edit, *, chats: int, messages: int, edits: int) -> dict:
+    async def one_chat(chat_id: int) -> list[str]:
+        sent = []
+        status, data = await send(chat_id, "pensando…")
+        mid = (data.get("result") or {}).get("message_id") if status == 200 else None
+        if mid is not None:
+            await asyncio.gather(*(edit(chat_id, mid, f"pensando{'.' * (i + 1)}") for i in range(edits)))
+        for i in range(messages):
+            text = f"parte {i}"
+            status, _ = await send(chat_id, text)
+            if status == 200:
+                sent.append(text)
+        return sent
+
+    t0 = time.perf_counter()
+    results = await asyncio.gather(*(one_chat(c) for c in range(1, chats + 1)))
+    elapsed = time.perf_counter() - t0
+    expected = [f"parte {i}" for i in range(messages)]
+    return {
+        "elapsed_s": round(elapsed, 2),
+        "delivered": sum(len(r) for r in results),
+        "expected": chats * messages,
+        "in_order": all(r == expected for r in results),
+    }
+
+async def run_naive(args) -> dict:
+    state = FakeTelegramState(chat_limit=args.chat_limit, global_limit=args.global_limit, latency_ms=args.latency_ms)
+    get_client = _client_factory(args, state)
+    base = f"{(args.base_url or 'http://fake-telegram').rstrip('/')}/bot{TOKEN}"
+    hist = LatencyHistogram()
+
+    async def post(method: str, payload: dict):
+        client = await get_client()
+        t0 = time.perf_counter()
+        resp = await client.post(f"{base}/{method}", json=payload)
+        hist.observe((time.perf_counter() - t0) * 1000.0)
+        return resp.status_code, resp.json()
+
+    req0, thr0 = await _server_counts(args, state, get_client)
+    report = await _scenario(
+        lambda c, t: post("sendMessage", {"chat_id": c, "text": t}),
+        lambda c, m, t: post("editMessageText", {"chat_id": c, "message_id": m, "text": t}),
+        chats=args.chats, messages=args.messages, edits=args.edits,
+    )
+    req1, thr1 = await _server_counts(args, state, get_client)
+    await (await get_client()).aclose()
+    return {"mode": "naive", **report, "server_requests": req1 - req0,
+            "throttled": thr1 - thr0, "latency": hist.snapshot()}
+
+async def run_dispatcher(args) -> dict:
+    state = FakeTelegramState(chat_limit=args.chat_limit, global_limit=args.global_limit, latency_ms=args.latency_ms)
+    get_client = _client_factory(args, state)
+    disp = TelegramDispatcher(
+        get_client, base_url=args.base_url or "http://fake-telegram", token=TOKEN,
+        global_rate=args.global_rate, chat_rate=args.chat_rate, chat_burst=args.chat_burst,
+        concurrency=args.concurrency, max_retries=args.max_retries,
+    )
+    req0, thr0 = await _server_counts(args, state, get_client)
+    report = await _scenario(
+        lambda c, t: disp.call("sendMessage", {"chat_id": c, "text": t}, chat_id=c),
+        lambda c, m, t: disp.edit(c, m, {"chat_id": c, "message_id": m, "text": t}),
+        chats=args.chats, messages=args.messages, edits=args.edits,
+    )
+    req1, thr1 = await _server_counts(args, state, get_client)
+    await (await get_client()).aclose()
+    return {"mode": "dispatcher", **report, "server_requests": req1 - req0,
+            "throttled": thr1 - thr0, **disp.stats()}
+
+async def run(args) -> list[dict]:
+    reports = []
+    if args.mode in ("naive", "both"):
+        reports.append(await run_naive(args))
+    if args.mode in ("dispatcher", "both"):
+        reports.append(await run_dispatcher(args))
+    return reports
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--mode", choices=["naive", "dispatcher", "both"], default="both")
+    ap.add_argument("--base-url", default=None, help="servidor falso externo (p.ej. http://localhost:8081)")
+    ap.add_argument("--chats", type=int, default=20)
+    ap.add_argument("--messages", type=int, default=5, help="mensajes por chat")
+    ap.add_argument("--edits", type=int, default=10, help="ediciones rápidas al primer mensaje")
+    ap.add_argument("--chat-limit", type=int, default=3, help="límite del servidor falso por chat y segundo")
+    ap.add_argument("--global-limit", type=int, default=30, help="límite global del servidor falso por segundo")
+    ap.add_argument("--latency-ms", type=float, default=20.0)
+    ap.add_argument("--global-rate", type=float, default=30.0)
+    ap.add_argument("--chat-rate", type=float, default=1.0)
+    ap.add_argument("--chat-burst", type=float, default=3.0)
+    ap.add_argument("--concurrency", type=int, default=32)
+    ap.add_argument("--max-retries", type=int, default=3)
+    ap.add_argument("--json", action="store_true", help="imprimir el reporte como JSON")
+    ap.add_argument("--check", action="store_true",
+                    help="código 1 si el dispatcher recibe 429, pierde o desordena mensajes")
+    args = ap.parse_args()
+
+    reports = asyncio.run(run(args))
+    _print(reports, as_json=args.json)
+    if args.check:
+        bad = [r for r in reports if r["mode"] == "dispatcher"
+               and (r["throttled"] or not r["in_order"] or r["delivered"] < r["expected"])]
+        if bad:
+            print("CHECK FAILED: el dispatcher no respetó los límites", file=sys.stderr)
+            sys.exit(1)
+
+def _print(reports: list[dict], *, as_json: bool) -> None:
+    if as_json:
+        print(json.dumps(reports, ensure_ascii=False, indent=2))
+        return
+    for r in reports:
+        lat = r["latency"]
+        print(f"{r['mode']}: delivered={r['delivered']}/{r['expected']} in_order={r['in_order']} "
+              f"elapsed={r['elapsed_s']} s server_requests={r['server_requests']} throttled(429)={r['throttled']}")
+        if r["mode"] == "dispatcher":
+            print(f"    retries={r['retries']} coalesced_edits={r['coalesced_edits']}")
+        print(f"    latency: n={lat['count']} mean={lat['mean_ms']} ms p50<={lat['p50_ms']} ms "
+              f"p95<={lat['p95_ms']} ms p99<={lat['p99_ms']} ms")
+        print("    " + "  ".join(f"{k}={v}" for k, v in lat["buckets"].items()))
+
+if __name__ == "__main__":
+    main()
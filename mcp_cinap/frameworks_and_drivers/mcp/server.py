@@ -30,6 +30,7 @@ from interface_adapters.services.token_cipher import get_token_cipher
 from interface_adapters.gateways.calendar_gateway import NullCalendarGateway
 
 SEMANTIC_URL = os.getenv("SEMANTIC_URL", "http://localhost:8000/search/semantic")
+SEMANTIC_MODE = os.getenv("SEMANTIC_MODE", "vector")
 _client: httpx.AsyncClient | None = None
 async def _get_client() -> httpx.AsyncClient:
     global _client
@@ -1237,17 +1238,19 @@ def build_mcp() -> FastMCP:
                 payload["data"]["next_hint"] = next_hint
             return payload
 
-    @app.tool(description="Busca conocimiento institucional/FAQ por similitud semántica (RAG CINAP). Devuelve solo el texto más relevante.")
+    @app.tool(description="Busca conocimiento institucional/FAQ por similitud semántica (RAG CINAP). Devuelve solo el texto más relevante. mode: 'vector' (por defecto), 'hybrid' (léxico + vectorial) o 'lexical'.")
     async def semantic_search(
         q: str,
         kinds: Optional[List[str]] = None,
-        probes: int = 10
+        probes: int = 10,
+        mode: Optional[str] = None,
     ) -> Dict[str, Any]:
         payload = {
             "q": q,
             "top_k": 5,
             "probes": probes,
             "kinds": kinds or ["general.page","doc.chunk"],
+            "mode": mode or SEMANTIC_MODE,
         }
 
         try:
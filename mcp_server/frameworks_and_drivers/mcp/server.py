@@ -1,10 +1,13 @@
 from datetime import datetime, timedelta, timezone
 from typing import List, Optional, Tuple, Dict, Any
-import os, httpx, json
+from contextlib import asynccontextmanager
+import os, json
+from urllib.parse import quote
 from mcp.server.fastmcp import FastMCP
 from dateutil import parser as dtparser
 
 from interface_adapters.gateways.google.google_auth import GoogleOAuthAdapter
+from interface_adapters.gateways.google.http_client import get_client, aclose as close_http_client
 from interface_adapters.gateways.google.google_event_repo import GoogleCalendarEventRepository
 from interface_adapters.gateways.google.google_mappers import from_google_event
 
@@ -27,11 +30,16 @@ from frameworks_and_drivers.mcp.tool_descriptions import (
     EVENT_GET_DESC, EVENT_DELETE_DESC
 )
 
+@asynccontextmanager
+async def _lifespan(_server: FastMCP):
+    try:
+        yield {}
+    finally:
+        await close_http_client()
+
 def build_mcp() -> FastMCP:
-    mcp = FastMCP("event-mcp")
+    mcp = FastMCP("event-mcp", lifespan=_lifespan)
 
-    GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID")
-    GOOGLE_CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET")
     DEFAULT_TZ = os.getenv("DEFAULT_TZ", "America/Santiago")
 
     oauth_adapter = GoogleOAuthAdapter()
@@ -48,21 +56,7 @@ def build_mcp() -> FastMCP:
             dt = dt.replace(tzinfo=dt_tz.gettz(DEFAULT_TZ))
         return {"dateTime": dt.isoformat(), "timeZone": DEFAULT_TZ}
 
-    def _exchange_refresh_sync(refresh_token: str) -> str:
-        with httpx.Client(timeout=20) as client:
-            r = client.post(
-                "https://oauth2.googleapis.com/token",
-                data={
-                    "client_id": GOOGLE_CLIENT_ID,
-                    "client_secret": GOOGLE_CLIENT_SECRET,
-                    "grant_type": "refresh_token",
-                    "refresh_token": refresh_token,
-                },
-            )
-            r.raise_for_status()
-            return r.json()["access_token"]
-
-    def _list_events_fast(
+    async def _list_events_fast(
         *,
         calendar_id: str,
         access_token: str,
@@ -70,7 +64,7 @@ def build_mcp() -> FastMCP:
         time_max: datetime,
     ) -> List[Dict[str, Any]]:
         """Consulta directa al endpoint REST para reducir latencia en overlap."""
-        url = f"https://www.googleapis.com/calendar/v3/calendars/{calendar_id}/events"
+        url = f"https://www.googleapis.com/calendar/v3/calendars/{quote(calendar_id, safe='')}/events"
         params = {
             "timeMin": time_min.isoformat(),
             "timeMax": time_max.isoformat(),
@@ -83,11 +77,9 @@ def build_mcp() -> FastMCP:
             "Authorization": f"Bearer {access_token}",
             "Accept": "application/json",
         }
-        timeout = httpx.Timeout(12.0, connect=4.0)
-        with httpx.Client(timeout=timeout) as client:
-            resp = client.get(url, params=params, headers=headers)
-            resp.raise_for_status()
-            data = resp.json() or {}
+        resp = await get_client().get(url, params=params, headers=headers)
+        resp.raise_for_status()
+        data = resp.json() or {}
         return data.get("items") or []
 
     def _event_payload(
@@ -112,7 +104,7 @@ def build_mcp() -> FastMCP:
             body["attendees"] = [{"email": a} for a in attendees if a]
         return body
 
-    def _event_create_fast(
+    async def _event_create_fast(
         *,
         calendar_id: str,
         access_token: str,
@@ -124,7 +116,7 @@ def build_mcp() -> FastMCP:
         attendees: Optional[List[str]],
         send_updates: str,
     ) -> Dict[str, Any]:
-        url = f"https://www.googleapis.com/calendar/v3/calendars/{calendar_id}/events"
+        url = f"https://www.googleapis.com/calendar/v3/calendars/{quote(calendar_id, safe='')}/events"
         params = {"sendUpdates": send_updates or "all"}
         headers = {"Authorization": f"Bearer {access_token}", "Accept": "application/json"}
         payload = _event_payload(
@@ -135,14 +127,12 @@ def build_mcp() -> FastMCP:
             location=location,
             attendees=attendees,
         )
-        timeout = httpx.Timeout(12.0, connect=4.0)
-        with httpx.Client(timeout=timeout) as client:
-            resp = client.post(url, params=params, json=payload, headers=headers)
-            resp.raise_for_status()
-            return resp.json()
+        resp = await get_client().post(url, params=params, json=payload, headers=headers)
+        resp.raise_for_status()
+        return resp.json()
 
     @mcp.tool(description="Crea un evento en Google Calendar")
-    def event_create(
+    async def event_create(
         title: str,
         start: datetime | str,
         end: datetime | str,
@@ -176,14 +166,14 @@ def build_mcp() -> FastMCP:
             return err_msg("OAUTH_REQUIRED", "Debe enviarse el refresh_token del asesor.")
 
         try:
-            access_token = oauth_adapter.exchange_refresh(refresh_token)
+            access_token = await oauth_adapter.exchange_refresh(refresh_token)
         except Exception as e:
             return err_msg("OAUTH_EXCHANGE", f"No pude refrescar el token del asesor: {e}")
 
         cal_id = with_default_calendar_id(calendar_id)
         created_event = None
         try:
-            raw = _event_create_fast(
+            raw = await _event_create_fast(
                 calendar_id=cal_id,
                 access_token=access_token,
                 title=title,
@@ -207,7 +197,7 @@ def build_mcp() -> FastMCP:
                 attendees=norm_atts,
                 send_updates=(send_updates or "all"),
             )
-            created_event = create_uc.execute(req)
+            created_event = await create_uc.execute(req)
 
         presented = present_event(created_event)
         say = f"Evento creado en tu calendario."
@@ -233,7 +223,7 @@ def build_mcp() -> FastMCP:
         return ok_msg(say, **data)
     
     @mcp.tool(description="Elimina un evento en Google Calendar por su event_id (Google) usando OAuth del asesor.")
-    def event_delete_by_id(
+    async def event_delete_by_id(
         calendar_id: Optional[str] = None,
         event_id: Optional[str] = None,
         refresh_token: Optional[str] = None,
@@ -244,14 +234,14 @@ def build_mcp() -> FastMCP:
             return err_msg("OAUTH_REQUIRED", "Debe enviarse el refresh_token del asesor.")
 
         try:
-            access_token = oauth_adapter.exchange_refresh(refresh_token)
+            access_token = await oauth_adapter.exchange_refresh(refresh_token)
         except Exception as e:
             return err_msg("OAUTH_EXCHANGE", f"No pude refrescar el token del asesor: {e}")
 
         cal_id = with_default_calendar_id(calendar_id)
 
         try:
-            delete_uc.execute(calendar_id=cal_id, event_id=event_id, oauth_access_token=access_token)
+            await delete_uc.execute(calendar_id=cal_id, event_id=event_id, oauth_access_token=access_token)
             return ok_msg(
                 "Evento eliminado en tu calendario.",
                 deleted_event_id=event_id,
@@ -261,7 +251,7 @@ def build_mcp() -> FastMCP:
             return err_msg("GOOGLE_DELETE_FAILED", f"No se pudo eliminar en Google: {e}")
         
     @mcp.tool(description="Parchea asistentes de un evento por event_id (marca asistencia del docente).")
-    def event_patch_attendees(
+    async def event_patch_attendees(
         event_id: str,
         attendees_patch: List[Dict[str, Any]],
         calendar_id: Optional[str] = None,
@@ -291,7 +281,7 @@ def build_mcp() -> FastMCP:
             return err_msg("VALIDATION", "attendees_patch no contiene emails válidos.")
 
         try:
-            access_token = oauth_adapter.exchange_refresh(refresh_token)
+            access_token = await oauth_adapter.exchange_refresh(refresh_token)
         except Exception as e:
             return err_msg("OAUTH_EXCHANGE", f"No pude refrescar el token del usuario: {e}")
 
@@ -305,7 +295,7 @@ def build_mcp() -> FastMCP:
                 send_updates=(send_updates or "all"),
                 absolute_patch={"attendees": norm_atts},
             )
-            updated = update_uc.execute(req)
+            updated = await update_uc.execute(req)
             presented = present_event(updated)
             say = f"Asistencia actualizada en tu calendario."
             return ok_msg(say, event=presented)
@@ -313,7 +303,7 @@ def build_mcp() -> FastMCP:
             return err_msg("GOOGLE_UPDATE_FAILED", f"No se pudo actualizar el evento: {e}")
 
     @mcp.tool(description="Busca eventos en Google Calendar que se solapen con el rango indicado (start, end).")
-    def event_find_overlap(
+    async def event_find_overlap(
         start: datetime | str,
         end: datetime | str,
         calendar_id: Optional[str] = None,
@@ -333,7 +323,7 @@ def build_mcp() -> FastMCP:
             return err_msg("OAUTH_REQUIRED", "Debe enviarse el refresh_token del asesor.")
 
         try:
-            access_token = oauth_adapter.exchange_refresh(refresh_token)
+            access_token = await oauth_adapter.exchange_refresh(refresh_token)
         except Exception as e:
             return err_msg("OAUTH_EXCHANGE", f"No pude refrescar el token del asesor: {e}")
 
@@ -343,7 +333,7 @@ def build_mcp() -> FastMCP:
         events = []
         use_json_events = False
         try:
-            events = _list_events_fast(calendar_id=cal_id, access_token=access_token, time_min=sf, time_max=st)
+            events = await _list_events_fast(calendar_id=cal_id, access_token=access_token, time_min=sf, time_max=st)
             use_json_events = True
         except Exception:
             try:
@@ -351,7 +341,7 @@ def build_mcp() -> FastMCP:
                     req = ListEventsRequest(calendar_id=cal_id, time_min=sf, time_max=st, oauth_access_token=access_token)
                 except TypeError:
                     req = ListEventsRequest(calendar_id=cal_id, time_min=sf, time_max=st)
-                resp = list_uc.execute(req)
+                resp = await list_uc.execute(req)
                 events = as_items(resp)
                 use_json_events = False
             except Exception as e:
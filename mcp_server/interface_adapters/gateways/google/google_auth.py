@@ -1,25 +1,14 @@
-import httpx, os
+import os
+from interface_adapters.gateways.google.token_broker import broker_from_env
+from usecases.ports_oauth import OAuthPort
 
-GOOGLE_TOKEN_URL = "https://oauth2.googleapis.com/token"
-
-class GoogleOAuthAdapter:
+class GoogleOAuthAdapter(OAuthPort):
     def __init__(self, *, client_id: str | None = None, client_secret: str | None = None, timeout: int = 20):
         self.client_id = client_id or os.getenv("GOOGLE_CLIENT_ID", "")
         self.client_secret = client_secret or os.getenv("GOOGLE_CLIENT_SECRET", "")
         self.timeout = timeout
+        # Cachea el access token (proceso + Redis) en vez de intercambiar en cada tool
+        self._tokens = broker_from_env(client_id=self.client_id, client_secret=self.client_secret, timeout=timeout)
 
-    def exchange_refresh(self, refresh_token: str) -> str:
-        if not self.client_id or not self.client_secret:
-            raise RuntimeError("Faltan GOOGLE_CLIENT_ID / GOOGLE_CLIENT_SECRET")
-        with httpx.Client(timeout=self.timeout) as client:
-            r = client.post(
-                GOOGLE_TOKEN_URL,
-                data={
-                    "client_id": self.client_id,
-                    "client_secret": self.client_secret,
-                    "grant_type": "refresh_token",
-                    "refresh_token": refresh_token,
-                },
-            )
-            r.raise_for_status()
-            return r.json()["access_token"]
\ No newline at end of file
+    async def exchange_refresh(self, refresh_token: str) -> str:
+        return await self._tokens.access_token(refresh_token)
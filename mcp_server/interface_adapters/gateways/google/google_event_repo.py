@@ -1,30 +1,38 @@
 from typing import Any, Dict, Optional, List, Union
 from datetime import datetime
-from googleapiclient.discovery import build
-from google.oauth2.credentials import Credentials
-from googleapiclient.errors import HttpError
+from urllib.parse import quote
 
 from entities.event import Event
 from usecases.ports import EventRepository
+from interface_adapters.gateways.google.http_client import get_client
 from interface_adapters.gateways.google.google_mappers import (
     to_google_body, from_google_event, to_google_patch_body
 )
 
+CALENDAR_API = "https://www.googleapis.com/calendar/v3"
+
 class GoogleCalendarEventRepository(EventRepository):
+    """Calendar API v3 por REST sobre el cliente HTTP/2 compartido (antes: cliente
+    de discovery de googleapiclient reconstruido en cada llamada)."""
     def __init__(self, *, default_timezone: Optional[str] = "America/Santiago") -> None:
         self.default_timezone = default_timezone
 
-    def _svc(self, bearer: str):
+    @staticmethod
+    def _headers(bearer: str) -> Dict[str, str]:
         if not bearer:
             raise RuntimeError("Se requiere un access token válido (oauth_access_token).")
-        creds = Credentials(token=bearer)
-        return build("calendar", "v3", credentials=creds)
+        return {"Authorization": f"Bearer {bearer}", "Accept": "application/json"}
+
+    @staticmethod
+    def _events_url(calendar_id: str, event_id: Optional[str] = None) -> str:
+        url = f"{CALENDAR_API}/calendars/{quote(calendar_id, safe='')}/events"
+        return f"{url}/{quote(event_id, safe='')}" if event_id else url
 
     @staticmethod
     def _ensure_fields() -> str:
         return "id,summary,start,end,description,location,attendees,htmlLink"
 
-    def add(
+    async def add(
         self,
         *,
         calendar_id: str,
@@ -37,7 +45,7 @@ class GoogleCalendarEventRepository(EventRepository):
         attendees: Optional[List[str]] = None,
         send_updates: str = "all",
     ) -> Event:
-        svc = self._svc(oauth_access_token)
+        headers = self._headers(oauth_access_token)
         body = to_google_body(
             title=title,
             start_iso=start.isoformat(),
@@ -47,15 +55,16 @@ class GoogleCalendarEventRepository(EventRepository):
             attendees=attendees or [],
             timezone=self.default_timezone,
         )
-        created = svc.events().insert(
-            calendarId=calendar_id,
-            body=body,
-            sendUpdates=(send_updates or "all"),
-            fields=self._ensure_fields(),
-        ).execute()
-        return from_google_event(created, calendar_id=calendar_id)
+        r = await get_client().post(
+            self._events_url(calendar_id),
+            params={"sendUpdates": send_updates or "all", "fields": self._ensure_fields()},
+            json=body,
+            headers=headers,
+        )
+        r.raise_for_status()
+        return from_google_event(r.json(), calendar_id=calendar_id)
 
-    def list(
+    async def list(
         self,
         *,
         calendar_id: str,
@@ -65,58 +74,55 @@ class GoogleCalendarEventRepository(EventRepository):
         q: Optional[str] = None,
         max_results: int = 100,
     ) -> List[Event]:
-        svc = self._svc(oauth_access_token)
-        kwargs: Dict[str, Any] = {
-            "calendarId": calendar_id,
-            "singleEvents": True,
+        headers = self._headers(oauth_access_token)
+        params: Dict[str, Any] = {
+            "singleEvents": "true",
             "orderBy": "startTime",
             "maxResults": max_results,
             "fields": f"items({self._ensure_fields()})",
         }
         if time_min:
-            kwargs["timeMin"] = time_min.isoformat()
+            params["timeMin"] = time_min.isoformat()
         if time_max:
-            kwargs["timeMax"] = time_max.isoformat()
+            params["timeMax"] = time_max.isoformat()
         if q:
-            kwargs["q"] = q
+            params["q"] = q
 
-        result = svc.events().list(**kwargs).execute()
-        items = result.get("items", [])
+        r = await get_client().get(self._events_url(calendar_id), params=params, headers=headers)
+        r.raise_for_status()
+        items = (r.json() or {}).get("items", [])
         return [
             from_google_event(it, calendar_id=calendar_id)
             for it in items
             if "dateTime" in it.get("start", {})
         ]
 
-    def get(self, *, calendar_id: str, event_id: str, oauth_access_token: str) -> Optional[Event]:
+    async def get(self, *, calendar_id: str, event_id: str, oauth_access_token: str) -> Optional[Event]:
         try:
-            svc = self._svc(oauth_access_token)
-            item = svc.events().get(
-                calendarId=calendar_id,
-                eventId=event_id,
-                fields=self._ensure_fields(),
-            ).execute()
+            r = await get_client().get(
+                self._events_url(calendar_id, event_id),
+                params={"fields": self._ensure_fields()},
+                headers=self._headers(oauth_access_token),
+            )
+            r.raise_for_status()
+            item = r.json()
             if "dateTime" not in item.get("start", {}):
                 return None
             return from_google_event(item, calendar_id=calendar_id)
         except Exception:
             return None
 
-    def delete(self, *, calendar_id: str, event_id: str, oauth_access_token: str) -> None:
-        svc = self._svc(oauth_access_token)
-        try:
-            svc.events().delete(
-                calendarId=calendar_id,
-                eventId=event_id,
-                sendUpdates="all"
-            ).execute()
-        except HttpError as e:
-            status = getattr(e, "status_code", None) or getattr(e, "resp", getattr(e, "response", None)).status
-            if status in (404, 410):
-                raise RuntimeError(f"EVENT_NOT_FOUND_OR_GONE: {event_id}") from e
-            raise
+    async def delete(self, *, calendar_id: str, event_id: str, oauth_access_token: str) -> None:
+        r = await get_client().delete(
+            self._events_url(calendar_id, event_id),
+            params={"sendUpdates": "all"},
+            headers=self._headers(oauth_access_token),
+        )
+        if r.status_code in (404, 410):
+            raise RuntimeError(f"EVENT_NOT_FOUND_OR_GONE: {event_id}")
+        r.raise_for_status()
 
-    def update(
+    async def update(
         self,
         *,
         calendar_id: str,
@@ -131,7 +137,7 @@ class GoogleCalendarEventRepository(EventRepository):
         absolute_patch: Optional[Dict[str, Any]] = None,
         send_updates: str = "all",
     ) -> Event:
-        svc = self._svc(oauth_access_token)
+        headers = self._headers(oauth_access_token)
 
         if absolute_patch is not None:
             body = absolute_patch
@@ -146,11 +152,11 @@ class GoogleCalendarEventRepository(EventRepository):
                 timezone=self.default_timezone,
             )
 
-        updated = svc.events().patch(
-            calendarId=calendar_id,
-            eventId=event_id,
-            body=body,
-            sendUpdates=(send_updates or "all"),
-            fields=self._ensure_fields(),
-        ).execute()
-        return from_google_event(updated, calendar_id=calendar_id)
\ No newline at end of file
+        r = await get_client().patch(
+            self._events_url(calendar_id, event_id),
+            params={"sendUpdates": send_updates or "all", "fields": self._ensure_fields()},
+            json=body,
+            headers=headers,
+        )
+        r.raise_for_status()
+        return from_google_event(r.json(), calendar_id=calendar_id)
@@ -0,0 +1,24 @@
+import os
+import httpx
+
+# Un solo cliente por proceso: HTTP/2 + keep-alive hacia oauth2/www.googleapis.com
+_TIMEOUT = httpx.Timeout(float(os.getenv("GOOGLE_HTTP_TIMEOUT", "12")), connect=4.0)
+_LIMITS = httpx.Limits(
+    max_connections=int(os.getenv("GOOGLE_HTTP_MAX_CONNECTIONS", "20")),
+    max_keepalive_connections=int(os.getenv("GOOGLE_HTTP_MAX_KEEPALIVE", "10")),
+    keepalive_expiry=60.0,
+)
+
+_client: httpx.AsyncClient | None = None
+
+def get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(timeout=_TIMEOUT, limits=_LIMITS, http2=True)
+    return _client
+
+async def aclose() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
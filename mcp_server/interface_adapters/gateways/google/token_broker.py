@@ -0,0 +1,196 @@
+import asyncio, hashlib, json, logging, os, time
+from collections import OrderedDict
+from typing import Optional
+
+import httpx
+
+from interface_adapters.gateways.google.http_client import get_client
+
+try:
+    from redis.asyncio import from_url as redis_from_url
+except ImportError:
+    redis_from_url = None
+
+log = logging.getLogger(__name__)
+
+GOOGLE_TOKEN_URL = "https://oauth2.googleapis.com/token"
+# Mismo formato que el broker del backend (app/interface_adapters/gateways/oauth/google_token_broker.py)
+KEY_PREFIX = "gtok:"
+
+class InvalidGrantError(httpx.HTTPStatusError):
+    """El refresh_token fue revocado o expiró (`invalid_grant`)."""
+
+def token_key(refresh_token: str) -> str:
+    return KEY_PREFIX + hashlib.sha256(refresh_token.encode("utf-8")).hexdigest()
+
+class _RedisStore:
+    def __init__(self, url: str):
+        self._r = redis_from_url(url, decode_responses=False)
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self._r.get(key)
+
+    async def set(self, key: str, value: bytes, ttl_seconds: int) -> None:
+        await self._r.set(key, value, ex=ttl_seconds)
+
+    async def delete(self, key: str) -> None:
+        await self._r.delete(key)
+
+    async def acquire_lock(self, key: str, ttl_seconds: int = 10) -> bool:
+        return bool(await self._r.set(f"lock:{key}", b"1", ex=ttl_seconds, nx=True))
+
+    async def release_lock(self, key: str) -> None:
+        await self._r.delete(f"lock:{key}")
+
+class GoogleTokenBroker:
+    """
+    Access tokens reutilizados hasta poco antes de `expires_in`: frente en proceso +
+    Redis (compartido con el backend si REDIS_URL apunta al mismo servidor).
+    Single-flight por refresh_token; `invalid_grant` borra la entrada.
+    """
+    def __init__(self, *, client_id: str, client_secret: str, store=None, skew_s: float = 120.0,
+                 local_max: int = 1024, timeout: float = 20.0, lock_wait_s: float = 3.0):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self._store = store
+        self._skew = skew_s
+        self._local_max = max(1, int(local_max))
+        self._timeout = timeout
+        self._lock_wait = lock_wait_s
+        self._local: "OrderedDict[str, tuple[str, float]]" = OrderedDict()
+        self._inflight: dict[str, asyncio.Task] = {}
+
+    def _local_get(self, key: str) -> Optional[str]:
+        hit = self._local.get(key)
+        if hit is None:
+            return None
+        if hit[1] - self._skew <= time.time():
+            self._local.pop(key, None)
+            return None
+        self._local.move_to_end(key)
+        return hit[0]
+
+    def _local_put(self, key: str, token: str, exp: float) -> None:
+        self._local[key] = (token, exp)
+        self._local.move_to_end(key)
+        while len(self._local) > self._local_max:
+            self._local.popitem(last=False)
+
+    async def _shared_get(self, key: str) -> Optional[str]:
+        if self._store is None:
+            return None
+        try:
+            raw = await self._store.get(key)
+            if not raw:
+                return None
+            obj = json.loads(raw)
+            token, exp = obj["t"], float(obj["exp"])
+        except Exception as e:
+            log.debug(f"token broker: lectura de Redis falló: {e}")
+            return None
+        if exp - self._skew <= time.time():
+            return None
+        self._local_put(key, token, exp)
+        return token
+
+    async def _shared_put(self, key: str, token: str, exp: float) -> None:
+        ttl = int(exp - self._skew - time.time())
+        if self._store is None or ttl <= 0:
+            return
+        try:
+            await self._store.set(key, json.dumps({"t": token, "exp": exp}).encode("utf-8"), ttl_seconds=ttl)
+        except Exception as e:
+            log.debug(f"token broker: escritura en Redis falló: {e}")
+
+    async def _exchange(self, refresh_token: str) -> tuple[str, float]:
+        if not self.client_id or not self.client_secret:
+            raise RuntimeError("Faltan GOOGLE_CLIENT_ID / GOOGLE_CLIENT_SECRET")
+        r = await get_client().post(
+            GOOGLE_TOKEN_URL,
+            data={
+                "client_id": self.client_id,
+                "client_secret": self.client_secret,
+                "grant_type": "refresh_token",
+                "refresh_token": refresh_token,
+            },
+            timeout=self._timeout,
+        )
+        if r.status_code >= 400:
+            try:
+                body = r.json()
+            except Exception:
+                body = None
+            if isinstance(body, dict) and body.get("error") == "invalid_grant":
+                await self.invalidate(refresh_token)
+                raise InvalidGrantError("invalid_grant", request=r.request, response=r)
+            r.raise_for_status()
+        data = r.json()
+        return data["access_token"], time.time() + float(data.get("expires_in") or 3600)
+
+    async def _resolve(self, key: str, refresh_token: str) -> str:
+        token = await self._shared_get(key)
+        if token:
+            return token
+        locked = False
+        if self._store is not None:
+            try:
+                locked = await self._store.acquire_lock(key, ttl_seconds=max(5, int(self._timeout)))
+            except Exception:
+                locked = True
+            if not locked:
+                # Otro proceso está intercambiando: esperar a que publique el token
+                deadline = time.monotonic() + self._lock_wait
+                while time.monotonic() < deadline:
+                    await asyncio.sleep(0.1)
+                    token = await self._shared_get(key)
+                    if token:
+                        return token
+        try:
+            token, exp = await self._exchange(refresh_token)
+        finally:
+            if locked and self._store is not None:
+                try:
+                    await self._store.release_lock(key)
+                except Exception:
+                    pass
+        self._local_put(key, token, exp)
+        await self._shared_put(key, token, exp)
+        return token
+
+    async def access_token(self, refresh_token: str) -> str:
+        key = token_key(refresh_token)
+        token = self._local_get(key)
+        if token:
+            return token
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._resolve(key, refresh_token))
+            self._inflight[key] = task
+
+            def _done(t: asyncio.Task, key=key) -> None:
+                self._inflight.pop(key, None)
+                if not t.cancelled():
+                    t.exception()
+            task.add_done_callback(_done)
+        return await asyncio.shield(task)
+
+    async def invalidate(self, refresh_token: str) -> None:
+        key = token_key(refresh_token)
+        self._local.pop(key, None)
+        if self._store is not None:
+            try:
+                await self._store.delete(key)
+            except Exception:
+                pass
+
+def broker_from_env(*, client_id: str, client_secret: str, timeout: float = 20.0) -> GoogleTokenBroker:
+    url = os.getenv("REDIS_URL", "")
+    store = _RedisStore(url) if (url and redis_from_url is not None) else None
+    return GoogleTokenBroker(
+        client_id=client_id,
+        client_secret=client_secret,
+        store=store,
+        skew_s=float(os.getenv("GOOGLE_TOKEN_SKEW_S", "120")),
+        local_max=int(os.getenv("GOOGLE_TOKEN_LOCAL_MAX", "1024")),
+        timeout=timeout,
+    )
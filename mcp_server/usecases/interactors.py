@@ -31,10 +31,10 @@ class CreateEvent:
     def __init__(self, repo: EventRepository) -> None:
         self.repo = repo
 
-    def execute(self, req: CreateEventRequest) -> EventResponse:
+    async def execute(self, req: CreateEventRequest) -> EventResponse:
         _validate_title(req.title)
         _validate_times(req.start, req.end)
-        ev = self.repo.add(
+        ev = await self.repo.add(
             calendar_id=req.calendar_id,
             title=req.title,
             start=req.start,
@@ -51,9 +51,9 @@ class ListEvents:
     def __init__(self, repo: EventRepository) -> None:
         self.repo = repo
 
-    def execute(self, req: ListEventsRequest) -> ListEventsResponse:
+    async def execute(self, req: ListEventsRequest) -> ListEventsResponse:
         items = [
-            _to_response(e) for e in self.repo.list(
+            _to_response(e) for e in await self.repo.list(
                 calendar_id=req.calendar_id,
                 oauth_access_token=req.oauth_access_token,
                 time_min=req.time_min,
@@ -68,23 +68,23 @@ class GetEvent:
     def __init__(self, repo: EventRepository) -> None:
         self.repo = repo
 
-    def execute(self, *, calendar_id: str, event_id: str, oauth_access_token: str):
-        e = self.repo.get(calendar_id=calendar_id, event_id=event_id, oauth_access_token=oauth_access_token)
+    async def execute(self, *, calendar_id: str, event_id: str, oauth_access_token: str):
+        e = await self.repo.get(calendar_id=calendar_id, event_id=event_id, oauth_access_token=oauth_access_token)
         return _to_response(e) if e else None
 
 class DeleteEvent:
     def __init__(self, repo: EventRepository) -> None: self.repo = repo
     
-    def execute(self, *, calendar_id: str, event_id: str, oauth_access_token: str) -> None:
-        self.repo.delete(calendar_id=calendar_id, event_id=event_id, oauth_access_token=oauth_access_token)
+    async def execute(self, *, calendar_id: str, event_id: str, oauth_access_token: str) -> None:
+        await self.repo.delete(calendar_id=calendar_id, event_id=event_id, oauth_access_token=oauth_access_token)
 
 class UpdateEvent:
     def __init__(self, repo: EventRepository) -> None:
         self.repo = repo
 
-    def execute(self, req: UpdateEventRequest) -> Optional[EventResponse]:
+    async def execute(self, req: UpdateEventRequest) -> Optional[EventResponse]:
         if req.absolute_patch is not None:
-            updated = self.repo.update(
+            updated = await self.repo.update(
                 calendar_id=req.calendar_id,
                 event_id=req.event_id,
                 oauth_access_token=req.oauth_access_token,
@@ -93,7 +93,7 @@ class UpdateEvent:
             )
             return _to_response(updated)
 
-        current = self.repo.get(
+        current = await self.repo.get(
             calendar_id=req.calendar_id,
             event_id=req.event_id,
             oauth_access_token=req.oauth_access_token,
@@ -108,7 +108,7 @@ class UpdateEvent:
         _validate_title(new_title)
         _validate_times(new_start, new_end)
 
-        updated = self.repo.update(
+        updated = await self.repo.update(
             calendar_id=req.calendar_id,
             event_id=req.event_id,
             oauth_access_token=req.oauth_access_token,
@@ -5,7 +5,8 @@ from entities.event import Event
 
 class EventRepository(ABC):
     @abstractmethod
-    def add(
+    async def add(
+        self,
         *,
         calendar_id: str,
         title: str,
@@ -19,7 +20,7 @@ class EventRepository(ABC):
     ) -> Event: ...
 
     @abstractmethod
-    def list(
+    async def list(
         self,
         *,
         calendar_id: str,
@@ -31,13 +32,13 @@ class EventRepository(ABC):
     ) -> List[Event]: ...
 
     @abstractmethod
-    def get(self, *, calendar_id: str, event_id: str, oauth_access_token: str) -> Optional[Event]: ...
+    async def get(self, *, calendar_id: str, event_id: str, oauth_access_token: str) -> Optional[Event]: ...
 
     @abstractmethod
-    def delete(self, *, calendar_id: str, event_id: str, oauth_access_token: str) -> None: ...
+    async def delete(self, *, calendar_id: str, event_id: str, oauth_access_token: str) -> None: ...
 
     @abstractmethod
-    def update(
+    async def update(
         self,
         *,
         calendar_id: str,
@@ -2,5 +2,5 @@ from abc import ABC, abstractmethod
 
 class OAuthPort(ABC):
     @abstractmethod
-    def exchange_refresh(self, refresh_token: str) -> str:
-        raise NotImplementedError
\ No newline at end of file
+    async def exchange_refresh(self, refresh_token: str) -> str:
+        raise NotImplementedError